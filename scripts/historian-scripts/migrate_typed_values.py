@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*- {{{
+# vim: set fenc=utf-8 ft=python sw=4 ts=4 sts=4 et:
+#
+# Copyright 2017, Battelle Memorial Institute.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# This material was prepared as an account of work sponsored by an agency of
+# the United States Government. Neither the United States Government nor the
+# United States Department of Energy, nor Battelle, nor any of their
+# employees, nor any jurisdiction or organization that has cooperated in the
+# development of these materials, makes any warranty, express or
+# implied, or assumes any legal liability or responsibility for the accuracy,
+# completeness, or usefulness or any information, apparatus, product,
+# software, or process disclosed, or represents that its use would not infringe
+# privately owned rights. Reference herein to any specific commercial product,
+# process, or service by trade name, trademark, manufacturer, or otherwise
+# does not necessarily constitute or imply its endorsement, recommendation, or
+# favoring by the United States Government or any agency thereof, or
+# Battelle Memorial Institute. The views and opinions of authors expressed
+# herein do not necessarily state or reflect those of the
+# United States Government or any agency thereof.
+#
+# PACIFIC NORTHWEST NATIONAL LABORATORY operated by
+# BATTELLE for the UNITED STATES DEPARTMENT OF ENERGY
+# under Contract DE-AC05-76RL01830
+# }}}
+
+from argparse import ArgumentParser
+import os
+import sys
+
+from volttron.platform.agent.utils import load_config
+from volttron.platform.dbutils import sqlutils
+
+DEFAULT_TABLES_DEF = {"table_prefix": "",
+                      "data_table": "data",
+                      "topics_table": "topics",
+                      "meta_table": "meta"}
+
+
+def main(config_path, batch_size, drop_json_table):
+    if not os.path.exists(config_path):
+        sys.exit("Configuration file {} not found".format(config_path))
+    config = load_config(config_path)
+    connection = config['connection']
+    tables_def = config.get('tables_def') or DEFAULT_TABLES_DEF
+
+    # Table names as built by the historian.
+    table_prefix = tables_def.get('table_prefix')
+    table_prefix = table_prefix + "_" if table_prefix else ""
+    table_names = dict((key, table_prefix + tables_def[key])
+                       for key in ('data_table', 'topics_table', 'meta_table'))
+    table_names['agg_topics_table'] = table_prefix + "aggregate_" + \
+        tables_def['topics_table']
+    table_names['agg_meta_table'] = table_prefix + "aggregate_" + \
+        tables_def['meta_table']
+
+    driver_class = sqlutils.get_dbfuncts_class(connection['type'])
+    driver = driver_class(connection['params'], table_names)
+    try:
+        if driver.has_typed_values():
+            print("Table {} already stores typed values".format(
+                table_names['data_table']))
+            return
+        copied = driver.migrate_to_typed_values(batch_size, drop_json_table)
+    finally:
+        driver.close()
+    print("Converted {} rows of table {}".format(copied,
+                                                 table_names['data_table']))
+    if not drop_json_table:
+        print("The JSON values are kept in table {}_json. Drop it once the "
+              "historian works with the new table.".format(
+                  table_names['data_table']))
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Convert the data table of an SQL Historian from JSON encoded values to "
+                            "typed value columns, as created by historians configured with "
+                            "\"typed_values\": true. Supports sqlite, mysql and postgresql. The historian must "
+                            "not be running while this script is. SqliteHistorian databases created before "
+                            "VOLTTRON 4.1 must first be updated with update_sqlite_historian_database.py. It is "
+                            "recommended that you backup your database before running this.")
+
+    parser.add_argument('config',
+                        help='The configuration file of the historian.')
+    parser.add_argument('--batch-size', type=int, default=10000,
+                        help='Number of rows converted per transaction.')
+    parser.add_argument('--drop-json-table', action='store_true',
+                        help='Drop the table of JSON values once converted.')
+
+    args = parser.parse_args()
+    main(args.config, args.batch_size, args.drop_json_table)
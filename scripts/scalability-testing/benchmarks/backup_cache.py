@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*- {{{
+# vim: set fenc=utf-8 ft=python sw=4 ts=4 sts=4 et:
+#
+# Copyright 2017, Battelle Memorial Institute.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# This material was prepared as an account of work sponsored by an agency of
+# the United States Government. Neither the United States Government nor the
+# United States Department of Energy, nor Battelle, nor any of their
+# employees, nor any jurisdiction or organization that has cooperated in the
+# development of these materials, makes any warranty, express or
+# implied, or assumes any legal liability or responsibility for the accuracy,
+# completeness, or usefulness or any information, apparatus, product,
+# software, or process disclosed, or represents that its use would not infringe
+# privately owned rights. Reference herein to any specific commercial product,
+# process, or service by trade name, trademark, manufacturer, or otherwise
+# does not necessarily constitute or imply its endorsement, recommendation, or
+# favoring by the United States Government or any agency thereof, or
+# Battelle Memorial Institute. The views and opinions of authors expressed
+# herein do not necessarily state or reflect those of the
+# United States Government or any agency thereof.
+#
+# PACIFIC NORTHWEST NATIONAL LABORATORY operated by
+# BATTELLE for the UNITED STATES DEPARTMENT OF ENERGY
+# under Contract DE-AC05-76RL01830
+# }}}
+
+"""Historian backup cache ingest benchmark.
+
+Feeds device publishes through each historian backup cache the way the
+historian process loop does: cache new records, read the oldest back and
+remove them once published. Reports records per second for the sqlite,
+memory and segment caches while the historian keeps up, and for each
+cache while nothing is published and records pile up (the memory cache
+reads records back from disk). Runs in a temporary directory; no platform needs to be
+running.
+
+    python backup_cache.py --devices 200 --points 20 --scrapes 10
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+
+from volttron.platform.agent.base_historian import (BackupDatabase,
+                                                    MemoryDatabase,
+                                                    SegmentDatabase)
+from volttron.platform.agent.utils import get_aware_utc_now
+
+
+class Owner(object):
+    pass
+
+
+def device_publishes(devices, points, scrape):
+    now = get_aware_utc_now() + timedelta(seconds=scrape)
+    return [{'source': 'scrape',
+             'topic': 'devices/campus/building{}/point{}'.format(device, point),
+             'meta': {'units': 'F', 'type': 'float', 'tz': 'UTC'},
+             'headers': {'Date': now.isoformat()},
+             'readings': [(now, 70.0 + point)]}
+            for device in range(devices) for point in range(points)]
+
+
+def run(cache, opts, publish):
+    records = 0
+    elapsed = 0.0
+    for scrape in range(opts.scrapes):
+        batch = device_publishes(opts.devices, opts.points, scrape)
+        start = time.time()
+        cache.backup_new_data(batch)
+        while publish:
+            to_publish = cache.get_outstanding_to_publish(opts.submit_size)
+            if not to_publish:
+                break
+            cache.remove_successfully_published({None}, opts.submit_size)
+        elapsed += time.time() - start
+        records += len(batch)
+    cache.close()
+    return records / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--devices', type=int, default=200)
+    parser.add_argument('--points', type=int, default=20)
+    parser.add_argument('--scrapes', type=int, default=10)
+    parser.add_argument('--submit-size', type=int, default=1000)
+    opts = parser.parse_args()
+
+    caches = [
+        ('sqlite', lambda: BackupDatabase(Owner(), None, 0.9)),
+        ('memory', lambda: MemoryDatabase(Owner(), None, 0.9)),
+        ('segment', lambda: SegmentDatabase(Owner(), None, 0.9)),
+    ]
+    print('{:>8} {:>10} {:>16}'.format('cache', 'mode', 'records/s'))
+    cwd = os.getcwd()
+    for publish, mode in [(True, 'keeping up'), (False, 'behind')]:
+        for name, create in caches:
+            directory = tempfile.mkdtemp()
+            os.chdir(directory)
+            try:
+                cache = create()
+                if not publish and name == 'memory':
+                    # Read every record back from disk
+                    cache._ring_size = 0
+                rate = run(cache, opts, publish)
+            finally:
+                os.chdir(cwd)
+                shutil.rmtree(directory)
+            print('{:>8} {:>10} {:>16.0f}'.format(name, mode, rate))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*- {{{
+# vim: set fenc=utf-8 ft=python sw=4 ts=4 sts=4 et:
+#
+# Copyright 2017, Battelle Memorial Institute.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# This material was prepared as an account of work sponsored by an agency of
+# the United States Government. Neither the United States Government nor the
+# United States Department of Energy, nor Battelle, nor any of their
+# employees, nor any jurisdiction or organization that has cooperated in the
+# development of these materials, makes any warranty, express or
+# implied, or assumes any legal liability or responsibility for the accuracy,
+# completeness, or usefulness or any information, apparatus, product,
+# software, or process disclosed, or represents that its use would not infringe
+# privately owned rights. Reference herein to any specific commercial product,
+# process, or service by trade name, trademark, manufacturer, or otherwise
+# does not necessarily constitute or imply its endorsement, recommendation, or
+# favoring by the United States Government or any agency thereof, or
+# Battelle Memorial Institute. The views and opinions of authors expressed
+# herein do not necessarily state or reflect those of the
+# United States Government or any agency thereof.
+#
+# PACIFIC NORTHWEST NATIONAL LABORATORY operated by
+# BATTELLE for the UNITED STATES DEPARTMENT OF ENERGY
+# under Contract DE-AC05-76RL01830
+# }}}
+
+"""Historian query benchmark.
+
+Builds a synthetic sqlite historian database of `--topics` topics scraped
+together every minute for `--rows` scrapes, then times querying a window
+of every topic. Each query is run with all topics fetched by one
+statement, as SQLHistorian does, and with one statement per topic, which
+is how the drivers queried before. Runs in a temporary directory unless `--database`
+names a database to build once and reuse.
+
+    python historian_query.py --topics 100 --rows 20000 --count 1000
+"""
+
+from __future__ import print_function
+
+import argparse
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import pytz
+
+from volttron.platform.agent.utils import format_timestamp
+from volttron.platform.dbutils.sqlitefuncts import SqlLiteFuncts
+
+TABLES = {'data_table': 'data', 'topics_table': 'topics',
+          'meta_table': 'meta', 'agg_topics_table': 'aggregate_topics',
+          'agg_meta_table': 'aggregate_meta'}
+START = datetime(2019, 1, 1, tzinfo=pytz.UTC)
+
+
+def build(path, topics, rows):
+    driver = SqlLiteFuncts({'database': path}, TABLES)
+    driver.setup_historian_tables()
+    id_name_map = {}
+    for topic in range(topics):
+        name = 'campus/building/device{}/point{}'.format(topic // 20, topic)
+        id_name_map[driver.insert_topic(name)] = name
+    driver.commit()
+    connection = sqlite3.connect(path)
+    for row in range(rows):
+        ts = format_timestamp(START + timedelta(minutes=row))
+        connection.executemany(
+            'INSERT INTO data VALUES (?, ?, ?)',
+            ((ts, topic_id, str(float(row % 1000) + topic_id / 100.0))
+             for topic_id in id_name_map))
+        if row % 10000 == 0:
+            connection.commit()
+    connection.commit()
+    connection.close()
+    return driver, id_name_map
+
+
+def timed(function, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        result = function()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--topics', type=int, default=100)
+    parser.add_argument('--rows', type=int, default=20000,
+                        help='scrapes stored for every topic')
+    parser.add_argument('--count', type=int, default=1000,
+                        help='values returned per topic')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--database', help='database to build or reuse')
+    opts = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    directory = None
+    path = opts.database
+    if path is None:
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'historian.sqlite')
+    try:
+        if os.path.exists(path):
+            driver = SqlLiteFuncts({'database': path}, TABLES)
+            id_map, name_map = driver.get_topic_map()
+            id_name_map = dict((id_map[key], name_map[key]) for key in id_map)
+        else:
+            print('Building {} rows...'.format(opts.topics * opts.rows))
+            driver, id_name_map = build(path, opts.topics, opts.rows)
+        topic_ids = sorted(id_name_map)
+
+        start = START + timedelta(minutes=opts.rows // 2)
+        queries = [
+            ('first {}'.format(opts.count),
+             dict(start=start, count=opts.count)),
+            ('last {}'.format(opts.count),
+             dict(count=opts.count, order='LAST_TO_FIRST')),
+            ('latest value', dict(count=1, order='LAST_TO_FIRST')),
+            ('1 hour window',
+             dict(start=start, end=start + timedelta(hours=1))),
+        ]
+        print('{:>16} {:>14} {:>14} {:>10}'.format(
+            'query', 'all topics s', 'per topic s', 'values'))
+        for name, kwargs in queries:
+            together, result = timed(
+                lambda: driver.query(topic_ids, id_name_map, **kwargs),
+                opts.repeat)
+            separately, _ = timed(
+                lambda: [driver.query([topic_id], id_name_map, **kwargs)
+                         for topic_id in topic_ids],
+                opts.repeat)
+            print('{:>16} {:>14.4f} {:>14.4f} {:>10}'.format(
+                name, together, separately,
+                sum(len(values) for values in result.values())))
+    finally:
+        if directory is not None:
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
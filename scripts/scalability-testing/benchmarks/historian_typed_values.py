@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*- {{{
+# vim: set fenc=utf-8 ft=python sw=4 ts=4 sts=4 et:
+#
+# Copyright 2017, Battelle Memorial Institute.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# This material was prepared as an account of work sponsored by an agency of
+# the United States Government. Neither the United States Government nor the
+# United States Department of Energy, nor Battelle, nor any of their
+# employees, nor any jurisdiction or organization that has cooperated in the
+# development of these materials, makes any warranty, express or
+# implied, or assumes any legal liability or responsibility for the accuracy,
+# completeness, or usefulness or any information, apparatus, product,
+# software, or process disclosed, or represents that its use would not infringe
+# privately owned rights. Reference herein to any specific commercial product,
+# process, or service by trade name, trademark, manufacturer, or otherwise
+# does not necessarily constitute or imply its endorsement, recommendation, or
+# favoring by the United States Government or any agency thereof, or
+# Battelle Memorial Institute. The views and opinions of authors expressed
+# herein do not necessarily state or reflect those of the
+# United States Government or any agency thereof.
+#
+# PACIFIC NORTHWEST NATIONAL LABORATORY operated by
+# BATTELLE for the UNITED STATES DEPARTMENT OF ENERGY
+# under Contract DE-AC05-76RL01830
+# }}}
+
+"""Historian typed value storage benchmark.
+
+Writes the same synthetic device data, `--topics` topics scraped together
+every minute for `--rows` scrapes, through the sqlite historian driver
+into a data table of JSON values and into one of typed value columns.
+Reports the ingest rate, the size of the database, the time to query
+`--count` values of every topic and the time to average every topic.
+
+    python historian_typed_values.py --topics 100 --rows 5000
+"""
+
+from __future__ import print_function
+
+import argparse
+import logging
+import os
+import shutil
+import struct
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import pytz
+
+from volttron.platform.dbutils.sqlitefuncts import SqlLiteFuncts
+
+TABLES = {'data_table': 'data', 'topics_table': 'topics',
+          'meta_table': 'meta', 'agg_topics_table': 'aggregate_topics',
+          'agg_meta_table': 'aggregate_meta'}
+START = datetime(2019, 1, 1, tzinfo=pytz.UTC)
+
+
+def reading(topic_id, row):
+    # Mostly analog points with some counters and binary points. Analog
+    # values are read as single precision floats, as BACnet and Modbus
+    # devices report them, so their JSON takes up to 17 digits.
+    kind = topic_id % 10
+    if kind == 0:
+        return row % 2 == 0
+    if kind == 1:
+        return row
+    value = 20.0 + (row % 1000) / 7.0 + topic_id / 100.0
+    return struct.unpack('f', struct.pack('f', value))[0]
+
+
+def run(path, typed, topics, rows, count):
+    driver = SqlLiteFuncts({'database': path}, TABLES)
+    driver.setup_historian_tables(typed_values=typed)
+    id_name_map = {}
+    for topic in range(topics):
+        name = 'campus/building/device{}/point{}'.format(topic // 20, topic)
+        id_name_map[driver.insert_topic(name)] = name
+    driver.commit()
+    topic_ids = sorted(id_name_map)
+
+    start = time.time()
+    for row in range(rows):
+        ts = START + timedelta(minutes=row)
+        with driver.bulk_insert() as insert_data:
+            for topic_id in topic_ids:
+                insert_data(ts, topic_id, reading(topic_id, row))
+        driver.commit()
+    ingest = time.time() - start
+
+    start = time.time()
+    driver.query(topic_ids, id_name_map, count=count)
+    query = time.time() - start
+
+    start = time.time()
+    for topic_id in topic_ids:
+        driver.collect_aggregate([topic_id], 'AVG')
+    aggregate = time.time() - start
+    driver.close()
+    return (topics * rows / ingest, os.path.getsize(path) / 1024.0 ** 2,
+            query, aggregate)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--topics', type=int, default=100)
+    parser.add_argument('--rows', type=int, default=5000,
+                        help='scrapes stored for every topic')
+    parser.add_argument('--count', type=int, default=1000,
+                        help='values queried per topic')
+    opts = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    directory = tempfile.mkdtemp()
+    try:
+        print('{:>8} {:>12} {:>10} {:>10} {:>12}'.format(
+            'values', 'ingest /s', 'size MB', 'query s', 'aggregate s'))
+        for name, typed in (('json', False), ('typed', True)):
+            path = os.path.join(directory, name + '.sqlite')
+            print('{:>8} {:>12.0f} {:>10.2f} {:>10.4f} {:>12.4f}'.format(
+                name, *run(path, typed, opts.topics, opts.rows, opts.count)))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
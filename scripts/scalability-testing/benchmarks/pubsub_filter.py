@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*- {{{
+# vim: set fenc=utf-8 ft=python sw=4 ts=4 sts=4 et:
+#
+# Copyright 2017, Battelle Memorial Institute.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# This material was prepared as an account of work sponsored by an agency of
+# the United States Government. Neither the United States Government nor the
+# United States Department of Energy, nor Battelle, nor any of their
+# employees, nor any jurisdiction or organization that has cooperated in the
+# development of these materials, makes any warranty, express or
+# implied, or assumes any legal liability or responsibility for the accuracy,
+# completeness, or usefulness or any information, apparatus, product,
+# software, or process disclosed, or represents that its use would not infringe
+# privately owned rights. Reference herein to any specific commercial product,
+# process, or service by trade name, trademark, manufacturer, or otherwise
+# does not necessarily constitute or imply its endorsement, recommendation, or
+# favoring by the United States Government or any agency thereof, or
+# Battelle Memorial Institute. The views and opinions of authors expressed
+# herein do not necessarily state or reflect those of the
+# United States Government or any agency thereof.
+#
+# PACIFIC NORTHWEST NATIONAL LABORATORY operated by
+# BATTELLE for the UNITED STATES DEPARTMENT OF ENERGY
+# under Contract DE-AC05-76RL01830
+# }}}
+
+"""Router fanout benchmark for subscriptions with change filters.
+
+Routes device "all" publishes of slowly drifting points through
+PubSubService to subscribers without a filter and to subscribers with a
+deadband filter, and reports router throughput together with the number
+of messages and bytes forwarded. Messages are sent to a socket which
+counts and discards them, so only router work is timed. No platform
+needs to be running.
+
+    python pubsub_filter.py --points 10 100 --deadband 0.5
+"""
+
+from __future__ import print_function
+
+import argparse
+import random
+import timeit
+
+import zmq
+
+from volttron.platform.agent import json as jsonapi
+from volttron.platform.vip.pubsubservice import PubSubService
+
+
+class CountingSocket(object):
+    def __init__(self):
+        self.messages = 0
+        self.bytes = 0
+
+    def send_multipart(self, frames, flags=0, copy=True):
+        self.messages += 1
+        self.bytes += sum(len(bytes(frame)) for frame in frames)
+
+
+def build_service(subscribers, deadband):
+    socket = CountingSocket()
+    service = PubSubService(socket, {}, None)
+    options = dict(deadband=deadband) if deadband is not None else None
+    for index in range(subscribers):
+        msg = dict(prefix='devices', bus='', all_platforms=False, filter=options)
+        service.handle_subsystem([zmq.Frame('agent{}'.format(index)), b'', b'VIP1', b'', b'1', b'pubsub',
+                                  b'subscribe', zmq.Frame(jsonapi.dumps(msg))])
+    return service, socket
+
+
+def build_messages(points, count, seed=1):
+    """Messages in which each point drifts by a small random step."""
+    rand = random.Random(seed)
+    values = {'point{}'.format(index): 70.0 for index in range(points)}
+    meta = {name: {'type': 'float', 'tz': 'US/Pacific', 'units': 'degreesFahrenheit'}
+            for name in values}
+    messages = []
+    for _ in range(count):
+        for name in values:
+            values[name] = round(values[name] + rand.gauss(0, 0.05), 3)
+        messages.append(jsonapi.dumps(dict(headers={'Date': '2017-01-01T00:00:00.000000+00:00'},
+                                           message=[dict(values), meta])))
+    return messages
+
+
+def publish(service, messages):
+    topic = 'devices/campus/building/device/all'
+    for data in messages:
+        frames = [zmq.Frame(b'publisher'), b'', b'VIP1', b'', b'1', b'pubsub',
+                  b'publish', zmq.Frame(topic), zmq.Frame(data), zmq.Frame(b'')]
+        service.handle_subsystem(frames, b'')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--points', type=int, nargs='+', default=[10, 100])
+    parser.add_argument('--subscribers', type=int, default=10)
+    parser.add_argument('--deadband', type=float, default=0.5)
+    parser.add_argument('--messages', type=int, default=1000,
+                        help='number of messages routed per measurement')
+    opts = parser.parse_args()
+
+    print('{:>7} {:>10} {:>10} {:>12} {:>14}'.format(
+        'points', 'filter', 'msg/s', 'forwarded', 'forwarded MB'))
+    for points in opts.points:
+        messages = build_messages(points, opts.messages)
+        for deadband in (None, opts.deadband):
+            service, socket = build_service(opts.subscribers, deadband)
+            elapsed = timeit.timeit(lambda: publish(service, messages), number=1)
+            print('{:>7} {:>10} {:>10.0f} {:>12} {:>14.2f}'.format(
+                points, 'none' if deadband is None else deadband, opts.messages / elapsed,
+                socket.messages, socket.bytes / 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*- {{{
+# vim: set fenc=utf-8 ft=python sw=4 ts=4 sts=4 et:
+#
+# Copyright 2017, Battelle Memorial Institute.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# This material was prepared as an account of work sponsored by an agency of
+# the United States Government. Neither the United States Government nor the
+# United States Department of Energy, nor Battelle, nor any of their
+# employees, nor any jurisdiction or organization that has cooperated in the
+# development of these materials, makes any warranty, express or
+# implied, or assumes any legal liability or responsibility for the accuracy,
+# completeness, or usefulness or any information, apparatus, product,
+# software, or process disclosed, or represents that its use would not infringe
+# privately owned rights. Reference herein to any specific commercial product,
+# process, or service by trade name, trademark, manufacturer, or otherwise
+# does not necessarily constitute or imply its endorsement, recommendation, or
+# favoring by the United States Government or any agency thereof, or
+# Battelle Memorial Institute. The views and opinions of authors expressed
+# herein do not necessarily state or reflect those of the
+# United States Government or any agency thereof.
+#
+# PACIFIC NORTHWEST NATIONAL LABORATORY operated by
+# BATTELLE for the UNITED STATES DEPARTMENT OF ENERGY
+# under Contract DE-AC05-76RL01830
+# }}}
+
+"""Router throughput benchmark for large publish payloads.
+
+Routes device "all" publishes through PubSubService with the bus carried
+only inside the JSON message, which the router has to decode, and with
+the bus in its own frame, which lets the router skip decoding. Messages
+are sent to a socket which discards them, so only router work is timed.
+No platform needs to be running.
+
+    python pubsub_payload.py --points 10 100 1000
+"""
+
+from __future__ import print_function
+
+import argparse
+import timeit
+
+import zmq
+
+from volttron.platform.agent import json as jsonapi
+from volttron.platform.vip.pubsubservice import PubSubService
+
+
+class NullSocket(object):
+    def send_multipart(self, frames, flags=0, copy=True):
+        pass
+
+
+def build_service(subscribers):
+    service = PubSubService(NullSocket(), {}, None)
+    for index in range(subscribers):
+        service._add_peer_subscription('agent{}'.format(index), '', 'devices')
+    return service
+
+
+def build_message(points):
+    values = {'point{}'.format(index): index * 1.5 for index in range(points)}
+    meta = {'point{}'.format(index): {'type': 'float', 'tz': 'US/Pacific',
+                                      'units': 'degreesFahrenheit'}
+            for index in range(points)}
+    return dict(bus='', headers={'Date': '2017-01-01T00:00:00.000000+00:00'},
+                message=[values, meta])
+
+
+def publish(service, data, bus_frame, count):
+    topic = 'devices/campus/building/device/all'
+    for _ in range(count):
+        frames = [zmq.Frame(b'publisher'), b'', b'VIP1', b'', b'1', b'pubsub',
+                  b'publish', zmq.Frame(topic), zmq.Frame(data)]
+        if bus_frame:
+            frames.append(zmq.Frame(b''))
+        service.handle_subsystem(frames, b'')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--points', type=int, nargs='+',
+                        default=[10, 100, 1000])
+    parser.add_argument('--subscribers', type=int, default=5)
+    parser.add_argument('--messages', type=int, default=1000,
+                        help='number of messages routed per measurement')
+    parser.add_argument('--repeat', type=int, default=3)
+    opts = parser.parse_args()
+
+    service = build_service(opts.subscribers)
+    print('{:>7} {:>10} {:>16} {:>16} {:>9}'.format(
+        'points', 'bytes', 'decode (msg/s)', 'frame (msg/s)', 'speedup'))
+    for points in opts.points:
+        data = jsonapi.dumps(build_message(points))
+        results = []
+        for bus_frame in (False, True):
+            elapsed = min(timeit.repeat(
+                lambda: publish(service, data, bus_frame, opts.messages),
+                number=1, repeat=opts.repeat))
+            results.append(opts.messages / elapsed)
+        print('{:>7} {:>10} {:>16.0f} {:>16.0f} {:>8.1f}x'.format(
+            points, len(data), results[0], results[1], results[1] / results[0]))
+
+
+if __name__ == '__main__':
+    main()
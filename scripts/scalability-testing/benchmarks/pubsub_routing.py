@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*- {{{
+# vim: set fenc=utf-8 ft=python sw=4 ts=4 sts=4 et:
+#
+# Copyright 2017, Battelle Memorial Institute.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# This material was prepared as an account of work sponsored by an agency of
+# the United States Government. Neither the United States Government nor the
+# United States Department of Energy, nor Battelle, nor any of their
+# employees, nor any jurisdiction or organization that has cooperated in the
+# development of these materials, makes any warranty, express or
+# implied, or assumes any legal liability or responsibility for the accuracy,
+# completeness, or usefulness or any information, apparatus, product,
+# software, or process disclosed, or represents that its use would not infringe
+# privately owned rights. Reference herein to any specific commercial product,
+# process, or service by trade name, trademark, manufacturer, or otherwise
+# does not necessarily constitute or imply its endorsement, recommendation, or
+# favoring by the United States Government or any agency thereof, or
+# Battelle Memorial Institute. The views and opinions of authors expressed
+# herein do not necessarily state or reflect those of the
+# United States Government or any agency thereof.
+#
+# PACIFIC NORTHWEST NATIONAL LABORATORY operated by
+# BATTELLE for the UNITED STATES DEPARTMENT OF ENERGY
+# under Contract DE-AC05-76RL01830
+# }}}
+
+"""Micro-benchmark of PubSubService subscriber lookup.
+
+Compares the cost of finding the subscribers of a device topic with a
+linear prefix scan against the SubscriptionTrie index for increasing
+numbers of subscriptions. No platform needs to be running.
+
+    python pubsub_routing.py --counts 10 100 1000 10000
+"""
+
+from __future__ import print_function
+
+import argparse
+import random
+import timeit
+
+from volttron.platform.vip.topictrie import SubscriptionTrie
+
+
+def build_subscriptions(count, rand):
+    subscriptions = SubscriptionTrie()
+    for index in range(count):
+        prefix = 'devices/campus{}/building{}/device{}'.format(
+            index % 10, index % 100, index)
+        subscriptions[prefix].add('agent{}'.format(rand.randint(0, 50)))
+    subscriptions['devices'].add('historian')
+    return subscriptions
+
+
+def build_topics(count, rand, samples):
+    topics = []
+    for _ in range(samples):
+        index = rand.randint(0, count - 1)
+        topics.append('devices/campus{}/building{}/device{}/all'.format(
+            index % 10, index % 100, index))
+    return topics
+
+
+def linear(subscriptions, topics):
+    for topic in topics:
+        subscribers = set()
+        for prefix, subscription in subscriptions.iteritems():
+            if subscription and topic.startswith(prefix):
+                subscribers |= subscription
+
+
+def indexed(subscriptions, topics):
+    for topic in topics:
+        subscribers = set()
+        for subscription in subscriptions.match(topic):
+            subscribers |= subscription
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--counts', type=int, nargs='+',
+                        default=[10, 100, 1000, 10000])
+    parser.add_argument('--topics', type=int, default=1000,
+                        help='number of topics routed per measurement')
+    parser.add_argument('--repeat', type=int, default=3)
+    opts = parser.parse_args()
+
+    rand = random.Random(0)
+    print('{:>14} {:>16} {:>16} {:>9}'.format(
+        'subscriptions', 'linear (us/msg)', 'trie (us/msg)', 'speedup'))
+    for count in opts.counts:
+        subscriptions = build_subscriptions(count, rand)
+        topics = build_topics(count, rand, opts.topics)
+        results = []
+        for func in (linear, indexed):
+            elapsed = min(timeit.repeat(lambda: func(subscriptions, topics),
+                                        number=1, repeat=opts.repeat))
+            results.append(elapsed * 1e6 / len(topics))
+        print('{:>14} {:>16.2f} {:>16.2f} {:>8.1f}x'.format(
+            count, results[0], results[1], results[0] / results[1]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*- {{{
+# vim: set fenc=utf-8 ft=python sw=4 ts=4 sts=4 et:
+#
+# Copyright 2017, Battelle Memorial Institute.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# This material was prepared as an account of work sponsored by an agency of
+# the United States Government. Neither the United States Government nor the
+# United States Department of Energy, nor Battelle, nor any of their
+# employees, nor any jurisdiction or organization that has cooperated in the
+# development of these materials, makes any warranty, express or
+# implied, or assumes any legal liability or responsibility for the accuracy,
+# completeness, or usefulness or any information, apparatus, product,
+# software, or process disclosed, or represents that its use would not infringe
+# privately owned rights. Reference herein to any specific commercial product,
+# process, or service by trade name, trademark, manufacturer, or otherwise
+# does not necessarily constitute or imply its endorsement, recommendation, or
+# favoring by the United States Government or any agency thereof, or
+# Battelle Memorial Institute. The views and opinions of authors expressed
+# herein do not necessarily state or reflect those of the
+# United States Government or any agency thereof.
+#
+# PACIFIC NORTHWEST NATIONAL LABORATORY operated by
+# BATTELLE for the UNITED STATES DEPARTMENT OF ENERGY
+# under Contract DE-AC05-76RL01830
+# }}}
+
+"""Router per-message overhead benchmark.
+
+Routes RPC requests between two peers through the platform router and
+reports the time spent per message with nothing observing the router,
+with statistics tracking, with tracing of all or a sample of messages
+and with every message formatted for the debug log. Messages are sent
+to a socket which discards them, so only router work is timed. No
+platform needs to be running.
+
+    python router_overhead.py --messages 100000
+"""
+
+from __future__ import print_function
+
+import argparse
+import logging
+import timeit
+
+import zmq
+
+from volttron.platform.main import Router
+from volttron.platform.vip.pubsubservice import PubSubService
+from volttron.platform.vip.tracking import Tracker
+
+
+class DiscardingSocket(object):
+    identity = b'router'
+
+    def send_multipart(self, frames, flags=0, copy=True):
+        pass
+
+
+def build_router(tracker):
+    router = Router('inproc://router-overhead', tracker=tracker)
+    router.socket = DiscardingSocket()
+    router.pubsub = PubSubService(router.socket, {}, None)
+    return router
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=3)
+    opts = parser.parse_args()
+
+    # Keep formatted messages from reaching the terminal
+    logging.getLogger('vip.router').addHandler(logging.NullHandler())
+    logging.getLogger('vip.router').propagate = False
+    args = (b'{"jsonrpc": "2.0", "id": "1", "method": "ping", "params": []}',)
+
+    configurations = [
+        ('fast path', lambda tracker: None),
+        ('stats', lambda tracker: tracker.enable()),
+        ('trace 1/100', lambda tracker: tracker.trace(sample=100)),
+        ('trace all', lambda tracker: tracker.trace()),
+        ('trace peer', lambda tracker: tracker.trace(peers=['other'])),
+    ]
+    print('{:>12} {:>14} {:>12}'.format('tracing', 'us/message', 'msg/s'))
+    for name, configure in configurations + [('debug log', None)]:
+        tracker = Tracker()
+        if configure is None:
+            logging.getLogger('vip.router').setLevel(logging.DEBUG)
+        router = build_router(tracker)
+        if configure is not None:
+            configure(tracker)
+
+        def route():
+            for _ in xrange(opts.messages):
+                router.route([zmq.Frame(b'caller'), zmq.Frame(b'callee'), zmq.Frame(b'VIP1'),
+                              zmq.Frame(b''), zmq.Frame(b'1'), zmq.Frame(b'RPC')] +
+                             [zmq.Frame(arg) for arg in args])
+
+        elapsed = min(timeit.repeat(route, number=1, repeat=opts.repeat))
+        print('{:>12} {:>14.2f} {:>12.0f}'.format(
+            name, elapsed / opts.messages * 1e6, opts.messages / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*- {{{
+# vim: set fenc=utf-8 ft=python sw=4 ts=4 sts=4 et:
+#
+# Copyright 2017, Battelle Memorial Institute.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# This material was prepared as an account of work sponsored by an agency of
+# the United States Government. Neither the United States Government nor the
+# United States Department of Energy, nor Battelle, nor any of their
+# employees, nor any jurisdiction or organization that has cooperated in the
+# development of these materials, makes any warranty, express or
+# implied, or assumes any legal liability or responsibility for the accuracy,
+# completeness, or usefulness or any information, apparatus, product,
+# software, or process disclosed, or represents that its use would not infringe
+# privately owned rights. Reference herein to any specific commercial product,
+# process, or service by trade name, trademark, manufacturer, or otherwise
+# does not necessarily constitute or imply its endorsement, recommendation, or
+# favoring by the United States Government or any agency thereof, or
+# Battelle Memorial Institute. The views and opinions of authors expressed
+# herein do not necessarily state or reflect those of the
+# United States Government or any agency thereof.
+#
+# PACIFIC NORTHWEST NATIONAL LABORATORY operated by
+# BATTELLE for the UNITED STATES DEPARTMENT OF ENERGY
+# under Contract DE-AC05-76RL01830
+# }}}
+
+"""Capability-protected RPC throughput benchmark.
+
+Dispatches JSON-RPC requests through an agent's RPC subsystem to an
+unprotected method and to a method requiring a capability, both with
+the caller's authorization remembered and with the capabilities checked
+on every call as they were before authorizations were cached. Only the
+dispatch within the agent is timed. No platform needs to be running.
+
+    python rpc_auth.py --calls 100000
+"""
+
+from __future__ import print_function
+
+import argparse
+import timeit
+
+from volttron.platform.vip.agent.dispatch import Signal
+from volttron.platform.vip.agent.subsystems.auth import Auth
+from volttron.platform.vip.agent.subsystems.rpc import RPC
+
+
+class BenchmarkCore(object):
+    messagebus = 'zmq'
+
+    def __init__(self):
+        self.onsetup = Signal()
+        self.onconnected = Signal()
+        self.ondisconnected = Signal()
+
+    def register(self, name, handler, error_handler):
+        pass
+
+
+class Message(object):
+    peer = b'caller'
+    user = b'caller'
+
+
+class BenchmarkAgent(object):
+    def __init__(self):
+        self.vip = type('vip', (), {})()
+
+    @RPC.export
+    def get_point(self, point):
+        return point
+
+    @RPC.export
+    @RPC.allow('can_set_point')
+    def set_point(self, point, value):
+        return value
+
+
+def build_rpc():
+    agent = BenchmarkAgent()
+    core = BenchmarkCore()
+    rpc = RPC(core, agent, None)
+    agent.vip.auth = auth = Auth(agent, core, rpc)
+    core.onsetup.send(core)
+    # Capabilities as pushed by the auth service
+    auth._user_to_capabilities = {
+        b'caller': ['can_set_point'] + ['capability{}'.format(i) for i in range(20)]}
+    auth._dirty = False
+    return core, rpc
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--calls', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=3)
+    opts = parser.parse_args()
+
+    get_point = b'{"jsonrpc": "2.0", "id": "1", "method": "get_point", "params": ["a"]}'
+    set_point = b'{"jsonrpc": "2.0", "id": "1", "method": "set_point", "params": ["a", 1]}'
+    configurations = [
+        ('unprotected', get_point, False),
+        ('protected', set_point, False),
+        ('uncached', set_point, True),
+    ]
+    print('{:>12} {:>10} {:>12}'.format('method', 'us/call', 'calls/s'))
+    for name, request, reset in configurations:
+        core, rpc = build_rpc()
+        dispatch = rpc._dispatcher.dispatch
+        message = Message()
+
+        def run():
+            for _ in xrange(opts.calls):
+                if reset:
+                    rpc.reset_authorizations()
+                dispatch(request, message)
+
+        elapsed = min(timeit.repeat(run, number=1, repeat=opts.repeat))
+        print('{:>12} {:>10.2f} {:>12.0f}'.format(
+            name, elapsed / opts.calls * 1e6, opts.calls / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*- {{{
+# vim: set fenc=utf-8 ft=python sw=4 ts=4 sts=4 et:
+#
+# Copyright 2017, Battelle Memorial Institute.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# This material was prepared as an account of work sponsored by an agency of
+# the United States Government. Neither the United States Government nor the
+# United States Department of Energy, nor Battelle, nor any of their
+# employees, nor any jurisdiction or organization that has cooperated in the
+# development of these materials, makes any warranty, express or
+# implied, or assumes any legal liability or responsibility for the accuracy,
+# completeness, or usefulness or any information, apparatus, product,
+# software, or process disclosed, or represents that its use would not infringe
+# privately owned rights. Reference herein to any specific commercial product,
+# process, or service by trade name, trademark, manufacturer, or otherwise
+# does not necessarily constitute or imply its endorsement, recommendation, or
+# favoring by the United States Government or any agency thereof, or
+# Battelle Memorial Institute. The views and opinions of authors expressed
+# herein do not necessarily state or reflect those of the
+# United States Government or any agency thereof.
+#
+# PACIFIC NORTHWEST NATIONAL LABORATORY operated by
+# BATTELLE for the UNITED STATES DEPARTMENT OF ENERGY
+# under Contract DE-AC05-76RL01830
+# }}}
+
+"""RPC latency benchmark under a pubsub storm.
+
+Runs the platform router in a process of its own and measures the round
+trip of RPC calls between two peers while other peers flood it with
+device publishes which are fanned out to several subscribers. The
+router is run fanning publishes out as they are read and with deferred
+fanout, which routes requests ahead of pending publishes. No platform
+needs to be running.
+
+    python rpc_latency.py --publishes 50000 --publishers 20 --subscribers 5
+"""
+
+from __future__ import print_function
+
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+
+import zmq
+
+from volttron.platform.agent import json as jsonapi
+from volttron.platform.main import Router
+from volttron.platform.vip.pubsubservice import PubSubService
+
+
+class BenchmarkRouter(Router):
+    """Router bound only to a local address, without authentication or external platforms"""
+    def setup(self):
+        self.socket.bind(self.local_address.base)
+        self._ext_routing = None
+        self.pubsub = PubSubService(self.socket, {}, None)
+        self._poller.register(self.socket, zmq.POLLIN)
+
+
+def connect(context, address, identity):
+    sock = context.socket(zmq.DEALER)
+    sock.identity = identity
+    sock.connect(address)
+    return sock
+
+
+def route(address, defer):
+    BenchmarkRouter(address, default_user_id=b'', defer_pubsub_fanout=defer).run()
+
+
+def drain(address, subscribers, received, ready):
+    context = zmq.Context()
+    poller = zmq.Poller()
+    msg = jsonapi.dumps(dict(prefix='devices', bus='', all_platforms=False))
+    for index in range(subscribers):
+        sock = connect(context, address, 'subscriber{}'.format(index))
+        sock.send_multipart([b'', b'VIP1', b'', b'1', b'pubsub', b'subscribe', msg])
+        sock.recv_multipart()
+        poller.register(sock, zmq.POLLIN)
+    ready.set()
+    count = 0
+    while True:
+        for sock, _ in poller.poll(100):
+            sock.recv_multipart()
+            count += 1
+        received.value = count
+
+
+def echo(address, ready):
+    sock = connect(zmq.Context(), address, 'callee')
+    sock.send_multipart([b'', b'VIP1', b'', b'1', b'ping'])
+    sock.recv_multipart()
+    ready.set()
+    while True:
+        frames = sock.recv_multipart()
+        sock.send_multipart([frames[0], b'VIP1', b'', frames[3], b'RPC', frames[5]])
+
+
+def storm(address, publishers, publishes, points):
+    context = zmq.Context()
+    socks = [connect(context, address, 'publisher{}'.format(index)) for index in range(publishers)]
+    data = jsonapi.dumps(dict(bus='', headers={}, message=[
+        {'point{}'.format(index): 70.5 for index in range(points)}]))
+    for count in range(publishes):
+        sock = socks[count % publishers]
+        topic = b'devices/building/{}/all'.format(sock.identity)
+        sock.send_multipart([b'', b'VIP1', b'', b'noack', b'pubsub', b'publish', topic, data, b''])
+    time.sleep(60)
+
+
+def run(defer, opts, address):
+    received = multiprocessing.Value('l', 0)
+    subscribed = multiprocessing.Event()
+    introduced = multiprocessing.Event()
+    processes = [multiprocessing.Process(target=route, args=(address, defer)),
+                 multiprocessing.Process(target=drain, args=(address, opts.subscribers, received, subscribed)),
+                 multiprocessing.Process(target=echo, args=(address, introduced))]
+    for process in processes:
+        process.daemon = True
+        process.start()
+    subscribed.wait()
+    introduced.wait()
+    caller = connect(zmq.Context.instance(), address, 'caller')
+    publisher = multiprocessing.Process(target=storm, args=(address, opts.publishers, opts.publishes, opts.points))
+    publisher.daemon = True
+    processes.append(publisher)
+    publisher.start()
+
+    # Calls are made at a fixed rate and timed until the storm has been fanned out
+    expected = opts.publishes * opts.subscribers
+    latencies = []
+    start = time.time()
+    idle = None
+    while received.value < expected:
+        delay = start + len(latencies) * opts.interval - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        sent = time.time()
+        caller.send_multipart([b'callee', b'VIP1', b'', str(len(latencies)), b'RPC', b'ping'])
+        caller.recv_multipart()
+        latencies.append(time.time() - sent)
+        # Publishes dropped for subscribers which cannot keep up never arrive
+        count = received.value
+        if idle is None or idle[0] != count:
+            idle = (count, time.time())
+        elif time.time() - idle[1] > 1:
+            break
+    elapsed = time.time() - start
+    caller.close(linger=0)
+    for process in processes:
+        process.terminate()
+    return sorted(latencies), elapsed, received.value
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--publishes', type=int, default=50000,
+                        help='number of publishes in the storm')
+    parser.add_argument('--publishers', type=int, default=20,
+                        help='number of peers sharing the storm, like drivers publishing a scrape')
+    parser.add_argument('--subscribers', type=int, default=5)
+    parser.add_argument('--points', type=int, default=20,
+                        help='points in each device publish')
+    parser.add_argument('--interval', type=float, default=0.02,
+                        help='seconds between the starts of RPC calls')
+    opts = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    print('{:>10} {:>8} {:>10} {:>10} {:>10} {:>10} {:>12}'.format(
+        'fanout', 'calls', 'p50 (ms)', 'p99 (ms)', 'max (ms)', 'storm (s)', 'delivered'))
+    for defer in [False, True]:
+        address = 'ipc://{}'.format(os.path.join(directory, 'deferred' if defer else 'inline'))
+        latencies, elapsed, delivered = run(defer, opts, address)
+        print('{:>10} {:>8} {:>10.2f} {:>10.2f} {:>10.2f} {:>10.2f} {:>12}'.format(
+            'deferred' if defer else 'inline', len(latencies), percentile(latencies, 0.5),
+            percentile(latencies, 0.99), latencies[-1] * 1000, elapsed, delivered))
+
+
+if __name__ == '__main__':
+    main()
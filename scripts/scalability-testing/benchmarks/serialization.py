@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*- {{{
+# vim: set fenc=utf-8 ft=python sw=4 ts=4 sts=4 et:
+#
+# Copyright 2017, Battelle Memorial Institute.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# This material was prepared as an account of work sponsored by an agency of
+# the United States Government. Neither the United States Government nor the
+# United States Department of Energy, nor Battelle, nor any of their
+# employees, nor any jurisdiction or organization that has cooperated in the
+# development of these materials, makes any warranty, express or
+# implied, or assumes any legal liability or responsibility for the accuracy,
+# completeness, or usefulness or any information, apparatus, product,
+# software, or process disclosed, or represents that its use would not infringe
+# privately owned rights. Reference herein to any specific commercial product,
+# process, or service by trade name, trademark, manufacturer, or otherwise
+# does not necessarily constitute or imply its endorsement, recommendation, or
+# favoring by the United States Government or any agency thereof, or
+# Battelle Memorial Institute. The views and opinions of authors expressed
+# herein do not necessarily state or reflect those of the
+# United States Government or any agency thereof.
+#
+# PACIFIC NORTHWEST NATIONAL LABORATORY operated by
+# BATTELLE for the UNITED STATES DEPARTMENT OF ENERGY
+# under Contract DE-AC05-76RL01830
+# }}}
+
+"""Serialization benchmark for device publish payloads.
+
+Encodes and decodes device "all" publish messages with each VIP codec
+available (JSON and, if installed, msgpack) and reports the message
+size and the encode and decode rates. No platform needs to be running.
+
+    python serialization.py --points 10 100 1000
+"""
+
+from __future__ import print_function
+
+import argparse
+import timeit
+
+from volttron.platform.vip import codec
+
+
+def build_message(points):
+    values = {'point{}'.format(index): index * 1.5 for index in range(points)}
+    meta = {'point{}'.format(index): {'type': 'float', 'tz': 'US/Pacific',
+                                      'units': 'degreesFahrenheit'}
+            for index in range(points)}
+    return dict(bus='', headers={'Date': '2017-01-01T00:00:00.000000+00:00'},
+                message=[values, meta])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--points', type=int, nargs='+',
+                        default=[10, 100, 1000])
+    parser.add_argument('--messages', type=int, default=1000,
+                        help='number of messages encoded per measurement')
+    parser.add_argument('--repeat', type=int, default=3)
+    opts = parser.parse_args()
+
+    print('{:>7} {:>8} {:>10} {:>16} {:>16}'.format(
+        'points', 'codec', 'bytes', 'encode (msg/s)', 'decode (msg/s)'))
+    for points in opts.points:
+        message = build_message(points)
+        for name in codec.available_codecs()[::-1]:
+            data = codec.dumps(message, name)
+            encode = min(timeit.repeat(lambda: codec.dumps(message, name),
+                                       number=opts.messages, repeat=opts.repeat))
+            decode = min(timeit.repeat(lambda: codec.loads(data),
+                                       number=opts.messages, repeat=opts.repeat))
+            print('{:>7} {:>8} {:>10} {:>16.0f} {:>16.0f}'.format(
+                points, name, len(data), opts.messages / encode, opts.messages / decode))
+
+
+if __name__ == '__main__':
+    main()
@@ -51,7 +51,7 @@ import bisect
 import fnmatch
 from volttron.platform.agent import json as jsonapi
 from interfaces import DriverInterfaceError
-from driver_locks import configure_socket_lock, configure_publish_lock
+from driver_locks import configure_socket_lock
 
 utils.setup_logging()
 _log = logging.getLogger(__name__)
@@ -94,9 +94,6 @@ def master_driver_agent(config_path, **kwargs):
 
     max_open_sockets = get_config('max_open_sockets', None)
 
-    #TODO: update the default after scalability testing.
-    max_concurrent_publishes = get_config('max_concurrent_publishes', 10000)
-
     driver_config_list = get_config('driver_config_list')
     
     scalability_test = get_config('scalability_test', False)
@@ -120,7 +117,6 @@ def master_driver_agent(config_path, **kwargs):
                              driver_scrape_interval,
                              group_offset_interval,
                              max_open_sockets,
-                             max_concurrent_publishes,
                              system_socket_limit,
                              publish_depth_first_all,
                              publish_breadth_first_all,
@@ -134,7 +130,6 @@ class MasterDriverAgent(Agent):
                  driver_scrape_interval = 0.02,
                  group_offset_interval = 0.0,
                  max_open_sockets = None,
-                 max_concurrent_publishes = 10000,
                  system_socket_limit = None,
                  publish_depth_first_all=True,
                  publish_breadth_first_all=False,
@@ -179,7 +174,6 @@ class MasterDriverAgent(Agent):
         self.default_config = {"scalability_test": scalability_test,
                                "scalability_test_iterations": scalability_test_iterations,
                                "max_open_sockets": max_open_sockets,
-                               "max_concurrent_publishes": max_concurrent_publishes,
                                "driver_scrape_interval": self.driver_scrape_interval,
                                "group_offset_interval": self.group_offset_interval,
                                "publish_depth_first_all": self.publish_depth_first_all,
@@ -214,15 +208,6 @@ class MasterDriverAgent(Agent):
                     _log.warn("No limit set on the maximum number of concurrently open sockets. "
                               "Consider setting max_open_sockets if you plan to work with 800+ modbus devices.")
 
-                self.max_concurrent_publishes = config['max_concurrent_publishes']
-                max_concurrent_publishes = int(self.max_concurrent_publishes)
-                if max_concurrent_publishes < 1:
-                    _log.warn("No limit set on the maximum number of concurrent driver publishes. "
-                              "Consider setting max_concurrent_publishes if you plan to work with many devices.")
-                else:
-                    _log.info("maximum concurrent driver publishes limited to " + str(max_concurrent_publishes))
-                configure_publish_lock(max_concurrent_publishes)
-
                 self.scalability_test = bool(config["scalability_test"])
                 self.scalability_test_iterations = int(config["scalability_test_iterations"])
 
@@ -241,9 +226,6 @@ class MasterDriverAgent(Agent):
             if self.max_open_sockets != config["max_open_sockets"]:
                 _log.info("The master driver must be restarted for changes to the max_open_sockets setting to take effect")
 
-            if self.max_concurrent_publishes != config["max_concurrent_publishes"]:
-                _log.info("The master driver must be restarted for changes to the max_concurrent_publishes setting to take effect")
-
             if self.scalability_test != bool(config["scalability_test"]):
                 if not self.scalability_test:
                     _log.info(
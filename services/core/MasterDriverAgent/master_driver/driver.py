@@ -49,7 +49,6 @@ from volttron.platform.messaging.topics import (DRIVER_TOPIC_BASE,
                                                 DEVICES_PATH)
 
 from volttron.platform.vip.agent.errors import VIPError, Again
-from driver_locks import publish_lock
 import datetime
 
 utils.setup_logging()
@@ -266,59 +265,50 @@ class DriverAgent(BasicAgent):
 
 
 
+        # Everything from one scrape goes out in a single publish_batch.
+        items = []
         if self.publish_depth_first or self.publish_breadth_first:
             for point, value in results.iteritems():
                 depth_first_topic, breadth_first_topic = self.get_paths_for_point(point)
                 message = [value, self.meta_data[point]]
 
                 if self.publish_depth_first:
-                    self._publish_wrapper(depth_first_topic,
-                                          headers=headers,
-                                          message=message)
+                    items.append((depth_first_topic, headers, message))
 
                 if self.publish_breadth_first:
-                    self._publish_wrapper(breadth_first_topic,
-                                          headers=headers,
-                                          message=message)
+                    items.append((breadth_first_topic, headers, message))
 
         message = [results, self.meta_data]
         if self.publish_depth_first_all:
-            self._publish_wrapper(self.all_path_depth,
-                                  headers=headers,
-                                  message=message)
+            items.append((self.all_path_depth, headers, message))
 
         if self.publish_breadth_first_all:
-            self._publish_wrapper(self.all_path_breadth,
-                                  headers=headers,
-                                  message=message)
+            items.append((self.all_path_breadth, headers, message))
+
+        if items:
+            self._publish_batch_wrapper(items)
 
         self.parent.scrape_ending(self.device_name)
 
 
-    def _publish_wrapper(self, topic, headers, message):
+    def _publish_batch_wrapper(self, items):
+        # Scrape results are published without waiting for an acknowledgement.
+        # Flow control with the router limits how many are in flight; Again
+        # means the router has not accepted publishes for a while and nothing
+        # was sent, so back off and try again.
         while True:
             try:
-                with publish_lock():
-                    _log.debug("publishing: " + topic)
-                    self.vip.pubsub.publish('pubsub',
-                                        topic,
-                                        headers=headers,
-                                        message=message).get(timeout=10.0)
-
-                    _log.debug("finish publishing: " + topic)
-            except gevent.Timeout:
-                _log.warn("Did not receive confirmation of publish to "+topic)
-                break
+                _log.debug("publishing batch: {} topics".format(len(items)))
+                self.vip.pubsub.publish_batch('pubsub', items, ack=False)
             except Again:
-                _log.warn("publish delayed: " + topic + " pubsub is busy")
+                _log.warn("publish delayed: " + self.device_name + " pubsub is busy")
                 gevent.sleep(random.random())
             except VIPError as ex:
-                _log.warn("driver failed to publish " + topic + ": " + str(ex))
+                _log.warn("driver failed to publish batch for " + self.device_name + ": " + str(ex))
                 break
             else:
                 break
 
-
     def heart_beat(self):
         if self.heart_beat_point is None:
             return
@@ -377,6 +367,7 @@ class DriverAgent(BasicAgent):
             headers_mod.DATE: utcnow_string,
             headers_mod.TIMESTAMP: utcnow_string,
         }
+        items = []
         for point, value in point_values.iteritems():
             results = {point_name: value}
             meta = {point_name: self.meta_data[point_name]}
@@ -387,21 +378,18 @@ class DriverAgent(BasicAgent):
                 point_name)
 
             if self.publish_depth_first:
-                self._publish_wrapper(depth_first_topic,
-                                      headers=headers,
-                                      message=individual_point_message)
+                items.append((depth_first_topic, headers,
+                              individual_point_message))
             #
             if self.publish_breadth_first:
-                self._publish_wrapper(breadth_first_topic,
-                                      headers=headers,
-                                      message=individual_point_message)
+                items.append((breadth_first_topic, headers,
+                              individual_point_message))
 
             if self.publish_depth_first_all:
-                self._publish_wrapper(self.all_path_depth,
-                                      headers=headers,
-                                      message=all_message)
+                items.append((self.all_path_depth, headers, all_message))
 
             if self.publish_breadth_first_all:
-                self._publish_wrapper(self.all_path_breadth,
-                                      headers=headers,
-                                      message=all_message)
+                items.append((self.all_path_breadth, headers, all_message))
+
+        if items:
+            self._publish_batch_wrapper(items)
@@ -106,7 +106,8 @@ class SQLHistorian(BaseHistorian):
 
     """
 
-    def __init__(self, connection, tables_def = None, **kwargs):
+    def __init__(self, connection, tables_def = None, typed_values=False,
+                 **kwargs):
         """Initialise the historian.
 
         The historian makes two connections to the data store.  Both of
@@ -133,9 +134,14 @@ class SQLHistorian(BaseHistorian):
           4. "meta_table": name of the table that stores the metadata data
           for topics
 
+        :param typed_values: optional parameter. If True a new data table
+        stores numbers and booleans in typed columns instead of as JSON.
+        Not supported by redshift.
+
         :param kwargs: additional keyword arguments.
         """
         self.connection = connection
+        self.typed_values = typed_values
         self.tables_def, self.table_names = self.parse_table_def(tables_def)
         self.topic_id_map = {}
         self.topic_name_map = {}
@@ -180,53 +186,14 @@ class SQLHistorian(BaseHistorian):
             with self.bg_thread_dbutils.bulk_insert() as insert_data:
                 for x in to_publish_list:
                     ts = x['timestamp']
-                    topic = x['topic']
-                    value = x['value']
-                    meta = x['meta']
-
-                    # look at the topics that are stored in the database
-                    # already to see if this topic has a value
-                    lowercase_name = topic.lower()
-                    topic_id = self.topic_id_map.get(lowercase_name, None)
-                    db_topic_name = self.topic_name_map.get(lowercase_name,
-                                                            None)
-                    if topic_id is None:
-                        # _log.debug('Inserting topic: {}'.format(topic))
-                        # Insert topic name as is in db
-                        topic_id = self.bg_thread_dbutils.insert_topic(topic)
-                        # user lower case topic name when storing in map
-                        # for case insensitive comparison
-                        self.topic_id_map[lowercase_name] = topic_id
-                        self.topic_name_map[lowercase_name] = topic
-                        # _log.debug('TopicId: {} => {}'.format(topic_id, topic))
-                    elif db_topic_name != topic:
-                        # _log.debug('Updating topic: {}'.format(topic))
-                        self.bg_thread_dbutils.update_topic(topic, topic_id)
-                        self.topic_name_map[lowercase_name] = topic
-
-                    old_meta = self.topic_meta.get(topic_id, {})
-                    if set(old_meta.items()) != set(meta.items()):
-                        # _log.debug(
-                        #    'Updating meta for topic: {} {}'.format(topic,
-                        #                                            meta))
-                        self.bg_thread_dbutils.insert_meta(topic_id, meta)
-                        self.topic_meta[topic_id] = meta
-
-                    if insert_data(ts, topic_id, value):
+                    topic_id = self._get_topic_id(x['topic'])
+                    self._update_meta(topic_id, x['meta'])
+
+                    if insert_data(ts, topic_id, x['value']):
                         # _log.debug('item was inserted')
                         published += 1
 
-            if published:
-                if self.bg_thread_dbutils.commit():
-                    # _log.debug('published {} data values'.format(published))
-                    self.report_all_handled()
-                else:
-                    _log.debug('Commit error. Rolling back {} values.'.format(
-                        published))
-                    self.bg_thread_dbutils.rollback()
-            else:
-                _log.debug(
-                    'Unable to publish {}'.format(len(to_publish_list)))
+            self._commit_published(published, len(to_publish_list))
         except Exception as e:
             #TODO Unable to send alert from here
             # if isinstance(e, ConnectionError):
@@ -245,6 +212,72 @@ class SQLHistorian(BaseHistorian):
             # Raise to the platform so it is logged properly.
             raise
 
+    @doc_inherit
+    def publish_batches_to_historian(self, batches):
+        count = 0
+        try:
+            published = 0
+            with self.bg_thread_dbutils.bulk_insert() as insert_data:
+                for batch in batches:
+                    # All points of a device publish share the timestamp.
+                    ts = batch['timestamp']
+                    for topic, value, meta in zip(batch['topics'],
+                                                  batch['values'],
+                                                  batch['meta']):
+                        topic_id = self._get_topic_id(topic)
+                        self._update_meta(topic_id, meta)
+
+                        if insert_data(ts, topic_id, value):
+                            published += 1
+                    count += len(batch['topics'])
+
+            self._commit_published(published, count)
+        except Exception:
+            self.bg_thread_dbutils.rollback()
+            # Raise to the platform so it is logged properly.
+            raise
+
+    def _get_topic_id(self, topic):
+        # look at the topics that are stored in the database
+        # already to see if this topic has a value
+        lowercase_name = topic.lower()
+        topic_id = self.topic_id_map.get(lowercase_name, None)
+        db_topic_name = self.topic_name_map.get(lowercase_name, None)
+        if topic_id is None:
+            # _log.debug('Inserting topic: {}'.format(topic))
+            # Insert topic name as is in db
+            topic_id = self.bg_thread_dbutils.insert_topic(topic)
+            # user lower case topic name when storing in map
+            # for case insensitive comparison
+            self.topic_id_map[lowercase_name] = topic_id
+            self.topic_name_map[lowercase_name] = topic
+            # _log.debug('TopicId: {} => {}'.format(topic_id, topic))
+        elif db_topic_name != topic:
+            # _log.debug('Updating topic: {}'.format(topic))
+            self.bg_thread_dbutils.update_topic(topic, topic_id)
+            self.topic_name_map[lowercase_name] = topic
+        return topic_id
+
+    def _update_meta(self, topic_id, meta):
+        old_meta = self.topic_meta.get(topic_id, {})
+        if set(old_meta.items()) != set(meta.items()):
+            # _log.debug(
+            #    'Updating meta for topic: {} {}'.format(topic_id, meta))
+            self.bg_thread_dbutils.insert_meta(topic_id, meta)
+            self.topic_meta[topic_id] = meta
+
+    def _commit_published(self, published, count):
+        if published:
+            if self.bg_thread_dbutils.commit():
+                # _log.debug('published {} data values'.format(published))
+                self.report_all_handled()
+            else:
+                _log.debug('Commit error. Rolling back {} values.'.format(
+                    published))
+                self.bg_thread_dbutils.rollback()
+        else:
+            _log.debug('Unable to publish {}'.format(count))
+
     @doc_inherit
     def query_topic_list(self):
 
@@ -366,7 +399,8 @@ class SQLHistorian(BaseHistorian):
             self.table_names)
 
         if not self._readonly:
-            self.bg_thread_dbutils.setup_historian_tables()
+            self.bg_thread_dbutils.setup_historian_tables(
+                typed_values=self.typed_values)
 
         topic_id_map, topic_name_map = self.bg_thread_dbutils.get_topic_map()
         self.topic_id_map.update(topic_id_map)
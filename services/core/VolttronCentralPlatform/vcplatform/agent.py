@@ -747,6 +747,7 @@ class VolttronCentralPlatform(Agent):
         versions = self.vip.rpc.call(CONTROL, "agent_versions").get(timeout=5)
         status_running = self.status_agents()
         uuid_to_status = {}
+        running = []
         # proc_info has a list of [startproc, endprox]
         for a in agents:
             pinfo = None
@@ -787,22 +788,30 @@ class VolttronCentralPlatform(Agent):
             }
 
             if is_running:
-                identity = self.vip.rpc.call(CONTROL, 'agent_vip_identity',
-                                             a['uuid']).get(timeout=30)
-                try:
-                    status = self.vip.rpc.call(identity,
-                                               'health.get_status').get(
-                        timeout=5)
-                    uuid_to_status[a['uuid']]['health'] = status
-                except gevent.Timeout:
-                    _log.error("Couldn't get health from {} uuid: {}".format(
-                        identity, a['uuid']
+                running.append(a['uuid'])
+
+        # Ask all running agents at once rather than one after another.
+        identity_to_uuid = {}
+        for call, result in self.vip.rpc.call_many(
+                [(CONTROL, 'agent_vip_identity', [uuid]) for uuid in running],
+                timeout=30):
+            identity_to_uuid[result.get()] = call[2][0]
+        for call, result in self.vip.rpc.call_many(
+                [(identity, 'health.get_status', [])
+                 for identity in identity_to_uuid], timeout=5):
+            identity = call[0]
+            uuid = identity_to_uuid[identity]
+            try:
+                uuid_to_status[uuid]['health'] = result.get()
+            except gevent.Timeout:
+                _log.error("Couldn't get health from {} uuid: {}".format(
+                    identity, uuid
+                ))
+            except Unreachable:
+                _log.error(
+                    "Couldn't reach agent identity {} uuid: {}".format(
+                        identity, uuid
                     ))
-                except Unreachable:
-                    _log.error(
-                        "Couldn't reach agent identity {} uuid: {}".format(
-                            identity, a['uuid']
-                        ))
         for a in agents:
             if a['uuid'] in uuid_to_status.keys():
                 _log.debug('UPDATING STATUS OF: {}'.format(a['uuid']))
@@ -195,6 +195,15 @@ As records are published to the data store
 records that was published or :py:meth:`BaseHistorianAgent.report_all_handled`
 if everything was published.
 
+Each device publish is cached as one record per point and the points of a
+publish share a timestamp, source and headers. Historians that can store a
+whole device publish at once may override
+:py:meth:`BaseHistorianAgent.publish_batches_to_historian` which is then
+called instead of :py:meth:`BaseHistorianAgent.publish_to_historian` with the
+records grouped into batch records (see :py:func:`batch_records`). The
+default implementation expands the batches again so existing historians
+keep working unchanged.
+
 Querying Data
 -------------
 
@@ -222,12 +231,17 @@ the same date over again.
 from __future__ import absolute_import, print_function
 
 import logging
+import mmap
+import os
 import sqlite3
+import struct
 import threading
 import weakref
+import zlib
 from Queue import Queue, Empty
 from abc import abstractmethod
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
+from itertools import islice
 from datetime import datetime, timedelta
 from threading import Thread
 
@@ -308,11 +322,93 @@ def add_timing_data_to_header(headers, agent_id, phase):
     return abs((time1 - time2).total_seconds())
 
 
+def batch_records(to_publish_list):
+    """
+    Group cached records into batch records, one per device publish.
+
+    Consecutive records that share a timestamp, source and headers become
+    one batch record holding the per point fields in parallel lists:
+
+    .. code-block:: python
+
+        {
+            '_ids': [1, 2],
+            'timestamp': timestamp1.replace(tzinfo=pytz.UTC),
+            'source': 'scrape',
+            'topics': ["pnnl/isb1/hvac1/thermostat",
+                       "pnnl/isb1/hvac1/temperature"],
+            'values': [73.0, 74.1],
+            'meta': [{"units": "F", "tz": "UTC", "type": "float"},
+                     {"units": "F", "tz": "UTC", "type": "float"}],
+            'headers': {...}
+        }
+
+    :param to_publish_list: Records from the backup cache.
+    :type to_publish_list: list
+    :returns: List of batch records.
+    :rtype: list
+    """
+    batches = []
+    batch = None
+    for record in to_publish_list:
+        if (batch is None or
+                batch['timestamp'] != record['timestamp'] or
+                batch['source'] != record['source'] or
+                batch['headers'] != record['headers']):
+            batch = {'_ids': [],
+                     'timestamp': record['timestamp'],
+                     'source': record['source'],
+                     'topics': [],
+                     'values': [],
+                     'meta': [],
+                     'headers': record['headers']}
+            batches.append(batch)
+        batch['_ids'].append(record['_id'])
+        batch['topics'].append(record['topic'])
+        batch['values'].append(record['value'])
+        batch['meta'].append(record['meta'])
+    return batches
+
+
+def unbatch_records(batches):
+    """
+    Expand batch records from :py:func:`batch_records` back into one record
+    per point.
+
+    :param batches: List of batch records.
+    :type batches: list
+    :returns: List of records.
+    :rtype: list
+    """
+    return [{'_id': _id,
+             'timestamp': batch['timestamp'],
+             'source': batch['source'],
+             'topic': topic,
+             'value': value,
+             'headers': batch['headers'],
+             'meta': meta}
+            for batch in batches
+            for _id, topic, value, meta in zip(batch['_ids'], batch['topics'],
+                                               batch['values'], batch['meta'])]
+
+
 STATUS_KEY_BACKLOGGED = "backlogged"
 STATUS_KEY_CACHE_COUNT = "cache_count"
 STATUS_KEY_PUBLISHING = "publishing"
 STATUS_KEY_CACHE_FULL = "cache_full"
 
+# Backup cache implementations selectable with the backup_engine setting
+BACKUP_ENGINES = ("sqlite", "memory", "segment")
+# Records the memory backup cache holds before spilling to disk
+BACKUP_RING_SIZE = 100000
+# Size at which the segment backup cache starts a new segment file
+BACKUP_SEGMENT_SIZE = 16 * 1024 ** 2
+# Records the segment backup cache reads past its cursor
+BACKUP_SEGMENT_READ_AHEAD = 100000
+
+# Most values of each topic in a chunk of query_stream
+QUERY_CHUNK_SIZE = 1000
+
 
 class BaseHistorianAgent(Agent):
     """
@@ -349,6 +445,8 @@ class BaseHistorianAgent(Agent):
                  max_time_publishing=30.0,
                  backup_storage_limit_gb=None,
                  backup_storage_report=0.9,
+                 backup_engine="sqlite",
+                 backup_ring_size=BACKUP_RING_SIZE,
                  topic_replace_list=[],
                  gather_timing_data=False,
                  readonly=False,
@@ -382,6 +480,8 @@ class BaseHistorianAgent(Agent):
         self.volttron_table_defs = 'volttron_table_definitions'
         self._backup_storage_limit_gb = backup_storage_limit_gb
         self._backup_storage_report = backup_storage_report
+        self._backup_engine = backup_engine
+        self._backup_ring_size = int(backup_ring_size)
         self._retry_period = float(retry_period)
         self._submit_size_limit = int(submit_size_limit)
         self._max_time_publishing = float(max_time_publishing)
@@ -418,6 +518,8 @@ class BaseHistorianAgent(Agent):
                                 "max_time_publishing": self._max_time_publishing,
                                 "backup_storage_limit_gb": self._backup_storage_limit_gb,
                                 "backup_storage_report": self._backup_storage_report,
+                                "backup_engine": self._backup_engine,
+                                "backup_ring_size": self._backup_ring_size,
                                 "topic_replace_list": self._topic_replace_list,
                                 "gather_timing_data": self.gather_timing_data,
                                 "readonly": self._readonly,
@@ -509,6 +611,11 @@ class BaseHistorianAgent(Agent):
             else:
                 backup_storage_report = 0.9
 
+            backup_engine = config.get("backup_engine", "sqlite")
+            if backup_engine not in BACKUP_ENGINES:
+                raise ValueError("Unknown backup_engine {}".format(backup_engine))
+            backup_ring_size = int(config.get("backup_ring_size", BACKUP_RING_SIZE))
+
             retry_period = float(config.get("retry_period", 300.0))
 
             storage_limit_gb = config.get("storage_limit_gb")
@@ -546,6 +653,8 @@ class BaseHistorianAgent(Agent):
         self.gather_timing_data = gather_timing_data
         self._backup_storage_limit_gb = backup_storage_limit_gb
         self._backup_storage_report = backup_storage_report
+        self._backup_engine = backup_engine
+        self._backup_ring_size = backup_ring_size
         self._retry_period = retry_period
         self._submit_size_limit = submit_size_limit
         self._max_time_publishing = timedelta(seconds=max_time_publishing)
@@ -909,13 +1018,15 @@ class BaseHistorianAgent(Agent):
         if self.gather_timing_data:
             add_timing_data_to_header(headers, self.core.agent_uuid or self.core.identity, "collected")
 
-        for key, value in values.iteritems():
-            point_topic = device + '/' + key
-            self._event_queue.put({'source': source,
-                                   'topic': point_topic,
-                                   'readings': [(timestamp, value)],
-                                   'meta': meta.get(key, {}),
-                                   'headers': headers})
+        # Queue the whole publish as one batch record rather than one record
+        # per point. See :py:func:`batch_records` for the layout.
+        points = values.keys()
+        self._event_queue.put({'source': source,
+                               'timestamp': timestamp,
+                               'topics': [device + '/' + key for key in points],
+                               'values': [values[key] for key in points],
+                               'meta': [meta.get(key, {}) for key in points],
+                               'headers': headers})
 
     def _capture_actuator_data(self, topic, headers, message, match):
         """Capture actuation data and submit it to be published by a historian.
@@ -1024,8 +1135,7 @@ class BaseHistorianAgent(Agent):
             _log.info("Historian setup in readonly mode.")
             return
 
-        backupdb = BackupDatabase(self, self._backup_storage_limit_gb,
-                                  self._backup_storage_report)
+        backupdb = self._create_backup_cache()
         self._update_status({STATUS_KEY_CACHE_COUNT: backupdb.get_backlog_count()})
 
         # now that everything is setup we need to make sure that the topics
@@ -1110,7 +1220,11 @@ class BaseHistorianAgent(Agent):
                         history_limit_timestamp = last_time_stamp - self._history_limit_days
 
                     try:
-                        self.publish_to_historian(to_publish_list)
+                        if self._publishes_batches():
+                            self.publish_batches_to_historian(
+                                batch_records(to_publish_list))
+                        else:
+                            self.publish_to_historian(to_publish_list)
                         self.manage_db_size(history_limit_timestamp, self._storage_limit_gb)
                     except:
                         _log.exception(
@@ -1167,6 +1281,17 @@ class BaseHistorianAgent(Agent):
         _log.debug("Process loop stopped.")
         self._stop_process_loop = False
 
+    def _create_backup_cache(self):
+        if self._backup_engine == "memory":
+            return MemoryDatabase(self, self._backup_storage_limit_gb,
+                                  self._backup_storage_report,
+                                  ring_size=self._backup_ring_size)
+        if self._backup_engine == "segment":
+            return SegmentDatabase(self, self._backup_storage_limit_gb,
+                                   self._backup_storage_report)
+        return BackupDatabase(self, self._backup_storage_limit_gb,
+                              self._backup_storage_report)
+
     def _historian_setup(self):
         try:
             _log.exception("Trying to setup historian")
@@ -1190,14 +1315,17 @@ class BaseHistorianAgent(Agent):
         list of records has been successfully published and should be
         removed from the cache.
 
-        :param record: Record or list of records to remove from cache.
+        :param record: Record, batch record or list of either to remove from
+                       cache.
         :type record: dict or list
         """
-        if isinstance(record, list):
-            for x in record:
+        if not isinstance(record, list):
+            record = [record]
+        for x in record:
+            if '_ids' in x:
+                self._successful_published.update(x['_ids'])
+            else:
                 self._successful_published.add(x['_id'])
-        else:
-            self._successful_published.add(record['_id'])
 
     def report_all_handled(self):
         """
@@ -1252,6 +1380,30 @@ class BaseHistorianAgent(Agent):
         report records as being published.
         """
 
+    def publish_batches_to_historian(self, batches):
+        """
+        Optional publishing method for historians that store a whole device
+        publish at once.
+
+        When overridden it is called instead of
+        :py:meth:`BaseHistorianAgent.publish_to_historian` with the cached
+        records grouped by :py:func:`batch_records`: one batch record per
+        device publish with the topics, values and meta of its points in
+        parallel lists and the timestamp, source and headers shared. Batch
+        records may be passed to :py:meth:`BaseHistorianAgent.report_handled`.
+
+        The default implementation expands the batches and passes them to
+        :py:meth:`BaseHistorianAgent.publish_to_historian`.
+
+        :param batches: List of batch records
+        :type batches: list
+        """
+        self.publish_to_historian(unbatch_records(batches))
+
+    def _publishes_batches(self):
+        return (type(self).publish_batches_to_historian.im_func is not
+                BaseHistorianAgent.publish_batches_to_historian.im_func)
+
     def historian_setup(self):
         """
         Optional setup routine, run in the processing thread before
@@ -1279,69 +1431,6 @@ class BaseHistorianAgent(Agent):
         table name prefix for data, topics, and meta tables should be inserted
         """
 
-#TODO: Finish this.
-# from collections import deque
-#
-# class MemoryDatabase:
-#     def __init__(self, owner, backup_storage_limit_gb):
-#         # The topic cache is only meant as a local lookup and should not be
-#         # accessed via the implemented historians.
-#         self._backup_cache = {}
-#         self._meta_data = defaultdict(dict)
-#         self._owner = weakref.ref(owner)
-#         self._backup_storage_limit_gb = backup_storage_limit_gb
-#         self._deque = deque()
-#
-#     def get_outstanding_to_publish(self, size_limit):
-#         _log.debug("Getting oldest outstanding to publish.")
-#         results = []
-#
-#         count = 0
-#         for row in self._deque:
-#             timestamp = row[0]
-#             source = row[1]
-#             topic = row[2]
-#             value = row[3]
-#             headers = {} if row[4] is None else row[4]
-#             meta = self._meta_data[(source, topic)].copy()
-#             results.append({'timestamp': timestamp.replace(tzinfo=pytz.UTC),
-#                             'source': source,
-#                             'topic': topic,
-#                             'value': value,
-#                             'headers': headers,
-#                             'meta': meta})
-#             count += 1
-#             if count >= size_limit:
-#                 break
-#
-#         return results
-#
-#     def backup_new_data(self, new_publish_list):
-#         _log.debug("Backing up unpublished values.")
-#         for item in new_publish_list:
-#             source = item['source']
-#             topic = item['topic']
-#             readings = item['readings']
-#             headers = item.get('headers', {})
-#
-#             for timestamp, value in readings:
-#                 if timestamp is None:
-#                     timestamp = get_aware_utc_now()
-#
-#                 self._deque.append((timestamp, source, topic, value, headers))
-#
-#
-#     def remove_successfully_published(self, successful_publishes,
-#                                       submit_size):
-#         _log.debug("Cleaning up successfully published values.")
-#         if len(self._deque) <= submit_size:
-#             self._deque.clear()
-#             return
-#         my_deque = self._deque
-#         for i in xrange(submit_size):
-#             my_deque.popleft()
-
-
 class BackupDatabase:
     """
     A creates and manages backup cache for the
@@ -1376,31 +1465,18 @@ class BackupDatabase:
         c = self._connection.cursor()
 
         for item in new_publish_list:
+            if 'topics' in item:
+                self._backup_batch(c, item)
+                continue
+
             source = item['source']
             topic = item['topic']
             meta = item.get('meta', {})
             readings = item['readings']
             headers = item.get('headers', {})
 
-            topic_id = self._backup_cache.get(topic)
-
-            if topic_id is None:
-                c.execute('''INSERT INTO topics values (?,?)''',
-                          (None, topic))
-                c.execute('''SELECT last_insert_rowid()''')
-                row = c.fetchone()
-                topic_id = row[0]
-                self._backup_cache[topic_id] = topic
-                self._backup_cache[topic] = topic_id
-
-            meta_dict = self._meta_data[(source, topic_id)]
-            for name, value in meta.iteritems():
-                current_meta_value = meta_dict.get(name)
-                if current_meta_value != value:
-                    c.execute('''INSERT OR REPLACE INTO metadata
-                                 values(?, ?, ?, ?)''',
-                              (source, topic_id, name, value))
-                    meta_dict[name] = value
+            topic_id = self._get_topic_id(c, topic)
+            self._update_meta(c, source, topic_id, meta)
 
             for timestamp, value in readings:
                 if timestamp is None:
@@ -1445,6 +1521,59 @@ class BackupDatabase:
 
         return cache_full
 
+    def _backup_batch(self, c, item):
+        """Cache the points of a batch record with a single statement."""
+        source = item['source']
+        timestamp = item['timestamp']
+        if timestamp is None:
+            timestamp = get_aware_utc_now()
+        headers = dumps(item.get('headers', {}))
+        rows = []
+        for topic, value, meta in zip(item['topics'], item['values'],
+                                      item['meta']):
+            topic_id = self._get_topic_id(c, topic)
+            self._update_meta(c, source, topic_id, meta)
+            rows.append((timestamp, source, topic_id, dumps(value), headers))
+        connection = c.connection
+        changes = connection.total_changes
+        try:
+            c.executemany('''INSERT INTO outstanding
+                            values(NULL, ?, ?, ?, ?, ?)''', rows)
+        except sqlite3.IntegrityError:
+            # An upgraded installation may still have the unique constraint
+            # on the outstanding table. The rows ahead of the duplicate are
+            # in; insert the rest one at a time to skip the duplicates only.
+            inserted = connection.total_changes - changes
+            for row in rows[inserted + 1:]:
+                try:
+                    c.execute('''INSERT INTO outstanding
+                                 values(NULL, ?, ?, ?, ?, ?)''', row)
+                except sqlite3.IntegrityError:
+                    pass
+        self._record_count += connection.total_changes - changes
+
+    def _get_topic_id(self, c, topic):
+        topic_id = self._backup_cache.get(topic)
+        if topic_id is None:
+            c.execute('''INSERT INTO topics values (?,?)''',
+                      (None, topic))
+            c.execute('''SELECT last_insert_rowid()''')
+            row = c.fetchone()
+            topic_id = row[0]
+            self._backup_cache[topic_id] = topic
+            self._backup_cache[topic] = topic_id
+        return topic_id
+
+    def _update_meta(self, c, source, topic_id, meta):
+        meta_dict = self._meta_data[(source, topic_id)]
+        for name, value in meta.iteritems():
+            current_meta_value = meta_dict.get(name)
+            if current_meta_value != value:
+                c.execute('''INSERT OR REPLACE INTO metadata
+                             values(?, ?, ?, ?)''',
+                          (source, topic_id, name, value))
+                meta_dict[name] = value
+
     def remove_successfully_published(self, successful_publishes,
                                       submit_size):
         """
@@ -1663,6 +1792,754 @@ for method in [BackupDatabase.get_outstanding_to_publish,
     setattr(AsyncBackupDatabase, method.__name__, _using_threadpool(method))
 
 
+class _SpillFile(object):
+    """
+    Append-only file of cached records, read back through a memory map.
+
+    Each record is a 4 byte big-endian length followed by the record
+    encoded as JSON. Published records are skipped by moving the read
+    offset past them. The id of the newest record before the read offset
+    is kept in a cursor file next to the spill file, so published records
+    are not published again after a restart or a crash. The file is
+    emptied once everything in it has been published.
+    """
+
+    _LENGTH = struct.Struct('>I')
+
+    def __init__(self, path):
+        self.path = path
+        self._cursor_path = path + '.cursor'
+        self._file = None
+        self._map = None
+        self._open()
+        # Offset of the oldest unpublished record.
+        self.read_offset = 0
+        # Published records past read_offset.
+        self._published = set()
+        # Id of the newest record before read_offset.
+        self.cursor = 0
+        if os.path.exists(self._cursor_path):
+            with open(self._cursor_path) as cursor_file:
+                self.cursor = int(cursor_file.read() or 0)
+        self._saved_cursor = self.cursor
+        self.count = 0
+        self.last_id = self.cursor
+        good_end = 0
+        for _, end, _id, _ in self._records(0):
+            if _id <= self.cursor:
+                self.read_offset = end
+            else:
+                self.count += 1
+            self.last_id = max(self.last_id, _id)
+            good_end = end
+        if good_end < self.size:
+            _log.warning("Dropping partially written records from {}".format(
+                self.path))
+            self._truncate(good_end)
+        if not self.count and self.size:
+            self.read_offset = 0
+            self._truncate(0)
+
+    def __len__(self):
+        return self.count
+
+    def _open(self):
+        self._file = open(self.path, 'a+b')
+        self._file.seek(0, os.SEEK_END)
+        self.size = self._file.tell()
+
+    def _truncate(self, size):
+        self._close_map()
+        self._file.truncate(size)
+        self._file.seek(0, os.SEEK_END)
+        self.size = size
+
+    def _close_map(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def _records(self, offset, decode=True):
+        """Yield the (offset, end, id, record) of each record from offset on.
+
+        If decode is not set only the id is read and record is None.
+        """
+        if offset >= self.size:
+            return
+        if self._map is None or len(self._map) < self.size:
+            self._close_map()
+            self._map = mmap.mmap(self._file.fileno(), self.size,
+                                  access=mmap.ACCESS_READ)
+        data = self._map
+        length_size = self._LENGTH.size
+        while offset + length_size <= self.size:
+            length, = self._LENGTH.unpack_from(data, offset)
+            start = offset + length_size
+            end = start + length
+            if end > self.size:
+                return
+            if decode:
+                try:
+                    record = loads(data[start:end])
+                except ValueError:
+                    return
+                _id = record[0]
+            else:
+                record = None
+                _id = int(data[start + 1:data.find(b',', start, end)])
+            yield offset, end, _id, record
+            offset = end
+
+    @classmethod
+    def _encode(cls, _id, timestamp, source, topic, value, headers, meta):
+        data = dumps([_id, utils.format_timestamp(timestamp), source, topic,
+                      value, headers, meta])
+        return cls._LENGTH.pack(len(data)) + data
+
+    def append(self, _id, timestamp, source, topic, value, headers, meta):
+        data = self._encode(_id, timestamp, source, topic, value, headers,
+                            meta)
+        self._file.write(data)
+        self.size += len(data)
+        self.count += 1
+        self.last_id = _id
+
+    def flush(self):
+        self._file.flush()
+
+    def read(self, size_limit, offset=None):
+        """Return up to size_limit of the oldest unpublished records,
+        starting at offset if given."""
+        results = []
+        if size_limit <= 0:
+            return results
+        self.flush()
+        if offset is None:
+            offset = self.read_offset
+        for _, _, _id, record in self._records(offset):
+            if _id in self._published:
+                continue
+            _, timestamp, source, topic, value, headers, meta = record
+            timestamp = parse_timestamp_string(timestamp)
+            if timestamp.tzinfo is None:
+                timestamp = timestamp.replace(tzinfo=pytz.UTC)
+            results.append({'_id': _id,
+                            'timestamp': timestamp,
+                            'source': source,
+                            'topic': topic,
+                            'value': value,
+                            'headers': headers,
+                            'meta': meta})
+            if len(results) >= size_limit:
+                break
+        return results
+
+    def consume(self, count):
+        """Mark the oldest count unpublished records as published."""
+        self.flush()
+        published = self._published
+        for _, end, _id, _ in self._records(self.read_offset, decode=False):
+            if count <= 0:
+                break
+            if _id in published:
+                published.discard(_id)
+            else:
+                count -= 1
+                self.count -= 1
+            self.read_offset = end
+            self.cursor = _id
+        self._advance()
+
+    def acknowledge(self, ids):
+        """Mark the records with the given ids as published."""
+        ids = [_id for _id in ids
+               if _id > self.cursor and _id not in self._published]
+        self._published.update(ids)
+        self.count -= len(ids)
+        self._advance()
+
+    def _advance(self):
+        published = self._published
+        if published:
+            self.flush()
+            for _, end, _id, _ in self._records(self.read_offset,
+                                                decode=False):
+                if _id not in published:
+                    break
+                published.discard(_id)
+                self.read_offset = end
+                self.cursor = _id
+        if not self.count:
+            published.clear()
+            self.cursor = self.last_id
+        if self.cursor != self._saved_cursor:
+            self._save_cursor()
+        if not self.count and self.size:
+            self.read_offset = 0
+            self._truncate(0)
+
+    def _save_cursor(self):
+        temp_path = self._cursor_path + '.new'
+        with open(temp_path, 'w') as cursor_file:
+            cursor_file.write(str(self.cursor))
+        os.rename(temp_path, self._cursor_path)
+        self._saved_cursor = self.cursor
+
+    def trim(self, max_bytes):
+        """Drop the oldest records until at most max_bytes are unpublished.
+
+        The file is compacted once a quarter of max_bytes has been dropped
+        from its start.
+        """
+        self.flush()
+        if self.size - self.read_offset <= max_bytes:
+            return False
+        published = self._published
+        for _, end, _id, _ in self._records(self.read_offset, decode=False):
+            if self.size - self.read_offset <= max_bytes:
+                break
+            if _id in published:
+                published.discard(_id)
+            else:
+                self.count -= 1
+            self.read_offset = end
+            self.cursor = _id
+        self._advance()
+        if self.read_offset > max_bytes // 4:
+            self.compact()
+        return True
+
+    def unpublished_size(self):
+        return self.size - self.read_offset
+
+    def compact(self):
+        """Rewrite the file without the records that have been published."""
+        if not self.read_offset and not self._published:
+            return
+        self.flush()
+        temp_path = self.path + '.new'
+        with open(temp_path, 'wb') as new_file:
+            for offset, end, _id, _ in self._records(self.read_offset,
+                                                     decode=False):
+                if _id not in self._published:
+                    new_file.write(self._map[offset:end])
+        self.close()
+        os.rename(temp_path, self.path)
+        self._open()
+        self.read_offset = 0
+        self._published = set()
+
+    def close(self):
+        self._close_map()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class MemoryDatabase(object):
+    """
+    A backup cache for the :py:class:`BaseHistorianAgent` class which keeps
+    the records waiting to be published in memory while the historian keeps
+    up.
+
+    Every record is appended to a spill file, so records are kept until
+    they are reported as published, across restarts and crashes alike. Up
+    to `ring_size` of the oldest records are also held in memory and
+    published from there, so records are only read back from the spill file
+    once the historian falls behind. A cursor file records what has been
+    published.
+
+    Historian implementors do not need to use this class. It is for internal
+    use only.
+    """
+
+    def __init__(self, owner, backup_storage_limit_gb, backup_storage_report,
+                 ring_size=BACKUP_RING_SIZE, spill_path='backup.spill'):
+        self._owner = weakref.ref(owner)
+        self._backup_storage_limit_gb = backup_storage_limit_gb
+        self._backup_storage_report = backup_storage_report
+        self._ring_size = ring_size
+        self._meta_data = defaultdict(dict)
+        # The oldest unpublished records by id, oldest first.
+        self._ring = OrderedDict()
+        # Offset in the spill file just past the newest record in the ring.
+        self._ring_end = 0
+        self._spill = _SpillFile(spill_path)
+        self._next_id = self._spill.last_id + 1
+
+    def backup_new_data(self, new_publish_list):
+        """
+        :param new_publish_list: An iterable of records to cache.
+        :type new_publish_list: iterable
+        :returns: True if records the cache has reached a full state.
+        :rtype: bool
+        """
+        for item in new_publish_list:
+            source = item['source']
+            headers = item.get('headers', {})
+            if 'topics' in item:
+                timestamp = item['timestamp']
+                for topic, value, meta in zip(item['topics'], item['values'],
+                                              item['meta']):
+                    self._backup_reading(source, topic, meta, timestamp,
+                                         value, headers)
+            else:
+                topic = item['topic']
+                meta = item.get('meta', {})
+                for timestamp, value in item['readings']:
+                    self._backup_reading(source, topic, meta, timestamp,
+                                         value, headers)
+        spill = self._spill
+        spill.flush()
+
+        cache_full = False
+        if self._backup_storage_limit_gb is not None:
+            max_bytes = int(self._backup_storage_limit_gb * 1024 ** 3)
+            cache_full = spill.trim(max_bytes)
+            if cache_full:
+                # The oldest records, those in memory first, were dropped.
+                self._ring.clear()
+            if spill.unpublished_size() >= max_bytes * self._backup_storage_report:
+                cache_full = True
+        return cache_full
+
+    def _backup_reading(self, source, topic, meta, timestamp, value,
+                        headers):
+        meta_dict = self._meta_data[(source, topic)]
+        meta_dict.update(meta)
+        if timestamp is None:
+            timestamp = get_aware_utc_now()
+        spill = self._spill
+        # Only hold a record in memory if every older unpublished record is
+        # held there too, to keep the order they are published in.
+        in_ring = (len(self._ring) == len(spill) and
+                   len(self._ring) < self._ring_size)
+        spill.append(self._next_id, timestamp, source, topic, value, headers,
+                     meta_dict)
+        if in_ring:
+            self._ring[self._next_id] = (timestamp, source, topic, value,
+                                         headers)
+            self._ring_end = spill.size
+        self._next_id += 1
+
+    def remove_successfully_published(self, successful_publishes,
+                                      submit_size):
+        """
+        Removes the reported successful publishes from the cache.
+        If None is found in `successful_publishes` we assume that everything
+        was published.
+
+        :param successful_publishes: List of records that was published.
+        :param submit_size: Number of things requested from previous call to
+                            :py:meth:`get_outstanding_to_publish`
+
+        :type successful_publishes: list
+        :type submit_size: int
+        """
+        ring = self._ring
+        if None in successful_publishes:
+            for _ in xrange(min(submit_size, len(ring))):
+                ring.popitem(last=False)
+            self._spill.consume(submit_size)
+        else:
+            for _id in successful_publishes:
+                ring.pop(_id, None)
+            self._spill.acknowledge(successful_publishes)
+
+    def get_outstanding_to_publish(self, size_limit):
+        """
+        Retrieve up to `size_limit` records from the cache.
+
+        :param size_limit: Max number of records to retrieve.
+        :type size_limit: int
+        :returns: List of records for publication.
+        :rtype: list
+        """
+        results = []
+        for _id, record in islice(self._ring.iteritems(), size_limit):
+            timestamp, source, topic, value, headers = record
+            if timestamp.tzinfo is None:
+                timestamp = timestamp.replace(tzinfo=pytz.UTC)
+            results.append({'_id': _id,
+                            'timestamp': timestamp,
+                            'source': source,
+                            'topic': topic,
+                            'value': value,
+                            'headers': headers,
+                            'meta': self._meta_data[(source, topic)].copy()})
+        # Every unpublished record older than the newest one in memory is in
+        # memory as well.
+        offset = self._ring_end if self._ring else None
+        results.extend(self._spill.read(size_limit - len(results), offset))
+        return results
+
+    def get_backlog_count(self):
+        """
+        Retrieve the current number of records in the cache.
+        """
+        return len(self._spill)
+
+    def close(self):
+        self._ring.clear()
+        self._spill.compact()
+        self._spill.close()
+
+
+class SegmentDatabase(object):
+    """
+    A backup cache for the :py:class:`BaseHistorianAgent` class made of
+    append-only segment files.
+
+    Each call to :py:meth:`backup_new_data` appends one frame to the newest
+    segment file in `directory`. A frame is a header holding the payload
+    length, the CRC32 of the payload, the id of its first record, the number
+    of records and flags, followed by the records encoded as JSON and, if
+    `compress` is set, compressed with zlib. A new segment is started once
+    the newest one reaches `segment_size` bytes.
+
+    Records are published oldest first. Everything up to the cursor, the id
+    of the newest record with no older record waiting to be published, has
+    been published. The cursor is persisted whenever it moves and every
+    segment entirely behind it is deleted. When the storage limit is
+    reached the oldest segments are dropped whole.
+
+    At most `read_ahead` records past the cursor are held in memory, so
+    records are only published up to that far ahead of the oldest record
+    still waiting to be published.
+
+    On start the segments are scanned and a frame cut short by a crash is
+    truncated. Publishing resumes after the persisted cursor, so records
+    reported as published ahead of the cursor may be published again.
+
+    Historian implementors do not need to use this class. It is for internal
+    use only.
+    """
+
+    _FRAME = struct.Struct('>IIQIB')
+    _COMPRESSED = 0x01
+    _SUFFIX = '.segment'
+
+    def __init__(self, owner, backup_storage_limit_gb, backup_storage_report,
+                 directory='backup.segments',
+                 segment_size=BACKUP_SEGMENT_SIZE, compress=True,
+                 read_ahead=BACKUP_SEGMENT_READ_AHEAD):
+        self._owner = weakref.ref(owner)
+        self._backup_storage_limit_gb = backup_storage_limit_gb
+        self._backup_storage_report = backup_storage_report
+        self._directory = directory
+        self._cursor_path = os.path.join(directory, 'cursor')
+        self._segment_size = segment_size
+        self._max_bytes = None
+        if backup_storage_limit_gb is not None:
+            self._max_bytes = int(backup_storage_limit_gb * 1024 ** 3)
+            # Dropping whole segments should not overshoot the limit by
+            # much.
+            self._segment_size = max(min(segment_size, self._max_bytes // 8),
+                                     self._FRAME.size)
+        self._compress = compress
+        self._read_ahead = read_ahead
+        # First id -> [path, last id, size] of each segment, oldest first.
+        self._segments = OrderedDict()
+        self._writer = None
+        self._writer_id = None
+        # First id of the segment and offset of the next frame to read.
+        self._read_segment = 0
+        self._read_offset = 0
+        # Records read past the cursor, oldest first.
+        self._pending = []
+        # Ids past the cursor reported as published.
+        self._published = set()
+        self._cursor = 0
+        self._record_count = 0
+        self._next_id = 1
+        self._recover()
+
+    def _recover(self):
+        if not os.path.isdir(self._directory):
+            os.makedirs(self._directory)
+        if os.path.exists(self._cursor_path):
+            with open(self._cursor_path) as cursor_file:
+                self._cursor = int(cursor_file.read() or 0)
+        names = sorted(name for name in os.listdir(self._directory)
+                       if name.endswith(self._SUFFIX))
+        for name in names:
+            path = os.path.join(self._directory, name)
+            first_id = int(name[:-len(self._SUFFIX)])
+            last_id = first_id - 1
+            size = 0
+            for frame_id, count, _, _, end in self._frames(path, 0):
+                last_id = frame_id + count - 1
+                self._record_count += max(
+                    0, last_id - max(self._cursor, frame_id - 1))
+                size = end
+            if size < os.path.getsize(path):
+                _log.warning("Dropping partially written records from "
+                             "{}".format(path))
+                with open(path, 'r+b') as segment:
+                    segment.truncate(size)
+            if size:
+                self._segments[first_id] = [path, last_id, size]
+                self._next_id = max(self._next_id, last_id + 1)
+            else:
+                os.remove(path)
+        self._next_id = max(self._next_id, self._cursor + 1)
+        self._reclaim()
+
+    def _frames(self, path, offset):
+        """Yield (first id, count, flags, payload, end) of each intact frame
+        of a segment from offset on."""
+        header_size = self._FRAME.size
+        with open(path, 'rb') as segment:
+            segment.seek(offset)
+            while True:
+                header = segment.read(header_size)
+                if len(header) < header_size:
+                    return
+                length, crc, first_id, count, flags = \
+                    self._FRAME.unpack(header)
+                payload = segment.read(length)
+                if (len(payload) < length or
+                        zlib.crc32(payload) & 0xffffffff != crc):
+                    return
+                offset += header_size + length
+                yield first_id, count, flags, payload, offset
+
+    def backup_new_data(self, new_publish_list):
+        """
+        :param new_publish_list: An iterable of records to cache to disk.
+        :type new_publish_list: iterable
+        :returns: True if records the cache has reached a full state.
+        :rtype: bool
+        """
+        # Headers are usually shared by every point of a publish so they
+        # are stored once per frame.
+        headers_list = []
+        headers_index = {}
+        rows = []
+        for item in new_publish_list:
+            source = item['source']
+            headers = item.get('headers', {})
+            index = headers_index.get(id(headers))
+            if index is None:
+                index = headers_index[id(headers)] = len(headers_list)
+                headers_list.append(headers)
+            if 'topics' in item:
+                timestamp = self._format_timestamp(item['timestamp'])
+                for topic, value, meta in zip(item['topics'], item['values'],
+                                              item['meta']):
+                    rows.append((timestamp, source, topic, value, index,
+                                 meta))
+            else:
+                topic = item['topic']
+                meta = item.get('meta', {})
+                for timestamp, value in item['readings']:
+                    rows.append((self._format_timestamp(timestamp), source,
+                                 topic, value, index, meta))
+        if rows:
+            self._append(headers_list, rows)
+
+        cache_full = False
+        if self._max_bytes is not None:
+            cache_full = self._trim(self._max_bytes)
+            unpublished = sum(size for _, _, size
+                              in self._segments.itervalues())
+            if unpublished >= self._max_bytes * self._backup_storage_report:
+                cache_full = True
+        return cache_full
+
+    @staticmethod
+    def _format_timestamp(timestamp):
+        if timestamp is None:
+            timestamp = get_aware_utc_now()
+        return utils.format_timestamp(timestamp)
+
+    def _append(self, headers_list, rows):
+        payload = dumps([headers_list, rows])
+        flags = 0
+        if self._compress:
+            payload = zlib.compress(payload, 1)
+            flags |= self._COMPRESSED
+        frame = self._FRAME.pack(len(payload),
+                                 zlib.crc32(payload) & 0xffffffff,
+                                 self._next_id, len(rows), flags) + payload
+
+        segment = self._segments.get(self._writer_id)
+        if segment is None or segment[2] >= self._segment_size:
+            self._close_writer()
+            self._writer_id = self._next_id
+            path = os.path.join(self._directory, '{:020d}{}'.format(
+                self._writer_id, self._SUFFIX))
+            self._writer = open(path, 'ab')
+            segment = self._segments[self._writer_id] = [path, 0, 0]
+        self._writer.write(frame)
+        self._writer.flush()
+        self._next_id += len(rows)
+        self._record_count += len(rows)
+        segment[1] = self._next_id - 1
+        segment[2] += len(frame)
+
+    def _close_writer(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+            self._writer_id = None
+
+    def _read_frame(self):
+        """Read the next frame into _pending, returning False at the end."""
+        for first_id, (path, _, size) in self._segments.iteritems():
+            if first_id < self._read_segment:
+                continue
+            if first_id != self._read_segment:
+                self._read_segment = first_id
+                self._read_offset = 0
+            if self._read_offset >= size:
+                continue
+            for frame_id, count, flags, payload, end in self._frames(
+                    path, self._read_offset):
+                break
+            else:
+                _log.error("Skipping corrupt records in {}".format(path))
+                self._read_offset = size
+                continue
+            self._read_offset = end
+            if flags & self._COMPRESSED:
+                payload = zlib.decompress(payload)
+            headers_list, rows = loads(payload)
+            timestamps = {}
+            for _id, row in enumerate(rows, frame_id):
+                if _id <= self._cursor:
+                    continue
+                timestamp, source, topic, value, index, meta = row
+                parsed = timestamps.get(timestamp)
+                if parsed is None:
+                    parsed = parse_timestamp_string(timestamp)
+                    if parsed.tzinfo is None:
+                        parsed = parsed.replace(tzinfo=pytz.UTC)
+                    timestamps[timestamp] = parsed
+                self._pending.append({'_id': _id,
+                                      'timestamp': parsed,
+                                      'source': source,
+                                      'topic': topic,
+                                      'value': value,
+                                      'headers': headers_list[index],
+                                      'meta': meta})
+            return True
+        return False
+
+    def _unpublished(self):
+        """Yield records waiting to be published, oldest first, reading
+        more frames as needed until read_ahead records are pending."""
+        pending = self._pending
+        i = 0
+        while True:
+            while i < len(pending):
+                if pending[i]['_id'] not in self._published:
+                    yield pending[i]
+                i += 1
+            if len(pending) >= self._read_ahead or not self._read_frame():
+                return
+
+    def get_outstanding_to_publish(self, size_limit):
+        """
+        Retrieve up to `size_limit` records from the cache.
+
+        :param size_limit: Max number of records to retrieve.
+        :type size_limit: int
+        :returns: List of records for publication.
+        :rtype: list
+        """
+        return [dict(record) for record
+                in islice(self._unpublished(), size_limit)]
+
+    def remove_successfully_published(self, successful_publishes,
+                                      submit_size):
+        """
+        Removes the reported successful publishes from the cache.
+        If None is found in `successful_publishes` we assume that everything
+        was published.
+
+        :param successful_publishes: List of records that was published.
+        :param submit_size: Number of things requested from previous call to
+                            :py:meth:`get_outstanding_to_publish`
+
+        :type successful_publishes: list
+        :type submit_size: int
+        """
+        if None in successful_publishes:
+            published = [record['_id'] for record
+                         in islice(self._unpublished(), submit_size)]
+        else:
+            published = [_id for _id in successful_publishes
+                         if _id > self._cursor and
+                         _id not in self._published]
+        self._published.update(published)
+        self._record_count -= len(published)
+
+        pending = self._pending
+        done = 0
+        while done < len(pending) and pending[done]['_id'] in self._published:
+            self._published.discard(pending[done]['_id'])
+            done += 1
+        if done:
+            self._cursor = pending[done - 1]['_id']
+            del pending[:done]
+            self._save_cursor()
+            self._reclaim()
+
+    def _save_cursor(self):
+        temp_path = self._cursor_path + '.new'
+        with open(temp_path, 'w') as cursor_file:
+            cursor_file.write(str(self._cursor))
+        os.rename(temp_path, self._cursor_path)
+
+    def _reclaim(self):
+        """Delete the segments entirely behind the cursor."""
+        for first_id, (path, last_id, size) in self._segments.items():
+            if last_id > self._cursor:
+                break
+            if first_id == self._writer_id:
+                # Keep appending to the newest segment until it is full.
+                if size < self._segment_size:
+                    break
+                self._close_writer()
+            self._remove_segment(first_id)
+
+    def _remove_segment(self, first_id):
+        os.remove(self._segments.pop(first_id)[0])
+
+    def _trim(self, max_bytes):
+        """Drop the oldest segments until at most max_bytes are cached."""
+        size = sum(size for _, _, size in self._segments.itervalues())
+        dropped = False
+        while size > max_bytes and len(self._segments) > 1:
+            first_id, (_, last_id, segment_size) = \
+                next(self._segments.iteritems())
+            published = set(_id for _id in self._published
+                            if _id <= last_id)
+            self._record_count -= (last_id - max(self._cursor, first_id - 1) -
+                                   len(published))
+            self._published -= published
+            self._pending = [record for record in self._pending
+                             if record['_id'] > last_id]
+            self._cursor = max(self._cursor, last_id)
+            self._remove_segment(first_id)
+            size -= segment_size
+            dropped = True
+        if dropped:
+            self._save_cursor()
+        return dropped
+
+    def get_backlog_count(self):
+        """
+        Retrieve the current number of records in the cache.
+        """
+        return self._record_count
+
+    def close(self):
+        self._close_writer()
+        self._save_cursor()
+
+
 class BaseQueryHistorianAgent(Agent):
     """This is the base agent for historian Agents that support querying of
     their data stores.
@@ -1838,6 +2715,103 @@ class BaseQueryHistorianAgent(Agent):
 
         """
 
+        start, end, agg_period = self._parse_query_args(
+            topic, start, end, agg_type, agg_period)
+        results = self.query_historian(topic, start, end, agg_type,
+                                       agg_period, skip, count, order)
+        metadata = results.get("metadata", None)
+        values = results.get("values", None)
+        if values and metadata is None:
+            results['metadata'] = {}
+
+        return results
+
+    @RPC.export
+    def query_stream(self, topic=None, start=None, end=None, agg_type=None,
+                     agg_period=None, order="FIRST_TO_LAST",
+                     chunk_size=QUERY_CHUNK_SIZE):
+        """RPC call to query an Historian for time series data in chunks.
+
+        Takes the same arguments as :py:meth:`query`, without skip and
+        count. Read it with ``self.vip.rpc.stream(...)``; each chunk is a
+        query result of the same form :py:meth:`query` returns, holding
+        at most chunk_size values for each topic, so large queries are
+        never held in memory at once. Topics without further values are
+        left out of later chunks. A plain ``call`` fails with a TypeError.
+
+        :param chunk_size: Most values of each topic in a chunk.
+        :type chunk_size: int
+        """
+        start, end, agg_period = self._parse_query_args(
+            topic, start, end, agg_type, agg_period)
+        multiple = isinstance(topic, list)
+        # Each chunk continues every topic from the last timestamp it
+        # returned rather than skipping past the rows already returned, so
+        # reading a chunk does not rescan the earlier ones. Topics that
+        # continue from the same place are queried together.
+        pages = {(start, end, 0): topic}
+        while pages:
+            values = {}
+            next_pages = defaultdict(list)
+            for page, page_topic in pages.items():
+                page_start, page_end, skip = page
+                results = self.query_historian(page_topic, page_start,
+                                               page_end, agg_type, agg_period,
+                                               skip, chunk_size, order)
+                if not multiple:
+                    topic_values = results.get("values", None)
+                    if topic_values and results.get("metadata", None) is None:
+                        results['metadata'] = {}
+                    yield results
+                    next_page = self._next_page(topic_values or [], page,
+                                                order, chunk_size)
+                    if next_page is not None:
+                        next_pages[next_page] = topic
+                    continue
+                for name, topic_values in (results.get("values", None)
+                                           or {}).items():
+                    values[name] = topic_values
+                    next_page = self._next_page(topic_values, page, order,
+                                                chunk_size)
+                    if next_page is not None:
+                        next_pages[next_page].append(name)
+            if multiple:
+                yield {'values': values, 'metadata': {}}
+            pages = next_pages
+
+    @staticmethod
+    def _next_page(values, page, order, chunk_size):
+        """
+        Return the (start, end, skip) query arguments of the chunk following
+        values, read with the (start, end, skip) of page, or None if values
+        was the last chunk.
+        """
+        if len(values) < chunk_size:
+            return None
+        start, end, skip = page
+        last = values[-1][0]
+        # The start of a query is inclusive, so skip the values at the last
+        # timestamp that were already returned.
+        repeated = 0
+        for timestamp, _ in reversed(values):
+            if timestamp != last:
+                break
+            repeated += 1
+        last = parse_timestamp_string(last)
+        if last.tzinfo is None:
+            last = last.replace(tzinfo=pytz.UTC)
+        if order == "LAST_TO_FIRST":
+            # The end of a query is exclusive.
+            boundary = end - timedelta(microseconds=1) if end else None
+            end = last + timedelta(microseconds=1)
+        else:
+            boundary = start
+            start = last
+        if repeated == len(values) and boundary == last:
+            repeated += skip
+        return start, end, repeated
+
+    def _parse_query_args(self, topic, start, end, agg_type, agg_period):
         if topic is None:
             raise TypeError('"Topic" required')
 
@@ -1874,14 +2848,7 @@ class BaseQueryHistorianAgent(Agent):
         if start:
             _log.debug("start={}".format(start))
 
-        results = self.query_historian(topic, start, end, agg_type,
-                                       agg_period, skip, count, order)
-        metadata = results.get("metadata", None)
-        values = results.get("values", None)
-        if values and metadata is None:
-            results['metadata'] = {}
-
-        return results
+        return start, end, agg_period
 
     @abstractmethod
     def query_historian(self, topic, start=None, end=None, agg_type=None,
@@ -123,6 +123,11 @@ class ControlService(BaseAgent):
         self.vip.rpc.export(self._tracker.enable, 'stats.enable')
         self.vip.rpc.export(self._tracker.disable, 'stats.disable')
         self.vip.rpc.export(lambda: self._tracker.stats, 'stats.get')
+        self.vip.rpc.export(self._tracker.snapshot, 'stats.histograms')
+        self.vip.rpc.export(lambda: self._tracker.tracing, 'trace.status')
+        self.vip.rpc.export(self._tracker.trace, 'trace.enable')
+        self.vip.rpc.export(self._tracker.untrace, 'trace.disable')
+        self.vip.rpc.export(lambda: list(self._tracker.traced), 'trace.get')
 
     @Core.receiver('onstart')
     def onstart(self, sender, **kwargs):
@@ -976,12 +981,72 @@ def do_stats(opts):
             pprint.pprint(stats, _stdout)
         else:
             _stdout.writelines([str(stats), '\n'])
+    elif opts.op == 'snapshot':
+        _stdout.writelines([json.dumps(call('stats.histograms')), '\n'])
+    elif opts.op == 'histograms':
+        snapshot = call('stats.histograms')
+        for name, title in [('dwell', 'router time (us)'), ('size', 'message size (bytes)')]:
+            for key in ['subsystem', 'peer']:
+                _stdout.write('\n{} by {}\n'.format(title, key))
+                _stdout.write('{:<30} {:>10} {:>10} {:>10} {:>10} {:>10}\n'.format(
+                    key, 'count', 'p50', 'p99', 'p999', 'max'))
+                for item, histogram in sorted(snapshot[name][key].items()):
+                    _stdout.write('{:<30} {:>10} {:>10} {:>10} {:>10} {:>10}\n'.format(
+                        item, histogram['count'], histogram['p50'], histogram['p99'],
+                        histogram['p999'], histogram['max']))
     else:
         call('stats.' + opts.op)
         _stdout.write(
             '%sabled\n' % ('en' if call('stats.enabled') else 'dis'))
 
 
+def do_trace(opts):
+    call = opts.connection.call
+    if opts.op == 'enable':
+        call('trace.enable', sample=opts.sample, peers=opts.peer,
+             subsystems=opts.subsystem)
+    elif opts.op == 'disable':
+        call('trace.disable')
+    elif opts.op == 'dump':
+        for message in call('trace.get'):
+            _stdout.write('{time:.6f} {topic}{extra}: {frames}\n'.format(
+                time=message['time'], topic=message['topic'],
+                extra=' ({})'.format(message['extra']) if message['extra'] else '',
+                frames=message['frames']))
+        return
+    tracing = call('trace.status')
+    if tracing is None:
+        _stdout.write('disabled\n')
+    else:
+        _stdout.write('enabled: 1 in {} messages of peers {} and subsystems {}\n'.format(
+            tracing['sample'], ', '.join(tracing['peers']) or 'any',
+            ', '.join(tracing['subsystems']) or 'any'))
+
+
+def do_rpc_stats(opts):
+    try:
+        stats = opts.connection.server.vip.rpc.call(
+            opts.peer, 'rpc.stats', opts.reset).get(timeout=10)
+    except VIPError:
+        _stderr.write('{}: error: peer not reachable: {}\n'.format(
+            opts.command, opts.peer))
+        return 1
+    if opts.json:
+        _stdout.writelines([json.dumps(stats), '\n'])
+        return
+    # Methods taking the most time overall first
+    methods = sorted(stats['methods'].items(), reverse=True,
+                     key=lambda item: item[1]['latency']['mean'] * item[1]['calls'])
+    _stdout.write('{:<40} {:>8} {:>8} {:>10} {:>10} {:>10} {:>10}\n'.format(
+        'method', 'calls', 'errors', 'total ms', 'p50 us', 'p99 us', 'max us'))
+    for name, method in methods:
+        latency = method['latency']
+        _stdout.write('{:<40} {:>8} {:>8} {:>10.1f} {:>10} {:>10} {:>10}\n'.format(
+            name, method['calls'], method['errors'],
+            latency['mean'] * method['calls'] / 1000.0,
+            latency['p50'], latency['p99'], latency['max']))
+
+
 def show_serverkey(opts):
     """
     write serverkey to standard out.
@@ -2463,10 +2528,40 @@ def main(argv=sys.argv):
     stats = add_parser('stats',
                        help='manage router message statistics tracking')
     op = stats.add_argument(
-        'op', choices=['status', 'enable', 'disable', 'dump', 'pprint'],
-        nargs='?')
+        'op', choices=['status', 'enable', 'disable', 'dump', 'pprint',
+                       'histograms', 'snapshot'],
+        nargs='?', help='histograms shows percentiles of the time the router '
+        'spends on messages and of their size by subsystem and peer; '
+        'snapshot writes the histograms as JSON')
     stats.set_defaults(func=do_stats, op='status')
 
+    trace = add_parser('trace',
+                       help='trace messages passing through the router')
+    trace.add_argument(
+        'op', choices=['status', 'enable', 'disable', 'dump'], nargs='?')
+    trace.add_argument(
+        '--sample', metavar='N', type=int, default=1,
+        help='trace one in every N selected messages')
+    trace.add_argument(
+        '--peer', action='append', default=[],
+        help='only trace messages sent to or by this peer '
+             '(may be given more than once)')
+    trace.add_argument(
+        '--subsystem', action='append', default=[],
+        help='only trace messages of this subsystem, such as RPC or pubsub '
+             '(may be given more than once)')
+    trace.set_defaults(func=do_trace, op='status')
+
+    rpc_stats = add_parser('rpc-stats',
+                           help='show call counts and latencies of the RPC '
+                                'methods of a peer')
+    rpc_stats.add_argument('peer', help='VIP identity of the peer')
+    rpc_stats.add_argument('--reset', action='store_true',
+                           help='reset the statistics after showing them')
+    rpc_stats.add_argument('--json', action='store_true',
+                           help='show the statistics and latency histograms as JSON')
+    rpc_stats.set_defaults(func=do_rpc_stats)
+
     # ==============================================================================
     global message_bus, rmq_mgmt
 
@@ -40,7 +40,9 @@ from __future__ import absolute_import, print_function
 import contextlib
 import importlib
 import logging
+import math
 import threading
+from datetime import datetime
 from gevent.local import local
 
 import sys
@@ -75,6 +77,116 @@ def closing(obj):
                            'the cursor and is being ignored.')
 
 
+# Most topics fetched by a single statement of a multi topic query. Keeps
+# statements within the limits databases put on bound parameters and
+# compound selects.
+QUERY_TOPICS_PER_STATEMENT = 250
+
+
+def topic_id_chunks(topic_ids):
+    """
+    Split the topic ids of a query into lists of up to
+    QUERY_TOPICS_PER_STATEMENT, each fetched by one statement.
+    """
+    return [topic_ids[i:i + QUERY_TOPICS_PER_STATEMENT]
+            for i in range(0, len(topic_ids), QUERY_TOPICS_PER_STATEMENT)]
+
+
+# Value columns of a data table created with typed values, in the order
+# returned by typed_value_columns. A value is stored in the column of its
+# type. value_string holds the JSON of any other value.
+TYPED_VALUE_COLUMNS = ('value_double', 'value_int', 'value_bool',
+                       'value_string')
+
+# Timestamp before all data copied by DbDriver.migrate_to_typed_values.
+_MIGRATION_START = datetime(1970, 1, 1)
+
+# Range of the 64 bit integer column. Larger integers are stored as JSON.
+_MIN_INT = -2 ** 63
+_MAX_INT = 2 ** 63 - 1
+
+
+def typed_value_columns(value):
+    """
+    Split a value into the typed value columns of a data table.
+
+    :param value: value published for a topic
+    :return: tuple of (value_double, value_int, value_bool, value_string)
+             with the value in one column and None in the others
+    """
+    if isinstance(value, bool):
+        return None, None, value, None
+    if isinstance(value, (int, long)):
+        if _MIN_INT <= value <= _MAX_INT:
+            return None, value, None, None
+    elif isinstance(value, float):
+        # Databases can't all store infinity and NaN in a double column.
+        if not (math.isinf(value) or math.isnan(value)):
+            return value, None, None, None
+    return None, None, None, jsonapi.dumps(value)
+
+
+def collect_query_rows(values, rows, id_name_map, skip=0, format_ts=None,
+                       typed=False):
+    """
+    Add rows of (topic_id, ts, value_string) fetched for several topics at
+    once to the result of :py:meth:`DbDriver.query`.
+
+    The rows of each topic must arrive in the requested order. The first
+    `skip` rows of each topic are dropped without being decoded. Points
+    scraped together share their timestamps and often their values, so each
+    distinct timestamp is formatted once and each distinct value string is
+    decoded once per call.
+
+    :param values: dictionary of topic name to list of (timestamp, value)
+                   to add to
+    :param rows: iterable of (topic_id, ts, value_string), or of
+                 (topic_id, ts, value_double, value_int, value_bool,
+                 value_string) if typed is True
+    :param id_name_map: dictionary that maps topic id to topic name
+    :param skip: number of rows of each topic to drop
+    :param format_ts: converts ts to the timestamp string returned. None if
+                      the database returns formatted timestamps.
+    :param typed: True if the rows hold the typed value columns of
+                  TYPED_VALUE_COLUMNS
+    """
+    skipped = {}
+    timestamps = {}
+    decoded = {}
+    for row in rows:
+        if typed:
+            topic_id, ts, value_double, value_int, value_bool, value = row
+        else:
+            topic_id, ts, value = row
+        if skip:
+            seen = skipped.get(topic_id, 0)
+            if seen < skip:
+                skipped[topic_id] = seen + 1
+                continue
+        if format_ts is not None:
+            formatted = timestamps.get(ts)
+            if formatted is None:
+                formatted = timestamps[ts] = format_ts(ts)
+            ts = formatted
+        if typed and value is None:
+            if value_double is not None:
+                parsed = value_double
+            elif value_int is not None:
+                parsed = value_int
+            else:
+                parsed = bool(value_bool)
+            values[id_name_map[topic_id]].append((ts, parsed))
+            continue
+        try:
+            parsed = decoded[value]
+        except KeyError:
+            parsed = jsonapi.loads(value)
+            # Containers are decoded each time so results don't share them.
+            if not isinstance(parsed, (dict, list)):
+                decoded[value] = parsed
+        values[id_name_map[topic_id]].append((ts, parsed))
+
+
 class DbDriver(object):
     """
     Parent class used by :py:class:`sqlhistorian.historian.SQLHistorian` to
@@ -99,6 +211,7 @@ class DbDriver(object):
         self.__connect = connect
         self.__connection = None
         self.stash = local()
+        self._typed_values = None
 
     @contextlib.contextmanager
     def bulk_insert(self):
@@ -172,12 +285,52 @@ class DbDriver(object):
         return table_names
 
     @abstractmethod
-    def setup_historian_tables(self):
+    def setup_historian_tables(self, typed_values=False):
         """
         Create historian tables if necessary
+
+        :param typed_values: True to store the values of a new data table in
+                             the typed columns of TYPED_VALUE_COLUMNS instead
+                             of as JSON. An existing data table keeps its
+                             columns.
+        """
+        pass
+
+    @abstractmethod
+    def create_data_table(self, table_name, typed_values=False):
+        """
+        Create a table for historian data and its index on ts
+
+        :param table_name: name of the table to create
+        :param typed_values: True to create the typed value columns of
+                             TYPED_VALUE_COLUMNS instead of a value_string
+                             column of JSON
         """
         pass
 
+    def get_data_columns(self):
+        """
+        Optional function that returns the names of the columns of the data
+        table. Drivers that don't implement it only store JSON values.
+
+        :return: list of column names, empty if the table does not exist
+        """
+        return []
+
+    def has_typed_values(self):
+        """
+        Check whether the data table stores values in typed columns. The
+        answer is remembered once the table exists.
+
+        :return: True if the data table has the typed value columns
+        """
+        if self._typed_values is None:
+            columns = [name.lower() for name in self.get_data_columns()]
+            if not columns:
+                return False
+            self._typed_values = 'value_double' in columns
+        return self._typed_values
+
     @abstractmethod
     def get_topic_map(self):
         """
@@ -227,6 +380,24 @@ class DbDriver(object):
         """
         pass
 
+    @abstractmethod
+    def insert_typed_data_query(self, table_name=None):
+        """
+        :param table_name: table to insert into. Defaults to the data table
+        :return: query string to insert data into the typed value columns
+        of a data table
+        """
+        pass
+
+    @abstractmethod
+    def select_data_batch_query(self, table_name):
+        """
+        :param table_name: data table of JSON values to read
+        :return: query string to select the next (ts, value_string) rows of
+        a topic by topic_id, ts after which to start and number of rows
+        """
+        pass
+
     @abstractmethod
     def insert_topic_query(self):
         """
@@ -311,8 +482,14 @@ class DbDriver(object):
         :return: True if execution completes. raises Exception if unable to
         connect to database
         """
-        self.execute_stmt(self.insert_data_query(),
-                          (ts, topic_id, jsonapi.dumps(data)), commit=False)
+        if self.has_typed_values():
+            self.execute_stmt(self.insert_typed_data_query(),
+                              (ts, topic_id) + typed_value_columns(data),
+                              commit=False)
+        else:
+            self.execute_stmt(self.insert_data_query(),
+                              (ts, topic_id, jsonapi.dumps(data)),
+                              commit=False)
         return True
 
     def insert_topic(self, topic):
@@ -381,6 +558,72 @@ class DbDriver(object):
                           (agg_topic_name, agg_id),commit=False)
         return True
 
+    def rename_table(self, table_name, new_name):
+        """
+        Rename a table
+
+        :param table_name: current name of the table
+        :param new_name: new name of the table
+        """
+        self.execute_stmt('ALTER TABLE ' + table_name + ' RENAME TO ' +
+                          new_name, commit=True)
+
+    def drop_table(self, table_name):
+        """
+        Drop a table and its data
+
+        :param table_name: name of the table to drop
+        """
+        self.execute_stmt('DROP TABLE ' + table_name, commit=True)
+
+    def migrate_to_typed_values(self, batch_size=10000,
+                                drop_json_table=False):
+        """
+        Convert a data table of JSON values to the typed value columns of
+        TYPED_VALUE_COLUMNS. The rows are copied to a new table, one topic
+        and batch at a time, which then replaces the data table. The old
+        table is renamed to <data_table>_json. Historians writing to the
+        table must be stopped first. If interrupted the migration can be
+        run again.
+
+        :param batch_size: number of rows copied per transaction
+        :param drop_json_table: True to drop the old table afterwards
+        :return: number of rows copied
+        """
+        if self.has_typed_values():
+            _log.info("Data table {} already has typed values".format(
+                self.data_table))
+            return 0
+        typed_table = self.data_table + '_typed'
+        json_table = self.data_table + '_json'
+        self.create_data_table(typed_table, typed_values=True)
+        select_query = self.select_data_batch_query(self.data_table)
+        insert_query = self.insert_typed_data_query(typed_table)
+        copied = 0
+        for topic_id in sorted(self.get_topic_map()[0].values()):
+            last_ts = _MIGRATION_START
+            while True:
+                rows = self.select(select_query,
+                                   (topic_id, last_ts, batch_size))
+                if not rows:
+                    break
+                self.execute_many(
+                    insert_query,
+                    [(ts, topic_id) +
+                     typed_value_columns(jsonapi.loads(value))
+                     for ts, value in rows],
+                    commit=True)
+                copied += len(rows)
+                last_ts = rows[-1][0]
+            _log.debug("Copied values of topic {}, {} rows in all".format(
+                topic_id, copied))
+        self.rename_table(self.data_table, json_table)
+        self.rename_table(typed_table, self.data_table)
+        self._typed_values = None
+        if drop_json_table:
+            self.drop_table(json_table)
+        return copied
+
     def commit(self):
         """
         Commit a transaction
@@ -37,19 +37,23 @@
 # }}}
 import ast
 import logging
-from collections import defaultdict
 
 import pytz
 import re
-from basedb import DbDriver
+from basedb import (DbDriver, TYPED_VALUE_COLUMNS, collect_query_rows,
+                    topic_id_chunks)
 from mysql.connector import Error as MysqlError
 from mysql.connector import errorcode as mysql_errorcodes
 from volttron.platform.agent import utils
-from volttron.platform.agent import json as jsonapi
 
 utils.setup_logging()
 _log = logging.getLogger(__name__)
 
+
+def _format_timestamp(ts):
+    return utils.format_timestamp(ts.replace(tzinfo=pytz.UTC))
+
+
 """
 Implementation of Mysql database operation for
 :py:class:`sqlhistorian.historian.SQLHistorian` and
@@ -93,7 +97,7 @@ class MySqlFuncts(DbDriver):
         else:
             self.MICROSECOND_SUPPORT = True
 
-    def setup_historian_tables(self):
+    def setup_historian_tables(self, typed_values=False):
         if self.MICROSECOND_SUPPORT is None:
             self.init_microsecond_support()
 
@@ -101,26 +105,14 @@ class MySqlFuncts(DbDriver):
         if rows:
             _log.debug("Found table {}. Historian table exists".format(
                 self.data_table))
+            if typed_values and not self.has_typed_values():
+                _log.warning("Data table {} stores values as JSON. Run "
+                             "migrate_typed_values.py to convert it to typed "
+                             "values.".format(self.data_table))
             return
 
         try:
-            if self.MICROSECOND_SUPPORT:
-                self.execute_stmt(
-                    'CREATE TABLE IF NOT EXISTS ' + self.data_table +
-                    ' (ts timestamp(6) NOT NULL,\
-                     topic_id INTEGER NOT NULL, \
-                     value_string TEXT NOT NULL, \
-                     UNIQUE(topic_id, ts))')
-            else:
-                self.execute_stmt(
-                    'CREATE TABLE IF NOT EXISTS ' + self.data_table +
-                    ' (ts timestamp NOT NULL,\
-                     topic_id INTEGER NOT NULL, \
-                     value_string TEXT NOT NULL, \
-                     UNIQUE(topic_id, ts))')
-
-            self.execute_stmt('''CREATE INDEX data_idx
-                                    ON ''' + self.data_table + ''' (ts ASC)''')
+            self.create_data_table(self.data_table, typed_values)
             self.execute_stmt('''CREATE TABLE IF NOT EXISTS ''' +
                               self.topics_table +
                               ''' (topic_id INTEGER NOT NULL AUTO_INCREMENT,
@@ -147,6 +139,33 @@ class MySqlFuncts(DbDriver):
                 err_msg = err.msg + " : " + err_msg
             raise RuntimeError(err_msg)
 
+    def create_data_table(self, table_name, typed_values=False):
+        if self.MICROSECOND_SUPPORT is None:
+            self.init_microsecond_support()
+
+        ts_type = 'timestamp(6)' if self.MICROSECOND_SUPPORT else 'timestamp'
+        if typed_values:
+            value_columns = 'value_double DOUBLE, \
+                             value_int BIGINT, \
+                             value_bool BOOLEAN, \
+                             value_string TEXT,'
+        else:
+            value_columns = 'value_string TEXT NOT NULL,'
+        self.execute_stmt(
+            'CREATE TABLE IF NOT EXISTS ' + table_name +
+            ' (ts ' + ts_type + ' NOT NULL,\
+             topic_id INTEGER NOT NULL, \
+             ' + value_columns + ' \
+             UNIQUE(topic_id, ts), \
+             INDEX data_idx (ts ASC))')
+
+    def get_data_columns(self):
+        rows = self.select('''SELECT column_name
+                              FROM information_schema.columns
+                              WHERE table_schema = DATABASE()
+                              AND table_name = %s''', [self.data_table])
+        return [row[0] for row in rows]
+
     def record_table_definitions(self, tables_def, meta_table_name):
         _log.debug(
             "In record_table_def {} {}".format(tables_def, meta_table_name))
@@ -208,18 +227,26 @@ class MySqlFuncts(DbDriver):
         if agg_type and agg_period:
             table_name = agg_type + "_" + agg_period
 
-        query = '''SELECT topic_id, ts, value_string
+        # Aggregate tables always store JSON values.
+        typed = table_name == self.data_table and self.has_typed_values()
+        value_columns = 'value_string'
+        if typed:
+            value_columns = ', '.join(TYPED_VALUE_COLUMNS)
+
+        # All topics are fetched with one statement, a union of one select
+        # per topic so each topic gets its own limit.
+        query = '''(SELECT topic_id, ts, ''' + value_columns + '''
                 FROM ''' + table_name + '''
-                {where}
-                {order_by}
-                {limit}
-                {offset}'''
+                WHERE topic_id = %s{where}
+                ORDER BY ts {direction}
+                LIMIT %s
+                {offset})'''
 
         if self.MICROSECOND_SUPPORT is None:
             self.init_microsecond_support()
 
-        where_clauses = ["WHERE topic_id = %s"]
-        args = [topic_ids[0]]
+        where_clauses = []
+        args = []
 
         if start is not None:
             if start.tzinfo != pytz.UTC:
@@ -246,19 +273,15 @@ class MySqlFuncts(DbDriver):
                 where_clauses.append("ts < %s")
                 args.append(end)
 
-        where_statement = ' AND '.join(where_clauses)
+        where_statement = ''.join(' AND ' + clause for clause in where_clauses)
 
-        order_by = 'ORDER BY ts ASC'
-        if order == 'LAST_TO_FIRST':
-            order_by = ' ORDER BY topic_id DESC, ts DESC'
+        direction = 'DESC' if order == 'LAST_TO_FIRST' else 'ASC'
 
         # can't have an offset without a limit
         # -1 = no limit and allows the user to
         # provide just an offset
         if count is None:
             count = 100
-
-        limit_statement = 'LIMIT %s'
         args.append(int(count))
 
         offset_statement = ''
@@ -266,24 +289,24 @@ class MySqlFuncts(DbDriver):
             offset_statement = 'OFFSET %s'
             args.append(skip)
 
+        query = query.format(where=where_statement, direction=direction,
+                             offset=offset_statement)
+
         _log.debug("About to do real_query")
-        values = defaultdict(list)
-        for topic_id in topic_ids:
-            args[0] = topic_id
-            values[id_name_map[topic_id]] = []
-            real_query = query.format(where=where_statement,
-                                      limit=limit_statement,
-                                      offset=offset_statement,
-                                      order_by=order_by)
+        values = dict((id_name_map[topic_id], []) for topic_id in topic_ids)
+        for chunk in topic_id_chunks(topic_ids):
+            real_query = '\nUNION ALL\n'.join([query] * len(chunk))
+            real_args = []
+            for topic_id in chunk:
+                real_args.append(topic_id)
+                real_args.extend(args)
             _log.debug("Real Query: " + real_query)
-            _log.debug("args: " + str(args))
+            _log.debug("args: " + str(real_args))
 
-            cursor = self.select(real_query, args, fetch_all=False)
+            cursor = self.select(real_query, real_args, fetch_all=False)
             if cursor:
-                for _id, ts, value in cursor:
-                    values[id_name_map[topic_id]].append(
-                        (utils.format_timestamp(ts.replace(tzinfo=pytz.UTC)),
-                         jsonapi.loads(value)))
+                collect_query_rows(values, cursor, id_name_map,
+                                   format_ts=_format_timestamp, typed=typed)
 
             if cursor is not None:
                 cursor.close()
@@ -296,6 +319,16 @@ class MySqlFuncts(DbDriver):
         return '''REPLACE INTO ''' + self.data_table + \
                '''  values(%s, %s, %s)'''
 
+    def insert_typed_data_query(self, table_name=None):
+        return '''REPLACE INTO ''' + (table_name or self.data_table) + \
+               ''' (ts, topic_id, ''' + ', '.join(TYPED_VALUE_COLUMNS) + \
+               ''') values(%s, %s, %s, %s, %s, %s)'''
+
+    def select_data_batch_query(self, table_name):
+        return '''SELECT ts, value_string FROM ''' + table_name + '''
+               WHERE topic_id = %s AND ts > %s
+               ORDER BY ts ASC LIMIT %s'''
+
     def insert_topic_query(self):
         _log.debug("In insert_topic_query - self.topic_table "
                    "{}".format(self.topics_table))
@@ -417,9 +450,13 @@ class MySqlFuncts(DbDriver):
             if agg_type.upper() not in ['AVG', 'MIN', 'MAX', 'COUNT', 'SUM']:
                 raise ValueError(
                     "Invalid aggregation type {}".format(agg_type))
+        value = 'value_string'
+        if self.has_typed_values():
+            # Booleans are left out, as JSON true and false are not summed
+            value = 'COALESCE(value_double, value_int)'
         query = '''SELECT ''' \
-                + agg_type + '''(value_string), count(value_string) FROM ''' \
-                + self.data_table + ''' {where}'''
+                + agg_type + '''(''' + value + '''), count(''' + value + \
+                ''') FROM ''' + self.data_table + ''' {where}'''
         where_clauses = ["WHERE topic_id = %s"]
         args = [topic_ids[0]]
         if len(topic_ids) > 1:
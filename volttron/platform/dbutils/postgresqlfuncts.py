@@ -28,11 +28,18 @@ from psycopg2.sql import Identifier, Literal, SQL
 from volttron.platform.agent import utils
 from volttron.platform.agent import json as jsonapi
 
-from .basedb import DbDriver
+from .basedb import (DbDriver, TYPED_VALUE_COLUMNS, collect_query_rows,
+                     topic_id_chunks, typed_value_columns)
 
 utils.setup_logging()
 _log = logging.getLogger(__name__)
 
+_TYPED_VALUES_SQL = SQL(', ').join(
+    Identifier(name) for name in TYPED_VALUE_COLUMNS)
+_TYPED_COLUMNS_SQL = SQL('(ts, topic_id, {})').format(_TYPED_VALUES_SQL)
+_TYPED_UPDATE_SQL = SQL(', ').join(
+    SQL('{0} = EXCLUDED.{0}').format(Identifier(name))
+    for name in TYPED_VALUE_COLUMNS)
 
 """
 Implementation of PostgreSQL database operation for
@@ -67,6 +74,7 @@ class PostgreSqlFuncts(DbDriver):
         :yields: insert method
         """
         records = []
+        typed = self.has_typed_values()
 
         def insert_data(ts, topic_id, data):
             """
@@ -81,6 +89,11 @@ class PostgreSqlFuncts(DbDriver):
             :return: Returns True after insert
             :rtype: bool
             """
+            if typed:
+                records.append(SQL('({}, {}, {}, {}, {}, {})').format(
+                    *[Literal(value) for value in
+                      (ts, topic_id) + typed_value_columns(data)]))
+                return True
             value = jsonapi.dumps(data)
             records.append(SQL('({}, {}, {})').format(Literal(ts), Literal(topic_id), Literal(value)))
             return True
@@ -88,10 +101,18 @@ class PostgreSqlFuncts(DbDriver):
         yield insert_data
 
         if records:
-            query = SQL('INSERT INTO {} VALUES {} '
-                        'ON CONFLICT (ts, topic_id) DO UPDATE '
-                        'SET value_string = EXCLUDED.value_string').format(
-                            Identifier(self.data_table), SQL(', ').join(records))
+            if typed:
+                query = SQL('INSERT INTO {} {} VALUES {} '
+                            'ON CONFLICT (ts, topic_id) DO UPDATE '
+                            'SET {}').format(
+                                Identifier(self.data_table),
+                                _TYPED_COLUMNS_SQL, SQL(', ').join(records),
+                                _TYPED_UPDATE_SQL)
+            else:
+                query = SQL('INSERT INTO {} VALUES {} '
+                            'ON CONFLICT (ts, topic_id) DO UPDATE '
+                            'SET value_string = EXCLUDED.value_string').format(
+                                Identifier(self.data_table), SQL(', ').join(records))
             self.execute_stmt(query)
 
     def rollback(self):
@@ -100,18 +121,13 @@ class PostgreSqlFuncts(DbDriver):
         except InterfaceError:
             return False
 
-    def setup_historian_tables(self):
-        self.execute_stmt(SQL(
-            'CREATE TABLE IF NOT EXISTS {} ('
-                'ts TIMESTAMP NOT NULL, '
-                'topic_id INTEGER NOT NULL, '
-                'value_string TEXT NOT NULL, '
-                'UNIQUE (topic_id, ts)'
-            ')').format(Identifier(self.data_table)))
-        self.execute_stmt(SQL(
-            'CREATE INDEX IF NOT EXISTS {} ON {} (ts ASC)').format(
-            Identifier('idx_' + self.data_table),
-            Identifier(self.data_table)))
+    def setup_historian_tables(self, typed_values=False):
+        if not self.get_data_columns():
+            self.create_data_table(self.data_table, typed_values)
+        elif typed_values and not self.has_typed_values():
+            _log.warning('Data table {} stores values as JSON. Run '
+                         'migrate_typed_values.py to convert it to typed '
+                         'values.'.format(self.data_table))
         self.execute_stmt(SQL(
             'CREATE TABLE IF NOT EXISTS {} ('
                 'topic_id SERIAL PRIMARY KEY NOT NULL, '
@@ -125,6 +141,43 @@ class PostgreSqlFuncts(DbDriver):
             ')').format(Identifier(self.meta_table)))
         self.commit()
 
+    def create_data_table(self, table_name, typed_values=False):
+        if typed_values:
+            value_columns = SQL(
+                'value_double DOUBLE PRECISION, '
+                'value_int BIGINT, '
+                'value_bool BOOLEAN, '
+                'value_string TEXT, ')
+        else:
+            value_columns = SQL('value_string TEXT NOT NULL, ')
+        self.execute_stmt(SQL(
+            'CREATE TABLE IF NOT EXISTS {} ('
+                'ts TIMESTAMP NOT NULL, '
+                'topic_id INTEGER NOT NULL, '
+                '{}'
+                'UNIQUE (topic_id, ts)'
+            ')').format(Identifier(table_name), value_columns))
+        self.execute_stmt(SQL(
+            'CREATE INDEX IF NOT EXISTS {} ON {} (ts ASC)').format(
+            Identifier('idx_' + table_name),
+            Identifier(table_name)))
+        self.commit()
+
+    def get_data_columns(self):
+        query = SQL(
+            'SELECT column_name '
+            'FROM information_schema.columns '
+            'WHERE table_schema = current_schema() AND table_name = %s')
+        return [name for name, in self.select(query, (self.data_table,))]
+
+    def rename_table(self, table_name, new_name):
+        self.execute_stmt(SQL('ALTER TABLE {} RENAME TO {}').format(
+            Identifier(table_name), Identifier(new_name)), commit=True)
+
+    def drop_table(self, table_name):
+        self.execute_stmt(SQL('DROP TABLE {}').format(
+            Identifier(table_name)), commit=True)
+
     def record_table_definitions(self, tables_def, meta_table_name):
         meta_table = Identifier(meta_table_name)
         self.execute_stmt(SQL(
@@ -183,37 +236,45 @@ class PostgreSqlFuncts(DbDriver):
             table_name = agg_type + '_' + agg_period
         else:
             table_name = self.data_table
-        topic_id = Literal(0)
-        query = [SQL(
-            '''SELECT to_char(ts, 'YYYY-MM-DD"T"HH24:MI:SS.USOF:00'), '''
-                'value_string\n'
-            'FROM {}\n'
-            'WHERE topic_id = {}'
-        ).format(Identifier(table_name), topic_id)]
+        where = []
         if start and start.tzinfo != pytz.UTC:
             start = start.astimezone(pytz.UTC)
         if end and end.tzinfo != pytz.UTC:
             end = end.astimezone(pytz.UTC)
         if start and start == end:
-            query.append(SQL(' AND ts = {}').format(Literal(start)))
+            where.append(SQL(' AND ts = {}').format(Literal(start)))
         else:
             if start:
-                query.append(SQL(' AND ts >= {}').format(Literal(start)))
+                where.append(SQL(' AND ts >= {}').format(Literal(start)))
             if end:
-                query.append(SQL(' AND ts < {}').format(Literal(end)))
-        query.append(SQL('ORDER BY ts {}'.format(
-            'DESC' if order == 'LAST_TO_FIRST' else 'ASC')))
+                where.append(SQL(' AND ts < {}').format(Literal(end)))
+        where = SQL('').join(where)
+        order_by = SQL('ORDER BY ts {}'.format(
+            'DESC' if order == 'LAST_TO_FIRST' else 'ASC'))
+        limit = SQL('')
         if skip or count:
-            query.append(SQL('LIMIT {} OFFSET {}').format(
+            limit = SQL('LIMIT {} OFFSET {}').format(
                 Literal(None if not count or count < 0 else count),
-                Literal(None if not skip or skip < 0 else skip)))
-        query = SQL('\n').join(query)
-        values = {}
-        for topic_id._wrapped in topic_ids:
-            name = id_name_map[topic_id.wrapped]
+                Literal(None if not skip or skip < 0 else skip))
+        # Aggregate tables always store JSON values.
+        typed = table_name == self.data_table and self.has_typed_values()
+        value_columns = _TYPED_VALUES_SQL if typed else SQL('value_string')
+        # All topics are fetched with one statement, a union of one select
+        # per topic so each topic gets its own limit.
+        values = dict((id_name_map[topic_id], []) for topic_id in topic_ids)
+        for chunk in topic_id_chunks(topic_ids):
+            query = SQL('\nUNION ALL\n').join(
+                SQL('(SELECT topic_id, '
+                    '''to_char(ts, 'YYYY-MM-DD"T"HH24:MI:SS.USOF:00'), '''
+                    '{}\n'
+                    'FROM {}\n'
+                    'WHERE topic_id = {}{}\n'
+                    '{}\n'
+                    '{})').format(value_columns, Identifier(table_name),
+                                  Literal(topic_id), where, order_by, limit)
+                for topic_id in chunk)
             with self.select(query, fetch_all=False) as cursor:
-                values[name] = [(ts, jsonapi.loads(value))
-                                for ts, value in cursor]
+                collect_query_rows(values, cursor, id_name_map, typed=typed)
         return values
 
     def insert_topic(self, topic):
@@ -241,6 +302,20 @@ class PostgreSqlFuncts(DbDriver):
             'SET value_string = EXCLUDED.value_string').format(
             Identifier(self.data_table))
 
+    def insert_typed_data_query(self, table_name=None):
+        return SQL(
+            'INSERT INTO {} {} VALUES (%s, %s, %s, %s, %s, %s) '
+            'ON CONFLICT (ts, topic_id) DO UPDATE '
+            'SET {}').format(
+            Identifier(table_name or self.data_table), _TYPED_COLUMNS_SQL,
+            _TYPED_UPDATE_SQL)
+
+    def select_data_batch_query(self, table_name):
+        return SQL(
+            'SELECT ts, value_string FROM {} '
+            'WHERE topic_id = %s AND ts > %s '
+            'ORDER BY ts ASC LIMIT %s').format(Identifier(table_name))
+
     def insert_topic_query(self):
         return SQL(
             'INSERT INTO {} (topic_name) VALUES (%(topic)s) '
@@ -348,8 +423,10 @@ class PostgreSqlFuncts(DbDriver):
                 agg_type.upper() not in self.get_aggregation_list()):
             raise ValueError('Invalid aggregation type {}'.format(agg_type))
         query = [
-            SQL('SELECT {}(CAST(value_string as float)), COUNT(value_string)'.format(
-                agg_type.upper())),
+            SQL('SELECT {0}({1}), COUNT({1})'.format(
+                agg_type.upper(),
+                'COALESCE(value_double, value_int)'
+                if self.has_typed_values() else 'CAST(value_string as float)')),
             SQL('FROM {}').format(Identifier(self.data_table)),
             SQL('WHERE topic_id in ({})').format(
                 SQL(', ').join(Literal(tid) for tid in topic_ids)),
@@ -105,7 +105,9 @@ class RedshiftFuncts(DbDriver):
         except InterfaceError:
             return False
 
-    def setup_historian_tables(self):
+    def setup_historian_tables(self, typed_values=False):
+        if typed_values:
+            raise ValueError('Typed values are not supported by Redshift')
         self.execute_stmt(SQL(
             'CREATE TABLE IF NOT EXISTS {} ('
                 'ts TIMESTAMP SORTKEY NOT NULL, '
@@ -36,18 +36,19 @@
 # under Contract DE-AC05-76RL01830
 # }}}
 import ast
+import contextlib
 import errno
 import logging
 import sqlite3
 import pytz
 import threading
-from collections import defaultdict
 from datetime import datetime
 from math import ceil
 
 import os
 import re
-from basedb import DbDriver
+from basedb import (DbDriver, TYPED_VALUE_COLUMNS, collect_query_rows,
+                    topic_id_chunks, typed_value_columns)
 from volttron.platform.agent import utils
 from volttron.platform.agent import json as jsonapi
 
@@ -58,6 +59,18 @@ from volttron.platform.agent.utils import fix_sqlite3_datetime
 #Make sure sqlite3 datetime adapters are updated.
 fix_sqlite3_datetime()
 
+# Timestamps as stored by the sqlite3 adapter registered above, which is
+# also the format returned by queries.
+STORED_TIMESTAMP_REX = re.compile(
+    r'\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d\.\d{6}([+-]\d\d:\d\d)?$')
+
+
+def _format_stored_timestamp(ts):
+    if STORED_TIMESTAMP_REX.match(ts):
+        return ts
+    return utils.format_timestamp(utils.parse_timestamp_string(ts))
+
+
 """
 Implementation of SQLite3 database operation for
 :py:class:`sqlhistorian.historian.SQLHistorian` and
@@ -113,7 +126,34 @@ class SqlLiteFuncts(DbDriver):
         _log.debug("In sqlitefuncts connect params {}".format(connect_params))
         super(SqlLiteFuncts, self).__init__('sqlite3', **connect_params)
 
-    def setup_historian_tables(self):
+    @contextlib.contextmanager
+    def bulk_insert(self):
+        """
+        Collects the rows of a bulk insert and writes them with one
+        executemany instead of a statement per row.
+
+        :yields: insert method
+        """
+        rows = []
+        if self.has_typed_values():
+            query = self.insert_typed_data_query()
+
+            def insert_data(ts, topic_id, data):
+                rows.append((ts, topic_id) + typed_value_columns(data))
+                return True
+        else:
+            query = self.insert_data_query()
+
+            def insert_data(ts, topic_id, data):
+                rows.append((ts, topic_id, jsonapi.dumps(data)))
+                return True
+
+        yield insert_data
+
+        if rows:
+            self.execute_many(query, rows)
+
+    def setup_historian_tables(self, typed_values=False):
 
         result = self.select('''PRAGMA auto_vacuum''')
         auto_vacuum = result[0][0]
@@ -125,15 +165,12 @@ class SqlLiteFuncts(DbDriver):
             self.select('''PRAGMA auto_vacuum=1''')
             self.select('''VACUUM;''')
 
-        self.execute_stmt(
-            '''CREATE TABLE IF NOT EXISTS ''' + self.data_table +
-            ''' (ts timestamp NOT NULL,
-                 topic_id INTEGER NOT NULL,
-                 value_string TEXT NOT NULL,
-                 UNIQUE(topic_id, ts))''',commit=False)
-        self.execute_stmt(
-            '''CREATE INDEX IF NOT EXISTS data_idx 
-            ON ''' + self.data_table + ''' (ts ASC)''', commit=False)
+        if not self.get_data_columns():
+            self.create_data_table(self.data_table, typed_values)
+        elif typed_values and not self.has_typed_values():
+            _log.warning("Data table {} stores values as JSON. Run "
+                         "migrate_typed_values.py to convert it to typed "
+                         "values.".format(self.data_table))
         self.execute_stmt(
             '''CREATE TABLE IF NOT EXISTS ''' + self.topics_table +
             ''' (topic_id INTEGER PRIMARY KEY,
@@ -145,6 +182,27 @@ class SqlLiteFuncts(DbDriver):
                 metadata TEXT NOT NULL)''', commit=True)
         _log.debug("Created data topics and meta tables")
 
+    def create_data_table(self, table_name, typed_values=False):
+        if typed_values:
+            value_columns = '''value_double REAL,
+                 value_int INTEGER,
+                 value_bool INTEGER,
+                 value_string TEXT,'''
+        else:
+            value_columns = '''value_string TEXT NOT NULL,'''
+        self.execute_stmt(
+            '''CREATE TABLE IF NOT EXISTS ''' + table_name +
+            ''' (ts timestamp NOT NULL,
+                 topic_id INTEGER NOT NULL,
+                 ''' + value_columns + '''
+                 UNIQUE(topic_id, ts))''', commit=False)
+        self.execute_stmt(
+            '''CREATE INDEX IF NOT EXISTS idx_''' + table_name +
+            ''' ON ''' + table_name + ''' (ts ASC)''', commit=True)
+
+    def get_data_columns(self):
+        rows = self.select('''PRAGMA table_info(''' + self.data_table + ''')''')
+        return [row[1] for row in rows]
 
     def record_table_definitions(self, table_defs, meta_table_name):
         _log.debug(
@@ -219,15 +277,8 @@ class SqlLiteFuncts(DbDriver):
         if agg_type and agg_period:
             table_name = agg_type + "_" + agg_period
 
-        query = '''SELECT topic_id, ts, value_string
-                   FROM ''' + table_name + '''
-                   {where}
-                   {order_by}
-                   {limit}
-                   {offset}'''
-
-        where_clauses = ["WHERE topic_id = ?"]
-        args = [topic_ids[0]]
+        where_clauses = []
+        args = []
 
         # base historian converts naive timestamps to UTC, but if the
         # start and end had explicit timezone info then they need to get
@@ -248,45 +299,64 @@ class SqlLiteFuncts(DbDriver):
                 where_clauses.append("ts < ?")
                 args.append(end)
 
-
-        where_statement = ' AND '.join(where_clauses)
-
-        order_by = 'ORDER BY topic_id ASC, ts ASC'
-        if order == 'LAST_TO_FIRST':
-            order_by = ' ORDER BY topic_id DESC, ts DESC'
-
-        # can't have an offset without a limit
-        # -1 = no limit and allows the user to
-        # provide just an offset
-        if count is None:
-            count = -1
-
-        limit_statement = 'LIMIT ?'
-        args.append(count)
-
-        offset_statement = ''
-        if skip > 0:
-            offset_statement = 'OFFSET ?'
-            args.append(skip)
-
-        real_query = query.format(where=where_statement,
-                                  limit=limit_statement,
-                                  offset=offset_statement,
-                                  order_by=order_by)
-        _log.debug("Real Query: " + real_query)
-        _log.debug("args: " + str(args))
-
-
-        values = defaultdict(list)
+        direction = 'DESC' if order == 'LAST_TO_FIRST' else 'ASC'
+
+        # Aggregate tables always store JSON values.
+        typed = table_name == self.data_table and self.has_typed_values()
+        value_columns = 'value_string'
+        if typed:
+            value_columns = ', '.join(TYPED_VALUE_COLUMNS)
+
+        # All topics are fetched with one statement. The timestamps are
+        # selected as stored, without the timestamp converter, to be
+        # formatted once per distinct value.
+        limited = count is not None and count >= 0
+        if not limited:
+            # Skipping is done while collecting the rows.
+            query = '''SELECT topic_id, CAST(ts AS TEXT), ''' + value_columns + '''
+                       FROM ''' + table_name + '''
+                       WHERE topic_id IN ({topics}){where}
+                       ORDER BY topic_id {direction}, ts {direction}'''
+        else:
+            # Each topic gets its own limit through a compound select of
+            # one select per topic. The limit and offset are written into
+            # the statement so that a chunk of topics stays below the 999
+            # variables older SQLite builds allow.
+            query = '''SELECT * FROM (
+                       SELECT topic_id, CAST(ts AS TEXT), ''' + value_columns + '''
+                       FROM ''' + table_name + '''
+                       WHERE topic_id = ?{where}
+                       ORDER BY ts {direction}
+                       LIMIT {limit} OFFSET {offset})'''
+
+        where_statement = ''.join(' AND ' + clause for clause in where_clauses)
+
+        values = dict((id_name_map[topic_id], []) for topic_id in topic_ids)
         start_t = datetime.utcnow()
-        for topic_id in topic_ids:
-            args[0] = topic_id
-            values[id_name_map[topic_id]] = []
-            cursor = self.select(real_query, args, fetch_all=False)
+        for chunk in topic_id_chunks(topic_ids):
+            if not limited:
+                real_query = query.format(topics=', '.join('?' * len(chunk)),
+                                          where=where_statement,
+                                          direction=direction)
+                real_args = list(chunk) + args
+            else:
+                real_query = '\nUNION ALL\n'.join(
+                    [query.format(where=where_statement,
+                                  direction=direction,
+                                  limit=int(count),
+                                  offset=max(int(skip), 0))] * len(chunk))
+                real_args = []
+                for topic_id in chunk:
+                    real_args.extend([topic_id] + args)
+            _log.debug("Real Query: " + real_query)
+            _log.debug("args: " + str(real_args))
+
+            cursor = self.select(real_query, real_args, fetch_all=False)
             if cursor:
-                for _id, ts, value in cursor:
-                    values[id_name_map[topic_id]].append(
-                        (utils.format_timestamp(ts), jsonapi.loads(value)))
+                collect_query_rows(values, cursor, id_name_map,
+                                   skip=0 if limited else skip,
+                                   format_ts=_format_stored_timestamp,
+                                   typed=typed)
                 cursor.close()
 
         _log.debug("Time taken to load results from db:{}".format(
@@ -348,6 +418,17 @@ class SqlLiteFuncts(DbDriver):
         return '''INSERT OR REPLACE INTO ''' + self.data_table + \
                ''' values(?, ?, ?)'''
 
+    def insert_typed_data_query(self, table_name=None):
+        return '''INSERT OR REPLACE INTO ''' + \
+               (table_name or self.data_table) + \
+               ''' (ts, topic_id, ''' + ', '.join(TYPED_VALUE_COLUMNS) + \
+               ''') values(?, ?, ?, ?, ?, ?)'''
+
+    def select_data_batch_query(self, table_name):
+        return '''SELECT ts, value_string FROM ''' + table_name + '''
+               WHERE topic_id = ? AND ts > ?
+               ORDER BY ts ASC LIMIT ?'''
+
     def insert_topic_query(self):
         return '''INSERT INTO ''' + self.topics_table + \
                ''' (topic_name) values (?)'''
@@ -521,9 +602,13 @@ class SqlLiteFuncts(DbDriver):
             if agg_type.upper() not in ['AVG', 'MIN', 'MAX', 'COUNT', 'SUM']:
                 raise ValueError(
                     "Invalid aggregation type {}".format(agg_type))
+        value = 'value_string'
+        if self.has_typed_values():
+            # Booleans are left out, as JSON true and false are not summed
+            value = 'COALESCE(value_double, value_int)'
         query = '''SELECT ''' \
-                + agg_type + '''(value_string), count(value_string) FROM ''' \
-                + self.data_table + ''' {where}'''
+                + agg_type + '''(''' + value + '''), count(''' + value + \
+                ''') FROM ''' + self.data_table + ''' {where}'''
 
         where_clauses = ["WHERE topic_id = ?"]
         args = [topic_ids[0]]
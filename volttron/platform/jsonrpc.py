@@ -42,6 +42,7 @@ See http://www.jsonrpc.org/specification for the complete specification.
 '''
 
 import sys
+import time
 from contextlib import contextmanager
 
 from volttron.platform.agent import json as jsonapi
@@ -238,8 +239,13 @@ class Dispatcher(object):
     Subclasses must implement the serialize and deserialize methods with
     the JSON library of choice. The exception, result, error, method and
     batch handling methods should also be implemented.
+
+    If stats is set, stats.record(name, seconds, failed) is called after
+    each implemented method returns or raises.
     '''
 
+    stats = None
+
     def serialize(self, json_obj):
         '''Pack compatible Python objects into and return JSON string.'''
         raise NotImplementedError()
@@ -397,6 +403,9 @@ class Dispatcher(object):
                     None, INVALID_PARAMS, 'invalid object type',
                     detail='expected a list or dictionary (object); '
                            'got a {!r} instead'.format(type(params).__name__))
+            stats = self.stats
+            if stats is not None:
+                started = time.time()
             try:
                 result = self.method(msg, ident, name, args, kwargs,
                                      batch=batch, context=context)
@@ -407,6 +416,8 @@ class Dispatcher(object):
                     ident, METHOD_NOT_FOUND, 'unimplemented method',
                     detail='method {!r} is not implemented'.format(name))
             except Exception as exc:   # pylint: disable=broad-except
+                if stats is not None:
+                    stats.record(name, time.time() - started, True)
                 if ident is None:
                     return
                 exc_info = getattr(exc, 'exc_info', {})
@@ -425,5 +436,7 @@ class Dispatcher(object):
                 error = {'detail': str(exc), 'exception.py': exc_info}
                 return json_error(ident, UNHANDLED_EXCEPTION,   # pylint: disable=star-args
                                   'unhandled exception', **error)
+            if stats is not None:
+                stats.record(name, time.time() - started, False)
             if ident is not None:
                 return json_result(ident, result)
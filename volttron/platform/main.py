@@ -52,6 +52,7 @@ import struct
 import sys
 import threading
 import uuid
+from collections import deque
 
 import gevent
 from gevent.fileobject import FileObject
@@ -82,7 +83,9 @@ from .agent import utils
 from .agent.known_identities import MASTER_WEB, CONFIGURATION_STORE, AUTH
 from .vip.agent.subsystems.pubsub import ProtectedPubSubTopics
 from .keystore import KeyStore, KnownHostsStore
-from .vip.pubsubservice import PubSubService
+from .vip.pubsubservice import PubSubService, QUEUE_POLICIES, QUEUE_DROP
+from .vip.retained import LastValueCache
+from .vip.codec import available_codecs
 from .vip.routingservice import RoutingService
 from .vip.externalrpcservice import ExternalRPCService
 from .vip.keydiscovery import KeyDiscoveryAgent
@@ -111,6 +114,14 @@ logging.getLogger("watchdog.observers.inotify_buffer").setLevel(logging.INFO)
 logging.getLogger("urllib3.connectionpool").setLevel(logging.INFO)
 VOLTTRON_INSTANCES = '~/.volttron_instances'
 
+# Milliseconds the router waits for messages while publishes are queued for slow subscribers
+PUBSUB_FLUSH_INTERVAL = 10
+# With deferred fanout, the messages read ahead of fanning out publishes, the publishes fanned out at a time and
+# the publishes which may be waiting before the router stops reading messages to catch up
+ROUTE_READ_AHEAD = 100
+PUBSUB_FANOUT_BATCH = 20
+PUBSUB_FANOUT_BACKLOG = 10000
+
 
 def log_to_file(file_, level=logging.WARNING,
                 handler_class=logging.StreamHandler):
@@ -265,7 +276,11 @@ class Router(BaseRouter):
                  volttron_central_address=None, instance_name=None,
                  bind_web_address=None, volttron_central_serverkey=None,
                  protected_topics={}, external_address_file='',
-                 msgdebug=None, agent_monitor_frequency=600):
+                 msgdebug=None, agent_monitor_frequency=600,
+                 retain_topics=(), retain_max_topics=10000,
+                 retain_max_bytes=50 * 1024 * 1024, retain_expiry=None,
+                 pubsub_queue_policy=QUEUE_DROP, pubsub_queue_length=1000,
+                 codecs=None, topic_ids=True, defer_pubsub_fanout=False):
 
         super(Router, self).__init__(
             context=context, default_user_id=default_user_id)
@@ -279,6 +294,8 @@ class Router(BaseRouter):
             self.logger.setLevel(logging.WARNING)
         self._monitor = monitor
         self._tracker = tracker
+        # Routed messages are only formatted for the log if it would show them
+        self._log_messages = self.logger.isEnabledFor(logging.DEBUG)
         self._volttron_central_address = volttron_central_address
         if self._volttron_central_address:
             parsed = urlparse(self._volttron_central_address)
@@ -299,6 +316,29 @@ class Router(BaseRouter):
         self._message_debugger_socket = None
         self._instance_name = instance_name
         self._agent_monitor_frequency = agent_monitor_frequency
+        self._retain_topics = retain_topics
+        self._retain_max_topics = retain_max_topics
+        self._retain_max_bytes = retain_max_bytes
+        self._retain_expiry = retain_expiry
+        self._pubsub_queue_policy = pubsub_queue_policy
+        self._pubsub_queue_length = pubsub_queue_length
+        if codecs:
+            self.accepted_codecs = codecs
+        self.topic_ids = topic_ids
+        # Publishes waiting to be fanned out to their subscribers after the requests routed ahead of them
+        self._defer_fanout = defer_pubsub_fanout
+        self._fanout = deque()
+        self._observe()
+        if tracker is not None:
+            tracker.register(self._observe)
+
+    def _observe(self):
+        '''Report routed messages to issue() only while something uses them.'''
+        tracker = self._tracker
+        self.observed = bool(self._log_messages or self._msgdebug or
+                             (tracker and (tracker.enabled or tracker.tracing is not None)))
+        # The tracker times how long the router takes for each message
+        self._timed = bool(tracker and tracker.enabled)
 
     def setup(self):
         sock = self.socket
@@ -338,25 +378,37 @@ class Router(BaseRouter):
                                            self._socket_class, self._poller,
                                            self._addr, self._instance_name)
 
+        retained = None
+        if self._retain_topics:
+            retained = LastValueCache(self._retain_topics,
+                                      max_topics=self._retain_max_topics,
+                                      max_bytes=self._retain_max_bytes,
+                                      expiry=self._retain_expiry)
         self.pubsub = PubSubService(self.socket,
                                     self._protected_topics,
-                                    self._ext_routing)
+                                    self._ext_routing,
+                                    retained=retained,
+                                    queue_policy=self._pubsub_queue_policy,
+                                    queue_length=self._pubsub_queue_length,
+                                    codecs=self._codecs,
+                                    topic_tables=self._topic_tables)
         self.ext_rpc = ExternalRPCService(self.socket,
                                           self._ext_routing)
         self._poller.register(sock, zmq.POLLIN)
         _log.debug("ZMQ version: {}".format(zmq.zmq_version()))
 
     def issue(self, topic, frames, extra=None):
-        log = self.logger.debug
-        formatter = FramesFormatter(frames)
-        if topic == ERROR:
-            errnum, errmsg = extra
-            log('%s (%s): %s', errmsg, errnum, formatter)
-        elif topic == UNROUTABLE:
-            log('unroutable: %s: %s', extra, formatter)
-        else:
-            log('%s: %s',
-                ('incoming' if topic == INCOMING else 'outgoing'), formatter)
+        if self._log_messages or topic == ERROR or topic == UNROUTABLE:
+            log = self.logger.debug
+            formatter = FramesFormatter(frames)
+            if topic == ERROR:
+                errnum, errmsg = extra
+                log('%s (%s): %s', errmsg, errnum, formatter)
+            elif topic == UNROUTABLE:
+                log('unroutable: %s: %s', extra, formatter)
+            else:
+                log('%s: %s',
+                    ('incoming' if topic == INCOMING else 'outgoing'), formatter)
         if self._tracker:
             self._tracker.hit(topic, frames, extra)
         if self._msgdebug:
@@ -427,6 +479,12 @@ class Router(BaseRouter):
             frames[3] = b''
             return frames
         elif subsystem == b'pubsub':
+            # Other pubsub requests, such as subscribe and unsubscribe, follow deferred publishes so that they are
+            # not applied ahead of publishes received before them
+            if self._defer_fanout and (self._fanout or (
+                    len(frames) > 6 and bytes(frames[6]) in (b'publish', b'publish_batch'))):
+                self._fanout.append((frames, user_id))
+                return False
             result = self.pubsub.handle_subsystem(frames, user_id)
             return result
         elif subsystem == b'routing_table':
@@ -436,6 +494,18 @@ class Router(BaseRouter):
             result = self.ext_rpc.handle_subsystem(frames)
             return result
 
+    def _fan_out(self, count=PUBSUB_FANOUT_BATCH):
+        """
+        Fan out up to count of the deferred publishes to their subscribers
+        """
+        fanout = self._fanout
+        for _ in xrange(min(count, len(fanout))):
+            frames, user_id = fanout.popleft()
+            response = self.pubsub.handle_subsystem(frames, user_id)
+            if response:
+                for peer in self._send(response):
+                    self._drop_peer(peer)
+
     def _drop_pubsub_peers(self, peer):
         self.pubsub.peer_drop(peer)
 
@@ -446,16 +516,28 @@ class Router(BaseRouter):
         """
         Poll for incoming messages through router socket or other external socket connections
         """
+        # Wake up periodically while publishes are queued for slow subscribers so they are retried
+        if self._fanout:
+            timeout = 0
+        elif self.pubsub.backlogged():
+            timeout = PUBSUB_FLUSH_INTERVAL
+        else:
+            timeout = None
         try:
-            sockets = dict(self._poller.poll())
+            sockets = dict(self._poller.poll(timeout))
         except ZMQError as ex:
             _log.error("ZMQ Error while polling: {}".format(ex))
 
         for sock in sockets:
             if sock == self.socket:
-                if sockets[sock] == zmq.POLLIN:
+                # Publishers outpacing the fanout are held back by the socket's high water mark
+                if sockets[sock] == zmq.POLLIN and len(self._fanout) < PUBSUB_FANOUT_BACKLOG:
                     frames = sock.recv_multipart(copy=False)
                     self.route(frames)
+                    if self._timed:
+                        self._tracker.routed()
+                    if self._defer_fanout:
+                        self._read_ahead(sock)
             elif sock in self._ext_routing._vip_sockets:
                 if sockets[sock] == zmq.POLLIN:
                     # _log.debug("From Ext Socket: ")
@@ -466,6 +548,29 @@ class Router(BaseRouter):
                 # _log.debug("External ")
                 frames = sock.recv_multipart(copy=False)
 
+        if self._fanout:
+            self._fan_out()
+        if self.pubsub.backlogged():
+            self.pubsub.flush_queues()
+
+    def _read_ahead(self, sock):
+        """
+        Route the messages already waiting on the socket, deferring the fanout of publishes among them, so that
+        requests arriving during a burst of publishes are not held up behind it
+        """
+        for _ in xrange(ROUTE_READ_AHEAD):
+            if len(self._fanout) >= PUBSUB_FANOUT_BACKLOG:
+                return
+            try:
+                frames = sock.recv_multipart(flags=zmq.NOBLOCK, copy=False)
+            except ZMQError as exc:
+                if exc.errno == zmq.EAGAIN:
+                    return
+                raise
+            self.route(frames)
+            if self._timed:
+                self._tracker.routed()
+
     def ext_route(self, socket):
         """
         Handler function for message received through external socket connection
@@ -745,7 +850,16 @@ def start_volttron_process(opts):
                    bind_web_address=opts.bind_web_address,
                    protected_topics=protected_topics,
                    external_address_file=external_address_file,
-                   msgdebug=opts.msgdebug).run()
+                   msgdebug=opts.msgdebug,
+                   retain_topics=opts.retain_topic,
+                   retain_max_topics=opts.retain_max_topics,
+                   retain_max_bytes=opts.retain_max_bytes,
+                   retain_expiry=opts.retain_expiry,
+                   pubsub_queue_policy=opts.pubsub_queue_policy,
+                   pubsub_queue_length=opts.pubsub_queue_length,
+                   codecs=opts.vip_codec,
+                   topic_ids=opts.topic_ids,
+                   defer_pubsub_fanout=opts.defer_pubsub_fanout).run()
         except Exception:
             _log.exception('Unhandled exception in router loop')
             raise
@@ -1135,6 +1249,47 @@ def main(argv=sys.argv):
         '--agent-monitor-frequency', default=600,
         help='How often should the platform check for crashed agents and '
              'attempt to restart. Units=seconds. Default=600')
+    agents.add_argument(
+        '--retain-topic', metavar='PREFIX', action='append', default=[],
+        help='keep the last message of topics beginning with PREFIX for '
+             'replay to new subscribers (may be given more than once)')
+    agents.add_argument(
+        '--retain-max-topics', metavar='COUNT', type=int, default=10000,
+        help='maximum number of retained messages. Default=10000')
+    agents.add_argument(
+        '--retain-max-bytes', metavar='BYTES', type=int,
+        default=50 * 1024 * 1024,
+        help='maximum size of retained messages. Default=52428800')
+    agents.add_argument(
+        '--retain-expiry', metavar='SECONDS', type=float, default=None,
+        help='do not replay retained messages older than SECONDS')
+    agents.add_argument(
+        '--pubsub-queue-policy', choices=QUEUE_POLICIES, default=QUEUE_DROP,
+        help='what to do with publishes to subscribers that cannot keep '
+             'up: drop them (the default), block the router, queue them '
+             'dropping the oldest, or queue them keeping only the latest '
+             'publish per topic (conflate)')
+    agents.add_argument(
+        '--pubsub-queue-length', metavar='COUNT', type=int, default=1000,
+        help='maximum number of publishes queued per subscriber. '
+             'Default=1000')
+    agents.add_argument(
+        '--vip-codec', action='append', default=[],
+        choices=available_codecs(),
+        help='codec agents may use for messages, most preferred first '
+             '(may be given more than once). Default is msgpack if it is '
+             'installed, then json')
+    agents.add_argument(
+        '--defer-pubsub-fanout', action='store_true',
+        help='route RPC, control and other requests ahead of pending '
+             'publishes, fanning publishes out to subscribers in between')
+    agents.add_argument(
+        '--topic-ids', action='store_true', inverse='--no-topic-ids',
+        help='let agents refer to pubsub topics by ids negotiated on '
+             'their connection')
+    agents.add_argument(
+        '--no-topic-ids', action='store_false', dest='topic_ids',
+        help=argparse.SUPPRESS)
 
     # XXX: re-implement control options
     # on
@@ -1200,6 +1355,8 @@ def main(argv=sys.argv):
         verboseness=logging.WARNING,
         volttron_home=volttron_home,
         autostart=True,
+        topic_ids=True,
+        defer_pubsub_fanout=False,
         publish_address=ipc + 'publish',
         subscribe_address=ipc + 'subscribe',
         vip_address=[],
@@ -67,7 +67,8 @@ from volttron.utils.rmq_mgmt import RabbitMQMgmt
 from .decorators import annotate, annotations, dualmethod
 from .dispatch import Signal
 from .errors import VIPError
-from .. import router
+from .. import codec, router
+from ..topicids import TOPIC_IDS
 from ..rmq_connection import RMQConnection
 from ..socket import Message
 from ..zmq_connection import ZMQConnection
@@ -500,6 +501,10 @@ class Core(BasicCore):
         self._version = version
         self.socket = None
         self.connection = None
+        # Codec for message payloads negotiated with the router
+        self.codec = codec.JSON
+        # Whether pubsub topics are interned on the connection
+        self.topic_ids = False
 
         _log.debug('address: %s', address)
         _log.debug('identity: %s', self.identity)
@@ -592,7 +597,8 @@ class Core(BasicCore):
             state.count += 1
             self.spawn(connection_failed_check)
             message = Message(peer=b'', subsystem=b'hello',
-                              id=ident, args=[b'hello'])
+                              id=ident, args=[b'hello', b','.join(codec.available_codecs()),
+                                    TOPIC_IDS])
             self.connection.send_vip_object(message)
 
         def hello_response(sender, version='',
@@ -822,6 +828,11 @@ class ZMQCore(Core):
                         bytes(message.args[0]) == b'welcome'):
                     version, server, identity = [
                         bytes(x) for x in message.args[1:4]]
+                    # Older routers do not negotiate a codec
+                    self.codec = (bytes(message.args[4])
+                                  if len(message.args) > 4 else codec.JSON)
+                    self.topic_ids = (len(message.args) > 5 and
+                                      bytes(message.args[5]) == TOPIC_IDS)
                     self.connected = True
                     self.onconnected.send(self, version=version,
                                           router=server, identity=identity)
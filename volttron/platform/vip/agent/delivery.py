@@ -0,0 +1,273 @@
+# -*- coding: utf-8 -*- {{{
+# vim: set fenc=utf-8 ft=python sw=4 ts=4 sts=4 et:
+#
+# Copyright 2017, Battelle Memorial Institute.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# This material was prepared as an account of work sponsored by an agency of
+# the United States Government. Neither the United States Government nor the
+# United States Department of Energy, nor Battelle, nor any of their
+# employees, nor any jurisdiction or organization that has cooperated in the
+# development of these materials, makes any warranty, express or
+# implied, or assumes any legal liability or responsibility for the accuracy,
+# completeness, or usefulness or any information, apparatus, product,
+# software, or process disclosed, or represents that its use would not infringe
+# privately owned rights. Reference herein to any specific commercial product,
+# process, or service by trade name, trademark, manufacturer, or otherwise
+# does not necessarily constitute or imply its endorsement, recommendation, or
+# favoring by the United States Government or any agency thereof, or
+# Battelle Memorial Institute. The views and opinions of authors expressed
+# herein do not necessarily state or reflect those of the
+# United States Government or any agency thereof.
+#
+# PACIFIC NORTHWEST NATIONAL LABORATORY operated by
+# BATTELLE for the UNITED STATES DEPARTMENT OF ENERGY
+# under Contract DE-AC05-76RL01830
+# }}}
+
+'''Bounded execution of pubsub callbacks.
+
+By default every incoming message is handled in a greenlet of its own,
+so a burst of messages creates an unbounded number of greenlets. A
+CallbackDispatcher instead runs callbacks inline, on a bounded pool of
+worker greenlets or in order per topic, and applies an overflow policy
+once max_pending messages are waiting.
+'''
+
+
+from __future__ import absolute_import
+
+from collections import deque
+import logging
+import time
+
+import gevent
+
+
+__all__ = ['CallbackDispatcher', 'SPAWN', 'INLINE', 'POOL', 'ORDERED',
+           'DROP_NEWEST', 'DROP_OLDEST', 'CONFLATE']
+
+_log = logging.getLogger(__name__)
+
+# Dispatch modes
+SPAWN = 'spawn'
+INLINE = 'inline'
+POOL = 'pool'
+ORDERED = 'ordered'
+
+# Overflow policies
+DROP_NEWEST = 'drop_newest'
+DROP_OLDEST = 'drop_oldest'
+CONFLATE = 'conflate'
+
+_MODES = (SPAWN, INLINE, POOL, ORDERED)
+_POLICIES = (DROP_NEWEST, DROP_OLDEST, CONFLATE)
+
+
+class _Entry(object):
+    __slots__ = ('key', 'func', 'args', 'queued', 'cancelled')
+
+    def __init__(self, key, func, args):
+        self.key = key
+        self.func = func
+        self.args = args
+        self.queued = time.time()
+        self.cancelled = False
+
+
+class CallbackDispatcher(object):
+    '''Run callbacks for incoming messages.
+
+    mode is one of:
+
+    spawn
+        Run every message in a new greenlet, without any limit.
+    inline
+        Run the callbacks in the greenlet receiving the messages, which
+        stops receiving until they return. Callbacks must not wait on
+        results of the same subsystem.
+    pool
+        Run the callbacks on at most size worker greenlets.
+    ordered
+        Like pool, but messages for the same key (the topic) run one at
+        a time in the order they were received.
+
+    In pool and ordered modes at most max_pending messages wait for a
+    worker. policy decides what happens to the next one: drop_newest
+    discards it, drop_oldest discards the oldest waiting message and
+    conflate replaces a waiting message for the same key with it, so
+    only the latest value per topic is kept, falling back to
+    drop_oldest. Messages with a key of None are never conflated. In
+    ordered mode messages are only dropped from the
+    queue of their own key; if it is empty the new message is dropped.
+    '''
+
+    def __init__(self, mode=SPAWN, size=10, max_pending=1000,
+                 policy=DROP_OLDEST):
+        if mode not in _MODES:
+            raise ValueError('invalid dispatch mode: {!r}'.format(mode))
+        if policy not in _POLICIES:
+            raise ValueError('invalid overflow policy: {!r}'.format(policy))
+        if size < 1 or max_pending < 1:
+            raise ValueError('size and max_pending must be positive')
+        self.mode = mode
+        self.size = size
+        self.max_pending = max_pending
+        self.policy = policy
+        # Entries waiting for a worker, in arrival order (pool mode)
+        self._queue = deque()
+        # Waiting entries by key (ordered mode) and the keys which have
+        # waiting entries but no worker (ordered mode)
+        self._keyed = {}
+        self._ready = deque()
+        # Latest waiting entry per key, for conflation
+        self._latest = {}
+        self._pending = 0
+        self._workers = 0
+        self._dispatched = 0
+        self._dropped = 0
+        self._conflated = 0
+        self._max_depth = 0
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+
+    def dispatch(self, key, func, *args):
+        '''Run func(*args) for a message with the given key.'''
+        if self.mode == INLINE:
+            self._run(_Entry(key, func, args))
+        elif self.mode == SPAWN:
+            gevent.spawn(self._run, _Entry(key, func, args))
+        else:
+            self._enqueue(_Entry(key, func, args))
+
+    def stats(self):
+        '''Return a dictionary of queue depth and latency statistics.
+
+        latency is the time in seconds messages waited before their
+        callbacks started.
+        '''
+        count = self._dispatched
+        return {
+            'mode': self.mode,
+            'pending': self._pending,
+            'max_depth': self._max_depth,
+            'workers': self._workers,
+            'dispatched': count,
+            'dropped': self._dropped,
+            'conflated': self._conflated,
+            'latency_avg': self._latency_total / count if count else 0.0,
+            'latency_max': self._latency_max,
+        }
+
+    def _enqueue(self, entry):
+        key = entry.key
+        conflate = self.policy == CONFLATE and key is not None
+        if conflate:
+            waiting = self._latest.get(key)
+            if waiting is not None:
+                # Keep the position of the waiting message, but deliver
+                # the newest value.
+                waiting.func = entry.func
+                waiting.args = entry.args
+                self._conflated += 1
+                return
+        if self._pending >= self.max_pending and not self._make_room(key):
+            self._dropped += 1
+            return
+        if self.mode == ORDERED:
+            queue = self._keyed.get(key)
+            if queue is None:
+                queue = self._keyed[key] = deque()
+                self._ready.append(key)
+            queue.append(entry)
+        else:
+            self._queue.append(entry)
+        if conflate:
+            self._latest[key] = entry
+        self._pending += 1
+        if self._pending > self._max_depth:
+            self._max_depth = self._pending
+        if self._workers < self.size:
+            self._workers += 1
+            gevent.spawn(self._work)
+
+    def _make_room(self, key):
+        '''Drop a waiting entry according to the policy.
+
+        Returns False if the new entry should be dropped instead.
+        '''
+        if self.policy == DROP_NEWEST:
+            return False
+        if self.mode == ORDERED:
+            queue = self._keyed.get(key)
+        else:
+            queue = self._queue
+        while queue:
+            entry = queue.popleft()
+            if not entry.cancelled:
+                self._forget(entry)
+                self._dropped += 1
+                return True
+        return False
+
+    def _forget(self, entry):
+        entry.cancelled = True
+        self._pending -= 1
+        if self._latest.get(entry.key) is entry:
+            del self._latest[entry.key]
+
+    def _next(self):
+        '''Return the next entry to run or None.'''
+        if self.mode == ORDERED:
+            while self._ready:
+                key = self._ready.popleft()
+                queue = self._keyed[key]
+                if queue:
+                    return queue.popleft()
+                del self._keyed[key]
+            return None
+        queue = self._queue
+        while queue:
+            entry = queue.popleft()
+            if not entry.cancelled:
+                return entry
+        return None
+
+    def _work(self):
+        try:
+            while True:
+                entry = self._next()
+                if entry is None:
+                    break
+                self._forget(entry)
+                self._run(entry)
+                if self.mode == ORDERED:
+                    key = entry.key
+                    if self._keyed[key]:
+                        self._ready.append(key)
+                    else:
+                        del self._keyed[key]
+        finally:
+            self._workers -= 1
+
+    def _run(self, entry):
+        latency = time.time() - entry.queued
+        self._dispatched += 1
+        self._latency_total += latency
+        if latency > self._latency_max:
+            self._latency_max = latency
+        try:
+            entry.func(*entry.args)
+        except Exception:
+            _log.exception('error in pubsub callback %r', entry.func)
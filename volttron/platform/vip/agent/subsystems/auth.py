@@ -345,4 +345,5 @@ class Auth(SubsystemBase):
         if identity == AUTH:
             self._user_to_capabilities = user_to_capabilities
             self._dirty = True
+            self._rpc().reset_authorizations()
 
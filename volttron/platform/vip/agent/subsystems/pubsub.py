@@ -39,6 +39,7 @@
 from __future__ import absolute_import
 
 from base64 import b64encode, b64decode
+import errno
 import inspect
 import logging
 import random
@@ -52,10 +53,15 @@ from zmq import SNDMORE
 from volttron.platform.agent import json as jsonapi
 from .base import SubsystemBase
 from ..decorators import annotate, annotations, dualmethod, spawn
-from ..errors import Unreachable, VIPError, UnknownSubsystem
+from ..delivery import CallbackDispatcher, DROP_OLDEST
+from ..errors import Again, Unreachable, VIPError, UnknownSubsystem
 from .... import jsonrpc
 from volttron.platform.agent import utils
+from volttron.platform.vip import codec
+from volttron.platform.vip.topicids import TopicDecoder, TopicEncoder
+from volttron.platform.vip.topictrie import SubscriptionTrie, MatchCache, check_pattern
 from ..results import ResultsDictionary
+from gevent.event import Event
 from gevent.queue import Queue, Empty
 from collections import defaultdict
 from datetime import timedelta
@@ -65,6 +71,18 @@ __all__ = ['PubSub']
 min_compatible_version = '3.0'
 max_compatible_version = ''
 
+# Number of recently published topics for which the matching callbacks
+# are cached by each agent.
+MATCH_CACHE_SIZE = 1024
+
+# Message id of unacknowledged publishes. PubSubService grants credits for
+# them in batches instead of responding to each one.
+NOACK_ID = b'noack'
+# Number of unacknowledged publishes which may be in flight, and seconds to
+# wait for the router to grant more credits before giving up.
+PUBLISH_WINDOW = 64
+PUBLISH_CREDIT_TIMEOUT = 10.0
+
 # utils.setup_logging()
 _log = logging.getLogger(__name__)
 
@@ -96,15 +114,27 @@ class PubSub(SubsystemBase):
         self._parameters_needed = True
 
         def platform_subscriptions():
-            return defaultdict(subscriptions)
-
-        def subscriptions():
-            return defaultdict(set)
+            return defaultdict(SubscriptionTrie)
 
         self._my_subscriptions = defaultdict(platform_subscriptions)
+        self._match_cache = MatchCache(MATCH_CACHE_SIZE)
+        self._batch_callbacks = set()
+        self._dispatcher = CallbackDispatcher()
+        self._callback_dispatchers = {}
+        # Policy requested from PubSubService for publishes this agent cannot keep up with (None for its default)
+        self._queue_policy = None
+        # Change filter options of subscriptions by (platform, bus, prefix), sent again when synchronizing
+        self._subscription_filters = {}
+        # Topic ids of the connection to the router, used if the router negotiated them
+        self._topic_encoder = TopicEncoder()
+        self._topic_decoder = TopicDecoder()
+        self._publish_credits = PUBLISH_WINDOW
+        self._credit_event = Event()
+        self._credit_event.set()
         self.protected_topics = ProtectedPubSubTopics()
         core.register('pubsub', self._handle_subsystem, self._handle_error)
         self.rpc().export(self._peer_push, 'pubsub.push')
+        self.rpc().export(self.dispatch_stats, 'pubsub.dispatch_stats')
         self.vip_socket = None
         self._results = ResultsDictionary()
         self._event_queue = Queue()
@@ -135,11 +165,16 @@ class PubSub(SubsystemBase):
         param kwargs: optional arguments
         type kwargs: pointer to arguments
         """
+        # Credits owed by a previous connection are lost
+        self._add_credits(PUBLISH_WINDOW - self._publish_credits)
+        # So are the topic ids
+        self._topic_encoder.clear()
+        self._topic_decoder.clear()
         self.synchronize()
 
     def _process_callback(self, sender, bus, topic, headers, message):
-        """Handle incoming subscription pushes from PubSubService. It iterates over all subscriptions to find the
-        subscription matching the topic and bus. It then calls the corresponding callback on finding a match.
+        """Handle incoming subscription pushes from PubSubService. It looks up the callbacks of all subscriptions
+        matching the topic and bus and calls them.
         param sender: identity of the publisher
         type sender: str
         param bus: bus
@@ -151,23 +186,92 @@ class PubSub(SubsystemBase):
         param message: actual message
         type message: dict
         """
+        callbacks = self._lookup_callbacks(bus, topic)
+        if not callbacks:
+            # No callbacks for topic; synchronize with sender
+            self.synchronize()
+            return
+        self._dispatch(topic, callbacks, sender, bus, topic, headers, message)
+
+    def _dispatch(self, key, callbacks, *args):
+        """Hand the callbacks for a message to the dispatcher of their subscription or of the agent.
+        param key: key used by the dispatcher for ordering and conflation
+        type key: str
+        param callbacks: callbacks matching the message
+        type callbacks: tuple
+        """
+        dispatchers = self._callback_dispatchers
+        if not dispatchers:
+            self._dispatcher.dispatch(key, self._run_callbacks, callbacks, *args)
+            return
+        groups = {}
+        for callback in callbacks:
+            groups.setdefault(dispatchers.get(callback, self._dispatcher), []).append(callback)
+        for dispatcher, group in groups.iteritems():
+            dispatcher.dispatch(key, self._run_callbacks, group, *args)
+
+    def _run_callbacks(self, callbacks, sender, bus, topic, headers, message):
         peer = 'pubsub'
+        batch_callbacks = self._batch_callbacks
+        for callback in callbacks:
+            if callback in batch_callbacks:
+                callback(peer, bus, [(sender, topic, headers, message)])
+            else:
+                callback(peer, sender, bus, topic, headers, message)
 
-        handled = 0
-        for platform in self._my_subscriptions:
-            # _log.debug("SYNC: process callback subscriptions: {}".format(self._my_subscriptions[platform][bus]))
-            buses = self._my_subscriptions[platform]
-            if bus in buses:
-                subscriptions = buses[bus]
-                for prefix, callbacks in subscriptions.iteritems():
-                    if topic.startswith(prefix):
-                        handled += 1
-                        for callback in callbacks:
-                            callback(peer, sender, bus, topic, headers, message)
+    def _process_batch_callback(self, bus, messages):
+        """Handle a batch of subscription pushes from PubSubService. Batch callbacks are called once with all the
+        messages matching their subscriptions, other callbacks once per message.
+        param bus: bus
+        type bus: str
+        param messages: list of (sender, topic, headers, message) tuples
+        type messages: list
+        """
+        handled = True
+        batches = {}
+        batch_callbacks = self._batch_callbacks
+        for sender, topic, headers, message in messages:
+            callbacks = self._lookup_callbacks(bus, topic)
+            if not callbacks:
+                handled = False
+                continue
+            single = []
+            for callback in callbacks:
+                if callback in batch_callbacks:
+                    batches.setdefault(callback, []).append((sender, topic, headers, message))
+                else:
+                    single.append(callback)
+            if single:
+                self._dispatch(topic, tuple(single), sender, bus, topic, headers, message)
+        for callback, batch in batches.iteritems():
+            dispatcher = self._callback_dispatchers.get(callback, self._dispatcher)
+            # Batches are never conflated with each other
+            dispatcher.dispatch(None, callback, 'pubsub', bus, batch)
         if not handled:
-            # No callbacks for topic; synchronize with sender
+            # No callbacks for some topic; synchronize with sender
             self.synchronize()
 
+    def _lookup_callbacks(self, bus, topic):
+        """Return the callbacks matching the topic and bus, using the cache of recent lookups."""
+        key = (bus, topic)
+        callbacks = self._match_cache.get(key)
+        if callbacks is None:
+            callbacks = self._match_callbacks(bus, topic)
+            self._match_cache.put(key, callbacks)
+        return callbacks
+
+    def _match_callbacks(self, bus, topic):
+        """Return a tuple of the callbacks of every subscription matching the topic and bus. A callback subscribed
+        to several matching prefixes is included once per prefix.
+        """
+        callbacks = []
+        for buses in self._my_subscriptions.itervalues():
+            subscriptions = buses.get(bus)
+            if subscriptions is not None:
+                for prefix_callbacks in subscriptions.match(topic):
+                    callbacks.extend(prefix_callbacks)
+        return tuple(callbacks)
+
     def _viperror(self, sender, error, **kwargs):
         if isinstance(error, Unreachable):
             self._peer_drop(self, error.peer)
@@ -303,9 +407,12 @@ class PubSub(SubsystemBase):
         items = [
             {platform: {bus: subscriptions.keys()} for platform, bus_subscriptions in self._my_subscriptions.items()
              for bus, subscriptions in bus_subscriptions.items()}]
+        filters = [[platform, bus, prefix, options]
+                   for (platform, bus, prefix), options in self._subscription_filters.items()
+                   if prefix in self._my_subscriptions.get(platform, {}).get(bus, {})]
         for subscriptions in items:
             sync_msg = jsonapi.dumps(
-                dict(subscriptions=subscriptions)
+                dict(subscriptions=subscriptions, batch=True, queue_policy=self._queue_policy, filters=filters)
             )
             frames = [b'synchronize', b'connected', sync_msg]
             # For backward compatibility with old pubsub
@@ -355,9 +462,15 @@ class PubSub(SubsystemBase):
             self.vip_socket.send_vip(b'', 'pubsub', frames, result.ident, copy=False)
             return result
 
-    def _add_subscription(self, prefix, callback, bus='', all_platforms=False):
+    def _add_subscription(self, prefix, callback, bus='', all_platforms=False, batch=False, dispatcher=None):
         if not callable(callback):
             raise ValueError('callback %r is not callable' % (callback,))
+        check_pattern(prefix)
+        self._match_cache.clear()
+        if batch:
+            self._batch_callbacks.add(callback)
+        if dispatcher is not None:
+            self._callback_dispatchers[callback] = dispatcher
         try:
             if not all_platforms:
                 self._my_subscriptions['internal'][bus][prefix].add(callback)
@@ -369,7 +482,8 @@ class PubSub(SubsystemBase):
 
     @dualmethod
     @spawn
-    def subscribe(self, peer, prefix, callback, bus='', all_platforms=False, persistent_queue=None):
+    def subscribe(self, peer, prefix, callback, bus='', all_platforms=False, persistent_queue=None, batch=False,
+                  dispatcher=None, replay=False, deadband=None, on_change=False, min_interval=None):
         """Subscribe to topic and register callback.
 
         Subscribes to topics beginning with prefix. If callback is
@@ -379,6 +493,30 @@ class PubSub(SubsystemBase):
         publishing peer, topic is the full message topic, headers is a
         case-insensitive dictionary (mapping) of message headers, and
         message is a possibly empty list of message parts.
+
+        prefix may instead be an MQTT style wildcard pattern matching whole
+        topics, where '+' matches one level, a final '#' matches any
+        remaining levels and '*' matches part of a level, e.g.
+        'devices/+/+/RTU*/all'. The platform filters publishes against the
+        pattern before sending them to the agent. '#' anywhere but the last
+        level raises ValueError.
+
+        If batch is True, callback is instead called as
+        callback(peer, bus, messages), where messages is a list of
+        (sender, topic, headers, message) tuples holding every message
+        of a publish_batch that matches the agent's subscriptions.
+
+        dispatcher is an optional CallbackDispatcher used to run callback
+        instead of the agent's dispatcher (see set_dispatch).
+
+        If replay is True, the platform immediately sends the last message
+        of every retained topic matching prefix, if it retains any.
+
+        deadband, on_change and min_interval make the platform forward a
+        message only if it differs from the last one forwarded on the same
+        topic: numbers must change by more than deadband, other values must
+        differ (on_change), and at least min_interval seconds must have
+        passed. They apply to all callbacks subscribed to prefix.
         :param peer
         :type peer
         :param prefix prefix to the topic
@@ -389,6 +527,18 @@ class PubSub(SubsystemBase):
         :type bus str
         :param platforms
         :type platforms
+        :param batch callback receives lists of messages
+        :type batch boolean
+        :param dispatcher dispatcher running callback
+        :type dispatcher CallbackDispatcher
+        :param replay receive the retained messages matching prefix
+        :type replay boolean
+        :param deadband minimum change of numeric values to be forwarded
+        :type deadband float
+        :param on_change forward only messages which changed
+        :type on_change boolean
+        :param min_interval minimum seconds between forwarded messages per topic
+        :type min_interval float
         :returns: Subscribe is successful or not
         :rtype: boolean
 
@@ -397,7 +547,7 @@ class PubSub(SubsystemBase):
         """
         # For backward compatibility with old pubsub
         if self._send_via_rpc == True:
-            self._add_subscription(prefix, callback, bus)
+            self._add_subscription(prefix, callback, bus, batch=batch, dispatcher=dispatcher)
             return self.rpc().call(peer, 'pubsub.subscribe', prefix, bus=bus)
         else:
             result = self._results.next()
@@ -405,9 +555,20 @@ class PubSub(SubsystemBase):
             if self._parameters_needed:
                 kwargs = dict(op='subscribe', prefix=prefix, bus=bus)
                 self._save_parameters(result.ident, **kwargs)
-            self._add_subscription(prefix, callback, bus, all_platforms)
+            self._add_subscription(prefix, callback, bus, all_platforms, batch, dispatcher)
+            options = None
+            if deadband is not None or on_change or min_interval:
+                options = dict(deadband=deadband, on_change=on_change, min_interval=min_interval)
+            platform = 'all' if all_platforms else 'internal'
+            for key in prefix if isinstance(prefix, list) else [prefix]:
+                if options:
+                    self._subscription_filters[(platform, bus, key)] = options
+                else:
+                    self._subscription_filters.pop((platform, bus, key), None)
+            # batch tells PubSubService that this agent accepts publish_batch messages
             sub_msg = jsonapi.dumps(
-                dict(prefix=prefix, bus=bus, all_platforms=all_platforms)
+                dict(prefix=prefix, bus=bus, all_platforms=all_platforms, batch=True, replay=replay,
+                     queue_policy=self._queue_policy, filter=options)
             )
 
             frames = [b'subscribe', sub_msg]
@@ -457,6 +618,7 @@ class PubSub(SubsystemBase):
         :Return Values:
         List of prefixes
         """
+        self._match_cache.clear()
         topics = []
         bus_subscriptions = dict()
         if prefix is None:
@@ -524,6 +686,22 @@ class PubSub(SubsystemBase):
                         del self._my_subscriptions[platform]
         return topics
 
+    def _forget_callbacks(self):
+        """Forget which callbacks take batches and their dispatchers once they are no longer subscribed to
+        anything.
+        """
+        if not self._batch_callbacks and not self._callback_dispatchers:
+            return
+        subscribed = set()
+        for bus_subscriptions in self._my_subscriptions.itervalues():
+            for subscriptions in bus_subscriptions.itervalues():
+                for callbacks in subscriptions.itervalues():
+                    subscribed.update(callbacks)
+        self._batch_callbacks &= subscribed
+        for callback in self._callback_dispatchers.keys():
+            if callback not in subscribed:
+                del self._callback_dispatchers[callback]
+
     def unsubscribe(self, peer, prefix, callback, bus='', all_platforms=False):
         """Unsubscribe and remove callback(s).
 
@@ -546,6 +724,7 @@ class PubSub(SubsystemBase):
         # For backward compatibility with old pubsub
         if self._send_via_rpc == True:
             topics = self._drop_subscription(prefix, callback, bus)
+            self._forget_callbacks()
             return self.rpc().call(peer, 'pubsub.unsubscribe', topics, bus=bus)
         else:
             subscriptions = dict()
@@ -566,11 +745,12 @@ class PubSub(SubsystemBase):
 
             unsub_msg = jsonapi.dumps(subscriptions)
             topics = self._drop_subscription(prefix, callback, bus)
+            self._forget_callbacks()
             frames = [b'unsubscribe', unsub_msg]
             self.vip_socket.send_vip(b'', 'pubsub', frames, result.ident, copy=False)
             return result
 
-    def publish(self, peer, topic, headers=None, message=None, bus=''):
+    def publish(self, peer, topic, headers=None, message=None, bus='', ack=True):
         """Publish a message to a given topic via a peer.
 
         Publish headers and message to all subscribers of topic on bus.
@@ -587,11 +767,20 @@ class PubSub(SubsystemBase):
         type message: None or any
         param bus: bus
         type bus: str
-        return: Number of subscribers the message was sent to.
+        param ack: wait for the router to acknowledge the message
+        type ack: bool
+        return: Number of subscribers the message was sent to, or None if
+        ack is False.
         :rtype: int
 
         :Return Values:
         Number of subscribers
+
+        If ack is False the message is sent without a response. At most
+        PUBLISH_WINDOW such messages may be unaccounted for by the router,
+        which grants credits for more as it routes them. Again is raised if
+        no credit is granted within PUBLISH_CREDIT_TIMEOUT seconds because
+        the router is overloaded.
         """
         if headers is None:
             headers = {}
@@ -603,9 +792,19 @@ class PubSub(SubsystemBase):
 
         # For backward compatibility with old pubsub
         if self._send_via_rpc:
+            if not ack:
+                self.rpc().notify(
+                    peer, 'pubsub.publish', topic=topic, headers=headers,
+                    message=message, bus=bus)
+                return None
             return self.rpc().call(
                 peer, 'pubsub.publish', topic=topic, headers=headers,
                 message=message, bus=bus)
+        elif not ack and not self._parameters_needed:
+            self._acquire_credit()
+            frames = self._publish_frames(topic, headers, message, bus)
+            self.vip_socket.send_vip(b'', 'pubsub', frames, NOACK_ID, copy=False)
+            return None
         else:
             result = next(self._results)
             # Parameters are stored initially, in case remote agent/platform is using old pubsub
@@ -615,12 +814,173 @@ class PubSub(SubsystemBase):
                               headers=headers, message=message)
                 self._save_parameters(result.ident, **kwargs)
 
-            json_msg = jsonapi.dumps(dict(bus=bus, headers=headers, message=message))
-            frames = [zmq.Frame(b'publish'), zmq.Frame(str(topic)), zmq.Frame(str(json_msg))]
+            frames = self._publish_frames(topic, headers, message, bus)
             # <recipient, subsystem, args, msg_id, flags>
             self.vip_socket.send_vip(b'', 'pubsub', frames, result.ident, copy=False)
             return result
 
+    def _publish_frames(self, topic, headers, message, bus):
+        json_msg = codec.dumps(dict(bus=bus, headers=headers, message=message), self.core().codec)
+        # The bus is repeated in its own frame so that PubSubService can route the message without decoding it.
+        # Older routers ignore the extra frame.
+        return [zmq.Frame(b'publish'), zmq.Frame(self._encode_topic(str(topic))), zmq.Frame(str(json_msg)),
+                zmq.Frame(str(bus))]
+
+    def _acquire_credit(self):
+        """Take a credit for an unacknowledged publish, waiting for the router to grant more if there are none left.
+        """
+        while self._publish_credits <= 0:
+            self._credit_event.clear()
+            if not self._credit_event.wait(PUBLISH_CREDIT_TIMEOUT):
+                raise Again(errno.EAGAIN, 'router has not accepted publishes for {} seconds'.format(
+                    PUBLISH_CREDIT_TIMEOUT), 'pubsub', 'pubsub')
+        self._publish_credits -= 1
+
+    def _add_credits(self, count):
+        self._publish_credits += count
+        if self._publish_credits > 0:
+            self._credit_event.set()
+
+    def set_dispatch(self, mode, size=10, max_pending=1000, policy=DROP_OLDEST):
+        """Set how the callbacks of subscriptions without their own dispatcher are run.
+
+        By default every incoming message is handled in a new greenlet. See CallbackDispatcher for the modes and
+        overflow policies.
+        param mode: spawn, inline, pool or ordered
+        type mode: str
+        param size: number of worker greenlets in pool and ordered modes
+        type size: int
+        param max_pending: number of messages waiting for a worker before the overflow policy applies
+        type max_pending: int
+        param policy: drop_newest, drop_oldest or conflate
+        type policy: str
+        """
+        self._dispatcher = CallbackDispatcher(mode, size, max_pending, policy)
+
+    def dispatch_stats(self):
+        """Return queue depth and dispatch latency statistics of the agent's dispatcher and of every subscription
+        dispatcher, keyed by callback name. Also exported as the pubsub.dispatch_stats RPC method.
+        :returns: statistics by dispatcher
+        :rtype: dict
+        """
+        stats = {'agent': self._dispatcher.stats()}
+        for callback, dispatcher in self._callback_dispatchers.iteritems():
+            stats[getattr(callback, '__name__', repr(callback))] = dispatcher.stats()
+        return stats
+
+    def set_queue_policy(self, policy):
+        """Choose what PubSubService does with publishes to this agent while the agent is not keeping up with them.
+
+        The policy is sent with the subscriptions, so it also applies after reconnecting.
+        param policy: drop (report EAGAIN to the publisher), block (the platform waits for this agent),
+        drop_oldest (queue, dropping the oldest when full) or conflate (queue, keeping the latest per topic)
+        type policy: str
+        """
+        self._queue_policy = policy
+        if self.vip_socket is not None and not self._send_via_rpc:
+            self.synchronize()
+
+    def queue_stats(self, peer):
+        """Get the outbound queue counters PubSubService keeps for the subscribers which could not keep up.
+        param peer: peer
+        type peer: str
+        :returns: policy, queued, max_depth, dropped and conflated counts keyed by subscriber identity
+        :rtype: AsyncResult of dict
+        """
+        result = next(self._results)
+        self.vip_socket.send_vip(b'', 'pubsub', [b'queue_stats'], result.ident, copy=False)
+        return result
+
+    def publish_batch(self, peer, items, bus='', ack=True):
+        """Publish several messages in a single request.
+
+        Each item is a (topic, headers, message) tuple and is delivered
+        as if it had been published with publish(). PubSubService sends
+        all the messages for a subscriber in one message, so framing and
+        round trips are paid once per batch instead of once per topic.
+        param peer: peer
+        type peer: str
+        param items: messages to publish
+        type items: list of (topic, headers, message) tuples
+        param bus: bus
+        type bus: str
+        param ack: wait for the router to acknowledge the batch, see publish
+        type ack: bool
+        return: Number of messages delivered to subscribers, or None if ack
+        is False.
+        :rtype: int
+
+        :Return Values:
+        Number of messages delivered
+        """
+        if peer is None:
+            peer = 'pubsub'
+
+        messages = []
+        for topic, headers, message in items:
+            if headers is None:
+                headers = {}
+            headers['min_compatible_version'] = min_compatible_version
+            headers['max_compatible_version'] = max_compatible_version
+            messages.append((topic, headers, message))
+
+        # For backward compatibility with old pubsub
+        if self._send_via_rpc:
+            if not ack:
+                for topic, headers, message in messages:
+                    self.rpc().notify(peer, 'pubsub.publish', topic=topic, headers=headers,
+                                      message=message, bus=bus)
+                return None
+            results = [self.rpc().call(peer, 'pubsub.publish', topic=topic, headers=headers,
+                                       message=message, bus=bus)
+                       for topic, headers, message in messages]
+            return self.core().spawn(lambda: [result.get() for result in results])
+        elif not ack and not self._parameters_needed:
+            self._acquire_credit()
+            frames = self._publish_batch_frames(messages, bus)
+            self.vip_socket.send_vip(b'', 'pubsub', frames, NOACK_ID, copy=False)
+            return None
+        else:
+            result = next(self._results)
+            # Parameters are stored initially, in case remote agent/platform is using old pubsub
+            if self._parameters_needed:
+                kwargs = dict(op='publish_batch', peer=peer, items=messages, bus=bus)
+                self._save_parameters(result.ident, **kwargs)
+
+            frames = self._publish_batch_frames(messages, bus)
+            self.vip_socket.send_vip(b'', 'pubsub', frames, result.ident, copy=False)
+            return result
+
+    def _publish_batch_frames(self, messages, bus):
+        frames = [zmq.Frame(b'publish_batch'), zmq.Frame(str(bus))]
+        for topic, headers, message in messages:
+            json_msg = codec.dumps(dict(bus=bus, headers=headers, message=message), self.core().codec)
+            frames.append(zmq.Frame(self._encode_topic(str(topic))))
+            frames.append(zmq.Frame(str(json_msg)))
+        return frames
+
+    def _encode_topic(self, topic):
+        """Return the topic as sent to the router, which is its id once the router knows it if topic ids were
+        negotiated.
+        param topic: topic of a message
+        type topic: str
+        """
+        if not self.core().topic_ids:
+            return topic
+        return self._topic_encoder.encode(topic)[0]
+
+    def _decode_topic(self, data):
+        """Return the topic of a message from the router, or None if it refers to a topic id this agent does not
+        know. The router is then asked to send its topics in full again.
+        param data: topic frame of a message
+        type data: str
+        """
+        topic = self._topic_decoder.decode(data)
+        if topic is None:
+            _log.warning("Unknown topic id from the router, asking for a topic reset")
+            self.vip_socket.send_vip(b'', 'pubsub', [b'topic_reset'], copy=False)
+        return topic
+
     def _check_if_protected_topic(self, topic):
         required_caps = self.protected_topics.get(topic)
         if required_caps:
@@ -639,7 +999,6 @@ class PubSub(SubsystemBase):
         """
         self._event_queue.put(message)
 
-    @spawn
     def _process_incoming_message(self, message):
         """Process incoming messages
         param message: VIP message from PubSubService
@@ -663,15 +1022,26 @@ class PubSub(SubsystemBase):
             # _log.debug("Message result: {}".format(response))
             if result:
                 result.set(response)
+            elif bytes(message.id) == NOACK_ID:
+                # Routers without flow control acknowledge every publish
+                self._add_credits(1)
+
+        elif op == 'credit':
+            try:
+                self._add_credits(int(message.args[1].bytes))
+            except (IndexError, ValueError):
+                _log.error("Invalid pubsub credit message")
 
         elif op == 'publish':
             try:
-                topic = topic = message.args[1].bytes
+                topic = self._decode_topic(message.args[1].bytes)
                 data = message.args[2].bytes
             except IndexError:
                 return
+            if topic is None:
+                return
             try:
-                msg = jsonapi.loads(data)
+                msg = codec.loads(data)
                 headers = msg['headers']
                 message = msg['message']
                 sender = msg['sender']
@@ -681,7 +1051,28 @@ class PubSub(SubsystemBase):
             else:
                 self._process_callback(sender, bus, topic, headers, message)
 
-        elif op == 'list_response':
+        elif op == 'publish_batch':
+            try:
+                bus = message.args[1].bytes
+            except IndexError:
+                return
+            args = message.args[2:]
+            messages = []
+            for topic, data in zip(args[0::2], args[1::2]):
+                topic = self._decode_topic(topic.bytes)
+                if topic is None:
+                    return
+                try:
+                    msg = codec.loads(data.bytes)
+                    messages.append((msg['sender'], topic, msg['headers'], msg['message']))
+                except KeyError as exc:
+                    _log.error("Missing keys in pubsub message: {}".format(exc))
+            self._process_batch_callback(bus, messages)
+
+        elif op == 'topic_reset':
+            self._topic_encoder.clear()
+
+        elif op in ('list_response', 'queue_stats_response'):
             result = None
             try:
                 result = self._results.pop(bytes(message.id))
@@ -694,9 +1085,13 @@ class PubSub(SubsystemBase):
             _log.error("Unknown operation ({})".format(op))
 
     def _process_loop(self):
-        """Incoming message processing loop"""
+        """Incoming message processing loop. Messages are decoded here and their callbacks handed to the
+        dispatchers."""
         for msg in self._event_queue:
-            self._process_incoming_message(msg)
+            try:
+                self._process_incoming_message(msg)
+            except Exception:
+                _log.exception("Error processing pubsub message")
 
     def _handle_error(self, sender, message, error, **kwargs):
         """Error handler. If UnknownSubsystem error is received, it implies that agent is connected to platform that has
@@ -712,6 +1107,8 @@ class PubSub(SubsystemBase):
             # Must be connected to OLD pubsub. Try sending using RPC
             self._send_via_rpc = True
             self._pubsubwithrpc.send(self._results, message)
+        elif bytes(message.id) == NOACK_ID:
+            _log.warning("Unacknowledged publish failed: {}".format(error))
         else:
             try:
                 result = self._results.pop(bytes(message.id))
@@ -783,6 +1180,8 @@ class PubSubWithRPC(object):
                 self._core().spawn(self._subscribe, id, results, parameters)
             elif parameters['op'] == 'publish':
                 self._core().spawn(self._publish, id, results, parameters)
+            elif parameters['op'] == 'publish_batch':
+                self._core().spawn(self._publish_batch, id, results, parameters)
             elif parameters['op'] == 'list':
                 self._core().spawn(self._list, id, results, parameters)
             elif parameters['op'] == 'unsubscribe':
@@ -898,6 +1297,35 @@ class PubSubWithRPC(object):
             if result is not None:
                 result.set_exception(exc)
 
+    def _publish_batch(self, results_id, results, parameters):
+        """Publish batch call using RPC, one call per message
+            param results_id: Asynchronous result ID required to the set response for the caller
+            type results_id: float (hash value)
+            param results: Async results dictionary
+            type results: Weak dictionary
+            param parameters: Input parameters for the publish_batch call
+        """
+        try:
+            result = results.pop(bytes(results_id))
+        except KeyError:
+            result = None
+        try:
+            items = parameters['items']
+            bus = parameters['bus']
+            event = parameters['event']
+            event.cancel()
+        except KeyError:
+            return
+        try:
+            response = [self._rpc().call(
+                'pubsub', 'pubsub.publish', topic=topic, headers=headers,
+                message=message, bus=bus).get(timeout=5) for topic, headers, message in items]
+            if result is not None:
+                result.set(response)
+        except gevent.Timeout as exc:
+            if result is not None:
+                result.set_exception(exc)
+
     def _unsubscribe(self, results_id, results, parameters):
         """Unsubscribe call using RPC
             param results_id: Asynchronous result ID required to the set response for the caller
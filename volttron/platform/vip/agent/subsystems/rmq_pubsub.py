@@ -80,8 +80,11 @@ from requests.packages.urllib3.connection import (ConnectionError,
 from volttron.platform import is_rabbitmq_available
 from volttron.platform.agent import json as jsonapi
 from ..decorators import annotate, annotations, dualmethod, spawn
+from ..delivery import CallbackDispatcher, DROP_OLDEST
 from ..errors import Unreachable
 from ..results import ResultsDictionary
+from volttron.platform.vip.pubsubfilter import SubscriptionFilter
+from volttron.platform.vip.topictrie import is_pattern, check_pattern, topic_matches
 
 if is_rabbitmq_available():
     import pika
@@ -112,6 +115,14 @@ class RMQPubSub(SubsystemBase):
             return defaultdict(set)
 
         self._my_subscriptions = defaultdict(subscriptions)
+        # Wildcard patterns of the queues they were subscribed with, checked again on delivery
+        self._queue_patterns = dict()
+        # Change filters of the queues subscribed with deadband, on_change or min_interval
+        self._queue_filters = dict()
+        self._dispatcher = CallbackDispatcher()
+        self._callback_dispatchers = {}
+        self._batch_callbacks = set()
+        self.rpc().export(self.dispatch_stats, 'pubsub.dispatch_stats')
 
         def setup(sender, **kwargs):
             # pylint: disable=unused-argument
@@ -121,6 +132,7 @@ class RMQPubSub(SubsystemBase):
                 for peer, bus, prefix, all_platforms, queue_name in annotations(
                         member, set, 'pubsub.subscriptions'):
                     self._logger.debug("peer: {0}, prefix:{1}".format(peer, prefix))
+                    check_pattern(prefix)
                     routing_key = self._form_routing_key(prefix, all_platforms=all_platforms)
                     # If named queue, add "persistent" in the queue name
                     if queue_name:
@@ -129,6 +141,8 @@ class RMQPubSub(SubsystemBase):
                     else:
                         queue_name = "{user}.pubsub.{uid}".format(user=self.core().rmq_user,
                                                                   uid=bytes(uuid.uuid4()))
+                    if is_pattern(prefix):
+                        self._queue_patterns[queue_name] = prefix
 
                     self._add_subscription(routing_key, member, queue_name)
                     # self._logger.debug("SYNC RMQ: all_platforms {}")
@@ -199,12 +213,27 @@ class RMQPubSub(SubsystemBase):
 
     @dualmethod
     @spawn
-    def subscribe(self, peer, prefix, callback, bus='', all_platforms=False, persistent_queue=None):
+    def subscribe(self, peer, prefix, callback, bus='', all_platforms=False, persistent_queue=None, batch=False,
+                  dispatcher=None, replay=False, deadband=None, on_change=False, min_interval=None):
         """Subscribe to a prefix and register callback. If 'all_platforms' flag is set to True, then
         agent subscribes to receive topic from all platforms. A named queue will set persistent
         behavior to the topic subscriptions. That means even if the agent shutdowns and restarts, it
         will receive all the messages during the shutdown/turn off period.
 
+        If batch is True, callback is instead called as callback(peer, bus, messages), where messages
+        is a list of (sender, topic, headers, message) tuples. RabbitMQ routes the messages of a
+        publish_batch one by one, so every list holds a single message.
+
+        dispatcher is an optional CallbackDispatcher used to run callback
+        instead of the agent's dispatcher (see set_dispatch).
+
+        replay is accepted for compatibility with the ZMQ message bus, but retained messages are not
+        replayed on RabbitMQ.
+
+        deadband, on_change and min_interval forward a message only if it differs from the last one
+        forwarded on the same topic, as on the ZMQ message bus. RabbitMQ delivers every message, so
+        the agent filters them before calling callback.
+
         :param peer "pubsub" string
         :type peer str
         :param prefix prefix of the topic
@@ -217,6 +246,18 @@ class RMQPubSub(SubsystemBase):
         :type all_platforms boolean
         :param persistent_queue Name of the queue for persistent behavior
         :type persistent_queue str
+        :param batch callback receives lists of messages
+        :type batch boolean
+        :param dispatcher dispatcher running callback
+        :type dispatcher CallbackDispatcher
+        :param replay ignored, retained messages are not replayed on RabbitMQ
+        :type replay boolean
+        :param deadband minimum change of numeric values to be forwarded
+        :type deadband float
+        :param on_change forward only messages which changed
+        :type on_change boolean
+        :param min_interval minimum seconds between forwarded messages per topic
+        :type min_interval float
         :returns: Subscribe is successful or not
         :rtype: boolean
 
@@ -224,6 +265,10 @@ class RMQPubSub(SubsystemBase):
         Success or Failure
         """
         result = None
+        check_pattern(prefix)
+        if replay:
+            self._logger.warning("Retained messages of {} are not replayed on the RabbitMQ message bus"
+                                 .format(prefix))
         connection = self.core().connection  # bytes(uuid.uuid4())
         routing_key = self._form_routing_key(prefix, all_platforms=all_platforms)
         if all_platforms:
@@ -241,6 +286,14 @@ class RMQPubSub(SubsystemBase):
                                                                         queue_name=persistent_queue)
         else:
             queue_name = "{user}.pubsub.{uid}".format(user=self.core().rmq_user, uid=str(uuid.uuid4()))
+        if is_pattern(prefix):
+            self._queue_patterns[queue_name] = prefix
+        if deadband is not None or on_change or min_interval:
+            self._queue_filters[queue_name] = SubscriptionFilter(deadband, on_change, min_interval)
+        if batch:
+            self._batch_callbacks.add(callback)
+        if dispatcher is not None:
+            self._callback_dispatchers[callback] = dispatcher
         # Store subscriptions for later use
         self._add_subscription(routing_key, callback, queue_name)
 
@@ -292,13 +345,24 @@ class RMQPubSub(SubsystemBase):
         def rmq_callback(ch, method, properties, body):
             # Strip prefix from routing key
             topic = self._get_original_topic(str(method.routing_key))
+            pattern = self._queue_patterns.get(queue)
+            if pattern is not None and not topic_matches(pattern, topic):
+                # The routing key only approximates levels containing '*'
+                return
             try:
                 msg = jsonapi.loads(body)
                 headers = msg['headers']
                 message = msg['message']
                 bus = msg['bus']
                 sender = msg['sender']
-                self.core().spawn(callback, 'pubsub', sender, bus, topic, headers, message)
+                subscription_filter = self._queue_filters.get(queue)
+                if subscription_filter is not None and not subscription_filter.accept(topic, message):
+                    return
+                dispatcher = self._callback_dispatchers.get(callback, self._dispatcher)
+                if callback in self._batch_callbacks:
+                    dispatcher.dispatch(topic, callback, 'pubsub', bus, [(sender, topic, headers, message)])
+                else:
+                    dispatcher.dispatch(topic, callback, 'pubsub', sender, bus, topic, headers, message)
             except KeyError as esc:
                 self._logger.error("Missing keys in pubsub message {}".format(esc))
 
@@ -372,7 +436,7 @@ class RMQPubSub(SubsystemBase):
         self.core().spawn_later(0.01, self.set_result, async_result.ident, results)
         return async_result
 
-    def publish(self, peer, topic, headers=None, message=None, bus=''):
+    def publish(self, peer, topic, headers=None, message=None, bus='', ack=True):
         """Publish a message to a given topic via a peer.
 
         Publish headers and message to all subscribers of topic on bus.
@@ -389,7 +453,10 @@ class RMQPubSub(SubsystemBase):
         type message: None or any
         param bus: bus
         type bus: str
-        return: Number of subscribers the message was sent to.
+        param ack: return a result for the message
+        type ack: bool
+        return: Number of subscribers the message was sent to, or None if
+        ack is False.
         :rtype: int
 
         :Return Values:
@@ -398,7 +465,7 @@ class RMQPubSub(SubsystemBase):
         result = next(self._results)
         self._pubcount[self._message_number] = result.ident
         self._message_number += 1
-        routing_key = self._form_routing_key(topic)
+        routing_key = self._form_routing_key(topic, subscription=False)
         connection = self.core().connection
         self.core().spawn_later(0.01, self.set_result, result.ident, 1)
         if headers is None:
@@ -435,6 +502,78 @@ class RMQPubSub(SubsystemBase):
             self._isconnected = False
             raise Unreachable(errno.EHOSTUNREACH, "Connection to RabbitMQ is lost",
                               'rabbitmq broker', 'pubsub')
+        if not ack:
+            return None
+        return result
+
+    def publish_batch(self, peer, items, bus='', ack=True):
+        """Publish several messages. Each item is a (topic, headers, message)
+        tuple. RabbitMQ routes every message on its own, so they are published
+        one after another.
+        param peer: peer
+        type peer: str
+        param items: messages to publish
+        type items: list of (topic, headers, message) tuples
+        param bus: bus
+        type bus: str
+        param ack: return a result for the batch
+        type ack: bool
+        return: Number of messages published, or None if ack is False.
+        :rtype: int
+        """
+        for topic, headers, message in items:
+            self.publish(peer, topic, headers=headers, message=message, bus=bus, ack=False)
+        if not ack:
+            return None
+        result = next(self._results)
+        self.core().spawn_later(0.01, self.set_result, result.ident, len(items))
+        return result
+
+    def set_dispatch(self, mode, size=10, max_pending=1000, policy=DROP_OLDEST):
+        """Set how the callbacks of subscriptions without their own dispatcher are run.
+
+        By default every incoming message is handled in a new greenlet. See CallbackDispatcher for the modes and
+        overflow policies.
+        param mode: spawn, inline, pool or ordered
+        type mode: str
+        param size: number of worker greenlets in pool and ordered modes
+        type size: int
+        param max_pending: number of messages waiting for a worker before the overflow policy applies
+        type max_pending: int
+        param policy: drop_newest, drop_oldest or conflate
+        type policy: str
+        """
+        self._dispatcher = CallbackDispatcher(mode, size, max_pending, policy)
+
+    def dispatch_stats(self):
+        """Return queue depth and dispatch latency statistics of the agent's dispatcher and of every subscription
+        dispatcher, keyed by callback name. Also exported as the pubsub.dispatch_stats RPC method.
+        :returns: statistics by dispatcher
+        :rtype: dict
+        """
+        stats = {'agent': self._dispatcher.stats()}
+        for callback, dispatcher in self._callback_dispatchers.iteritems():
+            stats[getattr(callback, '__name__', repr(callback))] = dispatcher.stats()
+        return stats
+
+    def set_queue_policy(self, policy):
+        """Accepted for compatibility with the ZMQ message bus. RabbitMQ keeps the messages of a slow subscriber
+        in its queue on the broker, so the policy has no effect.
+        param policy: drop, block, drop_oldest or conflate
+        type policy: str
+        """
+        self._logger.warning("Queue policy {} has no effect on the RabbitMQ message bus".format(policy))
+
+    def queue_stats(self, peer):
+        """Get the outbound queue counters of the subscribers which could not keep up. Messages are queued by the
+        RabbitMQ broker instead (see its management interface), so there are no counters.
+        param peer: peer
+        type peer: str
+        :returns: an empty dict
+        :rtype: AsyncResult of dict
+        """
+        result = next(self._results)
+        self.core().spawn_later(0.01, self.set_result, result.ident, {})
         return result
 
     def set_result(self, ident, value=None):
@@ -500,6 +639,7 @@ class RMQPubSub(SubsystemBase):
         if prefix is not None:
             routing_key = self._form_routing_key(prefix, all_platforms=all_platforms)
         topics = self._drop_subscription(routing_key, callback)
+        self._forget_callbacks()
         self.core().spawn_later(0.01, self.set_result, result.ident, topics)
         # Send the message to proxy router to send it to external 'zmq' platforms
         if all_platforms:
@@ -531,6 +671,7 @@ class RMQPubSub(SubsystemBase):
                     for queue_name in subscriptions.keys():
                         self.core().connection.channel.queue_delete(
                             callback=None, queue=queue_name)
+                        self._forget_queue(queue_name)
                         subscriptions.pop(queue_name)
                     topics.append(prefix)
             else:
@@ -548,6 +689,7 @@ class RMQPubSub(SubsystemBase):
                         if not callbacks:
                             # Delete queue
                             self.core().connection.channel.queue_delete(callback=None, queue=queue_name)
+                            self._forget_queue(queue_name)
                             remove.append(queue_name)
                     for que in remove:
                         del subscriptions[que]
@@ -569,6 +711,7 @@ class RMQPubSub(SubsystemBase):
                     for queue_name, callbacks in subscriptions.iteritems():
                         self._logger.debug("RMQ queues {}".format(queue_name))
                         self.core().connection.channel.queue_delete(callback=None, queue=queue_name)
+                        self._forget_queue(queue_name)
                     del self._my_subscriptions[routing_key]
                 else:
                     self._logger.debug("topics: {0}".format(topics))
@@ -580,6 +723,7 @@ class RMQPubSub(SubsystemBase):
                         if not callbacks:
                             # Delete queue
                             self.core().connection.channel.queue_delete(callback=None, queue=queue_name)
+                            self._forget_queue(queue_name)
                             remove.append(queue_name)
                     for que in remove:
                         del subscriptions[que]
@@ -593,6 +737,29 @@ class RMQPubSub(SubsystemBase):
         # self._logger.debug("AFTER DROP topics: {}".format(orig_topics))
         return orig_topics
 
+    def _forget_callbacks(self):
+        """
+        Forget which callbacks take batches and their dispatchers once they are no longer subscribed to anything
+        """
+        if not self._batch_callbacks and not self._callback_dispatchers:
+            return
+        subscribed = set()
+        for subscriptions in self._my_subscriptions.itervalues():
+            for callbacks in subscriptions.itervalues():
+                subscribed.update(callbacks)
+        self._batch_callbacks &= subscribed
+        for callback in self._callback_dispatchers.keys():
+            if callback not in subscribed:
+                del self._callback_dispatchers[callback]
+
+    def _forget_queue(self, queue_name):
+        """
+        Forget the pattern and filter of a deleted queue
+        :param queue_name: queue name
+        """
+        self._queue_patterns.pop(queue_name, None)
+        self._queue_filters.pop(queue_name, None)
+
     def _get_original_topic(self, routing_key):
         """
         Replace '.' delimiter with '/'
@@ -607,15 +774,25 @@ class RMQPubSub(SubsystemBase):
         except IndexError as exc:
             return routing_key
 
-    def _form_routing_key(self, topic, all_platforms=False):
+    def _form_routing_key(self, topic, all_platforms=False, subscription=True):
         """
         Form routing key from the original topic
         :param topic: Original topic
         :param all_platforms: Flag indicating if it is intended for all platforms
+        :param subscription: Flag indicating if topic is a subscription prefix or pattern rather than a published topic
         :return: Routing key string
         """
         routing_key = ''
-        topic = '#' if topic == '' else topic + '.#'
+        if subscription and is_pattern(topic):
+            # RabbitMQ topic exchanges support whole level wildcards only, so a level containing '*' matches any
+            # level and rmq_callback checks the pattern again. Published routing keys end with '.#'.
+            levels = ['*' if level == '+' or ('*' in level and level != '#') else level
+                      for level in topic.split('/')]
+            if levels[-1] != '#':
+                levels.append('#')
+            topic = '/'.join(levels)
+        else:
+            topic = '#' if topic == '' else topic + '.#'
 
         if all_platforms:
             # Format is '__pubsub__.*.<prefix>.#'
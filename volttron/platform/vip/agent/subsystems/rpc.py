@@ -38,22 +38,32 @@
 
 from __future__ import absolute_import
 
+import copy
+import errno
+import functools
 import inspect
+import itertools
 import logging
 import os
 import sys
+import time
 import traceback
 import weakref
+from collections import OrderedDict
 
+import gevent
 import gevent.local
+import gevent.queue
 from gevent.event import AsyncResult
 from volttron.platform.agent import json as jsonapi
 
 from .base import SubsystemBase
-from ..errors import VIPError
+from ..errors import Unreachable, VIPError
 from ..results import counter, ResultsDictionary
 from ..decorators import annotate, annotations, dualmethod, spawn
 from .... import jsonrpc
+from ... import codec
+from ...tracking import Histogram
 from volttron.platform.vip.socket import Message
 
 from zmq import Frame, NOBLOCK, ZMQError, EINVAL, EHOSTUNREACH
@@ -68,19 +78,171 @@ _ROOT_PACKAGE_PATH = os.path.dirname(
 
 _log = logging.getLogger(__name__)
 
+# Most results kept by a single ResultCache
+RESULT_CACHE_SIZE = 1024
+
+_MISSING = object()
+
+# Chunks sent per reply to a streamed call
+STREAM_WINDOW = 16
+# Seconds to wait for each reply of a streamed call
+STREAM_TIMEOUT = 30
+# Seconds after which streams not read by their caller are closed
+STREAM_IDLE_TIMEOUT = 300
+
+
+def _cache_key(*args, **kwargs):
+    '''Default cache key: the call arguments serialized as JSON.'''
+    return jsonapi.dumps([args, kwargs], sort_keys=True)
+
+
+def _cache_options(cache_ttl, cache_key, idempotent):
+    if cache_ttl is None:
+        if cache_key is not None or idempotent:
+            raise ValueError('cache_key and idempotent require a cache_ttl')
+        return None
+    if cache_ttl <= 0:
+        raise ValueError('cache_ttl must be greater than zero')
+    return cache_ttl, cache_key, idempotent
+
+
+class ResultCache(object):
+    '''Memoize method results for ttl seconds.
+
+    Results are keyed by the value returned from key, which is called
+    with the method arguments and must return something hashable. If
+    caller is given, it is called with no arguments and what it returns
+    is part of every key, so callers never share results. If copies is
+    set, every result handed out is a copy of the cached one. At most
+    size results are kept, dropping the oldest first.
+    '''
+
+    def __init__(self, ttl, key=None, idempotent=False,
+                 size=RESULT_CACHE_SIZE, caller=None, copies=False):
+        self.ttl = ttl
+        self.key = key or _cache_key
+        self.idempotent = idempotent
+        self.size = size
+        self.caller = caller
+        self.copies = copies
+        self.hits = 0
+        self.misses = 0
+        self._results = OrderedDict()
+
+    def __len__(self):
+        return len(self._results)
+
+    def call_key(self, *args, **kwargs):
+        '''Return the key of the result of a call.'''
+        key = self.key(*args, **kwargs)
+        if self.caller is not None:
+            return self.caller(), key
+        return key
+
+    def get(self, key):
+        try:
+            expires, value = self._results[key]
+        except KeyError:
+            return _MISSING
+        if expires <= time.time():
+            del self._results[key]
+            return _MISSING
+        if self.copies:
+            return copy.deepcopy(value)
+        return value
+
+    def store(self, key, value):
+        results = self._results
+        results.pop(key, None)
+        while len(results) >= self.size:
+            results.popitem(last=False)
+        if self.copies:
+            value = copy.deepcopy(value)
+        results[key] = time.time() + self.ttl, value
+
+    def invalidate(self, *args, **kwargs):
+        '''Drop the results for the given arguments, or all results.'''
+        if not (args or kwargs):
+            self._results.clear()
+        elif self.caller is None:
+            self._results.pop(self.key(*args, **kwargs), None)
+        else:
+            key = self.key(*args, **kwargs)
+            for caller_key in [caller_key for caller_key in self._results
+                               if caller_key[1] == key]:
+                del self._results[caller_key]
+
+    def wrap(self, method):
+        '''Return method wrapped to answer from the cache.'''
+        @functools.wraps(method)
+        def cached_method(*args, **kwargs):
+            key = self.call_key(*args, **kwargs)
+            value = self.get(key)
+            if value is _MISSING:
+                self.misses += 1
+                value = method(*args, **kwargs)
+                self.store(key, value)
+            else:
+                self.hits += 1
+            return value
+        cached_method.__wrapped__ = method
+        return cached_method
+
+    def stats(self):
+        return {'ttl': self.ttl, 'idempotent': self.idempotent,
+                'hits': self.hits, 'misses': self.misses,
+                'entries': len(self._results)}
+
+
+class MethodStats(object):
+    '''Call counts, error counts and latency histograms by method.'''
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.started = time.time()
+        # name -> [errors, latency histogram in microseconds]
+        self.methods = {}
+
+    def record(self, name, seconds, failed):
+        try:
+            stats = self.methods[name]
+        except KeyError:
+            stats = self.methods[name] = [0, Histogram()]
+        if failed:
+            stats[0] += 1
+        stats[1].record(int(seconds * 1000000))
+
+    def snapshot(self):
+        return {
+            'start': self.started,
+            'end': time.time(),
+            'methods': {
+                name: {'calls': latency.count, 'errors': errors,
+                       'latency': latency.snapshot()}
+                for name, (errors, latency) in self.methods.iteritems()},
+        }
+
 
 class Dispatcher(jsonrpc.Dispatcher):
-    def __init__(self, methods, local):
+    def __init__(self, methods, local, caches=None):
         super(Dispatcher, self).__init__()
         self.methods = methods
         self.local = local
+        # Server side caches by method name
+        self.caches = {} if caches is None else caches
+        # Results of idempotent methods of other peers by (peer, method)
+        self.remote_caches = {}
         self._results = ResultsDictionary()
+        # Codec negotiated with the router; requests of either codec are understood
+        self.codec = codec.JSON
 
     def serialize(self, json_obj):
-        return jsonapi.dumps(json_obj)
+        return codec.dumps(json_obj, self.codec)
 
     def deserialize(self, json_string):
-        return jsonapi.loads(json_string)
+        return codec.loads(json_string)
 
     def batch_call(self, requests):
         methods = []
@@ -106,6 +268,20 @@ class Dispatcher(jsonrpc.Dispatcher):
             result = self._results.pop(ident)
         except KeyError:
             return
+        ttl = response.get('cache_ttl')
+        if ttl:
+            # The method declared itself idempotent; remember the result
+            try:
+                peer, method, args, kwargs = result.cache_call
+            except AttributeError:
+                pass
+            else:
+                cache = self.remote_caches.get((peer, method))
+                if cache is None:
+                    cache = self.remote_caches[(peer, method)] = ResultCache(
+                        ttl, copies=True)
+                cache.ttl = ttl
+                cache.store(cache.call_key(*args, **kwargs), value)
         result.set(value)
 
     def error(self, response, ident, code, message, data=None, context=None):
@@ -136,21 +312,34 @@ class Dispatcher(jsonrpc.Dispatcher):
             method = self.methods[name]
         except KeyError:
             if name == 'inspect':
-                return {'methods': self.methods.keys()}
+                response = {'methods': self.methods.keys()}
+                if self.caches:
+                    response['cache'] = {
+                        method_name: cache.stats()
+                        for method_name, cache in self.caches.iteritems()}
+                if self.remote_caches:
+                    response['remote_cache'] = {
+                        '.'.join(key): cache.stats()
+                        for key, cache in self.remote_caches.iteritems()}
+                return response
             elif name.endswith('.inspect'):
                 try:
                     method = self.methods[name[:-8]]
                 except KeyError:
                     pass
                 else:
-                    return self._inspect(method)
+                    response = self._inspect(method)
+                    cache = self.caches.get(name[:-8])
+                    if cache is not None:
+                        response['cache'] = cache.stats()
+                    return response
             raise NotImplementedError(name)
         local = self.local
         local.vip_message = context
         local.request = request
         local.batch = batch
         try:
-            return method(*args, **kwargs)
+            result = method(*args, **kwargs)
         except Exception as exc:   # pylint: disable=broad-except
             exc_tb = traceback.format_exc()
             _log.error('unhandled exception in JSON-RPC method %r: \n%s',
@@ -162,8 +351,24 @@ class Dispatcher(jsonrpc.Dispatcher):
             del local.vip_message
             del local.request
             del local.batch
+        if inspect.isgenerator(result):
+            # Generators cannot be serialized; they are read with stream()
+            result.close()
+            raise TypeError('{} returns chunks and must be read with '
+                            'rpc.stream()'.format(name))
+        return result
+
+    def _dispatch_one(self, msg, batch, context):
+        response = super(Dispatcher, self)._dispatch_one(msg, batch, context)
+        if response and 'result' in response:
+            # Let callers cache results of methods declared idempotent
+            cache = self.caches.get(msg.get('method'))
+            if cache is not None and cache.idempotent:
+                response['cache_ttl'] = cache.ttl
+        return response
 
     def _inspect(self, method):
+        method = getattr(method, '__wrapped__', method)
         params = inspect.getargspec(method)
         if hasattr(method, 'im_self'):
             params.args.pop(0)
@@ -194,6 +399,12 @@ class RPC(SubsystemBase):
         self._owner = owner
         self.context = None
         self._exports = {}
+        self._caches = {}
+        # (user, method name) pairs which passed their capability check
+        self._authorized = set()
+        # Streams being read by callers: ident -> [peer, chunks, last read]
+        self._streams = {}
+        self._stats = MethodStats()
         self._dispatcher = None
         self._counter = counter()
         self._outstanding = weakref.WeakValueDictionary()
@@ -212,14 +423,23 @@ class RPC(SubsystemBase):
         def setup(sender, **kwargs):
             # pylint: disable=unused-argument
             self.context = gevent.local.local()
-            self._dispatcher = Dispatcher(self._exports, self.context)
+            self._dispatcher = Dispatcher(self._exports, self.context,
+                                          self._caches)
+            self._dispatcher.stats = self._stats
         core.onsetup.connect(setup, self)
         core.ondisconnected.connect(self._disconnected)
         core.onconnected.connect(self._connected)
+        self.export(self._open_stream, 'stream.open')
+        self.export(self._read_stream, 'stream.next')
+        self.export(self._close_stream, 'stream.close')
+        self.export(self._get_stats, 'rpc.stats')
         self._iterate_exports()
 
     def _connected(self, sender, **kwargs):
         self._isconnected =True
+        if self._dispatcher is not None:
+            self._dispatcher.codec = self.core().codec
+            self._dispatcher.remote_caches.clear()
         # Registering to 'onadd' and 'ondrop' signals to get notified whenever new peer is added/removed
         self.peerlist_subsystem.onadd.connect(self._add_new_peer)
         self.peerlist_subsystem.ondrop.connect(self._drop_new_peer)
@@ -243,30 +463,154 @@ class RPC(SubsystemBase):
             pass
 
     def _iterate_exports(self):
-        '''Iterates over exported methods and adds authorization checks
-        as necessary
+        '''Iterates over exported methods and adds result caches and
+        authorization checks as necessary
         '''
         for method_name in self._exports:
             method = self._exports[method_name]
             caps = annotations(method, set, 'rpc.allow_capabilities')
+            options = annotations(method, dict, 'rpc.cache').get(method_name)
+            if options:
+                method = self._add_cache(method_name, method, *options)
             if caps:
-                self._exports[method_name] = self._add_auth_check(method, caps)
+                method = self._add_auth_check(method, caps, method_name)
+            self._exports[method_name] = method
+
+    def _add_cache(self, name, method, ttl, key, idempotent):
+        '''Memoizes the results of method for ttl seconds.
+
+        The cache sits behind any authorization check so that cached
+        results are only returned to authorized callers. Results are kept
+        per calling peer.
+        '''
+        cache = self._caches[name] = ResultCache(ttl, key, idempotent,
+                                                 caller=self._caller)
+        return cache.wrap(method)
+
+    def _caller(self):
+        return getattr(getattr(self.context, 'vip_message', None), 'peer',
+                       None)
+
+    def invalidate(self, name=None, *args, **kwargs):
+        '''Drop cached results of exported methods.
+
+        With no name, all cached results are dropped. With a name, only
+        the results of that method are dropped, narrowed to a single
+        result when the call arguments are also given.
+        '''
+        if name is None:
+            for cache in self._caches.itervalues():
+                cache.invalidate()
+            return
+        try:
+            cache = self._caches[name]
+        except KeyError:
+            raise ValueError('method {!r} is not cached'.format(name))
+        cache.invalidate(*args, **kwargs)
+
+    def forget(self, peer=None, method=None):
+        '''Drop results of idempotent methods cached from other peers.
+
+        Results of all peers are dropped if peer is None and of all the
+        methods of peer if method is None.
+        '''
+        remote_caches = self._dispatcher.remote_caches
+        for key in remote_caches.keys():
+            if peer in (None, key[0]) and method in (None, key[1]):
+                del remote_caches[key]
 
-    def _add_auth_check(self, method, required_caps):
+    def _add_auth_check(self, method, required_caps, name):
         '''Adds an authorization check to verify the calling agent has the
         required capabilities.
+
+        Users which pass the check are remembered until the auth service
+        pushes new capabilities, so later calls need only a set lookup.
         '''
         def checked_method(*args, **kwargs):
             user = str(self.context.vip_message.user)
-            caps = self._owner.vip.auth.get_capabilities(user)
-            if not required_caps <= set(caps):
-                msg = ('method "{}" requires capabilities {},'
-                      ' but capability list {} was'
-                      ' provided').format(method.__name__, required_caps, caps)
-                raise jsonrpc.exception_from_json(jsonrpc.UNAUTHORIZED, msg)
+            authorized = self._authorized
+            if (user, name) not in authorized:
+                caps = self._owner.vip.auth.get_capabilities(user)
+                if not required_caps <= set(caps):
+                    msg = ('method "{}" requires capabilities {},'
+                          ' but capability list {} was'
+                          ' provided').format(method.__name__, required_caps, caps)
+                    raise jsonrpc.exception_from_json(jsonrpc.UNAUTHORIZED, msg)
+                authorized.add((user, name))
             return method(*args, **kwargs)
         return checked_method
 
+    def reset_authorizations(self):
+        '''Forget which users passed capability checks.
+
+        Called when user capabilities change.
+        '''
+        # Replaced rather than cleared so checks which were waiting on
+        # the old capabilities add their result to the discarded set
+        self._authorized = set()
+
+    def _get_stats(self, reset=False):
+        '''Return call counts, error counts and latencies of exported
+        methods since the agent started or the statistics were reset.
+
+        Latencies are in microseconds.
+        '''
+        stats = self._stats.snapshot()
+        if reset:
+            self._stats.reset()
+        return stats
+
+    def _open_stream(self, name, args, kwargs, count):
+        '''Call an exported method and return its first chunks.
+
+        Generators are read count chunks at a time by the caller; any
+        other result is sent as a single chunk.
+        '''
+        try:
+            method = self._exports[name]
+        except KeyError:
+            raise NotImplementedError(name)
+        result = method(*args, **kwargs)
+        chunks = result if inspect.isgenerator(result) else iter([result])
+        now = time.time()
+        for ident, (_, _, last_read) in self._streams.items():
+            if now - last_read > STREAM_IDLE_TIMEOUT:
+                self._discard_stream(ident)
+        ident = '%s.%s' % (next(self._counter), id(chunks))
+        self._streams[ident] = [
+            bytes(self.context.vip_message.peer), chunks, now]
+        return [ident] + self._read_stream(ident, count)
+
+    def _read_stream(self, ident, count):
+        '''Return the next count chunks of a stream and whether it ended.'''
+        stream = self._streams.get(ident)
+        if stream is None or stream[0] != bytes(self.context.vip_message.peer):
+            raise KeyError('unknown stream {!r}'.format(ident))
+        try:
+            chunks = list(itertools.islice(stream[1], count))
+        except Exception:
+            del self._streams[ident]
+            raise
+        done = len(chunks) < count
+        if done:
+            del self._streams[ident]
+        else:
+            stream[2] = time.time()
+        return [chunks, done]
+
+    def _close_stream(self, ident):
+        stream = self._streams.get(ident)
+        if stream is not None and stream[0] == bytes(self.context.vip_message.peer):
+            self._discard_stream(ident)
+
+    def _discard_stream(self, ident):
+        _, chunks, _ = self._streams.pop(ident)
+        try:
+            chunks.close()
+        except (AttributeError, ValueError):
+            # Not a generator or being read by another request
+            pass
+
     @spawn
     def _handle_external_rpc_subsystem(self, message):
         ret_msg = dict()
@@ -295,7 +639,9 @@ class RPC(SubsystemBase):
                     msg = jsonapi.dumps(dict(to_platform=rpc_msg['from_platform'],
                                              to_peer=rpc_msg['from_peer'],
                                              from_platform=rpc_msg['to_platform'],
-                                             from_peer=rpc_msg['to_peer'], args=responses))
+                                             from_peer=rpc_msg['to_peer'],
+                                             args=[codec.transcode(response, codec.JSON)
+                                                   for response in responses]))
                     frames.append(msg)
                 except KeyError:
                     _log.error("External RPC message did not contain proper message format")
@@ -353,19 +699,40 @@ class RPC(SubsystemBase):
                 result.set_exception(error)
 
     @dualmethod
-    def export(self, method, name=None):
-        self._exports[name or method.__name__] = method
+    def export(self, method, name=None, cache_ttl=None, cache_key=None,
+               idempotent=False):
+        name = name or method.__name__
+        options = _cache_options(cache_ttl, cache_key, idempotent)
+        if options:
+            self._exports[name] = self._add_cache(name, method, *options)
+        else:
+            self._caches.pop(name, None)
+            self._exports[name] = method
         return method
 
     @export.classmethod
-    def export(cls, name=None):   # pylint: disable=no-self-argument
-        if not isinstance(name, basestring):
+    def export(cls, name=None, cache_ttl=None, cache_key=None,
+               idempotent=False):   # pylint: disable=no-self-argument
+        '''Export the decorated method for calling over RPC.
+
+        If cache_ttl is given, results are memoized for that many
+        seconds for each calling peer, keyed by the JSON serialized
+        arguments or by the value returned from cache_key when called with
+        the method arguments.
+        Set idempotent to also let callers cache results for cache_ttl
+        seconds.
+        '''
+        if name is not None and not isinstance(name, basestring):
             method, name = name, name.__name__
             annotate(method, set, 'rpc.exports', name)
             return method
+        options = _cache_options(cache_ttl, cache_key, idempotent)
 
         def decorate(method):
-            annotate(method, set, 'rpc.exports', name)
+            export_name = name or method.__name__
+            annotate(method, set, 'rpc.exports', export_name)
+            if options:
+                annotate(method, dict, 'rpc.cache', {export_name: options})
             return method
         return decorate
 
@@ -390,7 +757,19 @@ class RPC(SubsystemBase):
 
     def call(self, peer, method, *args, **kwargs):
         platform = kwargs.pop('external_platform', b'')
+        if not platform:
+            cache = self._dispatcher.remote_caches.get((peer, method))
+            if cache is not None:
+                value = cache.get(cache.call_key(*args, **kwargs))
+                if value is not _MISSING:
+                    cache.hits += 1
+                    result = AsyncResult()
+                    result.set(value)
+                    return result
+                cache.misses += 1
         request, result = self._dispatcher.call(method, args, kwargs)
+        if not platform:
+            result.cache_call = peer, method, args, kwargs
         ident = '%s.%s' % (next(self._counter), hash(result))
         self._outstanding[ident] = result
         subsystem = None
@@ -408,8 +787,10 @@ class RPC(SubsystemBase):
                 op = b'send_platform'
                 subsystem = b'external_rpc'
                 frames.append(op)
+                # Remote platforms only accept JSON
                 msg = jsonapi.dumps(dict(to_platform=platform, to_peer=peer,
-                                         from_platform='', from_peer='', args=[request]))
+                                         from_platform='', from_peer='',
+                                         args=[codec.transcode(request, codec.JSON)]))
                 frames.append(msg)
                 peer = b''
 
@@ -447,6 +828,107 @@ class RPC(SubsystemBase):
 
     __call__ = call
 
+    def stream(self, peer, method, *args, **kwargs):
+        '''Call a method of peer whose result is read in chunks.
+
+        The exported method may return a generator, each chunk it
+        yields being returned by the iterator this method returns.
+        Chunks are requested stream_window at a time, the next window
+        being requested while the current one is consumed, so no more
+        than two windows are held at once. Each request waits up to
+        stream_timeout seconds for its reply. Stopping the iteration
+        early closes the generator.
+        '''
+        window = kwargs.pop('stream_window', STREAM_WINDOW)
+        timeout = kwargs.pop('stream_timeout', STREAM_TIMEOUT)
+        ident, chunks, done = self.call(
+            peer, 'stream.open', method, args, kwargs, window).get(
+            timeout=timeout)
+        return self._read_chunks(peer, ident, chunks, done, window, timeout)
+
+    def _read_chunks(self, peer, ident, chunks, done, window, timeout):
+        try:
+            while True:
+                if not done:
+                    pending = self.call(peer, 'stream.next', ident, window)
+                for chunk in chunks:
+                    yield chunk
+                if done:
+                    return
+                # Let the consumed window go while waiting for the next
+                chunks = None
+                chunks, done = pending.get(timeout=timeout)
+        finally:
+            if not done:
+                self.notify(peer, 'stream.close', ident)
+
+    def call_many(self, calls, timeout=None, concurrency=None):
+        '''Call methods of many peers at once.
+
+        calls is an iterable of (peer, method, args) or (peer, method,
+        args, kwargs) tuples. Calls are sent right away, at most
+        concurrency of them outstanding at a time if it is given.
+        Returns an iterator over (call, result) tuples, in the order the
+        calls complete, where call is the item from calls and result is
+        a ready AsyncResult. Errors are set on the result rather than
+        raised, and calls that have not completed within timeout seconds
+        of being sent fail with gevent.Timeout, so the remaining calls
+        are still returned.
+        '''
+        if concurrency is not None and concurrency < 1:
+            raise ValueError('concurrency must be at least 1')
+        calls = iter(calls)
+        done = gevent.queue.Queue()
+        # Outstanding results, in the order they were sent
+        outstanding = OrderedDict()
+
+        def completed(result):
+            try:
+                call, _ = outstanding.pop(result)
+            except KeyError:
+                return
+            done.put_nowait((call, result))
+
+        def send():
+            while concurrency is None or len(outstanding) < concurrency:
+                try:
+                    call = next(calls)
+                except StopIteration:
+                    return
+                peer, method, args = call[:3]
+                kwargs = call[3] if len(call) > 3 else {}
+                result = self.call(peer, method, *args, **kwargs)
+                if result is None:
+                    result = AsyncResult()
+                    result.set_exception(Unreachable(
+                        errno.EHOSTUNREACH, 'not connected', peer, b'RPC'))
+                deadline = None if timeout is None else time.time() + timeout
+                outstanding[result] = call, deadline
+                result.rawlink(completed)
+
+        def results():
+            while True:
+                send()
+                if not outstanding and done.empty():
+                    return
+                wait = None
+                if timeout is not None and outstanding:
+                    _, deadline = next(outstanding.itervalues())
+                    wait = max(0, deadline - time.time())
+                try:
+                    yield done.get(timeout=wait)
+                except gevent.queue.Empty:
+                    # A late reply sets the original result, so time out
+                    # with a result of our own
+                    result, (call, _) = outstanding.popitem(last=False)
+                    result.unlink(completed)
+                    expired = AsyncResult()
+                    expired.set_exception(gevent.Timeout(timeout))
+                    yield call, expired
+
+        send()
+        return results()
+
     def notify(self, peer, method, *args, **kwargs):
         platform = kwargs.pop('external_platform', '')
         request = self._dispatcher.notify(method, args, kwargs)
@@ -463,8 +945,10 @@ class RPC(SubsystemBase):
                 op = b'send_platform'
                 subsystem = b'external_rpc'
                 frames.append(op)
+                # Remote platforms only accept JSON
                 msg = jsonapi.dumps(dict(to_platform=platform, to_peer=peer,
-                                         from_platform='', from_peer='', args=[request]))
+                                         from_platform='', from_peer='',
+                                         args=[codec.transcode(request, codec.JSON)]))
                 frames.append(msg)
                 peer = b''
 
@@ -505,7 +989,11 @@ class RPC(SubsystemBase):
             cap = set([capabilities])
         else:
             cap = set(capabilities)
-        self._exports[method.__name__] = self._add_auth_check(method, cap)
+        name = method.__name__
+        cache = self._caches.get(name)
+        if cache is not None:
+            method = cache.wrap(method)
+        self._exports[name] = self._add_auth_check(method, cap, name)
 
     @allow.classmethod
     def allow(cls, capabilities):
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*- {{{
+# vim: set fenc=utf-8 ft=python sw=4 ts=4 sts=4 et:
+#
+# Copyright 2017, Battelle Memorial Institute.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# This material was prepared as an account of work sponsored by an agency of
+# the United States Government. Neither the United States Government nor the
+# United States Department of Energy, nor Battelle, nor any of their
+# employees, nor any jurisdiction or organization that has cooperated in the
+# development of these materials, makes any warranty, express or
+# implied, or assumes any legal liability or responsibility for the accuracy,
+# completeness, or usefulness or any information, apparatus, product,
+# software, or process disclosed, or represents that its use would not infringe
+# privately owned rights. Reference herein to any specific commercial product,
+# process, or service by trade name, trademark, manufacturer, or otherwise
+# does not necessarily constitute or imply its endorsement, recommendation, or
+# favoring by the United States Government or any agency thereof, or
+# Battelle Memorial Institute. The views and opinions of authors expressed
+# herein do not necessarily state or reflect those of the
+# United States Government or any agency thereof.
+#
+# PACIFIC NORTHWEST NATIONAL LABORATORY operated by
+# BATTELLE for the UNITED STATES DEPARTMENT OF ENERGY
+# under Contract DE-AC05-76RL01830
+# }}}
+
+'''Serialization of VIP message payloads.
+
+Pubsub messages and JSON-RPC requests are encoded with JSON by default.
+When msgpack is installed, agents offer it in the hello handshake and
+the router records which codec each connection accepts. Payloads are
+always maps or arrays, whose first byte tells the two formats apart, so
+decoding never needs to know the codec; only the router has to re-encode
+messages for peers which do not accept the sender's codec.
+'''
+
+
+from __future__ import absolute_import
+
+import struct
+
+from volttron.platform.agent import json as jsonapi
+
+try:
+    import msgpack
+    HAS_MSGPACK = True
+except ImportError:
+    HAS_MSGPACK = False
+
+__all__ = ['JSON', 'MSGPACK', 'HAS_MSGPACK', 'available_codecs', 'negotiate',
+           'codec_of', 'dumps', 'loads', 'transcode', 'prepend_item']
+
+JSON = b'json'
+MSGPACK = b'msgpack'
+
+
+def available_codecs():
+    '''Return the codecs supported here, most preferred first.'''
+    return [MSGPACK, JSON] if HAS_MSGPACK else [JSON]
+
+
+def negotiate(offered, accepted=None):
+    '''Return the first of the offered codecs which is accepted.
+
+    accepted defaults to the available codecs. JSON is always understood
+    and is returned when nothing else matches.
+    '''
+    if accepted is None:
+        accepted = available_codecs()
+    for codec in offered:
+        if codec in accepted:
+            return codec
+    return JSON
+
+
+def codec_of(data):
+    '''Return the codec of an encoded map or array.'''
+    # msgpack maps and arrays start with 0x80-0x9f or 0xdc-0xdf, JSON
+    # ones with a bracket or whitespace.
+    if data and ('\x80' <= data[0] <= '\x9f' or '\xdc' <= data[0] <= '\xdf'):
+        return MSGPACK
+    return JSON
+
+
+def _json_key(key):
+    '''Return a map key as JSON encodes it.'''
+    if isinstance(key, basestring):
+        return key
+    if key is True:
+        return 'true'
+    if key is False:
+        return 'false'
+    if key is None:
+        return 'null'
+    if isinstance(key, float):
+        return repr(key)
+    if isinstance(key, (int, long)):
+        return str(key)
+    raise TypeError('key {!r} is not a string'.format(key))
+
+
+def _json_keys(pairs):
+    '''Build a decoded map with its keys converted as JSON does.'''
+    return {_json_key(key): value for key, value in pairs}
+
+
+def dumps(data, codec=JSON):
+    '''Encode a dict or list with codec.
+
+    Data which msgpack cannot encode, such as integers beyond 64 bits, is
+    encoded with JSON instead.
+    '''
+    if codec == MSGPACK:
+        try:
+            return msgpack.packb(data, use_bin_type=False)
+        except (OverflowError, TypeError, ValueError):
+            pass
+    return jsonapi.dumps(data)
+
+
+def loads(data):
+    '''Decode a dict or list encoded with any codec.
+
+    Map keys are always strings, as they are in JSON.
+    '''
+    if codec_of(data) == MSGPACK:
+        try:
+            return msgpack.unpackb(data, raw=False, strict_map_key=True)
+        except ValueError:
+            # Some map has keys other than strings; convert them in Python.
+            return msgpack.unpackb(data, raw=False,
+                                   object_pairs_hook=_json_keys)
+    return jsonapi.loads(data)
+
+
+def transcode(data, codec):
+    '''Return data encoded with codec, re-encoding it only if necessary.'''
+    if codec_of(data) == codec:
+        return data
+    return dumps(loads(data), codec)
+
+
+def prepend_item(data, key, value):
+    '''Add an item to an encoded msgpack map without decoding it.'''
+    first = ord(data[0])
+    if first <= 0x8f:
+        count, start = first & 0x0f, 1
+    elif first == 0xde:
+        count, start = struct.unpack('>H', data[1:3])[0], 3
+    elif first == 0xdf:
+        count, start = struct.unpack('>I', data[1:5])[0], 5
+    else:
+        raise ValueError('not a msgpack map')
+    count += 1
+    if count <= 0x0f:
+        header = chr(0x80 | count)
+    elif count <= 0xffff:
+        header = '\xde' + struct.pack('>H', count)
+    else:
+        header = '\xdf' + struct.pack('>I', count)
+    pack = msgpack.packb
+    return header + pack(key, use_bin_type=False) + pack(value, use_bin_type=False) + data[start:]
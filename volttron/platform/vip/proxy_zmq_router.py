@@ -252,7 +252,8 @@ class ZMQProxyRouter(Agent):
         json_msg = jsonapi.dumps(dict(bus=bus, headers=headers, message=message))
         # Reformat the message into ZMQ VIP message frames
         frames = [sender, b'', b'VIP', '', '', 'pubsub',
-                  zmq.Frame(b'publish'), zmq.Frame(str(topic)), zmq.Frame(str(json_msg))]
+                  zmq.Frame(b'publish'), zmq.Frame(str(topic)), zmq.Frame(str(json_msg)),
+                  zmq.Frame(str(bus))]
 
         self.zmq_router.pubsub.handle_subsystem(frames, '')
 
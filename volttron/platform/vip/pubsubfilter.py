@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*- {{{
+# vim: set fenc=utf-8 ft=python sw=4 ts=4 sts=4 et:
+#
+# Copyright 2017, Battelle Memorial Institute.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# This material was prepared as an account of work sponsored by an agency of
+# the United States Government. Neither the United States Government nor the
+# United States Department of Energy, nor Battelle, nor any of their
+# employees, nor any jurisdiction or organization that has cooperated in the
+# development of these materials, makes any warranty, express or
+# implied, or assumes any legal liability or responsibility for the accuracy,
+# completeness, or usefulness or any information, apparatus, product,
+# software, or process disclosed, or represents that its use would not infringe
+# privately owned rights. Reference herein to any specific commercial product,
+# process, or service by trade name, trademark, manufacturer, or otherwise
+# does not necessarily constitute or imply its endorsement, recommendation, or
+# favoring by the United States Government or any agency thereof, or
+# Battelle Memorial Institute. The views and opinions of authors expressed
+# herein do not necessarily state or reflect those of the
+# United States Government or any agency thereof.
+#
+# PACIFIC NORTHWEST NATIONAL LABORATORY operated by
+# BATTELLE for the UNITED STATES DEPARTMENT OF ENERGY
+# under Contract DE-AC05-76RL01830
+# }}}
+
+'''Change filters for pubsub subscriptions.
+
+A subscriber may ask PubSubService to forward the messages of a
+subscription only when they differ meaningfully from the last message
+forwarded on the same topic. Numbers must move by more than the
+deadband, other values must differ and forwarding may be limited to
+once every min_interval seconds. Messages are compared structurally, so
+device "all" publishes pass when any point passes.
+'''
+
+
+from __future__ import absolute_import
+
+import time
+
+__all__ = ['SubscriptionFilter']
+
+
+_NUMBERS = {int, long, float}
+_MISSING = object()
+
+
+def _changed(old, new, deadband):
+    '''Return True if new differs from old by more than the deadband.'''
+    if new == old:
+        # Cheap for the parts of a message which never change, e.g. metadata
+        return False
+    kind = type(new)
+    if kind in _NUMBERS and type(old) in _NUMBERS:
+        return abs(new - old) > deadband
+    if kind is dict and type(old) is dict:
+        if len(new) != len(old):
+            return True
+        # Device points are mostly numbers, so they are compared inline
+        for key, value in new.iteritems():
+            previous = old.get(key, _MISSING)
+            if value == previous:
+                continue
+            if type(value) in _NUMBERS and type(previous) in _NUMBERS:
+                if abs(value - previous) > deadband:
+                    return True
+            elif previous is _MISSING or _changed(previous, value, deadband):
+                return True
+        return False
+    if kind is list and type(old) is list:
+        if len(new) != len(old):
+            return True
+        for previous, value in zip(old, new):
+            if _changed(previous, value, deadband):
+                return True
+        return False
+    return True
+
+
+class SubscriptionFilter(object):
+    '''Decides which messages of a subscription are forwarded.
+
+    deadband is the change a number must exceed to be forwarded,
+    on_change forwards only messages which differ from the last one
+    forwarded and min_interval is the minimum number of seconds between
+    forwarded messages. Each topic is tracked separately and the first
+    message of a topic is always forwarded.
+    '''
+
+    def __init__(self, deadband=None, on_change=False, min_interval=None):
+        self.deadband = deadband
+        self.on_change = on_change
+        self.min_interval = min_interval
+        self._last = {}
+
+    @classmethod
+    def from_options(cls, options):
+        '''Create a filter from the options sent with a subscription.'''
+        return cls(deadband=options.get('deadband'),
+                   on_change=options.get('on_change', False),
+                   min_interval=options.get('min_interval'))
+
+    def options(self):
+        '''Return the options of this filter as sent with a subscription.'''
+        return dict(deadband=self.deadband, on_change=self.on_change,
+                    min_interval=self.min_interval)
+
+    def accept(self, topic, message, now=None):
+        '''Return True if message is to be forwarded and remember it.'''
+        if now is None:
+            now = time.time()
+        last = self._last.get(topic)
+        if last is not None:
+            last_time, last_message = last
+            if self.min_interval and now - last_time < self.min_interval:
+                return False
+            if self.deadband is not None or self.on_change:
+                if not _changed(last_message, message, self.deadband or 0):
+                    return False
+        self._last[topic] = (now, message)
+        return True
@@ -46,11 +46,14 @@ import re
 import zmq
 from zmq import SNDMORE, EHOSTUNREACH, ZMQError, EAGAIN, NOBLOCK
 from zmq import green
-from collections import defaultdict
+from collections import defaultdict, deque
 
 # Create a context common to the green and non-green zmq modules.
 green.Context._instance = green.Context.shadow(zmq.Context.instance().underlying)
-from .agent.subsystems.pubsub import ProtectedPubSubTopics
+from .agent.subsystems.pubsub import ProtectedPubSubTopics, NOACK_ID
+from .codec import JSON, MSGPACK, codec_of, dumps, loads, prepend_item, transcode
+from .pubsubfilter import SubscriptionFilter
+from .topictrie import SubscriptionTrie, topic_matches
 from volttron.platform.jsonrpc import (INVALID_REQUEST, UNAUTHORIZED)
 from volttron.platform.vip.agent.errors import VIPError
 from volttron.platform.agent import json as jsonapi
@@ -62,16 +65,115 @@ _ROUTE_ERRORS = {
     for errnum in [zmq.EHOSTUNREACH, zmq.EAGAIN]
 }
 
+# Instead of a response to each unacknowledged publish, the publisher is granted PUBLISH_CREDIT_BATCH credits at a
+# time once that many have been routed.
+PUBLISH_CREDIT_BATCH = 16
+
+
+def _add_sender(data, sender):
+    """
+    Insert the sender into an encoded publish message, which must be a JSON object or msgpack map. The message is only
+    decoded if it may already hold a sender key, which is then replaced so a publisher cannot forge its sender.
+    :param data encoded publish message
+    :type data str
+    :param sender identity of the publishing agent
+    :type sender str
+    :returns: encoded publish message including the sender
+    :rtype: str
+    :raises ValueError: if the message is not a map
+    """
+    codec = codec_of(data)
+    # A sender key is spelled out in the message unless a JSON key escapes its characters.
+    if b'sender' in data or (codec == JSON and b'\\u' in data):
+        message = loads(data)
+        if not isinstance(message, dict):
+            raise ValueError('publish message is not a map')
+        message['sender'] = sender
+        return dumps(message, codec)
+    if codec == MSGPACK:
+        return prepend_item(data, 'sender', sender)
+    data = data.lstrip()
+    if not data.startswith(b'{'):
+        raise ValueError('publish message is not a map')
+    if data[1:].lstrip().startswith('}'):
+        return '{"sender": ' + jsonapi.dumps(sender) + '}'
+    return '{"sender": ' + jsonapi.dumps(sender) + ', ' + data[1:]
+
+
+# What is done with publishes to a subscriber whose socket queue is full:
+#   drop         - the publish is dropped and EAGAIN is reported to the publisher
+#   block        - publishes are queued and the router waits for the subscriber when the queue is full
+#   drop_oldest  - publishes are queued and the oldest queued publish is dropped when the queue is full
+#   conflate     - like drop_oldest, but a queued publish is replaced by a newer publish to the same topic
+QUEUE_DROP = 'drop'
+QUEUE_BLOCK = 'block'
+QUEUE_DROP_OLDEST = 'drop_oldest'
+QUEUE_CONFLATE = 'conflate'
+QUEUE_POLICIES = (QUEUE_DROP, QUEUE_BLOCK, QUEUE_DROP_OLDEST, QUEUE_CONFLATE)
+
+
+class _OutboundQueue(object):
+    """Publishes waiting to be sent to one subscriber, with the counters of what the queue policy discarded"""
+
+    def __init__(self, policy):
+        self.policy = policy
+        # Entries are [topic, frames] so conflation can replace the frames of a queued entry
+        self.messages = deque()
+        self.topics = {}
+        self.dropped = 0
+        self.conflated = 0
+        self.max_depth = 0
+
+    def put(self, topic, frames, max_length):
+        if self.policy == QUEUE_CONFLATE and topic is not None:
+            entry = self.topics.get(topic)
+            if entry is not None:
+                entry[1] = frames
+                self.conflated += 1
+                return
+        if len(self.messages) >= max_length and self.policy != QUEUE_BLOCK:
+            self.pop()
+            self.dropped += 1
+        entry = [topic, frames]
+        self.messages.append(entry)
+        if self.policy == QUEUE_CONFLATE and topic is not None:
+            self.topics[topic] = entry
+        self.max_depth = max(self.max_depth, len(self.messages))
+
+    def pop(self):
+        topic, _ = entry = self.messages.popleft()
+        if self.topics.get(topic) is entry:
+            del self.topics[topic]
+
+    def stats(self):
+        return dict(policy=self.policy, queued=len(self.messages), max_depth=self.max_depth,
+                    dropped=self.dropped, conflated=self.conflated)
+
 
 class PubSubService(object):
-    def __init__(self, socket, protected_topics, routing_service, *args, **kwargs):
+    def __init__(self, socket, protected_topics, routing_service, retained=None, queue_policy=QUEUE_DROP,
+                 queue_length=1000, codecs=None, topic_tables=None, *args, **kwargs):
         self._logger = logging.getLogger(__name__)
+        # Optional LastValueCache of retained messages
+        self._retained = retained
+        if queue_policy not in QUEUE_POLICIES:
+            raise ValueError('unknown queue policy {!r}'.format(queue_policy))
+        # Default policy for publishes to subscribers that cannot keep up and the per-subscriber overrides
+        self._queue_policy = queue_policy
+        self._queue_policies = {}
+        self._queue_length = queue_length
+        # Outbound queues of subscribers which failed to take a publish, and the ones with publishes waiting
+        self._outbound = {}
+        self._backlogged = set()
+        # Change filters of subscriptions, by peer and then (platform, bus, prefix)
+        self._filters = {}
+        # Codecs negotiated by peers which accept something besides JSON, maintained by the router
+        self._codecs = codecs if codecs is not None else {}
+        # Outbound and inbound topic tables of peers which negotiated topic ids, maintained by the router
+        self._topic_tables = topic_tables if topic_tables is not None else {}
 
         def platform_subscriptions():
-            return defaultdict(subscriptions)
-
-        def subscriptions():
-            return defaultdict(set)
+            return defaultdict(SubscriptionTrie)
 
         self._peer_subscriptions = defaultdict(platform_subscriptions)
         self._vip_sock = socket
@@ -79,6 +181,10 @@ class PubSubService(object):
         self._protected_topics = ProtectedPubSubTopics()
         self._load_protected_topics(protected_topics)
         self._ext_subscriptions = defaultdict(set)
+        # Peers which accept several publishes in one publish_batch message
+        self._batch_peers = set()
+        # Number of unacknowledged publishes routed per peer since it was last granted credits
+        self._credits_owed = defaultdict(int)
         self._ext_router = routing_service
         if self._ext_router is not None:
             self._ext_router.register('on_connect', self.external_platform_add)
@@ -94,8 +200,15 @@ class PubSubService(object):
         :type str
         :param prefix subscription prefix (peer is subscribing to all topics matching the prefix)
         :type str
+        :returns: False if prefix is not a valid pattern
+        :rtype: boolean
         """
-        self._peer_subscriptions[platform][bus][prefix].add(peer)
+        try:
+            self._peer_subscriptions[platform][bus][prefix].add(peer)
+        except ValueError as exc:
+            self._logger.error("Ignoring subscription of {} to {!r}: {}".format(peer, prefix, exc))
+            return False
+        return True
 
     def peer_drop(self, peer, **kwargs):
         """
@@ -106,6 +219,12 @@ class PubSubService(object):
         :type pointer to arguments
         """
         self._sync(peer, {})
+        self._batch_peers.discard(peer)
+        self._credits_owed.pop(peer, None)
+        self._queue_policies.pop(peer, None)
+        self._outbound.pop(peer, None)
+        self._backlogged.discard(peer)
+        self._filters.pop(peer, None)
 
     def peer_add(self, peer):
         # To do
@@ -175,10 +294,14 @@ class PubSubService(object):
                 data = frames[8].bytes
                 msg = jsonapi.loads(data)
                 peer = frames[0].bytes
+                if msg.get('batch', False):
+                    self._batch_peers.add(peer)
+                self._set_queue_policy(peer, msg.get('queue_policy'))
                 try:
                     items = msg['subscriptions']
                     assert isinstance(items, dict)
                     self._sync(peer, items)
+                    self._sync_filters(peer, msg.get('filters', []))
                 except KeyError as exc:
                     self._logger.error("Missing key in _peer_sync message {}".format(exc))
 
@@ -213,6 +336,9 @@ class PubSubService(object):
                 return False
 
             is_all = msg.get('all_platforms', False)
+            if msg.get('batch', False):
+                self._batch_peers.add(peer)
+            self._set_queue_policy(peer, msg.get('queue_policy'))
 
             if is_all:
                 platform = 'all'
@@ -225,8 +351,13 @@ class PubSubService(object):
                                                               self.publish_callback,
                                                               all_platforms=is_all)
 
-            for prefix in prefix if isinstance(prefix, list) else [prefix]:
-                self._add_peer_subscription(peer, bus, prefix, platform)
+            prefixes = prefix if isinstance(prefix, list) else [prefix]
+            options = msg.get('filter')
+            for prefix in prefixes:
+                if self._add_peer_subscription(peer, bus, prefix, platform):
+                    self._set_filter(peer, (platform, bus, prefix), options)
+            if msg.get('replay', False):
+                self._replay_retained(peer, bus, prefixes)
 
             # self._logger.debug("Subscribe after: {}".format(self._peer_subscriptions))
             if is_all and self._ext_router is not None:
@@ -272,12 +403,14 @@ class PubSubService(object):
                     remove = []
                     for topic, subscribers in subscriptions.iteritems():
                         subscribers.discard(peer)
+                        self._set_filter(peer, (platform, bus, topic), None)
                         if not subscribers:
                             remove.append(topic)
                     for topic in remove:
                         del subscriptions[topic]
                 else:
                     for prefix in prefix if isinstance(prefix, list) else [prefix]:
+                        self._set_filter(peer, (platform, bus, prefix), None)
                         subscribers = subscriptions[prefix]
                         subscribers.discard(peer)
                         if not subscribers:
@@ -301,7 +434,19 @@ class PubSubService(object):
         :Return Values:
         Number of subscribers to whom the message was sent
         """
-        if len(frames) > 8:
+        if len(frames) > 9:
+            # Newer agents send the bus in a frame of its own, so only the sender needs adding to the message and
+            # the payload is never decoded.
+            peer = bytes(frames[0])
+            try:
+                frames[8] = zmq.Frame(_add_sender(bytes(frames[8]), peer))
+            except ValueError as exc:
+                self._logger.error("Invalid publish message from {}: {}".format(peer, exc))
+                return 0
+            if self._rabbitmq_agent:
+                self._publish_on_rmq_bus(frames)
+            return self._distribute(frames, user_id)
+        elif len(frames) > 8:
             data = frames[8].bytes
             try:
                 msg = jsonapi.loads(data)
@@ -323,6 +468,111 @@ class PubSubService(object):
                 self._publish_on_rmq_bus(frames)
             return self._distribute(frames, user_id)
 
+    def _peer_publish_batch(self, frames, user_id):
+        """Publish several messages sent in one request to their subscribers. Each subscriber receives all the
+        messages meant for it in a single publish_batch message if it accepts batches, or one publish message per
+        topic otherwise. Messages to protected topics the publisher is not authorized for are reported back as errors
+        and skipped.
+        :param frames list of frames: bus followed by pairs of topic and message frames
+        :type frames list
+        :param user_id user id of the publishing agent. This is required for protected topics check.
+        :type user_id  UTF-8 encoded User-Id property
+        :returns: Count of messages delivered to subscribers.
+        :rtype: int
+
+        :Return Values:
+        Number of messages delivered
+        """
+        if len(frames) < 10 or len(frames) % 2:
+            return 0
+        publisher, receiver, proto, _, msg_id, subsystem, op, bus_frame = frames[0:8]
+        peer = bytes(publisher)
+        bus = bytes(bus_frame)
+        deliveries = defaultdict(list)
+        codecs = self._codecs
+        count = 0
+        for index in range(8, len(frames), 2):
+            topic_frame = frames[index]
+            topic = bytes(topic_frame)
+            errmsg = self._check_if_protected_topic(bytes(user_id), topic)
+            if errmsg is not None:
+                error = [publisher, b'', proto, user_id, msg_id,
+                         b'error', zmq.Frame(bytes(UNAUTHORIZED)),
+                         zmq.Frame(str(errmsg)), b'', subsystem]
+                self._send(error, publisher)
+                continue
+            try:
+                payload = _add_sender(bytes(frames[index + 1]), peer)
+            except ValueError as exc:
+                self._logger.error("Invalid publish message from {}: {}".format(peer, exc))
+                continue
+            self._retain(bus, topic, payload)
+            data = zmq.Frame(payload)
+            publish_frames = [publisher, receiver, proto, user_id, msg_id, subsystem,
+                              zmq.Frame(b'publish'), topic_frame, data, bus_frame]
+            if self._rabbitmq_agent:
+                self._publish_on_rmq_bus(publish_frames)
+            decoded = []
+            encoded = {None: data} if codecs else None
+            for subscriber in self._find_subscribers(bus, topic):
+                if self._filters and self._filtered_out(subscriber, bus, topic, payload, decoded):
+                    continue
+                if codecs:
+                    deliveries[subscriber].append((topic_frame, self._encoded_for(subscriber, payload, encoded)))
+                else:
+                    deliveries[subscriber].append((topic_frame, data))
+                count += 1
+            count += self._distribute_external(publish_frames)
+
+        header = [receiver, proto, user_id, msg_id, subsystem]
+        for subscriber, messages in deliveries.iteritems():
+            if subscriber in self._batch_peers:
+                batch = [zmq.Frame(subscriber)] + header + [zmq.Frame(b'publish_batch'), bus_frame]
+                for topic_frame, data in messages:
+                    batch.extend((topic_frame, data))
+                dropped = self._deliver(batch, publisher, None)
+            else:
+                for topic_frame, data in messages:
+                    single = [zmq.Frame(subscriber)] + header + [zmq.Frame(b'publish'), topic_frame, data, bus_frame]
+                    dropped = self._deliver(single, publisher, bytes(topic_frame))
+                    if dropped:
+                        break
+            for sub in dropped:
+                self.peer_drop(sub)
+        return count
+
+    def _retain(self, bus, topic, data):
+        """
+        Keep the message as the last value of the topic if the topic is retained
+        :param bus: bus
+        :param topic: topic of the message
+        :param data: message including the sender
+        """
+        if self._retained is not None and self._retained.retains(topic):
+            self._retained.put(bus, topic, data)
+
+    def _replay_retained(self, peer, bus, prefixes):
+        """
+        Send the retained messages matching the prefixes to a new subscriber
+        :param peer: identity of the subscriber
+        :param bus: bus
+        :param prefixes: list of subscribed prefixes
+        """
+        if self._retained is None:
+            return
+        messages = {}
+        for prefix in prefixes:
+            messages.update(self._retained.get(bus, prefix))
+        codec = self._codecs.get(peer, JSON)
+        for topic, data in messages.iteritems():
+            if codec == JSON:
+                data = transcode(data, JSON)
+            frames = [zmq.Frame(peer), b'', b'VIP1', b'', b'', b'pubsub',
+                      zmq.Frame(b'publish'), zmq.Frame(topic), zmq.Frame(data), zmq.Frame(str(bus))]
+            if self._deliver(frames, peer, topic):
+                self.peer_drop(peer)
+                break
+
     def _peer_list(self, frames):
         """Returns a list of subscriptions for a specific bus. If bus is None, then it returns list of subscriptions
         for all the buses.
@@ -424,51 +674,158 @@ class PubSubService(object):
         """
         publisher = bytes(frames[0])
         topic = bytes(frames[7])
-        data = bytes(frames[8])
-        try:
-            msg = jsonapi.loads(data)
-            bus = msg['bus']
-        except KeyError as exc:
-            self._logger.error("Missing key in _peer_publish message {}".format(exc))
-            return 0
-        except ValueError:
-            self._logger.error("JSON decode error. Invalid character")
-            return 0
-
-        all_subscriptions = dict()
-        subscriptions = dict()
-        subs = dict()
-        # Get subscriptions for all platforms
-        try:
-            all_subscriptions = self._peer_subscriptions['all'][bus]
-        except KeyError:
-            pass
-        try:
-            subscriptions = self._peer_subscriptions['internal'][bus]
-        except KeyError:
-            pass
-
-        subs.update(all_subscriptions)
-        subs.update(subscriptions)
-        subscribers = set()
-        # Check for local subscribers
-        for prefix, subscription in subs.iteritems():
-            if subscription and topic.startswith(prefix):
-                subscribers |= subscription
+        if len(frames) > 9:
+            bus = bytes(frames[9])
+        else:
+            # Older publishers only carry the bus inside the message
+            data = bytes(frames[8])
+            try:
+                msg = jsonapi.loads(data)
+                bus = msg['bus']
+            except KeyError as exc:
+                self._logger.error("Missing key in _peer_publish message {}".format(exc))
+                return 0
+            except ValueError:
+                self._logger.error("JSON decode error. Invalid character")
+                return 0
 
+        data = bytes(frames[8])
+        self._retain(bus, topic, data)
+        subscribers = self._find_subscribers(bus, topic)
+        count = 0
+        decoded = []
+        codecs = self._codecs
+        encoded = {None: frames[8]} if codecs else None
         if subscribers:
             # self._logger.debug("PUBSUBSERVICE: found subscribers: {}".format(subscribers))
             for subscriber in subscribers:
+                if self._filters and self._filtered_out(subscriber, bus, topic, data, decoded):
+                    continue
+                count += 1
                 frames[0] = zmq.Frame(subscriber)
+                if codecs:
+                    frames[8] = self._encoded_for(subscriber, data, encoded)
                 try:
                     # Send the message to the subscriber
-                    for sub in self._send(frames, publisher):
+                    for sub in self._deliver(frames, publisher, topic):
                         # Drop the subscriber if unreachable
                         self.peer_drop(sub)
                 except ZMQError:
                     raise
 
-        return len(subscribers)
+        return count
+
+    def _encoded_for(self, subscriber, data, encoded):
+        """
+        Return the publish message frame encoded for a subscriber. Subscribers which negotiated msgpack decode
+        either codec, so only subscribers accepting nothing but JSON may need the message re-encoded.
+        :param subscriber identity of the subscriber
+        :type subscriber str
+        :param data encoded publish message
+        :type data str
+        :param encoded message frame as published under the key None and as re-encoded by codec, shared by the
+        subscribers of the message
+        :type encoded dict
+        :returns: message frame
+        :rtype: zmq.Frame
+        """
+        if subscriber in self._codecs or codec_of(data) == JSON:
+            return encoded[None]
+        frame = encoded.get(JSON)
+        if frame is None:
+            frame = encoded[JSON] = zmq.Frame(transcode(data, JSON))
+        return frame
+
+    def _find_subscribers(self, bus, topic):
+        """
+        Find the local subscribers of a topic
+        :param bus: bus
+        :param topic: topic of the message
+        :return: set of subscriber identities
+        """
+        subscribers = set()
+        # The subscription index returns only the prefixes matching the topic.
+        for platform in ('internal', 'all'):
+            bus_subscriptions = self._peer_subscriptions.get(platform)
+            if bus_subscriptions is None or bus not in bus_subscriptions:
+                continue
+            for subscription in bus_subscriptions[bus].match(topic):
+                subscribers |= subscription
+        return subscribers
+
+    def _set_filter(self, peer, key, options):
+        """
+        Set or remove the change filter of a subscription
+        :param peer identity of the subscriber
+        :type peer str
+        :param key platform, bus and prefix of the subscription
+        :type key tuple
+        :param options filter options sent with the subscription or None to remove the filter
+        :type options dict
+        """
+        if options:
+            self._filters.setdefault(peer, {})[key] = SubscriptionFilter.from_options(options)
+        elif peer in self._filters:
+            filters = self._filters[peer]
+            filters.pop(key, None)
+            if not filters:
+                del self._filters[peer]
+
+    def _sync_filters(self, peer, entries):
+        """
+        Replace the change filters of a peer with the ones sent in its synchronize message. Filters whose options
+        did not change keep the last values they forwarded.
+        :param peer identity of the subscriber
+        :type peer str
+        :param entries list of [platform, bus, prefix, options]
+        :type entries list
+        """
+        old = self._filters.pop(peer, {})
+        for platform, bus, prefix, options in entries:
+            key = (platform, bus, prefix)
+            subscription_filter = SubscriptionFilter.from_options(options)
+            if key in old and old[key].options() == subscription_filter.options():
+                subscription_filter = old[key]
+            self._filters.setdefault(peer, {})[key] = subscription_filter
+
+    def _filtered_out(self, peer, bus, topic, data, decoded):
+        """
+        Check the message against the change filters of the peer's subscriptions matching the topic. The message is
+        decoded only if there are any, once for all subscribers.
+        :param peer identity of the subscriber
+        :type peer str
+        :param data JSON encoded publish message
+        :type data str
+        :param decoded empty list, or list holding the decoded message, shared by the subscribers of the message
+        :type decoded list
+        :returns: True if the message is not to be sent to the peer
+        :rtype: bool
+        """
+        filters = self._filters.get(peer)
+        if not filters:
+            return False
+        matched = 0
+        accepted = False
+        for (platform, filter_bus, prefix), subscription_filter in filters.iteritems():
+            if filter_bus != bus or not topic_matches(prefix, topic):
+                continue
+            matched += 1
+            if not decoded:
+                try:
+                    decoded.append(loads(data)['message'])
+                except (KeyError, ValueError):
+                    return False
+            if subscription_filter.accept(topic, decoded[0]):
+                accepted = True
+        if not matched or accepted:
+            return False
+        # Subscriptions without a filter which match the topic receive every message
+        subscriptions = 0
+        for platform in ('internal', 'all'):
+            bus_subscriptions = self._peer_subscriptions.get(platform)
+            if bus_subscriptions is not None and bus in bus_subscriptions:
+                subscriptions += sum(1 for subscribers in bus_subscriptions[bus].match(topic) if peer in subscribers)
+        return subscriptions <= matched
 
     def _distribute_external(self, frames):
         """
@@ -482,12 +839,18 @@ class PubSubService(object):
         external_subscribers = set()
         for platform_id, subscriptions in self._ext_subscriptions.items():
             for prefix in subscriptions:
-                if bytes(topic).startswith(prefix):
+                if topic_matches(prefix, bytes(topic)):
                     external_subscribers.add(platform_id)
         # self._logger.debug("PUBSUBSERVICE External subscriptions {0}, {1}".format(topic, external_subscribers))
         if external_subscribers:
+            # Keep the bus frame, if any, so the remote router does not have to decode the message either
+            bus_frame = frames[9:10]
+            if self._codecs and codec_of(bytes(data)) != JSON:
+                # Remote platforms only accept JSON
+                data = zmq.Frame(transcode(bytes(data), JSON))
             frames[:] = []
             frames[0:7] = b'', proto, user_id, msg_id, subsystem, b'external_publish', topic, data
+            frames.extend(bus_frame)
             for platform_id in external_subscribers:
                 try:
                     if self._ext_router is not None:
@@ -539,26 +902,219 @@ class PubSubService(object):
             # Try sending the message to its recipient
             self._vip_sock.send_multipart(frames, flags=NOBLOCK, copy=False)
         except ZMQError as exc:
-            try:
-                errnum, errmsg = error = _ROUTE_ERRORS[exc.errno]
-            except KeyError:
-                error = None
             if exc.errno == EHOSTUNREACH:
-                self._logger.debug("Host unreachable {}".format(subscriber.bytes))
+                self._logger.debug("Host unreachable {}".format(bytes(subscriber)))
                 drop.append(bytes(subscriber))
             elif exc.errno == EAGAIN:
-                self._logger.debug("EAGAIN error {}".format(subscriber.bytes))
-                # Only send EAGAIN errors
-                proto, user_id, msg_id, subsystem = frames[2:6]
-                frames = [publisher, b'', proto, user_id, msg_id,
-                          b'error', errnum, errmsg, subscriber, subsystem]
-                try:
-                    self._vip_sock.send_multipart(frames, flags=NOBLOCK, copy=False)
-                except ZMQError as exc:
-                    # raise
-                    pass
+                self._logger.debug("EAGAIN error {}".format(bytes(subscriber)))
+                self._report_again(frames, publisher)
         return drop
 
+    def _report_again(self, frames, publisher):
+        """
+        Report back to the publisher that the message could not be sent because the recipient's queue is full
+        :param frames list of frames of the message which was not sent
+        :type frames list
+        :param publisher
+        :type bytes
+        """
+        errnum, errmsg = _ROUTE_ERRORS[EAGAIN]
+        proto, user_id, msg_id, subsystem = frames[2:6]
+        frames = [publisher, b'', proto, user_id, msg_id,
+                  b'error', errnum, errmsg, frames[0], subsystem]
+        try:
+            self._vip_sock.send_multipart(frames, flags=NOBLOCK, copy=False)
+        except ZMQError as exc:
+            # raise
+            pass
+
+    def _set_queue_policy(self, peer, policy):
+        """
+        Set the policy for publishes to a subscriber which cannot keep up, as requested by the subscriber
+        :param peer identity of the subscriber
+        :type peer str
+        :param policy one of QUEUE_POLICIES or None to keep the current policy
+        :type policy str
+        """
+        if policy is None:
+            return
+        if policy not in QUEUE_POLICIES:
+            self._logger.error("Unknown queue policy {0} requested by {1}".format(policy, peer))
+            return
+        self._queue_policies[peer] = policy
+        queue = self._outbound.get(peer)
+        if queue is not None:
+            queue.policy = policy
+
+    def _deliver(self, frames, publisher, topic):
+        """
+        Send a publish to a subscriber. If the subscriber's socket queue is full, or publishes are already waiting
+        for it, the subscriber's queue policy decides what happens to the publish.
+        :param frames list of frames
+        :type frames list
+        :param publisher
+        :type bytes
+        :param topic topic of the publish or None if it is not to be conflated
+        :type topic str
+        :returns: List of dropped recipients, if any
+        :rtype: list
+        """
+        subscriber = bytes(frames[0])
+        queue = self._outbound.get(subscriber)
+        if queue is not None and queue.messages:
+            # Publishes must not overtake the ones already waiting
+            dropped = self._flush_queue(subscriber, queue)
+            if dropped:
+                return dropped
+        if queue is None or not queue.messages:
+            try:
+                self._send_publish(subscriber, frames, NOBLOCK)
+                return []
+            except ZMQError as exc:
+                if exc.errno == EHOSTUNREACH:
+                    self._logger.debug("Host unreachable {}".format(subscriber))
+                    return [subscriber]
+                if exc.errno != EAGAIN:
+                    raise
+            if queue is None:
+                queue = _OutboundQueue(self._queue_policies.get(subscriber, self._queue_policy))
+                self._outbound[subscriber] = queue
+            if queue.policy == QUEUE_DROP:
+                self._logger.debug("EAGAIN error {}".format(subscriber))
+                queue.dropped += 1
+                self._report_again(frames, publisher)
+                return []
+        # The frames list may be reused by the caller for the next subscriber
+        queue.put(topic, list(frames), self._queue_length)
+        self._backlogged.add(subscriber)
+        if queue.policy == QUEUE_BLOCK and len(queue.messages) >= self._queue_length:
+            return self._flush_queue(subscriber, queue, block=True)
+        return []
+
+    def _flush_queue(self, peer, queue, block=False):
+        """
+        Send as many queued publishes to a subscriber as its socket accepts
+        :param peer identity of the subscriber
+        :type peer str
+        :param queue outbound queue of the subscriber
+        :type queue _OutboundQueue
+        :param block wait for the subscriber to accept all queued publishes
+        :type block bool
+        :returns: List of dropped recipients, if any
+        :rtype: list
+        """
+        flags = 0 if block else NOBLOCK
+        while queue.messages:
+            try:
+                self._send_publish(peer, queue.messages[0][1], flags)
+            except ZMQError as exc:
+                if exc.errno == EAGAIN:
+                    return []
+                if exc.errno == EHOSTUNREACH:
+                    self._logger.debug("Host unreachable {}".format(peer))
+                    return [peer]
+                raise
+            queue.pop()
+        self._backlogged.discard(peer)
+        return []
+
+    def _send_publish(self, subscriber, frames, flags):
+        """
+        Send a publish or publish_batch message to a subscriber. Subscribers which negotiated topic ids receive each
+        topic in full only the first time it is sent to them, and its id after that.
+        :param subscriber identity of the subscriber
+        :type subscriber str
+        :param frames list of frames
+        :type frames list
+        :param flags flags of the send
+        :type flags int
+        """
+        tables = self._topic_tables.get(subscriber)
+        if tables is None:
+            self._vip_sock.send_multipart(frames, flags=flags, copy=False)
+            return
+        encoder = tables[0]
+        frames = list(frames)
+        indexes = (7,) if bytes(frames[6]) == b'publish' else range(8, len(frames), 2)
+        defined = []
+        for index in indexes:
+            topic = bytes(frames[index])
+            frames[index], new = encoder.encode(topic)
+            if new:
+                defined.append(topic)
+        try:
+            self._vip_sock.send_multipart(frames, flags=flags, copy=False)
+        except ZMQError:
+            # The subscriber never saw the definitions
+            for topic in defined:
+                encoder.forget(topic)
+            raise
+
+    def _decode_topics(self, frames):
+        """
+        Replace the topic ids of a publish or publish_batch message from a peer which negotiated topic ids with their
+        topics. If the message refers to an unknown id the peer is asked to reset its ids and send the topics in full.
+        :param frames list of frames
+        :type frames list
+        :returns: False if the message refers to an unknown topic id
+        :rtype: bool
+        """
+        peer = bytes(frames[0])
+        tables = self._topic_tables.get(peer)
+        if tables is None:
+            return True
+        decoder = tables[1]
+        indexes = (7,) if bytes(frames[6]) == b'publish' else range(8, len(frames), 2)
+        for index in indexes:
+            if index >= len(frames):
+                break
+            data = bytes(frames[index])
+            topic = decoder.decode(data)
+            if topic is None:
+                self._logger.warning("Unknown topic id from {}, asking for a topic reset".format(peer))
+                frames = [frames[0], b'', frames[2], b'', b'', b'pubsub', zmq.Frame(b'topic_reset')]
+                for sub in self._send(frames, frames[0]):
+                    self.peer_drop(sub)
+                return False
+            if topic is not data:
+                frames[index] = zmq.Frame(topic)
+        return True
+
+    def _reset_topic_ids(self, peer):
+        """
+        Forget the topic ids sent to a peer which received an id it did not know, so that topics are sent in full
+        again.
+        :param peer identity of the subscriber
+        :type peer str
+        """
+        tables = self._topic_tables.get(peer)
+        if tables is not None:
+            self._logger.debug("Resetting topic ids of {}".format(peer))
+            tables[0].clear()
+
+    def backlogged(self):
+        """
+        Returns true if publishes are waiting to be sent to any subscriber
+        """
+        return bool(self._backlogged)
+
+    def flush_queues(self):
+        """
+        Retry sending the queued publishes of all subscribers. The router calls this whenever it is idle while
+        publishes are waiting.
+        """
+        for peer in list(self._backlogged):
+            for sub in self._flush_queue(peer, self._outbound[peer]):
+                self.peer_drop(sub)
+
+    def queue_stats(self):
+        """
+        Returns counters of the outbound queue of every subscriber which could not keep up
+        :returns: dictionary of subscriber identity to policy, queued, max_depth, dropped and conflated counters
+        :rtype: dict
+        """
+        return {peer: queue.stats() for peer, queue in self._outbound.iteritems()}
+
     def _update_caps_users(self, frames):
         """
         Stores the user capabilities sent by the Auth Service
@@ -634,12 +1190,17 @@ class PubSubService(object):
         if subsystem == b'pubsub':
             if op == b'subscribe':
                 result = self._peer_subscribe(frames)
+            elif op in (b'publish', b'publish_batch') and not self._decode_topics(frames):
+                # The message refers to a topic id which is unknown, so it cannot be routed
+                pass
             elif op == b'publish':
                 try:
                     result = self._peer_publish(frames, user_id)
                 except IndexError:
                     # send response back -- Todo
                     return
+            elif op == b'publish_batch':
+                result = self._peer_publish_batch(frames, user_id)
             elif op == b'unsubscribe':
                 result = self._peer_unsubscribe(frames)
             elif op == b'list':
@@ -649,8 +1210,14 @@ class PubSubService(object):
                 response.append(zmq.Frame(b'list_response'))
                 response.append(zmq.Frame(bytes(result)))
                 result = None
+            elif op == b'queue_stats':
+                response = [sender, recipient, proto, user_id, msg_id, subsystem]
+                response.append(zmq.Frame(b'queue_stats_response'))
+                response.append(zmq.Frame(jsonapi.dumps(self.queue_stats())))
             elif op == b'synchronize':
                 self._peer_sync(frames)
+            elif op == b'topic_reset':
+                self._reset_topic_ids(bytes(sender))
             elif op == b'auth_update':
                 self._update_caps_users(frames)
             elif op == b'protected_update':
@@ -669,6 +1236,9 @@ class PubSubService(object):
                 self._logger.error("PUBSUBSERVICE Unknown pubsub request {}".format(bytes(op)))
                 pass
 
+        if op in (b'publish', b'publish_batch') and bytes(msg_id) == NOACK_ID:
+            return self._grant_credits(sender, recipient, proto, user_id, msg_id, subsystem)
+
         if result is not None:
             # Form response frame
             response = [sender, recipient, proto, user_id, msg_id, subsystem]
@@ -677,6 +1247,24 @@ class PubSubService(object):
 
         return response
 
+    def _grant_credits(self, sender, recipient, proto, user_id, msg_id, subsystem):
+        """
+        Account for an unacknowledged publish. Every PUBLISH_CREDIT_BATCH of them the publisher is granted that
+        many credits, allowing it to send more.
+        :param sender identity of the publisher
+        :type sender zmq.Frame
+        :returns: credit frames to be sent back to the publisher or an empty list
+        :rtype: list
+        """
+        peer = bytes(sender)
+        owed = self._credits_owed[peer] + 1
+        if owed < PUBLISH_CREDIT_BATCH:
+            self._credits_owed[peer] = owed
+            return []
+        del self._credits_owed[peer]
+        return [sender, recipient, proto, user_id, msg_id, subsystem,
+                zmq.Frame(b'credit'), zmq.Frame(str(owed))]
+
     def _check_if_protected_topic(self, peer, topic):
         """
          Checks if the peer is authorized to publish the topic.
@@ -780,8 +1368,6 @@ class PubSubService(object):
 
         if len(frames) > 8:
             publisher, receiver, proto, user_id, msg_id, subsystem, op, topic, data = frames[0:9]
-            data = frames[8].bytes
-            msg = jsonapi.loads(data)
             # Check if peer is authorized to publish the topic
             errmsg = self._check_if_protected_topic(bytes(user_id), bytes(topic))
 
@@ -843,7 +1429,7 @@ class PubSubService(object):
         """
         # self._logger.debug("PubSubService message: {}".format(message))
         json_msg = jsonapi.dumps(dict(sender=peer, bus=bus, headers=headers, message=message))
-        frames = [sender, b'', b'VIP1', '', '', b'pubsub', b'publish', topic, json_msg]
+        frames = [sender, b'', b'VIP1', '', '', b'pubsub', b'publish', topic, json_msg, bus]
         # Send it through ZMQ bus
         self._distribute(frames, '')
         self._logger.debug("Publish callback {}".format(topic))
@@ -858,7 +1444,7 @@ class PubSubService(object):
         topic = bytes(frames[7])
         data = bytes(frames[8])
         try:
-            msg = jsonapi.loads(data)
+            msg = loads(data)
             bus = msg['bus']
         except KeyError as exc:
             self._logger.error("Missing key in _peer_publish message {}".format(exc))
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*- {{{
+# vim: set fenc=utf-8 ft=python sw=4 ts=4 sts=4 et:
+#
+# Copyright 2017, Battelle Memorial Institute.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# This material was prepared as an account of work sponsored by an agency of
+# the United States Government. Neither the United States Government nor the
+# United States Department of Energy, nor Battelle, nor any of their
+# employees, nor any jurisdiction or organization that has cooperated in the
+# development of these materials, makes any warranty, express or
+# implied, or assumes any legal liability or responsibility for the accuracy,
+# completeness, or usefulness or any information, apparatus, product,
+# software, or process disclosed, or represents that its use would not infringe
+# privately owned rights. Reference herein to any specific commercial product,
+# process, or service by trade name, trademark, manufacturer, or otherwise
+# does not necessarily constitute or imply its endorsement, recommendation, or
+# favoring by the United States Government or any agency thereof, or
+# Battelle Memorial Institute. The views and opinions of authors expressed
+# herein do not necessarily state or reflect those of the
+# United States Government or any agency thereof.
+#
+# PACIFIC NORTHWEST NATIONAL LABORATORY operated by
+# BATTELLE for the UNITED STATES DEPARTMENT OF ENERGY
+# under Contract DE-AC05-76RL01830
+# }}}
+
+'''Last value cache for pubsub topics.
+
+PubSubService keeps the most recent message published to each topic
+beginning with one of the configured prefixes. Agents can ask for the
+retained messages matching a subscription when they subscribe instead
+of waiting for the next publish.
+'''
+
+
+from __future__ import absolute_import
+
+from collections import OrderedDict
+import time
+
+from .topictrie import SubscriptionTrie, topic_matches
+
+__all__ = ['LastValueCache']
+
+
+class LastValueCache(object):
+    '''Bounded store of the last message per bus and topic.
+
+    Only topics beginning with one of prefixes are retained. The least
+    recently updated messages are evicted once more than max_topics
+    messages or max_bytes of topics and messages are stored. Messages
+    older than expiry seconds are not replayed; None keeps them until
+    they are evicted.
+    '''
+
+    def __init__(self, prefixes, max_topics=10000, max_bytes=50 * 1024 * 1024,
+                 expiry=None):
+        self._prefixes = SubscriptionTrie((prefix, True) for prefix in prefixes)
+        self.max_topics = max_topics
+        self.max_bytes = max_bytes
+        self.expiry = expiry
+        # (bus, topic) -> (time, data), least recently updated first
+        self._messages = OrderedDict()
+        self._bytes = 0
+
+    def __len__(self):
+        return len(self._messages)
+
+    def retains(self, topic):
+        '''Return True if messages to topic are retained.'''
+        return bool(self._prefixes.match(topic))
+
+    def put(self, bus, topic, data):
+        '''Store data as the last message of topic on bus.'''
+        key = (bus, topic)
+        old = self._messages.pop(key, None)
+        if old is not None:
+            self._bytes -= len(topic) + len(old[1])
+        self._messages[key] = (time.time(), data)
+        self._bytes += len(topic) + len(data)
+        self._evict()
+
+    def get(self, bus, prefix):
+        '''Return a list of (topic, data) retained on bus matching prefix,
+        which may be a wildcard pattern.'''
+        self._evict()
+        return [(topic, data)
+                for (key_bus, topic), (_, data) in self._messages.iteritems()
+                if key_bus == bus and topic_matches(prefix, topic)]
+
+    def clear(self):
+        self._messages.clear()
+        self._bytes = 0
+
+    def _evict(self):
+        messages = self._messages
+        while messages and (len(messages) > self.max_topics or
+                            self._bytes > self.max_bytes):
+            self._pop_oldest()
+        if self.expiry is not None:
+            oldest = time.time() - self.expiry
+            while messages and next(messages.itervalues())[0] < oldest:
+                self._pop_oldest()
+
+    def _pop_oldest(self):
+        (_, topic), (_, data) = self._messages.popitem(last=False)
+        self._bytes -= len(topic) + len(data)
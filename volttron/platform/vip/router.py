@@ -44,6 +44,9 @@ import logging
 import zmq
 from zmq import Frame, NOBLOCK, ZMQError, EINVAL, EHOSTUNREACH
 
+from .codec import JSON, available_codecs, negotiate, transcode
+from .topicids import TOPIC_IDS, TopicDecoder, TopicEncoder
+
 
 __all__ = ['BaseRouter', 'OUTGOING', 'INCOMING', 'UNROUTABLE', 'ERROR']
 
@@ -99,6 +102,17 @@ class BaseRouter(object):
         self._poller = self._poller_class()
         self._ext_sockets = []
         self._socket_id_mapping = {}
+        # Codecs offered to peers in the hello handshake and the codec of
+        # every peer which negotiated something other than JSON
+        self.accepted_codecs = available_codecs()
+        self._codecs = {}
+        # Whether topic ids are offered to peers and the topic tables,
+        # outbound and inbound, of every peer which negotiated them
+        self.topic_ids = True
+        self._topic_tables = {}
+        # Whether issue() is called for every message routed. Subclasses
+        # may turn it off while nothing observes the messages.
+        self.observed = True
 
     def run(self):
         '''Main router loop.'''
@@ -232,6 +246,8 @@ class BaseRouter(object):
             self._peers.remove(peer)
         except KeyError:
             return
+        self._codecs.pop(peer, None)
+        self._topic_tables.pop(peer, None)
         self._distribute(b'peerlist', b'drop', peer)
         self._drop_pubsub_peers(peer)
 
@@ -247,7 +263,8 @@ class BaseRouter(object):
         socket = self.socket
         issue = self.issue
 
-        issue(INCOMING, frames)
+        if self.observed:
+            issue(INCOMING, frames)
         # for f in frames:
         #     _log.debug("ROUTER Receiving frames: {}".format(bytes(f)))
         if len(frames) < 6:
@@ -274,8 +291,24 @@ class BaseRouter(object):
             # Handle requests directed at the router
             name = subsystem.bytes
             if name == b'hello':
-                frames = [sender, recipient, proto, user_id, msg_id,
-                          b'hello', b'welcome', b'1.0', socket.identity, sender]
+                response = [sender, recipient, proto, user_id, msg_id,
+                            b'hello', b'welcome', b'1.0', socket.identity, sender]
+                if len(frames) > 7:
+                    # The peer offers the codecs it accepts, most preferred first
+                    codec = negotiate(frames[7].bytes.split(b','), self.accepted_codecs)
+                    if codec == JSON:
+                        self._codecs.pop(sender.bytes, None)
+                    else:
+                        self._codecs[sender.bytes] = codec
+                    response.append(codec)
+                    if (self.topic_ids and len(frames) > 8 and
+                            TOPIC_IDS in frames[8].bytes.split(b',')):
+                        # Ids from an earlier connection are not carried over
+                        self._topic_tables[sender.bytes] = (TopicEncoder(), TopicDecoder())
+                        response.append(TOPIC_IDS)
+                    else:
+                        self._topic_tables.pop(sender.bytes, None)
+                frames = response
             elif name == b'ping':
                 frames[:7] = [
                     sender, recipient, proto, user_id, msg_id, b'ping', b'pong']
@@ -309,6 +342,12 @@ class BaseRouter(object):
         else:
             # Route all other requests to the recipient
             frames[:4] = [recipient, sender, proto, user_id]
+            codecs = self._codecs
+            if (codecs and sender.bytes in codecs and
+                    recipient.bytes not in codecs and subsystem.bytes == b'RPC'):
+                # Re-encode requests and responses for a peer which only
+                # accepts JSON
+                frames[6:] = [transcode(frame.bytes, JSON) for frame in frames[6:]]
         for peer in self._send(frames):
             self._drop_peer(peer)
 
@@ -325,7 +364,8 @@ class BaseRouter(object):
         try:
             # Try sending the message to its recipient
             socket.send_multipart(frames, flags=NOBLOCK, copy=False)
-            issue(OUTGOING, frames)
+            if self.observed:
+                issue(OUTGOING, frames)
         except ZMQError as exc:
             try:
                 errnum, errmsg = error = _ROUTE_ERRORS[exc.errno]
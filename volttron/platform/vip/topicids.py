@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*- {{{
+# vim: set fenc=utf-8 ft=python sw=4 ts=4 sts=4 et:
+#
+# Copyright 2017, Battelle Memorial Institute.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# This material was prepared as an account of work sponsored by an agency of
+# the United States Government. Neither the United States Government nor the
+# United States Department of Energy, nor Battelle, nor any of their
+# employees, nor any jurisdiction or organization that has cooperated in the
+# development of these materials, makes any warranty, express or
+# implied, or assumes any legal liability or responsibility for the accuracy,
+# completeness, or usefulness or any information, apparatus, product,
+# software, or process disclosed, or represents that its use would not infringe
+# privately owned rights. Reference herein to any specific commercial product,
+# process, or service by trade name, trademark, manufacturer, or otherwise
+# does not necessarily constitute or imply its endorsement, recommendation, or
+# favoring by the United States Government or any agency thereof, or
+# Battelle Memorial Institute. The views and opinions of authors expressed
+# herein do not necessarily state or reflect those of the
+# United States Government or any agency thereof.
+#
+# PACIFIC NORTHWEST NATIONAL LABORATORY operated by
+# BATTELLE for the UNITED STATES DEPARTMENT OF ENERGY
+# under Contract DE-AC05-76RL01830
+# }}}
+
+'''Topic interning for VIP connections.
+
+Device topics are long and repeated in every publish. Peers which
+negotiate topic ids in the hello handshake send a topic in full once,
+together with a small id, and refer to it by the id afterwards. Each
+direction of a connection has its own table, kept by the sender in a
+TopicEncoder and by the receiver in a TopicDecoder. Encoded topics
+start with a byte which never begins a topic, so plain topics can still
+be sent at any time.
+'''
+
+
+from __future__ import absolute_import
+
+import struct
+from collections import OrderedDict
+
+__all__ = ['TOPIC_IDS', 'TopicEncoder', 'TopicDecoder']
+
+# Name of the feature in the hello handshake
+TOPIC_IDS = b'topic_ids'
+
+_REFERENCE = '\x00'
+_DEFINITION = '\x01'
+_ID = struct.Struct('>I')
+
+
+class TopicEncoder(object):
+    '''Assigns ids to the topics sent over a connection.
+
+    At most max_ids topics have ids. When there are more, the id of the
+    least recently sent topic is reassigned, which the receiver learns
+    from the new definition. Ids of forgotten topics are held by no other
+    topic and are reused before new ones.
+    '''
+
+    def __init__(self, max_ids=65536):
+        self.max_ids = max_ids
+        self._ids = OrderedDict()
+        self._free_ids = []
+        self._next_id = 0
+
+    def __len__(self):
+        return len(self._ids)
+
+    def encode(self, topic):
+        '''Return the encoded topic and whether it defines a new id.'''
+        ids = self._ids
+        topic_id = ids.pop(topic, None)
+        if topic_id is not None:
+            ids[topic] = topic_id
+            return _REFERENCE + _ID.pack(topic_id), False
+        if len(ids) >= self.max_ids:
+            _, topic_id = ids.popitem(last=False)
+        elif self._free_ids:
+            topic_id = self._free_ids.pop()
+        else:
+            topic_id = self._next_id
+            self._next_id += 1
+        ids[topic] = topic_id
+        return _DEFINITION + _ID.pack(topic_id) + topic, True
+
+    def forget(self, topic):
+        '''Forget the id of a topic whose definition was not sent.'''
+        topic_id = self._ids.pop(topic, None)
+        if topic_id is not None:
+            self._free_ids.append(topic_id)
+
+    def clear(self):
+        self._ids.clear()
+        del self._free_ids[:]
+        self._next_id = 0
+
+
+class TopicDecoder(object):
+    '''Resolves the topic ids received over a connection.'''
+
+    def __init__(self):
+        self._topics = {}
+
+    def decode(self, data):
+        '''Return the topic of an encoded or plain topic, or None if it
+        refers to an unknown id or is too short to hold one.'''
+        if not data or data[0] > _DEFINITION:
+            return data
+        if len(data) < 1 + _ID.size:
+            return None
+        topic_id = _ID.unpack_from(data, 1)[0]
+        if data[0] == _DEFINITION:
+            topic = self._topics[topic_id] = data[5:]
+            return topic
+        return self._topics.get(topic_id)
+
+    def clear(self):
+        self._topics.clear()
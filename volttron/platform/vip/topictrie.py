@@ -0,0 +1,423 @@
+# -*- coding: utf-8 -*- {{{
+# vim: set fenc=utf-8 ft=python sw=4 ts=4 sts=4 et:
+#
+# Copyright 2017, Battelle Memorial Institute.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# This material was prepared as an account of work sponsored by an agency of
+# the United States Government. Neither the United States Government nor the
+# United States Department of Energy, nor Battelle, nor any of their
+# employees, nor any jurisdiction or organization that has cooperated in the
+# development of these materials, makes any warranty, express or
+# implied, or assumes any legal liability or responsibility for the accuracy,
+# completeness, or usefulness or any information, apparatus, product,
+# software, or process disclosed, or represents that its use would not infringe
+# privately owned rights. Reference herein to any specific commercial product,
+# process, or service by trade name, trademark, manufacturer, or otherwise
+# does not necessarily constitute or imply its endorsement, recommendation, or
+# favoring by the United States Government or any agency thereof, or
+# Battelle Memorial Institute. The views and opinions of authors expressed
+# herein do not necessarily state or reflect those of the
+# United States Government or any agency thereof.
+#
+# PACIFIC NORTHWEST NATIONAL LABORATORY operated by
+# BATTELLE for the UNITED STATES DEPARTMENT OF ENERGY
+# under Contract DE-AC05-76RL01830
+# }}}
+
+'''Prefix index for pubsub subscriptions.
+
+Subscriptions are kept in dictionaries keyed by topic prefix. Finding
+the subscribers of a topic by testing every prefix costs time
+proportional to the number of subscriptions, which dominates routing
+once there are thousands of them. SubscriptionTrie keeps each key in a
+radix tree as well, so the prefixes of a topic are found in time
+proportional to the length of the topic instead.
+
+Keys may also be MQTT style wildcard patterns, which match whole topics
+level by level instead of prefixes: '+' matches any one level, '#' as
+the last level matches any number of remaining levels, including none,
+and '*' within a level matches any characters in that level, e.g.
+'devices/+/+/RTU*/all'. '#' is not allowed before the last level, since
+RabbitMQ would treat it as a wildcard there. Patterns are compiled into
+a tree of levels, so filtering happens without testing every pattern
+against the topic.
+'''
+
+
+from __future__ import absolute_import
+
+import re
+from collections import OrderedDict
+from fnmatch import translate
+
+__all__ = ['SubscriptionTrie', 'MatchCache', 'is_pattern', 'check_pattern',
+           'topic_matches']
+
+
+def is_pattern(key):
+    '''Return True if key is a wildcard pattern rather than a prefix.'''
+    return any(level in ('+', '#') or '*' in level
+               for level in key.split('/'))
+
+
+def check_pattern(key):
+    '''Raise ValueError if key uses '#' anywhere but as its last level.
+
+    A '#' in the middle of a pattern would be a literal level here but a
+    wildcard on RabbitMQ, so it is rejected rather than matched
+    differently by each bus.
+    '''
+    levels = key.split('/')
+    if '#' in levels[:-1]:
+        raise ValueError("'#' must be the last level of pattern %r" % (key,))
+
+
+_compiled = {}
+
+
+def topic_matches(key, topic):
+    '''Return True if the subscription key (prefix or pattern) matches topic.'''
+    if not is_pattern(key):
+        return topic.startswith(key)
+    try:
+        regex = _compiled[key]
+    except KeyError:
+        if len(_compiled) > 1024:
+            _compiled.clear()
+        regex = _compiled[key] = re.compile(_pattern_regex(key))
+    return regex.match(topic) is not None
+
+
+def _pattern_regex(key):
+    levels = key.split('/')
+    parts = []
+    for index, level in enumerate(levels):
+        if level == '#' and index == len(levels) - 1:
+            if parts:
+                # 'a/#' matches 'a' as well as everything below it
+                return '/'.join(parts) + '(/.*)?$'
+            return '.*$'
+        if level == '+':
+            parts.append('[^/]*')
+        elif '*' in level:
+            parts.append(_glob_regex(level))
+        else:
+            parts.append(re.escape(level))
+    return '/'.join(parts) + '$'
+
+
+def _glob_regex(level):
+    '''Return a regular expression matching one level against a glob.'''
+    return '[^/]*'.join(re.escape(part) for part in level.split('*'))
+
+
+class _Node(object):
+    '''Radix tree node.
+
+    label is the portion of the key on the edge leading to this node and
+    key is the full dictionary key ending at this node or None.
+    '''
+
+    __slots__ = ('label', 'children', 'key')
+
+    def __init__(self, label=''):
+        self.label = label
+        self.children = {}
+        self.key = None
+
+
+def _common_length(label, key, start):
+    '''Return the length of the common prefix of label and key[start:].'''
+    length = min(len(label), len(key) - start)
+    index = 0
+    while index < length and label[index] == key[start + index]:
+        index += 1
+    return index
+
+
+class _LevelNode(object):
+    '''Pattern tree node for one topic level.
+
+    children maps literal levels to nodes, single is the node for '+'
+    and globs maps levels containing '*' to their compiled expression
+    and node. key is the pattern ending at this node and multi the
+    pattern ending with '#' after this node.
+    '''
+
+    __slots__ = ('children', 'single', 'globs', 'key', 'multi')
+
+    def __init__(self):
+        self.children = {}
+        self.single = None
+        self.globs = {}
+        self.key = None
+        self.multi = None
+
+    def empty(self):
+        return not (self.children or self.single or self.globs or
+                    self.key is not None or self.multi is not None)
+
+
+class SubscriptionTrie(dict):
+    '''Dictionary of topic prefixes with a radix tree index.
+
+    Missing keys are created with an empty set, as with defaultdict(set),
+    so code manipulating subscription dictionaries works unchanged. The
+    index is updated incrementally as keys are added and removed. Use
+    match() to find the values of all keys which are prefixes of a topic
+    or patterns matching it.
+    '''
+
+    def __init__(self, *args, **kwargs):
+        super(SubscriptionTrie, self).__init__()
+        self._root = _Node()
+        self._patterns = _LevelNode()
+        self.update(*args, **kwargs)
+
+    def __missing__(self, key):
+        value = self[key] = set()
+        return value
+
+    def __setitem__(self, key, value):
+        if key not in self:
+            self._insert(key)
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        dict.__delitem__(self, key)
+        self._remove(key)
+
+    def pop(self, key, *default):
+        present = key in self
+        value = dict.pop(self, key, *default)
+        if present:
+            self._remove(key)
+        return value
+
+    def popitem(self):
+        key, value = dict.popitem(self)
+        self._remove(key)
+        return key, value
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return dict.__getitem__(self, key)
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).iteritems():
+            self[key] = value
+
+    def clear(self):
+        dict.clear(self)
+        self._root = _Node()
+        self._patterns = _LevelNode()
+
+    def copy(self):
+        return SubscriptionTrie(self)
+
+    def match(self, topic):
+        '''Return a list of the values of all keys matching topic.'''
+        get = dict.__getitem__
+        node = self._root
+        values = []
+        if node.key is not None:
+            values.append(get(self, node.key))
+        index = 0
+        length = len(topic)
+        while index < length:
+            node = node.children.get(topic[index])
+            if node is None or not topic.startswith(node.label, index):
+                break
+            index += len(node.label)
+            if node.key is not None:
+                values.append(get(self, node.key))
+        if not self._patterns.empty():
+            self._match_patterns(topic, values)
+        return values
+
+    def _match_patterns(self, topic, values):
+        get = dict.__getitem__
+        levels = topic.split('/')
+        count = len(levels)
+        # Every pattern has a single path through the tree, so each
+        # matching pattern is found exactly once.
+        stack = [(self._patterns, 0)]
+        while stack:
+            node, index = stack.pop()
+            if node.multi is not None:
+                values.append(get(self, node.multi))
+            if index == count:
+                if node.key is not None:
+                    values.append(get(self, node.key))
+                continue
+            level = levels[index]
+            child = node.children.get(level)
+            if child is not None:
+                stack.append((child, index + 1))
+            if node.single is not None:
+                stack.append((node.single, index + 1))
+            for regex, child in node.globs.itervalues():
+                if regex.match(level):
+                    stack.append((child, index + 1))
+
+    def _insert(self, key):
+        if is_pattern(key):
+            self._insert_pattern(key)
+            return
+        node = self._root
+        index = 0
+        length = len(key)
+        while index < length:
+            char = key[index]
+            child = node.children.get(char)
+            if child is None:
+                child = node.children[char] = _Node(key[index:])
+                node = child
+                break
+            label = child.label
+            common = _common_length(label, key, index)
+            if common < len(label):
+                # Split the edge so that the key ends on, or branches
+                # from, the new intermediate node.
+                middle = _Node(label[:common])
+                child.label = label[common:]
+                middle.children[child.label[0]] = child
+                node.children[char] = child = middle
+            node = child
+            index += common
+        node.key = key
+
+    def _insert_pattern(self, key):
+        check_pattern(key)
+        levels = key.split('/')
+        node = self._patterns
+        for index, level in enumerate(levels):
+            if level == '#' and index == len(levels) - 1:
+                node.multi = key
+                return
+            if level == '+':
+                if node.single is None:
+                    node.single = _LevelNode()
+                node = node.single
+            elif '*' in level:
+                if level not in node.globs:
+                    node.globs[level] = (re.compile(_glob_regex(level) + '$'),
+                                         _LevelNode())
+                node = node.globs[level][1]
+            else:
+                child = node.children.get(level)
+                if child is None:
+                    child = node.children[level] = _LevelNode()
+                node = child
+        node.key = key
+
+    def _remove_pattern(self, key):
+        levels = key.split('/')
+        node = self._patterns
+        path = []
+        for index, level in enumerate(levels):
+            if level == '#' and index == len(levels) - 1:
+                node.multi = None
+                break
+            if level == '+':
+                child = node.single
+            elif '*' in level:
+                child = node.globs.get(level, (None, None))[1]
+            else:
+                child = node.children.get(level)
+            if child is None:
+                return
+            path.append((node, level, child))
+            node = child
+        else:
+            node.key = None
+        # Prune nodes left without patterns
+        while path:
+            parent, level, node = path.pop()
+            if not node.empty():
+                break
+            if level == '+':
+                parent.single = None
+            elif '*' in level:
+                del parent.globs[level]
+            else:
+                del parent.children[level]
+
+    def _remove(self, key):
+        if is_pattern(key):
+            self._remove_pattern(key)
+            return
+        node = self._root
+        path = []
+        index = 0
+        length = len(key)
+        while index < length:
+            child = node.children.get(key[index])
+            if child is None or not key.startswith(child.label, index):
+                return
+            path.append((node, child))
+            node = child
+            index += len(child.label)
+        node.key = None
+        # Prune empty leaves and merge pass-through nodes to keep the
+        # tree compressed.
+        while path:
+            parent, node = path.pop()
+            if node.key is not None:
+                break
+            if not node.children:
+                del parent.children[node.label[0]]
+                continue
+            if len(node.children) == 1:
+                child, = node.children.values()
+                child.label = node.label + child.label
+                parent.children[child.label[0]] = child
+            break
+
+
+class MatchCache(object):
+    '''Bounded least-recently-used cache of subscription lookups.
+
+    The cache holds no references to the subscriptions themselves and
+    must be cleared whenever they change.
+    '''
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._cache = OrderedDict()
+
+    def __len__(self):
+        return len(self._cache)
+
+    def get(self, key, default=None):
+        '''Return the cached value for key and mark it most recently used.'''
+        try:
+            value = self._cache.pop(key)
+        except KeyError:
+            return default
+        self._cache[key] = value
+        return value
+
+    def put(self, key, value):
+        '''Cache value for key, evicting the least recently used entry.'''
+        cache = self._cache
+        cache.pop(key, None)
+        cache[key] = value
+        if len(cache) > self.maxsize:
+            cache.popitem(last=False)
+
+    def clear(self):
+        self._cache.clear()
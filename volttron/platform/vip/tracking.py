@@ -45,11 +45,30 @@
 
 from __future__ import absolute_import, print_function
 
+import time
+from array import array
+from collections import deque
+
 import gevent
 
-from .router import UNROUTABLE, ERROR, INCOMING
+from .router import UNROUTABLE, ERROR, INCOMING, OUTGOING
+
+# Number of traced messages kept and bytes kept of each of their frames
+TRACE_BUFFER_SIZE = 1000
+TRACE_FRAME_BYTES = 256
+
+_TOPIC_NAMES = {INCOMING: 'incoming', OUTGOING: 'outgoing',
+                UNROUTABLE: 'unroutable', ERROR: 'error'}
+
+# Histogram values below _LINEAR have buckets of their own. Above it each
+# power of two is split into _SUB_BUCKETS buckets, so recorded values are
+# accurate to 1/_SUB_BUCKETS, up to _MAX_VALUE.
+_LINEAR = 16
+_SUB_BUCKETS = 8
+_MAX_VALUE = (1 << 40) - 1
+_BUCKETS = _LINEAR + (_MAX_VALUE.bit_length() - 4) * _SUB_BUCKETS
 
-__all__ = ['Tracker']
+__all__ = ['Histogram', 'Tracker']
 
 
 def pick(frames, index):
@@ -68,12 +87,114 @@ def increment(prop, key):
         prop[key] = 1
 
 
+def _bucket(value):
+    '''Return the index of the histogram bucket of value.'''
+    if value < _LINEAR:
+        return value if value > 0 else 0
+    if value > _MAX_VALUE:
+        value = _MAX_VALUE
+    shift = value.bit_length() - 4
+    return _LINEAR + (shift - 1) * _SUB_BUCKETS + (value >> shift) - _SUB_BUCKETS
+
+
+def _bounds(index):
+    '''Return the lowest and highest values of a histogram bucket.'''
+    if index < _LINEAR:
+        return index, index
+    shift, sub = divmod(index - _LINEAR, _SUB_BUCKETS)
+    shift += 1
+    low = (sub + _SUB_BUCKETS) << shift
+    return low, low + (1 << shift) - 1
+
+
+class Histogram(object):
+    '''Streaming histogram of non-negative integers in fixed memory.
+
+    Like an HDR histogram, buckets are narrow for small values and grow
+    with the value, keeping the relative error of recorded values and
+    of the percentiles derived from them below 1/8.
+    '''
+
+    def __init__(self):
+        self.counts = array('l', [0]) * _BUCKETS
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def record(self, value):
+        '''Add a value to the histogram.'''
+        self.counts[_bucket(value)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def percentile(self, percent):
+        '''Return the highest value in the bucket where the given percentage
+        of recorded values is reached, or None if nothing was recorded.'''
+        if not self.count:
+            return None
+        target = max(1, self.count * percent / 100.0)
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return min(_bounds(index)[1], self.max)
+        return self.max
+
+    def snapshot(self):
+        '''Return the summary and non-empty buckets of the histogram.'''
+        return {
+            'count': self.count,
+            'min': self.min,
+            'max': self.max,
+            'mean': float(self.total) / self.count if self.count else None,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+            'p999': self.percentile(99.9),
+            'buckets': [list(_bounds(index)) + [count]
+                        for index, count in enumerate(self.counts) if count],
+        }
+
+
+def record(histograms, key, value):
+    '''Record value in the histogram histograms[key], creating it if needed.'''
+    try:
+        histogram = histograms[key]
+    except KeyError:
+        histogram = histograms[key] = Histogram()
+    histogram.record(value)
+
+
 class Tracker(object):
     '''Object for sharing data between the router and control objects.'''
 
     def __init__(self):
         self._reset()
         self.enabled = False
+        self.tracing = None
+        self.traced = deque(maxlen=TRACE_BUFFER_SIZE)
+        self._trace_peers = None
+        self._trace_subsystems = None
+        self._trace_sample = 1
+        self._trace_count = 0
+        self._callbacks = []
+
+    def register(self, callback):
+        '''Call callback whenever tracking or tracing is turned on or off.
+
+        The router uses this to skip reporting messages to the tracker
+        while it has nothing to do with them.
+        '''
+        self._callbacks.append(callback)
+
+    def _changed(self):
+        for callback in self._callbacks:
+            callback()
 
     def reset(self):
         '''Reset all counters to default values and set start time.'''
@@ -88,9 +209,18 @@ class Tracker(object):
             'incoming': {'peer': {}, 'user': {}, 'subsystem': {}},
             'outgoing': {'peer': {}, 'user': {}, 'subsystem': {}},
         }
+        # Sizes in bytes of incoming messages and microseconds the router
+        # spent on them
+        self.histograms = {
+            'size': {'peer': {}, 'subsystem': {}},
+            'dwell': {'peer': {}, 'subsystem': {}},
+        }
+        self._incoming = None
 
     def hit(self, topic, frames, extra):
         '''Increment counters for given topic and frames.'''
+        if self.tracing is not None:
+            self._trace(topic, frames, extra)
         if self.enabled:
             if topic == UNROUTABLE:
                 stat = self.stats['unroutable']
@@ -106,16 +236,94 @@ class Tracker(object):
                         'incoming' if topic == INCOMING else 'outgoing']
                 increment(stat['user'], user)
                 increment(stat['subsystem'], subsystem)
-            increment(stat['peer'], pick(frames, 0))
+            peer = pick(frames, 0)
+            increment(stat['peer'], peer)
+            if topic == INCOMING:
+                size = sum(len(frame) for frame in frames)
+                sizes = self.histograms['size']
+                record(sizes['peer'], peer, size)
+                record(sizes['subsystem'], subsystem, size)
+                self._incoming = (peer, subsystem, time.time())
+
+    def routed(self):
+        '''Record the time the router spent on the last incoming message.
+
+        The router calls this once it is done routing a message.
+        '''
+        incoming = self._incoming
+        if incoming is None:
+            return
+        self._incoming = None
+        peer, subsystem, start = incoming
+        dwell = int((time.time() - start) * 1e6)
+        dwells = self.histograms['dwell']
+        record(dwells['peer'], peer, dwell)
+        record(dwells['subsystem'], subsystem, dwell)
+
+    def snapshot(self):
+        '''Return a snapshot of the size and dwell time histograms.'''
+        snapshot = {'start': self.stats.get('start'),
+                    'end': self.stats.get('end', gevent.get_hub().loop.now())}
+        for name, histograms in self.histograms.iteritems():
+            snapshot[name] = {
+                key: {item: histogram.snapshot() for item, histogram in by_key.items()}
+                for key, by_key in histograms.iteritems()}
+        return snapshot
 
     def enable(self):
         '''Enable tracking.'''
         if not self.enabled:
             self.reset()
             self.enabled = True
+            self._changed()
 
     def disable(self):
         '''Disable tracking.'''
         if self.enabled:
             self.enabled = False
             self.stats['end'] = gevent.get_hub().loop.now()
+            self._changed()
+
+    def trace(self, sample=1, peers=None, subsystems=None):
+        '''Start tracing messages, replacing any previous trace.
+
+        One in every sample messages sent to or by one of peers, with
+        one of subsystems, is kept in traced. Messages of any peer or
+        subsystem are traced if peers or subsystems are not given.
+        '''
+        sample = int(sample)
+        if sample < 1:
+            raise ValueError('sample must be a positive integer')
+        self._trace_peers = set(peers) if peers else None
+        self._trace_subsystems = set(subsystems) if subsystems else None
+        self._trace_sample = sample
+        self._trace_count = 0
+        self.traced.clear()
+        self.tracing = {'sample': sample, 'peers': sorted(peers or []),
+                        'subsystems': sorted(subsystems or []),
+                        'start': gevent.get_hub().loop.now()}
+        self._changed()
+
+    def untrace(self):
+        '''Stop tracing messages, keeping those already traced.'''
+        if self.tracing is not None:
+            self.tracing = None
+            self._changed()
+
+    def _trace(self, topic, frames, extra):
+        '''Keep the message if it is selected by the trace.'''
+        peers = self._trace_peers
+        if peers is not None and pick(frames, 0) not in peers and pick(frames, 1) not in peers:
+            return
+        subsystems = self._trace_subsystems
+        if subsystems is not None and pick(frames, 5) not in subsystems:
+            return
+        self._trace_count += 1
+        if self._trace_count % self._trace_sample:
+            return
+        self.traced.append({
+            'time': gevent.get_hub().loop.now(),
+            'topic': _TOPIC_NAMES[topic],
+            'extra': None if extra is None else str(extra),
+            'frames': repr([bytes(frame)[:TRACE_FRAME_BYTES] for frame in frames]),
+        })
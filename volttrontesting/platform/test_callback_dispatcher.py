@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*- {{{
+# vim: set fenc=utf-8 ft=python sw=4 ts=4 sts=4 et:
+#
+# Copyright 2017, Battelle Memorial Institute.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# This material was prepared as an account of work sponsored by an agency of
+# the United States Government. Neither the United States Government nor the
+# United States Department of Energy, nor Battelle, nor any of their
+# employees, nor any jurisdiction or organization that has cooperated in the
+# development of these materials, makes any warranty, express or
+# implied, or assumes any legal liability or responsibility for the accuracy,
+# completeness, or usefulness or any information, apparatus, product,
+# software, or process disclosed, or represents that its use would not infringe
+# privately owned rights. Reference herein to any specific commercial product,
+# process, or service by trade name, trademark, manufacturer, or otherwise
+# does not necessarily constitute or imply its endorsement, recommendation, or
+# favoring by the United States Government or any agency thereof, or
+# Battelle Memorial Institute. The views and opinions of authors expressed
+# herein do not necessarily state or reflect those of the
+# United States Government or any agency thereof.
+#
+# PACIFIC NORTHWEST NATIONAL LABORATORY operated by
+# BATTELLE for the UNITED STATES DEPARTMENT OF ENERGY
+# under Contract DE-AC05-76RL01830
+# }}}
+
+import gevent
+import gevent.event
+import pytest
+
+from volttron.platform.vip.agent.delivery import CallbackDispatcher
+
+
+def blocked_dispatcher(*args, **kwargs):
+    """Return a dispatcher whose callbacks record their arguments once the returned event is set."""
+    dispatcher = CallbackDispatcher(*args, **kwargs)
+    event = gevent.event.Event()
+    calls = []
+
+    def callback(topic, value):
+        event.wait()
+        calls.append((topic, value))
+
+    return dispatcher, callback, event, calls
+
+
+@pytest.mark.pubsub
+def test_inline_runs_immediately():
+    dispatcher = CallbackDispatcher('inline')
+    calls = []
+    dispatcher.dispatch('a', calls.append, 1)
+    assert calls == [1]
+    assert dispatcher.stats()['dispatched'] == 1
+
+
+@pytest.mark.pubsub
+def test_pool_bounds_workers_and_drops_oldest():
+    dispatcher, callback, event, calls = blocked_dispatcher('pool', size=2, max_pending=3)
+    for value in range(6):
+        dispatcher.dispatch('topic', callback, 'topic', value)
+        # Let the workers pick up the first two messages
+        gevent.sleep(0)
+    stats = dispatcher.stats()
+    assert stats['workers'] == 2
+    # Two messages are running, three waiting and one was dropped
+    assert stats['pending'] == 3
+    assert stats['dropped'] == 1
+    event.set()
+    gevent.sleep(0.01)
+    assert sorted(value for _, value in calls) == [0, 1, 3, 4, 5]
+    assert dispatcher.stats()['workers'] == 0
+
+
+@pytest.mark.pubsub
+def test_drop_newest():
+    dispatcher, callback, event, calls = blocked_dispatcher('pool', size=1, max_pending=1,
+                                                            policy='drop_newest')
+    for value in range(3):
+        dispatcher.dispatch('topic', callback, 'topic', value)
+    event.set()
+    gevent.sleep(0.01)
+    assert calls == [('topic', 0)]
+    assert dispatcher.stats()['dropped'] == 2
+
+
+@pytest.mark.pubsub
+def test_conflate_keeps_latest_per_topic():
+    dispatcher, callback, event, calls = blocked_dispatcher('pool', size=1, policy='conflate')
+    dispatcher.dispatch('a', callback, 'a', 0)
+    gevent.sleep(0)
+    for value in range(1, 4):
+        dispatcher.dispatch('a', callback, 'a', value)
+        dispatcher.dispatch('b', callback, 'b', value)
+    event.set()
+    gevent.sleep(0.01)
+    assert calls == [('a', 0), ('a', 3), ('b', 3)]
+    assert dispatcher.stats()['conflated'] == 4
+
+
+@pytest.mark.pubsub
+def test_ordered_per_topic():
+    dispatcher = CallbackDispatcher('ordered', size=4)
+    running = set()
+    calls = []
+
+    def callback(topic, value):
+        assert topic not in running
+        running.add(topic)
+        gevent.sleep(0.001)
+        running.discard(topic)
+        calls.append((topic, value))
+
+    for value in range(5):
+        for topic in ('a', 'b'):
+            dispatcher.dispatch(topic, callback, topic, value)
+    gevent.sleep(0.1)
+    assert [value for topic, value in calls if topic == 'a'] == range(5)
+    assert [value for topic, value in calls if topic == 'b'] == range(5)
+    assert dispatcher.stats()['pending'] == 0
+
+
+@pytest.mark.pubsub
+def test_invalid_arguments():
+    with pytest.raises(ValueError):
+        CallbackDispatcher('threads')
+    with pytest.raises(ValueError):
+        CallbackDispatcher('pool', policy='block')
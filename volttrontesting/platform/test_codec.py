@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*- {{{
+# vim: set fenc=utf-8 ft=python sw=4 ts=4 sts=4 et:
+#
+# Copyright 2017, Battelle Memorial Institute.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# This material was prepared as an account of work sponsored by an agency of
+# the United States Government. Neither the United States Government nor the
+# United States Department of Energy, nor Battelle, nor any of their
+# employees, nor any jurisdiction or organization that has cooperated in the
+# development of these materials, makes any warranty, express or
+# implied, or assumes any legal liability or responsibility for the accuracy,
+# completeness, or usefulness or any information, apparatus, product,
+# software, or process disclosed, or represents that its use would not infringe
+# privately owned rights. Reference herein to any specific commercial product,
+# process, or service by trade name, trademark, manufacturer, or otherwise
+# does not necessarily constitute or imply its endorsement, recommendation, or
+# favoring by the United States Government or any agency thereof, or
+# Battelle Memorial Institute. The views and opinions of authors expressed
+# herein do not necessarily state or reflect those of the
+# United States Government or any agency thereof.
+#
+# PACIFIC NORTHWEST NATIONAL LABORATORY operated by
+# BATTELLE for the UNITED STATES DEPARTMENT OF ENERGY
+# under Contract DE-AC05-76RL01830
+# }}}
+
+import pytest
+
+import zmq
+
+from volttron.platform.vip import codec
+from volttron.platform.vip.router import BaseRouter
+
+pytestmark = pytest.mark.skipif(not codec.HAS_MSGPACK, reason='msgpack is not installed')
+
+MESSAGE = dict(bus='', headers={'Date': '2017-01-01T00:00:00.000000+00:00'},
+               message=[{'temp': 70.5, 'on': True, 'mode': 'cool'}, {'temp': {'units': 'F'}}])
+
+
+@pytest.mark.pubsub
+def test_round_trip_and_detection():
+    for name in (codec.JSON, codec.MSGPACK):
+        data = codec.dumps(MESSAGE, name)
+        assert codec.codec_of(data) == name
+        assert codec.loads(data) == MESSAGE
+        assert codec.transcode(data, name) is data
+    assert codec.loads(codec.transcode(codec.dumps(MESSAGE, codec.MSGPACK), codec.JSON)) == MESSAGE
+    assert codec.codec_of(codec.dumps([1, 2], codec.MSGPACK)) == codec.MSGPACK
+
+
+@pytest.mark.pubsub
+def test_msgpack_decodes_like_json():
+    value = {1: 'one', 2.5: [{None: True, True: False}], 'text': {3: 4}}
+    expected = codec.loads(codec.dumps(value, codec.JSON))
+    assert expected == {'1': 'one', '2.5': [{'null': True, 'true': False}],
+                        'text': {'3': 4}}
+    data = codec.dumps(value, codec.MSGPACK)
+    assert codec.codec_of(data) == codec.MSGPACK
+    assert codec.loads(data) == expected
+
+
+@pytest.mark.pubsub
+def test_msgpack_falls_back_to_json():
+    value = dict(message=[2 ** 64, -2 ** 63 - 1, 2 ** 63])
+    data = codec.dumps(value, codec.MSGPACK)
+    assert codec.codec_of(data) == codec.JSON
+    assert codec.loads(data) == value
+    assert codec.transcode(data, codec.MSGPACK) == data
+
+
+@pytest.mark.pubsub
+def test_negotiate():
+    assert codec.negotiate([codec.MSGPACK, codec.JSON]) == codec.MSGPACK
+    assert codec.negotiate([codec.MSGPACK, codec.JSON], [codec.JSON]) == codec.JSON
+    assert codec.negotiate(['cbor']) == codec.JSON
+
+
+@pytest.mark.pubsub
+@pytest.mark.parametrize('size', [0, 3, 15, 16, 70000])
+def test_prepend_item_to_map(size):
+    value = {'key{}'.format(index): index for index in range(size)}
+    data = codec.prepend_item(codec.dumps(value, codec.MSGPACK), 'sender', 'agent')
+    value['sender'] = 'agent'
+    assert codec.loads(data) == value
+
+
+class RecordingSocket(object):
+    identity = b'router'
+
+    def __init__(self):
+        self.sent = []
+
+    def send_multipart(self, frames, flags=0, copy=True):
+        self.sent.append([bytes(frame) for frame in frames])
+
+
+@pytest.mark.pubsub
+def test_router_negotiates_codec_and_transcodes_rpc():
+    router = BaseRouter()
+    router.socket = RecordingSocket()
+    router.accepted_codecs = [codec.MSGPACK, codec.JSON]
+
+    def frames(*parts):
+        return [zmq.Frame(part) for part in parts]
+
+    router.route(frames(b'fast', b'', b'VIP1', b'', b'1', b'hello', b'hello', b'msgpack,json'))
+    router.route(frames(b'legacy', b'', b'VIP1', b'', b'1', b'hello', b'hello'))
+    welcomes = [sent for sent in router.socket.sent if sent[5] == b'hello']
+    assert [welcome[-1] for welcome in welcomes] == [codec.MSGPACK, b'legacy']
+
+    request = codec.dumps(dict(jsonrpc='2.0', id='1', method='ping', params=[]), codec.MSGPACK)
+    router.route(frames(b'fast', b'legacy', b'VIP1', b'', b'1', b'RPC', request))
+    router.route(frames(b'fast', b'fast', b'VIP1', b'', b'1', b'RPC', request))
+    assert codec.codec_of(router.socket.sent[-2][6]) == codec.JSON
+    assert router.socket.sent[-1][6] == request
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*- {{{
+# vim: set fenc=utf-8 ft=python sw=4 ts=4 sts=4 et:
+#
+# Copyright 2017, Battelle Memorial Institute.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# This material was prepared as an account of work sponsored by an agency of
+# the United States Government. Neither the United States Government nor the
+# United States Department of Energy, nor Battelle, nor any of their
+# employees, nor any jurisdiction or organization that has cooperated in the
+# development of these materials, makes any warranty, express or
+# implied, or assumes any legal liability or responsibility for the accuracy,
+# completeness, or usefulness or any information, apparatus, product,
+# software, or process disclosed, or represents that its use would not infringe
+# privately owned rights. Reference herein to any specific commercial product,
+# process, or service by trade name, trademark, manufacturer, or otherwise
+# does not necessarily constitute or imply its endorsement, recommendation, or
+# favoring by the United States Government or any agency thereof, or
+# Battelle Memorial Institute. The views and opinions of authors expressed
+# herein do not necessarily state or reflect those of the
+# United States Government or any agency thereof.
+#
+# PACIFIC NORTHWEST NATIONAL LABORATORY operated by
+# BATTELLE for the UNITED STATES DEPARTMENT OF ENERGY
+# under Contract DE-AC05-76RL01830
+# }}}
+
+import pytest
+
+import zmq
+
+from volttron.platform.agent import json as jsonapi
+from volttron.platform.main import Router
+from volttron.platform.vip.pubsubservice import PubSubService
+
+
+class RecordingSocket(object):
+    identity = b'router'
+
+    def __init__(self):
+        self.sent = []
+
+    def send_multipart(self, frames, flags=0, copy=True):
+        self.sent.append([bytes(frame) for frame in frames])
+
+
+def frames(*parts):
+    return [zmq.Frame(part) for part in parts]
+
+
+@pytest.mark.pubsub
+def test_requests_routed_ahead_of_deferred_publishes():
+    router = Router('inproc://deferred-fanout', defer_pubsub_fanout=True)
+    router.socket = socket = RecordingSocket()
+    router.pubsub = PubSubService(socket, {}, None)
+    router.pubsub._add_peer_subscription('subscriber', '', 'devices')
+    data = jsonapi.dumps(dict(bus='', headers={}, message=1))
+
+    for index in range(3):
+        router.route(frames(b'publisher', b'', b'VIP1', b'', str(index), b'pubsub', b'publish',
+                            b'devices/building/all', data, b''))
+    router.route(frames(b'caller', b'', b'VIP1', b'', b'4', b'ping'))
+
+    assert [sent[0] for sent in socket.sent if sent[5] != b'peerlist'] == [b'caller']
+
+    router._fan_out()
+
+    delivered = [sent for sent in socket.sent if sent[0] == b'subscriber' and sent[5] == b'pubsub']
+    assert [jsonapi.loads(sent[8])['message'] for sent in delivered] == [1, 1, 1]
+    # Acknowledgements follow the publishes in order
+    assert [sent[4] for sent in socket.sent if sent[0] == b'publisher' and sent[5] == b'pubsub'] == [b'0', b'1', b'2']
+    assert not router._fanout
+
+
+@pytest.mark.pubsub
+def test_unsubscribe_follows_deferred_publishes():
+    router = Router('inproc://deferred-fanout', defer_pubsub_fanout=True)
+    router.socket = socket = RecordingSocket()
+    router.pubsub = PubSubService(socket, {}, None)
+    router.pubsub._add_peer_subscription('subscriber', '', 'devices')
+
+    def publish(value):
+        data = jsonapi.dumps(dict(bus='', headers={}, message=value))
+        router.route(frames(b'publisher', b'', b'VIP1', b'', str(value), b'pubsub', b'publish',
+                            b'devices/building/all', data, b''))
+
+    publish(1)
+    unsubscribe = jsonapi.dumps(dict(internal=dict(prefix=['devices'], bus='')))
+    router.route(frames(b'subscriber', b'', b'VIP1', b'', b'2', b'pubsub', b'unsubscribe', unsubscribe))
+    publish(3)
+    router._fan_out()
+
+    delivered = [sent for sent in socket.sent if sent[0] == b'subscriber' and sent[5] == b'pubsub' and
+                 sent[6] == b'publish']
+    assert [jsonapi.loads(sent[8])['message'] for sent in delivered] == [1]
+    assert not router._fanout
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*- {{{
+# vim: set fenc=utf-8 ft=python sw=4 ts=4 sts=4 et:
+#
+# Copyright 2017, Battelle Memorial Institute.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# This material was prepared as an account of work sponsored by an agency of
+# the United States Government. Neither the United States Government nor the
+# United States Department of Energy, nor Battelle, nor any of their
+# employees, nor any jurisdiction or organization that has cooperated in the
+# development of these materials, makes any warranty, express or
+# implied, or assumes any legal liability or responsibility for the accuracy,
+# completeness, or usefulness or any information, apparatus, product,
+# software, or process disclosed, or represents that its use would not infringe
+# privately owned rights. Reference herein to any specific commercial product,
+# process, or service by trade name, trademark, manufacturer, or otherwise
+# does not necessarily constitute or imply its endorsement, recommendation, or
+# favoring by the United States Government or any agency thereof, or
+# Battelle Memorial Institute. The views and opinions of authors expressed
+# herein do not necessarily state or reflect those of the
+# United States Government or any agency thereof.
+#
+# PACIFIC NORTHWEST NATIONAL LABORATORY operated by
+# BATTELLE for the UNITED STATES DEPARTMENT OF ENERGY
+# under Contract DE-AC05-76RL01830
+# }}}
+
+import time
+
+import pytest
+
+from volttron.platform.vip.retained import LastValueCache
+
+
+@pytest.mark.pubsub
+def test_retains_last_value_of_configured_prefixes():
+    cache = LastValueCache(['devices/campus', 'record'])
+    assert cache.retains('devices/campus/building/all')
+    assert not cache.retains('devices/other/all')
+    cache.put('', 'devices/campus/a/all', '1')
+    cache.put('', 'devices/campus/a/all', '2')
+    cache.put('', 'devices/campus/b/all', '3')
+    cache.put('other', 'devices/campus/a/all', '4')
+    assert sorted(cache.get('', 'devices/campus')) == [
+        ('devices/campus/a/all', '2'), ('devices/campus/b/all', '3')]
+    assert cache.get('', 'devices/campus/b') == [('devices/campus/b/all', '3')]
+    assert cache.get('other', '') == [('devices/campus/a/all', '4')]
+
+
+@pytest.mark.pubsub
+def test_evicts_least_recently_updated():
+    cache = LastValueCache([''], max_topics=2)
+    cache.put('', 'a', '1')
+    cache.put('', 'b', '2')
+    cache.put('', 'a', '3')
+    cache.put('', 'c', '4')
+    assert sorted(cache.get('', '')) == [('a', '3'), ('c', '4')]
+
+    cache = LastValueCache([''], max_bytes=10)
+    cache.put('', 'a', '1234')
+    cache.put('', 'b', '1234')
+    cache.put('', 'c', '1234')
+    assert sorted(cache.get('', '')) == [('b', '1234'), ('c', '1234')]
+
+
+@pytest.mark.pubsub
+def test_expired_messages_are_not_replayed():
+    cache = LastValueCache([''], expiry=0.05)
+    cache.put('', 'a', '1')
+    time.sleep(0.1)
+    cache.put('', 'b', '2')
+    assert cache.get('', '') == [('b', '2')]
+    assert len(cache) == 1
@@ -0,0 +1,420 @@
+# -*- coding: utf-8 -*- {{{
+# vim: set fenc=utf-8 ft=python sw=4 ts=4 sts=4 et:
+#
+# Copyright 2017, Battelle Memorial Institute.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# This material was prepared as an account of work sponsored by an agency of
+# the United States Government. Neither the United States Government nor the
+# United States Department of Energy, nor Battelle, nor any of their
+# employees, nor any jurisdiction or organization that has cooperated in the
+# development of these materials, makes any warranty, express or
+# implied, or assumes any legal liability or responsibility for the accuracy,
+# completeness, or usefulness or any information, apparatus, product,
+# software, or process disclosed, or represents that its use would not infringe
+# privately owned rights. Reference herein to any specific commercial product,
+# process, or service by trade name, trademark, manufacturer, or otherwise
+# does not necessarily constitute or imply its endorsement, recommendation, or
+# favoring by the United States Government or any agency thereof, or
+# Battelle Memorial Institute. The views and opinions of authors expressed
+# herein do not necessarily state or reflect those of the
+# United States Government or any agency thereof.
+#
+# PACIFIC NORTHWEST NATIONAL LABORATORY operated by
+# BATTELLE for the UNITED STATES DEPARTMENT OF ENERGY
+# under Contract DE-AC05-76RL01830
+# }}}
+
+import pytest
+import zmq
+
+from volttron.platform.agent import json as jsonapi
+from volttron.platform.vip import codec
+from volttron.platform.vip.pubsubservice import PubSubService, PUBLISH_CREDIT_BATCH
+from volttron.platform.vip.retained import LastValueCache
+from volttron.platform.vip.topicids import TopicDecoder, TopicEncoder
+
+
+class RecordingSocket(object):
+    def __init__(self):
+        self.sent = []
+
+    def send_multipart(self, frames, flags=0, copy=True):
+        self.sent.append([bytes(frame) for frame in frames])
+
+
+def publish_frames(data, bus=None, msg_id=b'1'):
+    frames = [zmq.Frame(b'publisher'), b'', b'VIP1', b'', msg_id, b'pubsub',
+              b'publish', zmq.Frame(b'devices/building/all'), zmq.Frame(data)]
+    if bus is not None:
+        frames.append(zmq.Frame(bus))
+    return frames
+
+
+@pytest.mark.pubsub
+@pytest.mark.parametrize('bus', [None, ''])
+def test_publish_delivered_with_sender(bus):
+    socket = RecordingSocket()
+    service = PubSubService(socket, {}, None)
+    service._add_peer_subscription('subscriber', '', 'devices')
+    data = jsonapi.dumps(dict(bus='', headers={'Date': 'now'}, message=[{'point': 1.5}]))
+
+    service.handle_subsystem(publish_frames(data, bus), b'')
+
+    assert len(socket.sent) == 1
+    sent = socket.sent[0]
+    assert sent[0] == b'subscriber'
+    assert sent[7] == b'devices/building/all'
+    assert jsonapi.loads(sent[8]) == dict(sender='publisher', bus='', headers={'Date': 'now'},
+                                          message=[{'point': 1.5}])
+
+
+@pytest.mark.pubsub
+def test_bus_frame_routes_without_decoding():
+    socket = RecordingSocket()
+    service = PubSubService(socket, {}, None)
+    service._add_peer_subscription('subscriber', 'other', 'devices')
+    # The payload is only forwarded, so the router must not try to decode it.
+    data = '{"bus": "other", "message": ' + '[1, 2, 3' * 10
+
+    service.handle_subsystem(publish_frames(data, 'other'), b'')
+
+    assert len(socket.sent) == 1
+    assert socket.sent[0][8].startswith(b'{"sender": "publisher", "bus": "other"')
+
+
+@pytest.mark.pubsub
+@pytest.mark.parametrize('data', [
+    '{"sender": "forged", "bus": "", "message": 1}',
+    '{"bus": "", "message": 1, "s\\u0065nder": "forged"}',
+    '{}',
+    '{ }',
+])
+def test_sender_stamped_by_router(data):
+    socket = RecordingSocket()
+    service = PubSubService(socket, {}, None)
+    service._add_peer_subscription('subscriber', '', 'devices')
+
+    service.handle_subsystem(publish_frames(data, ''), b'')
+
+    message = jsonapi.loads(socket.sent[0][8])
+    assert message['sender'] == 'publisher'
+    assert 'forged' not in message.values()
+
+
+@pytest.mark.pubsub
+def test_sender_stamped_after_leading_whitespace():
+    socket = RecordingSocket()
+    service = PubSubService(socket, {}, None)
+    service._add_peer_subscription('subscriber', '', 'devices')
+
+    service.handle_subsystem(publish_frames(' {"message": 1}', ''), b'')
+
+    assert jsonapi.loads(socket.sent[0][8]) == dict(sender='publisher', message=1)
+
+
+@pytest.mark.pubsub
+@pytest.mark.parametrize('data', ['[1, 2]', '1', '"devices"', ' [{"sender": "forged"}]'])
+def test_publish_of_non_object_dropped(data):
+    socket = RecordingSocket()
+    service = PubSubService(socket, {}, None)
+    service._add_peer_subscription('subscriber', '', 'devices')
+
+    service.handle_subsystem(publish_frames(data, ''), b'')
+
+    assert [sent for sent in socket.sent if sent[0] == b'subscriber'] == []
+
+
+@pytest.mark.pubsub
+@pytest.mark.skipif(not codec.HAS_MSGPACK, reason='msgpack not installed')
+def test_msgpack_sender_stamped_by_router():
+    socket = RecordingSocket()
+    service = PubSubService(socket, {}, None)
+    service._add_peer_subscription('subscriber', '', 'devices')
+    data = codec.dumps(dict(sender='forged', bus='', message=1), codec.MSGPACK)
+
+    service.handle_subsystem(publish_frames(data, ''), b'')
+
+    assert codec.loads(socket.sent[0][8]) == dict(sender='publisher', bus='', message=1)
+
+
+def batch_frames(items, bus=''):
+    frames = [zmq.Frame(b'publisher'), b'', b'VIP1', b'', b'1', b'pubsub',
+              b'publish_batch', zmq.Frame(bus)]
+    for topic, message in items:
+        frames.append(zmq.Frame(topic))
+        frames.append(zmq.Frame(jsonapi.dumps(dict(bus=bus, headers={}, message=message))))
+    return frames
+
+
+@pytest.mark.pubsub
+def test_publish_batch_fanout():
+    socket = RecordingSocket()
+    service = PubSubService(socket, {}, None)
+    sub_msg = jsonapi.dumps(dict(prefix='devices', bus='', batch=True))
+    service.handle_subsystem([zmq.Frame(b'batcher'), b'', b'VIP1', b'', b'2', b'pubsub',
+                              b'subscribe', zmq.Frame(sub_msg)], b'')
+    service._add_peer_subscription('single', '', 'devices/a')
+    items = [('devices/a/point1', 1), ('devices/b/point1', 2), ('analysis/x', 3)]
+
+    response = service.handle_subsystem(batch_frames(items), b'')
+
+    assert bytes(response[7]) == b'3'
+    batches = [sent for sent in socket.sent if sent[0] == b'batcher']
+    assert len(batches) == 1
+    assert batches[0][6:8] == [b'publish_batch', b'']
+    assert batches[0][8::2] == [b'devices/a/point1', b'devices/b/point1']
+    assert [jsonapi.loads(data)['message'] for data in batches[0][9::2]] == [1, 2]
+    singles = [sent for sent in socket.sent if sent[0] == b'single']
+    assert len(singles) == 1
+    assert singles[0][6:8] == [b'publish', b'devices/a/point1']
+    assert jsonapi.loads(singles[0][8])['sender'] == 'publisher'
+
+
+@pytest.mark.pubsub
+def test_unacknowledged_publish_grants_credits():
+    socket = RecordingSocket()
+    service = PubSubService(socket, {}, None)
+    data = jsonapi.dumps(dict(bus='', headers={}, message=1))
+
+    responses = [service.handle_subsystem(publish_frames(data, '', b'noack'), b'')
+                 for _ in range(PUBLISH_CREDIT_BATCH * 2)]
+
+    credits = [response for response in responses if response]
+    assert len(credits) == 2
+    for response in credits:
+        assert bytes(response[0]) == b'publisher'
+        assert [bytes(frame) for frame in response[6:]] == [b'credit', str(PUBLISH_CREDIT_BATCH)]
+    # Acknowledged publishes still get a response each
+    response = service.handle_subsystem(publish_frames(data, ''), b'')
+    assert bytes(response[6]) == b'request_response'
+
+
+@pytest.mark.pubsub
+def test_retained_messages_replayed_on_subscribe():
+    socket = RecordingSocket()
+    service = PubSubService(socket, {}, None, retained=LastValueCache(['devices']))
+    for value in (1, 2):
+        data = jsonapi.dumps(dict(bus='', headers={}, message=value))
+        service.handle_subsystem(publish_frames(data, ''), b'')
+    data = jsonapi.dumps(dict(bus='', headers={}, message=3))
+    service.handle_subsystem(publish_frames(data), b'')
+    assert not socket.sent
+
+    sub_msg = jsonapi.dumps(dict(prefix='devices/building', bus='', replay=True))
+    service.handle_subsystem([zmq.Frame(b'late'), b'', b'VIP1', b'', b'2', b'pubsub',
+                              b'subscribe', zmq.Frame(sub_msg)], b'')
+
+    assert len(socket.sent) == 1
+    sent = socket.sent[0]
+    assert sent[0] == b'late'
+    assert sent[6:8] == [b'publish', b'devices/building/all']
+    assert jsonapi.loads(sent[8]) == dict(sender='publisher', bus='', headers={}, message=3)
+
+
+class FullSocket(RecordingSocket):
+    """Raises EAGAIN for messages to the subscriber while it is full"""
+    def __init__(self):
+        super(FullSocket, self).__init__()
+        self.full = True
+
+    def send_multipart(self, frames, flags=0, copy=True):
+        if self.full and bytes(frames[0]) == b'subscriber':
+            raise zmq.ZMQError(zmq.EAGAIN)
+        super(FullSocket, self).send_multipart(frames, flags, copy)
+
+
+def publish_values(service, values, topic=b'devices/building/all'):
+    for value in values:
+        frames = publish_frames(jsonapi.dumps(dict(headers={}, message=value)), '')
+        frames[7] = zmq.Frame(topic)
+        service.handle_subsystem(frames, b'')
+
+
+@pytest.mark.pubsub
+def test_full_subscriber_drops_and_reports_by_default():
+    socket = FullSocket()
+    service = PubSubService(socket, {}, None)
+    service._add_peer_subscription('subscriber', '', 'devices')
+
+    publish_values(service, [1, 2])
+
+    assert [sent[0] for sent in socket.sent if sent[5] == b'error'] == [b'publisher', b'publisher']
+    assert not service.backlogged()
+    assert service.queue_stats()['subscriber']['dropped'] == 2
+
+
+@pytest.mark.pubsub
+def test_full_subscriber_conflates_by_topic():
+    socket = FullSocket()
+    service = PubSubService(socket, {}, None, queue_policy='conflate')
+    service._add_peer_subscription('subscriber', '', 'devices')
+
+    publish_values(service, [1, 2, 3])
+    publish_values(service, [4], topic=b'devices/other/all')
+    assert service.backlogged()
+    socket.full = False
+    service.flush_queues()
+
+    delivered = [(sent[7], jsonapi.loads(sent[8])['message']) for sent in socket.sent]
+    assert delivered == [(b'devices/building/all', 3), (b'devices/other/all', 4)]
+    assert not service.backlogged()
+    stats = service.queue_stats()['subscriber']
+    assert stats['conflated'] == 2
+    assert stats['dropped'] == 0
+
+
+@pytest.mark.pubsub
+def test_full_subscriber_queue_drops_oldest():
+    socket = FullSocket()
+    service = PubSubService(socket, {}, None, queue_length=2)
+    service._add_peer_subscription('subscriber', '', 'devices')
+    # The subscriber asks for its own policy when subscribing
+    service._set_queue_policy('subscriber', 'drop_oldest')
+
+    publish_values(service, [1, 2, 3])
+    socket.full = False
+    # Queued publishes are sent before newer ones
+    publish_values(service, [4])
+
+    assert [jsonapi.loads(sent[8])['message'] for sent in socket.sent] == [2, 3, 4]
+    assert service.queue_stats()['subscriber']['dropped'] == 1
+
+
+@pytest.mark.pubsub
+def test_wildcard_subscription_filters_before_fanout():
+    socket = RecordingSocket()
+    service = PubSubService(socket, {}, None)
+    service._add_peer_subscription('subscriber', '', 'devices/+/all')
+    service._add_peer_subscription('other', '', 'devices/+/+/all')
+    data = jsonapi.dumps(dict(headers={}, message=1))
+
+    service.handle_subsystem(publish_frames(data, ''), b'')
+
+    assert [sent[0] for sent in socket.sent] == [b'subscriber']
+
+
+def subscribe_frames(peer, prefix, **options):
+    msg = dict(prefix=prefix, bus='', all_platforms=False, filter=options or None)
+    return [zmq.Frame(peer), b'', b'VIP1', b'', b'1', b'pubsub', b'subscribe', zmq.Frame(jsonapi.dumps(msg))]
+
+
+@pytest.mark.pubsub
+def test_subscription_with_inner_hash_ignored():
+    socket = RecordingSocket()
+    service = PubSubService(socket, {}, None)
+    service.handle_subsystem(subscribe_frames(b'subscriber', ['devices/#/all', 'devices/+/all']), b'')
+    del socket.sent[:]
+    data = jsonapi.dumps(dict(headers={}, message=1))
+
+    service.handle_subsystem(publish_frames(data, ''), b'')
+
+    assert [sent[0] for sent in socket.sent] == [b'subscriber']
+    assert 'devices/#/all' not in service._peer_subscriptions['internal']['']
+
+
+@pytest.mark.pubsub
+def test_deadband_filter_applied_per_subscriber():
+    socket = RecordingSocket()
+    service = PubSubService(socket, {}, None)
+    service.handle_subsystem(subscribe_frames(b'filtered', 'devices', deadband=1.0), b'')
+    service.handle_subsystem(subscribe_frames(b'unfiltered', 'devices'), b'')
+    # Another subscription without a filter matching the topic receives every message
+    service.handle_subsystem(subscribe_frames(b'both', 'devices', deadband=1.0), b'')
+    service.handle_subsystem(subscribe_frames(b'both', 'devices/building'), b'')
+    del socket.sent[:]
+
+    publish_values(service, [70.0, 70.5, 71.5])
+
+    received = {}
+    for sent in socket.sent:
+        received.setdefault(sent[0], []).append(jsonapi.loads(sent[8])['message'])
+    assert received == {b'filtered': [70.0, 71.5],
+                        b'unfiltered': [70.0, 70.5, 71.5],
+                        b'both': [70.0, 70.5, 71.5]}
+
+
+@pytest.mark.pubsub
+@pytest.mark.skipif(not codec.HAS_MSGPACK, reason='msgpack is not installed')
+def test_msgpack_publish_transcoded_for_json_subscribers():
+    socket = RecordingSocket()
+    codecs = {'publisher': codec.MSGPACK, 'fast': codec.MSGPACK}
+    service = PubSubService(socket, {}, None, codecs=codecs)
+    service._add_peer_subscription('fast', '', 'devices')
+    service._add_peer_subscription('legacy', '', 'devices')
+    data = codec.dumps(dict(bus='', headers={}, message=[{'point': 1.5}]), codec.MSGPACK)
+
+    service.handle_subsystem(publish_frames(data, ''), b'')
+
+    received = {sent[0]: sent[8] for sent in socket.sent}
+    assert codec.codec_of(received['fast']) == codec.MSGPACK
+    assert codec.codec_of(received['legacy']) == codec.JSON
+    expected = dict(sender='publisher', bus='', headers={}, message=[{'point': 1.5}])
+    assert codec.loads(received['fast']) == expected
+    assert jsonapi.loads(received['legacy']) == expected
+
+
+@pytest.mark.pubsub
+def test_topic_ids_sent_once_per_subscriber():
+    socket = RecordingSocket()
+    tables = {'publisher': (TopicEncoder(), TopicDecoder()), 'subscriber': (TopicEncoder(), TopicDecoder())}
+    service = PubSubService(socket, {}, None, topic_tables=tables)
+    service._add_peer_subscription('subscriber', '', 'devices')
+    service._add_peer_subscription('legacy', '', 'devices')
+    publisher = TopicEncoder()
+    data = jsonapi.dumps(dict(bus='', headers={}, message=1))
+
+    for _ in range(2):
+        frames = publish_frames(data, '')
+        frames[7] = zmq.Frame(publisher.encode(b'devices/building/all')[0])
+        service.handle_subsystem(frames, b'')
+
+    received = [sent[7] for sent in socket.sent if sent[0] == b'subscriber']
+    assert len(received) == 2
+    assert received[0].endswith(b'devices/building/all')
+    assert len(received[1]) == 5
+    decoder = TopicDecoder()
+    assert [decoder.decode(topic) for topic in received] == [b'devices/building/all'] * 2
+    assert [sent[7] for sent in socket.sent if sent[0] == b'legacy'] == [b'devices/building/all'] * 2
+
+
+@pytest.mark.pubsub
+def test_unknown_topic_id_requests_reset():
+    socket = RecordingSocket()
+    tables = {'publisher': (TopicEncoder(), TopicDecoder())}
+    service = PubSubService(socket, {}, None, topic_tables=tables)
+    service._add_peer_subscription('subscriber', '', 'devices')
+    publisher = TopicEncoder()
+    # The definition of the id never reached the router
+    publisher.encode(b'devices/building/all')
+    frames = publish_frames(jsonapi.dumps(dict(bus='', headers={}, message=1)), '')
+    frames[7] = zmq.Frame(publisher.encode(b'devices/building/all')[0])
+
+    service.handle_subsystem(frames, b'')
+
+    assert socket.sent == [[b'publisher', b'', b'VIP1', b'', b'', b'pubsub', b'topic_reset']]
+
+
+@pytest.mark.pubsub
+def test_truncated_topic_id_requests_reset():
+    socket = RecordingSocket()
+    tables = {'publisher': (TopicEncoder(), TopicDecoder())}
+    service = PubSubService(socket, {}, None, topic_tables=tables)
+    service._add_peer_subscription('subscriber', '', 'devices')
+    frames = publish_frames(jsonapi.dumps(dict(bus='', headers={}, message=1)), '')
+    frames[7] = zmq.Frame(b'\x00ab')
+
+    service.handle_subsystem(frames, b'')
+
+    assert socket.sent == [[b'publisher', b'', b'VIP1', b'', b'', b'pubsub', b'topic_reset']]
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*- {{{
+# vim: set fenc=utf-8 ft=python sw=4 ts=4 sts=4 et:
+#
+# Copyright 2017, Battelle Memorial Institute.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# This material was prepared as an account of work sponsored by an agency of
+# the United States Government. Neither the United States Government nor the
+# United States Department of Energy, nor Battelle, nor any of their
+# employees, nor any jurisdiction or organization that has cooperated in the
+# development of these materials, makes any warranty, express or
+# implied, or assumes any legal liability or responsibility for the accuracy,
+# completeness, or usefulness or any information, apparatus, product,
+# software, or process disclosed, or represents that its use would not infringe
+# privately owned rights. Reference herein to any specific commercial product,
+# process, or service by trade name, trademark, manufacturer, or otherwise
+# does not necessarily constitute or imply its endorsement, recommendation, or
+# favoring by the United States Government or any agency thereof, or
+# Battelle Memorial Institute. The views and opinions of authors expressed
+# herein do not necessarily state or reflect those of the
+# United States Government or any agency thereof.
+#
+# PACIFIC NORTHWEST NATIONAL LABORATORY operated by
+# BATTELLE for the UNITED STATES DEPARTMENT OF ENERGY
+# under Contract DE-AC05-76RL01830
+# }}}
+
+import pytest
+
+import zmq
+
+from volttron.platform.main import Router
+from volttron.platform.vip.pubsubservice import PubSubService
+from volttron.platform.vip.tracking import Histogram, Tracker
+
+
+class RecordingSocket(object):
+    identity = b'router'
+
+    def __init__(self):
+        self.sent = []
+
+    def send_multipart(self, frames, flags=0, copy=True):
+        self.sent.append([bytes(frame) for frame in frames])
+
+
+def build_router(tracker):
+    router = Router('inproc://router-tracing', tracker=tracker)
+    router.socket = RecordingSocket()
+    router.pubsub = PubSubService(router.socket, {}, None)
+    return router
+
+
+def call(router, sender, recipient, subsystem=b'RPC'):
+    router.route([zmq.Frame(part) for part in (sender, recipient, b'VIP1', b'', b'1', subsystem, b'{}')])
+
+
+@pytest.mark.zmq
+def test_router_observed_only_while_tracking():
+    tracker = Tracker()
+    router = build_router(tracker)
+    assert not router.observed
+
+    tracker.enable()
+    assert router.observed
+    call(router, b'caller', b'callee')
+    assert tracker.stats['incoming']['subsystem'] == {b'RPC': 1}
+
+    tracker.disable()
+    assert not router.observed
+    call(router, b'caller', b'callee')
+    assert tracker.stats['incoming']['subsystem'] == {b'RPC': 1}
+
+
+@pytest.mark.zmq
+def test_trace_sampled_and_filtered():
+    tracker = Tracker()
+    router = build_router(tracker)
+    tracker.trace(sample=2, peers=[b'callee'], subsystems=[b'RPC'])
+    assert router.observed
+
+    for _ in range(4):
+        call(router, b'caller', b'callee')
+    call(router, b'caller', b'other')
+    call(router, b'caller', b'callee', subsystem=b'ping')
+
+    # Each call is traced coming in and going out, and every second one is kept
+    assert [message['topic'] for message in tracker.traced] == ['outgoing'] * 4
+    assert all("'callee'" in message['frames'] for message in tracker.traced)
+
+    tracker.untrace()
+    assert not router.observed
+    assert len(tracker.traced) == 4
+
+
+@pytest.mark.zmq
+def test_histogram_percentiles_within_bucket_precision():
+    histogram = Histogram()
+    for value in range(1, 10001):
+        histogram.record(value)
+
+    snapshot = histogram.snapshot()
+    assert (snapshot['count'], snapshot['min'], snapshot['max']) == (10000, 1, 10000)
+    assert snapshot['mean'] == 5000.5
+    for percent, key in [(50, 'p50'), (99, 'p99')]:
+        assert abs(snapshot[key] - percent * 100) <= percent * 100 / 8.0
+    assert sum(count for _, _, count in snapshot['buckets']) == 10000
+    assert Histogram().percentile(50) is None
+
+
+@pytest.mark.zmq
+def test_router_records_size_and_dwell_time():
+    tracker = Tracker()
+    router = build_router(tracker)
+    tracker.enable()
+    assert router._timed
+
+    call(router, b'caller', b'callee')
+    tracker.routed()
+
+    snapshot = tracker.snapshot()
+    size = snapshot['size']['subsystem'][b'RPC']
+    assert size['count'] == 1
+    assert size['max'] == len(b'callercalleeVIP11RPC{}')
+    assert snapshot['dwell']['peer'][b'caller']['count'] == 1
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*- {{{
+# vim: set fenc=utf-8 ft=python sw=4 ts=4 sts=4 et:
+#
+# Copyright 2017, Battelle Memorial Institute.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# This material was prepared as an account of work sponsored by an agency of
+# the United States Government. Neither the United States Government nor the
+# United States Department of Energy, nor Battelle, nor any of their
+# employees, nor any jurisdiction or organization that has cooperated in the
+# development of these materials, makes any warranty, express or
+# implied, or assumes any legal liability or responsibility for the accuracy,
+# completeness, or usefulness or any information, apparatus, product,
+# software, or process disclosed, or represents that its use would not infringe
+# privately owned rights. Reference herein to any specific commercial product,
+# process, or service by trade name, trademark, manufacturer, or otherwise
+# does not necessarily constitute or imply its endorsement, recommendation, or
+# favoring by the United States Government or any agency thereof, or
+# Battelle Memorial Institute. The views and opinions of authors expressed
+# herein do not necessarily state or reflect those of the
+# United States Government or any agency thereof.
+#
+# PACIFIC NORTHWEST NATIONAL LABORATORY operated by
+# BATTELLE for the UNITED STATES DEPARTMENT OF ENERGY
+# under Contract DE-AC05-76RL01830
+# }}}
+
+import pytest
+
+from volttron.platform.vip.pubsubfilter import SubscriptionFilter
+
+
+@pytest.mark.pubsub
+def test_deadband_compares_with_last_forwarded():
+    subscription_filter = SubscriptionFilter(deadband=1.0)
+    assert subscription_filter.accept('devices/a', 70.0, now=0)
+    assert not subscription_filter.accept('devices/a', 70.6, now=1)
+    # Drift is measured from the last value forwarded, not the last seen
+    assert subscription_filter.accept('devices/a', 71.2, now=2)
+    assert subscription_filter.accept('devices/b', 71.2, now=2)
+
+
+@pytest.mark.pubsub
+def test_on_change_compares_device_all_messages():
+    subscription_filter = SubscriptionFilter(on_change=True)
+    meta = {'temp': {'units': 'F'}, 'mode': {'units': None}}
+    assert subscription_filter.accept('devices/a/all', [{'temp': 70.0, 'mode': 'cool'}, meta], now=0)
+    assert not subscription_filter.accept('devices/a/all', [{'temp': 70.0, 'mode': 'cool'}, meta], now=1)
+    assert subscription_filter.accept('devices/a/all', [{'temp': 70.0, 'mode': 'heat'}, meta], now=2)
+    assert subscription_filter.accept('devices/a/all', [{'temp': 70.0, 'mode': 'heat', 'fan': 1}, meta], now=3)
+
+
+@pytest.mark.pubsub
+def test_min_interval():
+    subscription_filter = SubscriptionFilter(min_interval=10)
+    assert subscription_filter.accept('devices/a', 1, now=0)
+    assert not subscription_filter.accept('devices/a', 2, now=5)
+    assert subscription_filter.accept('devices/a', 3, now=10)
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*- {{{
+# vim: set fenc=utf-8 ft=python sw=4 ts=4 sts=4 et:
+#
+# Copyright 2017, Battelle Memorial Institute.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# This material was prepared as an account of work sponsored by an agency of
+# the United States Government. Neither the United States Government nor the
+# United States Department of Energy, nor Battelle, nor any of their
+# employees, nor any jurisdiction or organization that has cooperated in the
+# development of these materials, makes any warranty, express or
+# implied, or assumes any legal liability or responsibility for the accuracy,
+# completeness, or usefulness or any information, apparatus, product,
+# software, or process disclosed, or represents that its use would not infringe
+# privately owned rights. Reference herein to any specific commercial product,
+# process, or service by trade name, trademark, manufacturer, or otherwise
+# does not necessarily constitute or imply its endorsement, recommendation, or
+# favoring by the United States Government or any agency thereof, or
+# Battelle Memorial Institute. The views and opinions of authors expressed
+# herein do not necessarily state or reflect those of the
+# United States Government or any agency thereof.
+#
+# PACIFIC NORTHWEST NATIONAL LABORATORY operated by
+# BATTELLE for the UNITED STATES DEPARTMENT OF ENERGY
+# under Contract DE-AC05-76RL01830
+# }}}
+
+import random
+
+import pytest
+
+from volttron.platform.vip.topictrie import SubscriptionTrie, MatchCache, topic_matches
+
+
+def linear_match(subscriptions, topic):
+    return sorted(prefix for prefix in subscriptions if topic.startswith(prefix))
+
+
+def trie_match(trie, topic):
+    # Values are the prefixes themselves so the results are comparable.
+    return sorted(trie.match(topic))
+
+
+@pytest.mark.pubsub
+def test_match_prefixes():
+    trie = SubscriptionTrie()
+    for prefix in ['', 'devices', 'devices/campus', 'devices/cam',
+                   'devices/campus/building1', 'record', 'dev']:
+        trie[prefix] = prefix
+    assert trie_match(trie, 'devices/campus/building1/all') == \
+        ['', 'dev', 'devices', 'devices/cam', 'devices/campus',
+         'devices/campus/building1']
+    assert trie_match(trie, 'devices/campus2') == \
+        ['', 'dev', 'devices', 'devices/cam', 'devices/campus']
+    assert trie_match(trie, 'analysis') == ['']
+    assert trie_match(trie, 'de') == ['']
+
+
+@pytest.mark.pubsub
+def test_missing_key_creates_set():
+    trie = SubscriptionTrie()
+    trie['devices'].add('agent1')
+    trie['devices'].add('agent2')
+    assert trie.match('devices/all') == [{'agent1', 'agent2'}]
+
+
+@pytest.mark.pubsub
+def test_removal_updates_index():
+    trie = SubscriptionTrie()
+    for prefix in ['devices/a', 'devices/ab', 'devices/abc', 'devices/b']:
+        trie[prefix] = prefix
+    del trie['devices/ab']
+    assert trie_match(trie, 'devices/abcd') == ['devices/a', 'devices/abc']
+    assert trie.pop('devices/a') == 'devices/a'
+    assert trie.pop('devices/a', None) is None
+    assert trie_match(trie, 'devices/abcd') == ['devices/abc']
+    trie.clear()
+    assert trie.match('devices/abcd') == []
+    with pytest.raises(KeyError):
+        del trie['devices/abc']
+
+
+@pytest.mark.pubsub
+def test_random_against_linear_scan():
+    rand = random.Random(42)
+    alphabet = 'ab/'
+    keys = set()
+    trie = SubscriptionTrie()
+    for _ in range(2000):
+        key = ''.join(rand.choice(alphabet) for _ in range(rand.randint(0, 6)))
+        if key in keys and rand.random() < 0.5:
+            keys.remove(key)
+            del trie[key]
+        else:
+            keys.add(key)
+            trie[key] = key
+        topic = ''.join(rand.choice(alphabet) for _ in range(rand.randint(0, 8)))
+        assert trie_match(trie, topic) == linear_match(keys, topic)
+    assert sorted(trie) == sorted(keys)
+
+
+@pytest.mark.pubsub
+def test_match_cache_evicts_least_recently_used():
+    cache = MatchCache(2)
+    cache.put(('', 'devices/a'), 1)
+    cache.put(('', 'devices/b'), 2)
+    assert cache.get(('', 'devices/a')) == 1
+    cache.put(('', 'devices/c'), 3)
+    assert len(cache) == 2
+    assert cache.get(('', 'devices/b')) is None
+    assert cache.get(('', 'devices/a')) == 1
+    assert cache.get(('', 'devices/c')) == 3
+    cache.clear()
+    assert cache.get(('', 'devices/a')) is None
+
+
+@pytest.mark.pubsub
+def test_match_wildcard_patterns():
+    trie = SubscriptionTrie()
+    for key in ['devices', 'devices/+/+/RTU*/all', 'devices/campus/#', '#',
+                'devices/+/building1/+', 'devices/+']:
+        trie[key] = key
+    assert trie_match(trie, 'devices/campus/building1/RTU2/all') == \
+        ['#', 'devices', 'devices/+/+/RTU*/all', 'devices/campus/#']
+    assert trie_match(trie, 'devices/campus/building1/AHU1') == \
+        ['#', 'devices', 'devices/+/building1/+', 'devices/campus/#']
+    assert trie_match(trie, 'devices/campus') == \
+        ['#', 'devices', 'devices/+', 'devices/campus/#']
+    del trie['#']
+    del trie['devices/+/+/RTU*/all']
+    assert trie_match(trie, 'devices/campus/building1/RTU2/all') == \
+        ['devices', 'devices/campus/#']
+    assert trie_match(trie, 'analysis/campus') == []
+
+
+@pytest.mark.pubsub
+def test_topic_matches_agrees_with_trie():
+    rand = random.Random(7)
+    levels = ['a', 'b', 'ab', '+', '#', 'a*']
+    for _ in range(500):
+        key = '/'.join(rand.choice(levels) for _ in range(rand.randint(1, 3)))
+        if '#' in key.split('/')[:-1]:
+            continue
+        topic = '/'.join(rand.choice(['a', 'b', 'ab', 'ba'])
+                         for _ in range(rand.randint(1, 4)))
+        trie = SubscriptionTrie({key: key})
+        assert bool(trie.match(topic)) == topic_matches(key, topic), (key, topic)
+
+
+@pytest.mark.pubsub
+def test_hash_only_allowed_as_last_level():
+    trie = SubscriptionTrie()
+    with pytest.raises(ValueError):
+        trie['devices/#/all'] = 'devices/#/all'
+    assert 'devices/#/all' not in trie
+    assert trie_match(trie, 'devices/#/all') == []
+    trie['devices/#'] = 'devices/#'
+    assert trie_match(trie, 'devices/campus/all') == ['devices/#']
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*- {{{
+# vim: set fenc=utf-8 ft=python sw=4 ts=4 sts=4 et:
+#
+# Copyright 2017, Battelle Memorial Institute.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# This material was prepared as an account of work sponsored by an agency of
+# the United States Government. Neither the United States Government nor the
+# United States Department of Energy, nor Battelle, nor any of their
+# employees, nor any jurisdiction or organization that has cooperated in the
+# development of these materials, makes any warranty, express or
+# implied, or assumes any legal liability or responsibility for the accuracy,
+# completeness, or usefulness or any information, apparatus, product,
+# software, or process disclosed, or represents that its use would not infringe
+# privately owned rights. Reference herein to any specific commercial product,
+# process, or service by trade name, trademark, manufacturer, or otherwise
+# does not necessarily constitute or imply its endorsement, recommendation, or
+# favoring by the United States Government or any agency thereof, or
+# Battelle Memorial Institute. The views and opinions of authors expressed
+# herein do not necessarily state or reflect those of the
+# United States Government or any agency thereof.
+#
+# PACIFIC NORTHWEST NATIONAL LABORATORY operated by
+# BATTELLE for the UNITED STATES DEPARTMENT OF ENERGY
+# under Contract DE-AC05-76RL01830
+# }}}
+
+import pytest
+
+import zmq
+
+from volttron.platform.vip.router import BaseRouter
+from volttron.platform.vip.topicids import TOPIC_IDS, TopicDecoder, TopicEncoder
+
+
+@pytest.mark.pubsub
+def test_topics_defined_once_then_referenced():
+    encoder = TopicEncoder()
+    decoder = TopicDecoder()
+
+    first, defined = encoder.encode(b'devices/building/all')
+    second, again = encoder.encode(b'devices/building/all')
+
+    assert defined and not again
+    assert len(second) == 5
+    assert decoder.decode(first) == decoder.decode(second) == b'devices/building/all'
+    # Plain topics pass through untouched
+    assert decoder.decode(b'devices/other/all') == b'devices/other/all'
+
+
+@pytest.mark.pubsub
+def test_least_recently_sent_id_reassigned():
+    encoder = TopicEncoder(max_ids=2)
+    decoder = TopicDecoder()
+    for topic in [b'a', b'b', b'a', b'c']:
+        decoder.decode(encoder.encode(topic)[0])
+
+    # b was evicted and its id now stands for c
+    assert len(encoder) == 2
+    assert decoder.decode(encoder.encode(b'c')[0]) == b'c'
+    assert decoder.decode(encoder.encode(b'a')[0]) == b'a'
+    data, defined = encoder.encode(b'b')
+    assert defined
+    assert decoder.decode(data) == b'b'
+
+
+@pytest.mark.pubsub
+def test_forgotten_id_not_shared_with_live_topic():
+    encoder = TopicEncoder()
+    decoder = TopicDecoder()
+    encoder.encode(b'a')
+    decoder.decode(encoder.encode(b'b')[0])
+    # The definition of a was never delivered
+    encoder.forget(b'a')
+
+    data, defined = encoder.encode(b'c')
+    assert defined
+    assert decoder.decode(data) == b'c'
+    assert decoder.decode(encoder.encode(b'b')[0]) == b'b'
+    assert decoder.decode(encoder.encode(b'c')[0]) == b'c'
+    assert len(encoder) == 2
+
+
+@pytest.mark.pubsub
+def test_unknown_id_not_decoded():
+    encoder = TopicEncoder()
+    encoder.encode(b'devices/building/all')
+    assert TopicDecoder().decode(encoder.encode(b'devices/building/all')[0]) is None
+
+
+class RecordingSocket(object):
+    identity = b'router'
+
+    def __init__(self):
+        self.sent = []
+
+    def send_multipart(self, frames, flags=0, copy=True):
+        self.sent.append([bytes(frame) for frame in frames])
+
+
+@pytest.mark.pubsub
+def test_router_negotiates_topic_ids():
+    router = BaseRouter()
+    router.socket = RecordingSocket()
+
+    def hello(peer, *args):
+        router.route([zmq.Frame(part) for part in (peer, b'', b'VIP1', b'', b'1', b'hello', b'hello') + args])
+
+    hello(b'agent', b'json', TOPIC_IDS)
+    hello(b'legacy', b'json')
+    welcomes = dict((sent[0], sent[7:]) for sent in router.socket.sent if sent[5] == b'hello')
+    assert welcomes[b'agent'][-1] == TOPIC_IDS
+    assert welcomes[b'legacy'][-1] == b'json'
+    assert list(router._topic_tables) == [b'agent']
+
+    # A reconnecting peer starts with empty tables
+    encoder = router._topic_tables[b'agent'][0]
+    encoder.encode(b'devices/building/all')
+    hello(b'agent', b'json', TOPIC_IDS)
+    assert len(router._topic_tables[b'agent'][0]) == 0
+
+    router.topic_ids = False
+    hello(b'agent', b'json', TOPIC_IDS)
+    assert not router._topic_tables
@@ -0,0 +1,356 @@
+# -*- coding: utf-8 -*- {{{
+# vim: set fenc=utf-8 ft=python sw=4 ts=4 sts=4 et:
+#
+# Copyright 2017, Battelle Memorial Institute.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# This material was prepared as an account of work sponsored by an agency of
+# the United States Government. Neither the United States Government nor the
+# United States Department of Energy, nor Battelle, nor any of their
+# employees, nor any jurisdiction or organization that has cooperated in the
+# development of these materials, makes any warranty, express or
+# implied, or assumes any legal liability or responsibility for the accuracy,
+# completeness, or usefulness or any information, apparatus, product,
+# software, or process disclosed, or represents that its use would not infringe
+# privately owned rights. Reference herein to any specific commercial product,
+# process, or service by trade name, trademark, manufacturer, or otherwise
+# does not necessarily constitute or imply its endorsement, recommendation, or
+# favoring by the United States Government or any agency thereof, or
+# Battelle Memorial Institute. The views and opinions of authors expressed
+# herein do not necessarily state or reflect those of the
+# United States Government or any agency thereof.
+#
+# PACIFIC NORTHWEST NATIONAL LABORATORY operated by
+# BATTELLE for the UNITED STATES DEPARTMENT OF ENERGY
+# under Contract DE-AC05-76RL01830
+# }}}
+
+import os
+from datetime import datetime, timedelta
+
+import pytest
+import pytz
+
+from volttron.platform.agent.base_historian import (BackupDatabase,
+                                                    MemoryDatabase,
+                                                    SegmentDatabase,
+                                                    batch_records,
+                                                    unbatch_records)
+
+
+class Owner(object):
+    pass
+
+
+START = datetime(2019, 1, 1, tzinfo=pytz.UTC)
+
+
+def publish(count, first=0, topic='devices/campus/building/unit/point'):
+    return [{'source': 'scrape',
+             'topic': topic,
+             'meta': {'units': 'F'},
+             'headers': {'Date': 'now'},
+             'readings': [(START + timedelta(seconds=first + i), first + i)
+                          for i in range(count)]}]
+
+
+@pytest.fixture
+def spill_path(tmpdir):
+    return str(tmpdir.join('backup.spill'))
+
+
+def values(records):
+    return [record['value'] for record in records]
+
+
+@pytest.mark.historian
+def test_healthy_path_stays_in_memory(spill_path):
+    cache = MemoryDatabase(Owner(), None, 0.9, ring_size=10, spill_path=spill_path)
+
+    assert not cache.backup_new_data(publish(5))
+    # Records are written through to disk but read back from memory
+    assert os.path.getsize(spill_path) > 0
+    assert len(cache._ring) == 5
+    records = cache.get_outstanding_to_publish(3)
+    assert values(records) == [0, 1, 2]
+    assert records[0]['timestamp'] == START
+    assert records[0]['meta'] == {'units': 'F'}
+
+    cache.remove_successfully_published({None}, 3)
+    assert cache.get_backlog_count() == 2
+    cache.remove_successfully_published({records[0]['_id'] + 3}, 3)
+    assert values(cache.get_outstanding_to_publish(10)) == [4]
+
+
+@pytest.mark.historian
+def test_spills_when_behind_and_keeps_order(spill_path):
+    cache = MemoryDatabase(Owner(), None, 0.9, ring_size=3, spill_path=spill_path)
+
+    cache.backup_new_data(publish(5))
+    assert os.path.getsize(spill_path) > 0
+    assert cache.get_backlog_count() == 5
+    assert values(cache.get_outstanding_to_publish(10)) == [0, 1, 2, 3, 4]
+
+    cache.remove_successfully_published({None}, 4)
+    # Newer records follow the spilled ones to disk
+    cache.backup_new_data(publish(2, first=5))
+    records = cache.get_outstanding_to_publish(10)
+    assert values(records) == [4, 5, 6]
+    assert records[0]['timestamp'] == START + timedelta(seconds=4)
+    assert records[0]['meta'] == {'units': 'F'}
+
+    # Out of order acknowledgements
+    cache.remove_successfully_published({records[1]['_id']}, 10)
+    assert values(cache.get_outstanding_to_publish(10)) == [4, 6]
+    cache.remove_successfully_published({records[0]['_id'], records[2]['_id']}, 10)
+    assert cache.get_backlog_count() == 0
+    # The spill file is emptied once caught up and memory is used again
+    assert os.path.getsize(spill_path) == 0
+    cache.backup_new_data(publish(1, first=7))
+    assert len(cache._ring) == 1
+
+
+@pytest.mark.historian
+def test_unpublished_records_kept_across_restart(spill_path):
+    cache = MemoryDatabase(Owner(), None, 0.9, ring_size=3, spill_path=spill_path)
+    cache.backup_new_data(publish(5))
+    cache.remove_successfully_published({None}, 1)
+    cache.close()
+
+    cache = MemoryDatabase(Owner(), None, 0.9, ring_size=3, spill_path=spill_path)
+    assert cache.get_backlog_count() == 4
+    records = cache.get_outstanding_to_publish(10)
+    assert values(records) == [1, 2, 3, 4]
+    assert len(set(record['_id'] for record in records)) == 4
+    cache.backup_new_data(publish(1, first=5))
+    assert values(cache.get_outstanding_to_publish(10)) == [1, 2, 3, 4, 5]
+    cache.close()
+
+    # A record cut short by a crash is dropped
+    with open(spill_path, 'ab') as spill:
+        spill.write(b'\x00\x00\x01\x00{"partial')
+    cache = MemoryDatabase(Owner(), None, 0.9, ring_size=3, spill_path=spill_path)
+    assert values(cache.get_outstanding_to_publish(10)) == [1, 2, 3, 4, 5]
+
+
+@pytest.mark.historian
+def test_records_kept_across_crash(spill_path):
+    cache = MemoryDatabase(Owner(), None, 0.9, ring_size=3, spill_path=spill_path)
+    cache.backup_new_data(publish(2))
+    # Not closed, as if the historian died with the records in memory
+    cache = MemoryDatabase(Owner(), None, 0.9, ring_size=3, spill_path=spill_path)
+    assert values(cache.get_outstanding_to_publish(10)) == [0, 1]
+
+
+@pytest.mark.historian
+@pytest.mark.parametrize('close', [True, False])
+def test_published_records_not_replayed(spill_path, close):
+    cache = MemoryDatabase(Owner(), None, 0.9, ring_size=5, spill_path=spill_path)
+    cache.backup_new_data(publish(12))
+    records = cache.get_outstanding_to_publish(12)
+    cache.remove_successfully_published({None}, 5)
+    # The memory ring is empty, this record was only ever on disk
+    cache.remove_successfully_published({records[6]['_id']}, 12)
+    assert not cache._ring
+    assert cache.get_backlog_count() == 6
+    if close:
+        cache.close()
+
+    cache = MemoryDatabase(Owner(), None, 0.9, ring_size=5, spill_path=spill_path)
+    if close:
+        assert cache.get_backlog_count() == 6
+        assert values(cache.get_outstanding_to_publish(12)) == [5, 7, 8, 9, 10, 11]
+    else:
+        # Only out of order acknowledgements are repeated after a crash
+        assert cache.get_backlog_count() == 7
+        assert values(cache.get_outstanding_to_publish(12)) == [5, 6, 7, 8, 9, 10, 11]
+    cache.remove_successfully_published({None}, 12)
+    cache.close()
+    cache = MemoryDatabase(Owner(), None, 0.9, ring_size=5, spill_path=spill_path)
+    assert cache.get_backlog_count() == 0
+    cache.backup_new_data(publish(1, first=12))
+    records = cache.get_outstanding_to_publish(12)
+    assert values(records) == [12]
+    assert records[0]['_id'] > 12
+
+
+@pytest.mark.historian
+def test_storage_limit_drops_oldest_spilled(spill_path):
+    cache = MemoryDatabase(Owner(), 2000.0 / 1024 ** 3, 0.9, ring_size=1,
+                           spill_path=spill_path)
+    assert cache.backup_new_data(publish(100))
+    assert os.path.getsize(spill_path) <= 2000 * 1.25
+    records = cache.get_outstanding_to_publish(200)
+    assert values(records)[0] > 0
+    assert values(records) == sorted(values(records))
+    assert values(records)[-1] == 99
+    assert len(records) == cache.get_backlog_count() < 100
+
+
+def device_publish(scrape, points=3):
+    return {'source': 'scrape',
+            'timestamp': START + timedelta(seconds=scrape),
+            'topics': ['campus/building/unit/point{}'.format(i)
+                       for i in range(points)],
+            'values': [scrape * 10 + i for i in range(points)],
+            'meta': [{'units': 'F'}] * points,
+            'headers': {'Date': str(scrape)}}
+
+
+@pytest.mark.historian
+@pytest.mark.parametrize('engine', ['sqlite', 'memory', 'segment'])
+def test_batch_records_round_trip(engine, tmpdir, monkeypatch):
+    monkeypatch.chdir(tmpdir)
+    if engine == 'sqlite':
+        cache = BackupDatabase(Owner(), None, 0.9)
+    elif engine == 'memory':
+        cache = MemoryDatabase(Owner(), None, 0.9, ring_size=4)
+    else:
+        cache = SegmentDatabase(Owner(), None, 0.9)
+
+    cache.backup_new_data([device_publish(0), device_publish(1)] + publish(1, first=2))
+    assert cache.get_backlog_count() == 7
+    records = cache.get_outstanding_to_publish(10)
+    assert values(records) == [0, 1, 2, 10, 11, 12, 2]
+    assert records[0]['topic'] == 'campus/building/unit/point0'
+    assert records[0]['meta'] == {'units': 'F'}
+    assert records[3]['headers'] == {'Date': '1'}
+
+    batches = batch_records(records)
+    assert len(batches) == 3
+    assert batches[1]['timestamp'] == START + timedelta(seconds=1)
+    assert batches[1]['topics'] == device_publish(1)['topics']
+    assert batches[1]['values'] == [10, 11, 12]
+    assert batches[1]['_ids'] == [record['_id'] for record in records[3:6]]
+    assert batches[2]['values'] == [2]
+    assert unbatch_records(batches) == records
+
+    cache.remove_successfully_published(set(batches[0]['_ids']), 10)
+    assert values(cache.get_outstanding_to_publish(10)) == [10, 11, 12, 2]
+    cache.close()
+
+
+@pytest.mark.historian
+def test_batch_count_with_unique_constraint(tmpdir, monkeypatch):
+    monkeypatch.chdir(tmpdir)
+    cache = BackupDatabase(Owner(), None, 0.9)
+    # Left on the outstanding table of an upgraded installation
+    cache._connection.execute('''CREATE UNIQUE INDEX outstanding_unique
+                                 ON outstanding (ts, topic_id, source)''')
+    cache.backup_new_data(publish(1, topic='campus/building/unit/point1'))
+    # The second point is a duplicate; the points either side of it are not
+    cache.backup_new_data([device_publish(0)])
+    assert cache.get_backlog_count() == 3
+    assert values(cache.get_outstanding_to_publish(10)) == [0, 0, 2]
+    cache.close()
+
+
+def segments(directory):
+    return sorted(name for name in os.listdir(directory)
+                  if name.endswith('.segment'))
+
+
+@pytest.mark.historian
+@pytest.mark.parametrize('compress', [True, False])
+def test_segments_publish_in_order_and_reclaim(tmpdir, compress):
+    directory = str(tmpdir.join('segments'))
+    cache = SegmentDatabase(Owner(), None, 0.9, directory=directory,
+                            segment_size=1, compress=compress)
+
+    assert not cache.backup_new_data(publish(3))
+    cache.backup_new_data(publish(3, first=3))
+    # Every frame fills a one byte segment
+    assert len(segments(directory)) == 2
+    assert cache.get_backlog_count() == 6
+    records = cache.get_outstanding_to_publish(4)
+    assert values(records) == [0, 1, 2, 3]
+    assert records[0]['timestamp'] == START
+    assert records[0]['meta'] == {'units': 'F'}
+    assert records[0]['headers'] == {'Date': 'now'}
+
+    cache.remove_successfully_published({None}, 4)
+    assert cache.get_backlog_count() == 2
+    # The first segment is entirely published
+    assert len(segments(directory)) == 1
+
+    # Out of order acknowledgements
+    records = cache.get_outstanding_to_publish(10)
+    cache.remove_successfully_published({records[1]['_id']}, 10)
+    assert values(cache.get_outstanding_to_publish(10)) == [4]
+    cache.remove_successfully_published({records[0]['_id']}, 10)
+    assert cache.get_backlog_count() == 0
+    assert segments(directory) == []
+    cache.close()
+
+
+@pytest.mark.historian
+def test_segments_read_ahead_bounded_by_unpublished_record(tmpdir):
+    directory = str(tmpdir.join('segments'))
+    cache = SegmentDatabase(Owner(), None, 0.9, directory=directory,
+                            read_ahead=10)
+    for i in range(20):
+        cache.backup_new_data(publish(5, first=i * 5))
+    # Every record but the oldest is published
+    for _ in range(20):
+        records = cache.get_outstanding_to_publish(5)
+        cache.remove_successfully_published(
+            set(record['_id'] for record in records[1:]), 5)
+    assert values(records) == [0]
+    assert len(cache._pending) < 10 + 5
+    assert cache.get_backlog_count() == 100 - len(cache._pending) + 1
+
+    cache.remove_successfully_published({records[0]['_id']}, 5)
+    assert values(cache.get_outstanding_to_publish(5)) == [10, 11, 12, 13, 14]
+
+
+@pytest.mark.historian
+def test_segments_resume_from_cursor_after_crash(tmpdir):
+    directory = str(tmpdir.join('segments'))
+    cache = SegmentDatabase(Owner(), None, 0.9, directory=directory)
+    cache.backup_new_data(publish(3))
+    cache.backup_new_data(publish(3, first=3))
+    cache.remove_successfully_published({None}, 2)
+    ahead = cache.get_outstanding_to_publish(10)[2]['_id']
+    cache.remove_successfully_published({ahead}, 10)
+    # No close(), as if the process died, with a frame cut short
+    path = os.path.join(directory, segments(directory)[-1])
+    with open(path, 'ab') as segment:
+        segment.write(b'\x00\x00\x10\x00partial')
+
+    cache = SegmentDatabase(Owner(), None, 0.9, directory=directory)
+    # Records acknowledged ahead of the cursor are published again
+    assert cache.get_backlog_count() == 4
+    assert values(cache.get_outstanding_to_publish(10)) == [2, 3, 4, 5]
+    cache.backup_new_data(publish(1, first=6))
+    records = cache.get_outstanding_to_publish(10)
+    assert values(records) == [2, 3, 4, 5, 6]
+    assert len(set(record['_id'] for record in records)) == 5
+
+
+@pytest.mark.historian
+def test_segments_storage_limit_drops_oldest(tmpdir):
+    directory = str(tmpdir.join('segments'))
+    cache = SegmentDatabase(Owner(), 4000.0 / 1024 ** 3, 0.9,
+                            directory=directory, compress=False)
+    full = False
+    for i in range(50):
+        full = cache.backup_new_data(publish(2, first=i * 2)) or full
+    assert full
+    size = sum(os.path.getsize(os.path.join(directory, name))
+               for name in segments(directory))
+    assert size <= 4000
+    records = cache.get_outstanding_to_publish(200)
+    assert values(records)[-1] == 99
+    assert values(records)[0] > 0
+    assert len(records) == cache.get_backlog_count()
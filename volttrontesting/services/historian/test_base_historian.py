@@ -43,6 +43,7 @@ import json
 from volttron.platform import get_services_core
 
 from volttron.platform.agent.base_historian import (BaseHistorian,
+                                                    BaseQueryHistorianAgent,
                                                     STATUS_KEY_BACKLOGGED,
                                                     STATUS_KEY_CACHE_COUNT,
                                                     STATUS_KEY_PUBLISHING,
@@ -53,7 +54,8 @@ from volttron.platform.agent import utils
 from volttron.platform.messaging import headers as headers_mod
 from volttron.platform.messaging.health import *
 from time import sleep
-from datetime import datetime
+from datetime import datetime, timedelta
+import pytz
 import random
 import gevent
 import os
@@ -714,3 +716,75 @@ def test_restricting_topics(request, volttron_instance, client_agent):
         if historian:
             historian.core.stop()
             
+
+
+class StreamHistorian(object):
+    """Just enough of an historian to run query_stream against a list of
+    (timestamp, value) rows per topic."""
+
+    _parse_query_args = BaseQueryHistorianAgent._parse_query_args.im_func
+    _next_page = staticmethod(BaseQueryHistorianAgent._next_page)
+    query_stream = BaseQueryHistorianAgent.query_stream.im_func
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.queries = []
+
+    def query_historian(self, topic, start=None, end=None, agg_type=None,
+                        agg_period=None, skip=0, count=None, order=None):
+        self.queries.append((topic, start, end, skip))
+        if isinstance(topic, list):
+            return {'values': {name: self._query(name, start, end, skip, count,
+                                                 order)
+                               for name in topic},
+                    'metadata': {}}
+        return {'values': self._query(topic, start, end, skip, count, order)}
+
+    def _query(self, topic, start, end, skip, count, order):
+        rows = sorted(row for row in self.rows[topic]
+                      if (start is None or row[0] >= start) and
+                      (end is None or row[0] < end))
+        if order == 'LAST_TO_FIRST':
+            rows.reverse()
+        return [(utils.format_timestamp(ts), value)
+                for ts, value in rows[skip:skip + count]]
+
+
+def stream_rows(topic_rows, seconds):
+    base = datetime(2019, 1, 1, tzinfo=pytz.UTC)
+    return [(base + timedelta(seconds=second), (topic_rows, i))
+            for i, second in enumerate(seconds)]
+
+
+@pytest.mark.historian
+@pytest.mark.parametrize('order', ['FIRST_TO_LAST', 'LAST_TO_FIRST'])
+def test_query_stream_pages_by_timestamp(order):
+    # Runs of equal timestamps that cross and fill whole chunks
+    seconds = [0, 1, 1, 1, 2, 3, 3, 3, 3, 3, 3, 4, 5, 5]
+    historian = StreamHistorian({'a': stream_rows('a', seconds),
+                                 'b': stream_rows('b', range(5))})
+    expected = historian._query('a', None, None, 0, 100, order)
+
+    chunks = list(historian.query_stream('a', order=order, chunk_size=3))
+    assert all(len(chunk['values']) <= 3 for chunk in chunks)
+    assert sum([chunk['values'] for chunk in chunks], []) == expected
+    assert all(chunk['metadata'] == {} for chunk in chunks[:-1])
+
+    chunks = list(historian.query_stream(['a', 'b'], order=order,
+                                         chunk_size=3))
+    for name in ['a', 'b']:
+        assert sum([chunk['values'].get(name, []) for chunk in chunks],
+                   []) == historian._query(name, None, None, 0, 100, order)
+
+
+@pytest.mark.historian
+def test_query_stream_not_shifted_by_inserts():
+    historian = StreamHistorian({'a': stream_rows('a', range(6))})
+    stream = historian.query_stream('a', chunk_size=2)
+    first = next(stream)['values']
+    # A late row for an interval that was already read
+    historian.rows['a'].append((datetime(2019, 1, 1, tzinfo=pytz.UTC), 'late'))
+    rest = sum([chunk['values'] for chunk in stream], [])
+    assert [value for _, value in first + rest] == [('a', i) for i in range(6)]
+    # Later chunks are read from the last timestamp, not by skipping rows
+    assert all(skip == 1 for _, _, _, skip in historian.queries[1:])
@@ -173,6 +173,98 @@ class Suite(object):
                          second=0, microsecond=0, tzinfo=pytz.UTC)
         assert driver.query(id_name_map.keys(), id_name_map, start, end) == values
 
+    def test_query_count_skip_order_per_topic(self, driver):
+        id_name_map = {}
+        ts = datetime(year=2015, month=3, day=15, hour=9, minute=26,
+                      second=53, microsecond=59, tzinfo=pytz.UTC)
+        for topic in ['Building/LAB/Device2/OutsideAirTemperature',
+                      'Building/LAB/Device2/MixedAirTemperature']:
+            topic_id = driver.insert_topic(topic)
+            id_name_map[topic_id] = topic
+            for i in range(5):
+                driver.insert_data(ts + timedelta(seconds=i), topic_id,
+                                   {'reading': i} if i == 4 else float(i))
+        topic_id = driver.insert_topic('Building/LAB/Device2/DamperSignal')
+        id_name_map[topic_id] = 'Building/LAB/Device2/DamperSignal'
+        driver.commit()
+        stamps = [(ts + timedelta(seconds=i)).isoformat() for i in range(5)]
+
+        result = driver.query(id_name_map.keys(), id_name_map, skip=1,
+                              count=2, order='LAST_TO_FIRST')
+        assert result == {
+            'Building/LAB/Device2/OutsideAirTemperature': [
+                (stamps[3], 3.0), (stamps[2], 2.0)],
+            'Building/LAB/Device2/MixedAirTemperature': [
+                (stamps[3], 3.0), (stamps[2], 2.0)],
+            'Building/LAB/Device2/DamperSignal': []}
+        result = driver.query(id_name_map.keys(), id_name_map, skip=3)
+        assert result['Building/LAB/Device2/MixedAirTemperature'] == [
+            (stamps[3], 3.0), (stamps[4], {'reading': 4})]
+        assert result['Building/LAB/Device2/DamperSignal'] == []
+
+    @contextlib.contextmanager
+    def data_table(self, driver, table_name):
+        data_table = driver.data_table
+        driver.data_table = table_name
+        driver._typed_values = None
+        try:
+            yield
+        finally:
+            driver.data_table = data_table
+            driver._typed_values = None
+
+    @drop_tables(['typed_data'])
+    def test_typed_values(self, driver):
+        values = [1.5, -3, True, False, 'on', None, {'reading': 4}, [1, 2],
+                  2 ** 70, 0.0]
+        ts = datetime(year=2015, month=3, day=16, hour=9, minute=26,
+                      second=53, microsecond=59, tzinfo=pytz.UTC)
+        topic_id = driver.insert_topic('Building/LAB/Device3/Status')
+        id_name_map = {topic_id: 'Building/LAB/Device3/Status'}
+        with self.data_table(driver, 'typed_data'):
+            assert not driver.has_typed_values()
+            driver.create_data_table('typed_data', typed_values=True)
+            assert driver.has_typed_values()
+            with driver.bulk_insert() as insert_data:
+                for i, value in enumerate(values):
+                    insert_data(ts + timedelta(seconds=i), topic_id, value)
+            driver.commit()
+            result = driver.query([topic_id], id_name_map)
+            assert [value for _, value in
+                    result['Building/LAB/Device3/Status']] == values
+            assert [type(value) for _, value in
+                    result['Building/LAB/Device3/Status'][:4]] == [
+                float, int, bool, bool]
+            result = driver.query([topic_id], id_name_map, skip=1, count=2,
+                                  order='LAST_TO_FIRST')
+            assert result['Building/LAB/Device3/Status'] == [
+                ((ts + timedelta(seconds=8)).isoformat(), 2 ** 70),
+                ((ts + timedelta(seconds=7)).isoformat(), [1, 2])]
+            # Numbers are aggregated, booleans and other values are not.
+            assert driver.collect_aggregate([topic_id], 'sum') == (-1.5, 3)
+
+    @drop_tables(['json_data', 'json_data_json'])
+    def test_migrate_to_typed_values(self, driver):
+        ts = datetime(year=2015, month=3, day=17, hour=9, minute=26,
+                      second=53, microsecond=59, tzinfo=pytz.UTC)
+        id_name_map = {}
+        for topic in ['Building/LAB/Device4/OutsideAirTemperature',
+                      'Building/LAB/Device4/DamperSignal']:
+            id_name_map[driver.insert_topic(topic)] = topic
+        with self.data_table(driver, 'json_data'):
+            driver.create_data_table('json_data')
+            for topic_id in id_name_map:
+                for i in range(5):
+                    driver.insert_data(ts + timedelta(seconds=i), topic_id,
+                                       {'reading': i} if i == 4 else i * 0.5)
+            driver.commit()
+            expected = driver.query(id_name_map.keys(), id_name_map)
+            assert not driver.has_typed_values()
+            assert driver.migrate_to_typed_values(batch_size=2) == 10
+            assert driver.has_typed_values()
+            assert driver.query(id_name_map.keys(), id_name_map) == expected
+            assert driver.migrate_to_typed_values() == 0
+
     def test_topic_name_case_change(self, driver):
         topic_id = driver.insert_topic('This/is/some/Topic')
         assert topic_id
@@ -304,6 +396,14 @@ class TestRedshift(TestPostgreSql):
         with self._transact(redshift_params, truncate_tables, drop_tables):
             yield RedshiftFuncts, redshift_params
 
+    @pytest.mark.skip(reason='typed values not supported')
+    def test_typed_values(self, driver):
+        pass
+
+    @pytest.mark.skip(reason='typed values not supported')
+    def test_migrate_to_typed_values(self, driver):
+        pass
+
 
 class TestSqlite(AggregationSuite):
     @contextlib.contextmanager
@@ -335,6 +435,44 @@ class TestSqlite(AggregationSuite):
     def test_query_topic_pattern(self, driver):
         pass
 
+    def test_query_binds_at_most_999_variables(self, driver, monkeypatch):
+        ts = datetime(year=2015, month=3, day=18, hour=9, minute=26,
+                      second=53, microsecond=59, tzinfo=pytz.UTC)
+        id_name_map = {}
+        for i in range(basedb.QUERY_TOPICS_PER_STATEMENT + 1):
+            topic = 'Building/LAB/Device4/Point{}'.format(i)
+            topic_id = driver.insert_topic(topic)
+            id_name_map[topic_id] = topic
+            driver.insert_data(ts, topic_id, float(i))
+        driver.commit()
+        # SQLite builds before 3.32 allow at most 999 variables per statement
+        select = driver.select
+        bound = []
+        def counting_select(query, args=None, **kwargs):
+            bound.append(len(args or ()))
+            return select(query, args, **kwargs)
+        monkeypatch.setattr(driver, 'select', counting_select)
+
+        result = driver.query(id_name_map.keys(), id_name_map, start=ts,
+                              end=ts + timedelta(seconds=1), count=1)
+
+        assert result['Building/LAB/Device4/Point250'] == [(ts.isoformat(), 250.0)]
+        assert len(bound) == 2
+        assert max(bound) <= 999
+
+
+class TestTypedValueColumns:
+    def test_numbers(self):
+        assert basedb.typed_value_columns(1.5) == (1.5, None, None, None)
+        assert basedb.typed_value_columns(3) == (None, 3, None, None)
+        assert basedb.typed_value_columns(False) == (None, None, False, None)
+
+    def test_json(self):
+        assert basedb.typed_value_columns(2 ** 63) == (
+            None, None, None, '9223372036854775808')
+        assert basedb.typed_value_columns('on') == (None, None, None, '"on"')
+        assert basedb.typed_value_columns(None) == (None, None, None, 'null')
+
 
 class FauxConnection:
     def __init__(self, exc_class):
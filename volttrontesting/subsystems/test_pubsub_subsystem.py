@@ -9,6 +9,8 @@ from volttrontesting.utils.utils import (poll_gevent_sleep,
                                          messages_contains_prefix)
 
 from volttron.platform.vip.agent import PubSub
+from volttron.platform.vip.agent.delivery import CallbackDispatcher
+from volttron.platform.vip.agent.dispatch import Signal
 
 from volttron.platform.vip.agent import Agent
 
@@ -120,3 +122,42 @@ def test_multi_unsubscribe(volttron_instance):
     gevent.sleep(1)
 
     assert subscriber_agent.subscription_callback.call_count == 0
+
+
+class _FakeCore(object):
+    def __init__(self):
+        self.onsetup = Signal()
+
+    def register(self, name, handler, error_handler):
+        pass
+
+
+class _FakeRPC(object):
+    def export(self, method, name=None):
+        pass
+
+    def call(self, peer, method, *args, **kwargs):
+        pass
+
+
+@pytest.mark.pubsub
+def test_unsubscribe_forgets_batch_callbacks_and_dispatchers():
+    core, rpc, peerlist = _FakeCore(), _FakeRPC(), _FakeRPC()
+    pubsub = PubSub(core, rpc, peerlist, None)
+    pubsub._send_via_rpc = True
+    dispatcher = CallbackDispatcher()
+
+    def on_batch(peer, bus, messages):
+        pass
+
+    pubsub._add_subscription('devices/a', on_batch, batch=True, dispatcher=dispatcher)
+    pubsub._add_subscription('devices/b', on_batch, batch=True, dispatcher=dispatcher)
+    pubsub.unsubscribe('pubsub', 'devices/a', on_batch)
+    # Still subscribed to devices/b
+    assert on_batch in pubsub._batch_callbacks
+    assert pubsub._callback_dispatchers[on_batch] is dispatcher
+
+    pubsub.unsubscribe('pubsub', 'devices/b', on_batch)
+    assert not pubsub._batch_callbacks
+    assert not pubsub._callback_dispatchers
+    assert list(pubsub.dispatch_stats()) == ['agent']
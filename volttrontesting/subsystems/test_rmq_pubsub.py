@@ -41,6 +41,11 @@ import pytest
 
 from mock import MagicMock
 
+from volttron.platform.agent import json as jsonapi
+from volttron.platform.vip.agent.delivery import CallbackDispatcher
+from volttron.platform.vip.agent.dispatch import Signal
+from volttron.platform.vip.agent.subsystems.rmq_pubsub import RMQPubSub
+
 message_count2 = 0
 
 
@@ -326,3 +331,162 @@ def test_multi_unsubscribe(volttron_instance):
     gevent.sleep(1)
 
     assert subscriber_agent.subscription_callback.call_count == 0
+
+
+class _FakeChannel(object):
+    def __init__(self):
+        self.bindings = []
+        self.consumers = {}
+
+    def queue_declare(self, **kwargs):
+        pass
+
+    def queue_bind(self, **kwargs):
+        self.bindings.append((kwargs['queue'], kwargs['routing_key']))
+
+    def queue_delete(self, **kwargs):
+        pass
+
+    def basic_consume(self, callback, queue, no_ack):
+        self.consumers[queue] = callback
+
+
+class _FakeConnection(object):
+    def __init__(self):
+        self.channel = _FakeChannel()
+        self.exchange = 'volttron'
+
+
+class _FakeCore(object):
+    def __init__(self):
+        self.onsetup = Signal()
+        self.connection = _FakeConnection()
+        self.rmq_user = 'volttron1.subscriber'
+        self.instance_name = 'volttron1'
+        self.identity = 'subscriber'
+
+    def spawn(self, method, *args):
+        return method(*args)
+
+    def spawn_later(self, seconds, method, *args):
+        return gevent.spawn_later(seconds, method, *args)
+
+
+class _FakeRPC(object):
+    def export(self, method, name=None):
+        pass
+
+
+class _FakeMethod(object):
+    def __init__(self, routing_key):
+        self.routing_key = routing_key
+
+
+def rmq_deliver(core, topic, message):
+    body = jsonapi.dumps(dict(sender='publisher', bus='', headers={}, message=message))
+    method = _FakeMethod('__pubsub__.volttron1.{}.#'.format(topic.replace('/', '.')))
+    for queue, callback in core.connection.channel.consumers.items():
+        callback(None, method, None, body)
+    # Let the dispatcher run the callbacks
+    gevent.sleep(0.01)
+
+
+@pytest.mark.pubsub
+def test_glob_levels_checked_on_delivery():
+    core = _FakeCore()
+    pubsub = RMQPubSub(core, _FakeRPC(), _FakeRPC(), None)
+    received = []
+
+    def callback(peer, sender, bus, topic, headers, message):
+        received.append(topic)
+
+    pubsub.subscribe('pubsub', 'devices/+/+/RTU*/all', callback).get(timeout=2)
+    assert [key for _, key in core.connection.channel.bindings] == ['__pubsub__.volttron1.devices.*.*.*.all.#']
+
+    rmq_deliver(core, 'devices/campus/building1/AHU1/all', 1)
+    rmq_deliver(core, 'devices/campus/building1/RTU2/all', 2)
+
+    assert received == ['devices/campus/building1/RTU2/all']
+
+
+@pytest.mark.pubsub
+def test_deadband_filtered_by_subscriber():
+    core = _FakeCore()
+    pubsub = RMQPubSub(core, _FakeRPC(), _FakeRPC(), None)
+    received = []
+
+    def callback(peer, sender, bus, topic, headers, message):
+        received.append(message)
+
+    pubsub.subscribe('pubsub', 'devices', callback, deadband=1.0).get(timeout=2)
+    for value in [70.0, 70.5, 71.5]:
+        rmq_deliver(core, 'devices/building/all', value)
+
+    assert received == [70.0, 71.5]
+
+
+@pytest.mark.pubsub
+def test_callbacks_run_by_dispatcher():
+    core = _FakeCore()
+    pubsub = RMQPubSub(core, _FakeRPC(), _FakeRPC(), None)
+    pubsub.set_dispatch('inline')
+    dispatcher = CallbackDispatcher('pool', size=1)
+    received = []
+
+    def on_all(peer, sender, bus, topic, headers, message):
+        received.append(('all', message))
+
+    def on_building(peer, sender, bus, topic, headers, message):
+        received.append(('building', message))
+
+    pubsub.subscribe('pubsub', 'devices', on_all).get(timeout=2)
+    pubsub.subscribe('pubsub', 'devices/building', on_building, dispatcher=dispatcher).get(timeout=2)
+    rmq_deliver(core, 'devices/building/all', 1)
+
+    assert sorted(received) == [('all', 1), ('building', 1)]
+    stats = pubsub.dispatch_stats()
+    assert stats['agent']['mode'] == 'inline'
+    assert stats['agent']['dispatched'] == 1
+    assert stats['on_building']['dispatched'] == 1
+
+    pubsub.unsubscribe('pubsub', 'devices/building', on_building)
+    assert 'on_building' not in pubsub.dispatch_stats()
+
+
+@pytest.mark.pubsub
+def test_replay_accepted_without_retained_messages():
+    core = _FakeCore()
+    pubsub = RMQPubSub(core, _FakeRPC(), _FakeRPC(), None)
+    received = []
+
+    def callback(peer, sender, bus, topic, headers, message):
+        received.append(message)
+
+    pubsub.subscribe('pubsub', 'devices', callback, replay=True).get(timeout=2)
+    assert received == []
+    rmq_deliver(core, 'devices/building/all', 1)
+    assert received == [1]
+
+
+@pytest.mark.pubsub
+def test_queue_policy_accepted():
+    pubsub = RMQPubSub(_FakeCore(), _FakeRPC(), _FakeRPC(), None)
+    pubsub.set_queue_policy('conflate')
+    assert pubsub.queue_stats('pubsub').get(timeout=2) == {}
+
+
+@pytest.mark.pubsub
+def test_batch_callback_receives_lists():
+    core = _FakeCore()
+    pubsub = RMQPubSub(core, _FakeRPC(), _FakeRPC(), None)
+    received = []
+
+    def on_batch(peer, bus, messages):
+        received.append(messages)
+
+    pubsub.subscribe('pubsub', 'devices', on_batch, batch=True).get(timeout=2)
+    rmq_deliver(core, 'devices/building/all', 1)
+
+    assert received == [[('publisher', 'devices/building/all', {}, 1)]]
+    pubsub.unsubscribe('pubsub', 'devices', on_batch)
+    assert not pubsub._batch_callbacks
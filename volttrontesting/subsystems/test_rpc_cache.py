@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*- {{{
+# vim: set fenc=utf-8 ft=python sw=4 ts=4 sts=4 et:
+#
+# Copyright 2017, Battelle Memorial Institute.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# This material was prepared as an account of work sponsored by an agency of
+# the United States Government. Neither the United States Government nor the
+# United States Department of Energy, nor Battelle, nor any of their
+# employees, nor any jurisdiction or organization that has cooperated in the
+# development of these materials, makes any warranty, express or
+# implied, or assumes any legal liability or responsibility for the accuracy,
+# completeness, or usefulness or any information, apparatus, product,
+# software, or process disclosed, or represents that its use would not infringe
+# privately owned rights. Reference herein to any specific commercial product,
+# process, or service by trade name, trademark, manufacturer, or otherwise
+# does not necessarily constitute or imply its endorsement, recommendation, or
+# favoring by the United States Government or any agency thereof, or
+# Battelle Memorial Institute. The views and opinions of authors expressed
+# herein do not necessarily state or reflect those of the
+# United States Government or any agency thereof.
+#
+# PACIFIC NORTHWEST NATIONAL LABORATORY operated by
+# BATTELLE for the UNITED STATES DEPARTMENT OF ENERGY
+# under Contract DE-AC05-76RL01830
+# }}}
+
+import json
+
+import pytest
+
+from volttron.platform.vip.agent.dispatch import Signal
+from volttron.platform.vip.agent.subsystems.rpc import RPC, ResultCache
+
+
+class FakeCore(object):
+    messagebus = 'zmq'
+
+    def __init__(self):
+        self.onsetup = Signal()
+        self.onconnected = Signal()
+        self.ondisconnected = Signal()
+
+    def register(self, name, handler, error_handler):
+        pass
+
+
+class RecordingConnection(object):
+    def __init__(self):
+        self.sent = []
+
+    def send_vip(self, peer, subsystem, args=None, msg_id=b'', **kwargs):
+        self.sent.append((peer, json.loads(args[0])['method']))
+
+
+class Lookup(object):
+    def __init__(self):
+        self.calls = 0
+
+    @RPC.export(cache_ttl=60)
+    def get_topic_list(self, prefix=''):
+        self.calls += 1
+        return [prefix + 'a', prefix + 'b']
+
+    @RPC.export('weather', cache_ttl=60, idempotent=True,
+                cache_key=lambda location, units='si': location)
+    def get_weather(self, location, units='si'):
+        self.calls += 1
+        return {'location': location, 'calls': self.calls}
+
+    @RPC.export
+    def uncached(self):
+        self.calls += 1
+        return self.calls
+
+
+class FakeAuth(object):
+    def __init__(self, capabilities):
+        self.capabilities = capabilities
+        self.fetches = 0
+
+    def get_capabilities(self, user):
+        self.fetches += 1
+        return self.capabilities.get(user, [])
+
+
+class Protected(object):
+    def __init__(self, capabilities):
+        self.vip = type('vip', (), {})()
+        self.vip.auth = FakeAuth(capabilities)
+
+    @RPC.export
+    @RPC.allow('can_set')
+    def set_point(self, value):
+        return value
+
+
+class Context(object):
+    def __init__(self, user, peer=None):
+        self.user = user
+        self.peer = peer
+
+
+def make_rpc(owner):
+    core = FakeCore()
+    rpc = RPC(core, owner, None)
+    core.onsetup.send(core)
+    return core, rpc
+
+
+def call(rpc, method, *params, **kwargs):
+    request = json.dumps({'jsonrpc': '2.0', 'id': '1', 'method': method,
+                          'params': list(params)})
+    return json.loads(rpc._dispatcher.dispatch(request, kwargs.get('context')))
+
+
+@pytest.mark.subsystems
+def test_results_cached_per_arguments():
+    owner = Lookup()
+    core, rpc = make_rpc(owner)
+
+    assert call(rpc, 'get_topic_list')['result'] == ['a', 'b']
+    assert call(rpc, 'get_topic_list')['result'] == ['a', 'b']
+    assert call(rpc, 'get_topic_list', 'x/')['result'] == ['x/a', 'x/b']
+    assert owner.calls == 2
+
+    call(rpc, 'uncached')
+    assert call(rpc, 'uncached')['result'] == 4
+
+    stats = call(rpc, 'get_topic_list.inspect')['result']['cache']
+    assert (stats['hits'], stats['misses'], stats['entries']) == (1, 2, 2)
+    # Cached methods still report the signature of the exported method
+    inspected = call(rpc, 'get_topic_list.inspect')['result']
+    assert inspected['params']['args'] == ['prefix']
+    assert sorted(call(rpc, 'inspect')['result']['cache']) == [
+        'get_topic_list', 'weather']
+
+
+@pytest.mark.subsystems
+def test_results_cached_per_caller():
+    owner = Lookup()
+    core, rpc = make_rpc(owner)
+    alice, bob = Context('alice', 'alice.agent'), Context('bob', 'bob.agent')
+
+    first = call(rpc, 'weather', 'richland', context=alice)['result']
+    assert call(rpc, 'weather', 'richland', context=alice)['result'] == first
+    assert call(rpc, 'weather', 'richland', context=bob)['result'] != first
+    assert owner.calls == 2
+
+    rpc.invalidate('weather', 'richland')
+    call(rpc, 'weather', 'richland', context=alice)
+    call(rpc, 'weather', 'richland', context=bob)
+    assert owner.calls == 4
+
+
+@pytest.mark.subsystems
+def test_invalidate():
+    owner = Lookup()
+    core, rpc = make_rpc(owner)
+
+    call(rpc, 'get_topic_list')
+    call(rpc, 'get_topic_list', 'x/')
+    rpc.invalidate('get_topic_list', 'x/')
+    call(rpc, 'get_topic_list')
+    call(rpc, 'get_topic_list', 'x/')
+    assert owner.calls == 3
+
+    rpc.invalidate()
+    call(rpc, 'get_topic_list')
+    assert owner.calls == 4
+
+    with pytest.raises(ValueError):
+        rpc.invalidate('uncached')
+
+
+@pytest.mark.subsystems
+def test_cache_key_and_idempotent_responses():
+    owner = Lookup()
+    core, rpc = make_rpc(owner)
+
+    first = call(rpc, 'weather', 'richland')
+    # Units are not part of the key
+    second = call(rpc, 'weather', 'richland', 'us')
+    assert first['result'] == second['result']
+    assert first['cache_ttl'] == 60
+    assert 'cache_ttl' not in call(rpc, 'get_topic_list')
+
+
+@pytest.mark.subsystems
+def test_client_caches_idempotent_results():
+    core, rpc = make_rpc(Lookup())
+    core.connection = RecordingConnection()
+    sent = core.connection.sent
+
+    result = rpc.call('weather.agent', 'weather', 'richland')
+    response = {'jsonrpc': '2.0', 'id': result.ident,
+                'result': {'location': 'richland'}, 'cache_ttl': 60}
+    rpc._dispatcher.dispatch(json.dumps(response), None)
+    assert result.get(timeout=0) == {'location': 'richland'}
+
+    # Callers get their own copy of the cached result
+    result.get()['location'] = 'pasco'
+    cached = rpc.call('weather.agent', 'weather', 'richland')
+    assert cached.get(timeout=0) == {'location': 'richland'}
+    cached.get()['location'] = 'kennewick'
+    cached = rpc.call('weather.agent', 'weather', 'richland')
+    assert cached.get(timeout=0) == {'location': 'richland'}
+    rpc.call('weather.agent', 'weather', 'pasco')
+    assert sent == [('weather.agent', 'weather')] * 2
+
+    rpc.forget('weather.agent')
+    rpc.call('weather.agent', 'weather', 'richland')
+    assert len(sent) == 3
+
+
+@pytest.mark.subsystems
+def test_capability_checks_remembered_until_update():
+    owner = Protected({'operator': ['can_set']})
+    core, rpc = make_rpc(owner)
+    auth = owner.vip.auth
+    operator, guest = Context('operator'), Context('guest')
+
+    for value in range(3):
+        assert call(rpc, 'set_point', value, context=operator)['result'] == value
+    assert auth.fetches == 1
+    # Failed checks are not remembered
+    for _ in range(2):
+        assert 'error' in call(rpc, 'set_point', 1, context=guest)
+    assert auth.fetches == 3
+
+    auth.capabilities = {}
+    rpc.reset_authorizations()
+    assert 'error' in call(rpc, 'set_point', 1, context=operator)
+
+
+def test_cache_options_validated():
+    with pytest.raises(ValueError):
+        RPC.export(idempotent=True)
+    with pytest.raises(ValueError):
+        RPC.export(cache_ttl=0)
+    cache = ResultCache(60, size=2)
+    for key in 'abc':
+        cache.store(key, key)
+    assert len(cache) == 2
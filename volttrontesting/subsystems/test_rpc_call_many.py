@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*- {{{
+# vim: set fenc=utf-8 ft=python sw=4 ts=4 sts=4 et:
+#
+# Copyright 2017, Battelle Memorial Institute.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# This material was prepared as an account of work sponsored by an agency of
+# the United States Government. Neither the United States Government nor the
+# United States Department of Energy, nor Battelle, nor any of their
+# employees, nor any jurisdiction or organization that has cooperated in the
+# development of these materials, makes any warranty, express or
+# implied, or assumes any legal liability or responsibility for the accuracy,
+# completeness, or usefulness or any information, apparatus, product,
+# software, or process disclosed, or represents that its use would not infringe
+# privately owned rights. Reference herein to any specific commercial product,
+# process, or service by trade name, trademark, manufacturer, or otherwise
+# does not necessarily constitute or imply its endorsement, recommendation, or
+# favoring by the United States Government or any agency thereof, or
+# Battelle Memorial Institute. The views and opinions of authors expressed
+# herein do not necessarily state or reflect those of the
+# United States Government or any agency thereof.
+#
+# PACIFIC NORTHWEST NATIONAL LABORATORY operated by
+# BATTELLE for the UNITED STATES DEPARTMENT OF ENERGY
+# under Contract DE-AC05-76RL01830
+# }}}
+
+import json
+
+import gevent
+import pytest
+
+from volttron.platform.vip.agent.dispatch import Signal
+from volttron.platform.vip.agent.errors import Unreachable
+from volttron.platform.vip.agent.subsystems.rpc import RPC
+
+
+class FakeCore(object):
+    messagebus = 'zmq'
+
+    def __init__(self):
+        self.onsetup = Signal()
+        self.onconnected = Signal()
+        self.ondisconnected = Signal()
+        self.connection = self
+        self.requests = {}
+
+    def register(self, name, handler, error_handler):
+        pass
+
+    def send_vip(self, peer, subsystem, args=None, msg_id=b'', **kwargs):
+        request = json.loads(args[0])
+        self.requests[(peer, request['params'][0])] = request['id']
+
+
+@pytest.fixture
+def rpc():
+    core = FakeCore()
+    rpc = RPC(core, object(), None)
+    rpc.fake_core = core
+    core.onsetup.send(core)
+    return rpc
+
+
+def reply(rpc, peer, arg, result):
+    ident = rpc.fake_core.requests.pop((peer, arg))
+    response = {'jsonrpc': '2.0', 'id': ident, 'result': result}
+    rpc._dispatcher.dispatch(json.dumps(response), None)
+
+
+@pytest.mark.subsystems
+def test_results_returned_as_they_complete(rpc):
+    calls = [('a', 'echo', ['x']), ('b', 'echo', ['y'], {})]
+    results = rpc.call_many(calls)
+    # All calls are sent before any result is waited for
+    assert sorted(rpc.fake_core.requests) == [('a', 'x'), ('b', 'y')]
+
+    gevent.spawn_later(0.01, reply, rpc, 'b', 'y', 'from b')
+    gevent.spawn_later(0.02, reply, rpc, 'a', 'x', 'from a')
+    completed = [(call[0], result.get()) for call, result in results]
+    assert completed == [('b', 'from b'), ('a', 'from a')]
+
+
+@pytest.mark.subsystems
+def test_timeouts_and_errors_are_returned(rpc):
+    results = rpc.call_many([('a', 'echo', ['x']), ('b', 'echo', ['y'])],
+                            timeout=0.05)
+    gevent.spawn_later(0.01, reply, rpc, 'a', 'x', 'from a')
+    completed = dict((call[0], result) for call, result in results)
+    assert completed['a'].get() == 'from a'
+    with pytest.raises(gevent.Timeout):
+        completed['b'].get()
+    # A late reply does not change the result already returned
+    reply(rpc, 'b', 'y', 'late')
+    assert not completed['b'].successful()
+
+    rpc._isconnected = False
+    (call, result), = rpc.call_many([('c', 'echo', ['z'])])
+    with pytest.raises(Unreachable):
+        result.get()
+
+
+@pytest.mark.subsystems
+def test_concurrency_limits_outstanding_calls(rpc):
+    requests = rpc.fake_core.requests
+    most = []
+
+    def respond():
+        while True:
+            most.append(len(requests))
+            for peer, arg in list(requests):
+                reply(rpc, peer, arg, arg)
+            gevent.sleep(0.001)
+
+    calls = [('peer{}'.format(i), 'echo', [i]) for i in range(5)]
+    results = rpc.call_many(calls, concurrency=2)
+    assert len(requests) == 2
+    responder = gevent.spawn(respond)
+    try:
+        assert sorted(result.get() for call, result in results) == range(5)
+    finally:
+        responder.kill()
+    assert max(most) <= 2
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*- {{{
+# vim: set fenc=utf-8 ft=python sw=4 ts=4 sts=4 et:
+#
+# Copyright 2017, Battelle Memorial Institute.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# This material was prepared as an account of work sponsored by an agency of
+# the United States Government. Neither the United States Government nor the
+# United States Department of Energy, nor Battelle, nor any of their
+# employees, nor any jurisdiction or organization that has cooperated in the
+# development of these materials, makes any warranty, express or
+# implied, or assumes any legal liability or responsibility for the accuracy,
+# completeness, or usefulness or any information, apparatus, product,
+# software, or process disclosed, or represents that its use would not infringe
+# privately owned rights. Reference herein to any specific commercial product,
+# process, or service by trade name, trademark, manufacturer, or otherwise
+# does not necessarily constitute or imply its endorsement, recommendation, or
+# favoring by the United States Government or any agency thereof, or
+# Battelle Memorial Institute. The views and opinions of authors expressed
+# herein do not necessarily state or reflect those of the
+# United States Government or any agency thereof.
+#
+# PACIFIC NORTHWEST NATIONAL LABORATORY operated by
+# BATTELLE for the UNITED STATES DEPARTMENT OF ENERGY
+# under Contract DE-AC05-76RL01830
+# }}}
+
+import json
+
+import pytest
+
+from volttron.platform.vip.agent.dispatch import Signal
+from volttron.platform.vip.agent.subsystems.rpc import RPC
+
+
+class FakeCore(object):
+    messagebus = 'zmq'
+
+    def __init__(self):
+        self.onsetup = Signal()
+        self.onconnected = Signal()
+        self.ondisconnected = Signal()
+
+    def register(self, name, handler, error_handler):
+        pass
+
+
+class Device(object):
+    @RPC.export
+    def get_point(self, point):
+        return point
+
+    @RPC.export
+    def set_point(self, point, value):
+        raise ValueError('read only')
+
+
+def call(rpc, method, *params):
+    request = json.dumps({'jsonrpc': '2.0', 'id': '1', 'method': method,
+                          'params': list(params)})
+    return json.loads(rpc._dispatcher.dispatch(request, None))
+
+
+@pytest.mark.subsystems
+def test_calls_errors_and_latency_recorded():
+    core = FakeCore()
+    rpc = RPC(core, Device(), None)
+    core.onsetup.send(core)
+
+    for _ in range(3):
+        call(rpc, 'get_point', 'a')
+    call(rpc, 'set_point', 'a', 1)
+    call(rpc, 'missing')
+
+    stats = call(rpc, 'rpc.stats', True)['result']
+    methods = stats['methods']
+    assert sorted(methods) == ['get_point', 'set_point']
+    assert (methods['get_point']['calls'], methods['get_point']['errors']) == (3, 0)
+    assert (methods['set_point']['calls'], methods['set_point']['errors']) == (1, 1)
+    assert methods['get_point']['latency']['count'] == 3
+    assert stats['start'] <= stats['end']
+
+    # Reset after being read; only the call to rpc.stats remains
+    assert list(call(rpc, 'rpc.stats')['result']['methods']) == ['rpc.stats']
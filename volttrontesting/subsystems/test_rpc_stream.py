@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*- {{{
+# vim: set fenc=utf-8 ft=python sw=4 ts=4 sts=4 et:
+#
+# Copyright 2017, Battelle Memorial Institute.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# This material was prepared as an account of work sponsored by an agency of
+# the United States Government. Neither the United States Government nor the
+# United States Department of Energy, nor Battelle, nor any of their
+# employees, nor any jurisdiction or organization that has cooperated in the
+# development of these materials, makes any warranty, express or
+# implied, or assumes any legal liability or responsibility for the accuracy,
+# completeness, or usefulness or any information, apparatus, product,
+# software, or process disclosed, or represents that its use would not infringe
+# privately owned rights. Reference herein to any specific commercial product,
+# process, or service by trade name, trademark, manufacturer, or otherwise
+# does not necessarily constitute or imply its endorsement, recommendation, or
+# favoring by the United States Government or any agency thereof, or
+# Battelle Memorial Institute. The views and opinions of authors expressed
+# herein do not necessarily state or reflect those of the
+# United States Government or any agency thereof.
+#
+# PACIFIC NORTHWEST NATIONAL LABORATORY operated by
+# BATTELLE for the UNITED STATES DEPARTMENT OF ENERGY
+# under Contract DE-AC05-76RL01830
+# }}}
+
+import pytest
+
+from volttron.platform.jsonrpc import RemoteError
+from volttron.platform.vip.agent.dispatch import Signal
+from volttron.platform.vip.agent.subsystems.rpc import RPC
+
+
+class Context(object):
+    def __init__(self, peer):
+        self.peer = self.user = peer
+
+
+class LoopbackCore(object):
+    '''Delivers RPC requests straight to the dispatcher of another RPC.'''
+    messagebus = 'zmq'
+
+    def __init__(self, identity):
+        self.identity = identity
+        self.onsetup = Signal()
+        self.onconnected = Signal()
+        self.ondisconnected = Signal()
+        self.connection = self
+        self.peers = {}
+
+    def register(self, name, handler, error_handler):
+        pass
+
+    def send_vip(self, peer, subsystem, args=None, msg_id=b'', **kwargs):
+        rpc = self.peers[peer]
+        response = rpc._dispatcher.dispatch(args[0], Context(self.identity))
+        if response:
+            self.rpc._dispatcher.dispatch(response, Context(peer))
+
+
+class Reader(object):
+    def __init__(self):
+        self.produced = 0
+        self.closed = False
+
+    @RPC.export
+    def read(self, rows):
+        try:
+            for row in range(rows):
+                self.produced += 1
+                yield [row]
+        finally:
+            self.closed = True
+
+    @RPC.export
+    def fails(self):
+        yield 1
+        raise ValueError('bad row')
+
+    @RPC.export
+    def single(self):
+        return {'value': 1}
+
+
+def connect(owner):
+    cores = LoopbackCore('caller'), LoopbackCore('server')
+    caller, server = [RPC(core, obj, None)
+                      for core, obj in zip(cores, [object(), owner])]
+    for core, rpc in zip(cores, [caller, server]):
+        core.rpc = rpc
+        core.onsetup.send(core)
+    cores[0].peers['server'] = server
+    return cores, caller, server
+
+
+@pytest.mark.subsystems
+def test_chunks_read_a_window_at_a_time():
+    owner = Reader()
+    cores, caller, server = connect(owner)
+
+    chunks = caller.stream('server', 'read', 100, stream_window=10)
+    read = []
+    for chunk in chunks:
+        read.extend(chunk)
+        # At most the consumed window and the one requested ahead
+        assert owner.produced <= len(read) + 20
+    assert read == range(100)
+    assert owner.closed and not server._streams
+
+    assert list(caller.stream('server', 'single')) == [{'value': 1}]
+
+
+@pytest.mark.subsystems
+def test_closing_early_closes_generator():
+    owner = Reader()
+    cores, caller, server = connect(owner)
+
+    chunks = caller.stream('server', 'read', 1000, stream_window=5)
+    assert next(chunks) == [0]
+    chunks.close()
+    assert owner.closed and not server._streams
+    assert owner.produced == 10
+
+
+@pytest.mark.subsystems
+def test_errors_raised_to_caller():
+    cores, caller, server = connect(Reader())
+
+    chunks = caller.stream('server', 'fails', stream_window=1)
+    assert next(chunks) == 1
+    with pytest.raises(RemoteError):
+        list(chunks)
+    assert not server._streams
+
+
+@pytest.mark.subsystems
+def test_plain_call_of_stream_rejected():
+    owner = Reader()
+    cores, caller, server = connect(owner)
+
+    with pytest.raises(RemoteError) as exc_info:
+        caller.call('server', 'read', 10).get(timeout=1)
+    assert exc_info.value.exc_info['exc_type'] == 'TypeError'
+    assert 'rpc.stream()' in exc_info.value.message
+    assert owner.produced == 0